@@ -0,0 +1,63 @@
+"""Compare two benchmark results written by :mod:`benchmarks.hot_paths` or
+:mod:`benchmarks.startup`.
+
+.. code-block:: console
+
+    python -m benchmarks.compare baseline.json new.json --threshold 0.1
+
+The process exits with ``1``, if any benchmark got slower than the baseline
+by more than ``--threshold`` (relative).
+"""
+from __future__ import annotations
+
+import argparse
+from collections.abc import Sequence
+
+from benchmarks.results import read_results
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('new')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=.1,
+        help='relative slowdown that is considered a regression',
+    )
+    args = parser.parse_args(argv)
+
+    baseline = read_results(args.baseline)
+    new = read_results(args.new)
+    regressions = []
+    print(
+        f'{"benchmark":<24} {"baseline":>12} {"new":>12} {"change":>8} '
+        f'{"memory change":>14}',
+    )
+    for key, result in new.items():
+        if key not in baseline:
+            print(f'{key:<24} {"-":>12} {result.seconds:12.4f}')
+            continue
+
+        base = baseline[key]
+        change = result.seconds / base.seconds - 1
+        if base.peak_bytes and result.peak_bytes is not None:
+            mem = f'{result.peak_bytes / base.peak_bytes - 1:+14.1%}'
+        else:
+            mem = f'{"-":>14}'
+        print(
+            f'{key:<24} {base.seconds:12.4f} {result.seconds:12.4f} '
+            f'{change:+8.1%} {mem}',
+        )
+        if change > args.threshold:
+            regressions.append(key)
+
+    if regressions:
+        print(f'regressions: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+"""Generate synthetic messages and measurements for the benchmarks.
+
+The messages are created by :func:`vpf_730.simulator.random_msg` with the
+same fixed-width format the VPF-730 sends, so the parser takes the same code
+paths it takes in the field. A fixed seed makes the data reproducible between
+runs.
+"""
+from __future__ import annotations
+
+import random
+import sqlite3
+from collections.abc import Iterator
+
+from vpf_730.simulator import random_msg
+from vpf_730.vpf_730 import INSERT_MEASUREMENT
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+
+# 2022-07-25 14:22:57 UTC
+START = 1658758977
+
+
+def iter_msgs(n: int, seed: int = 42) -> Iterator[tuple[bytes, int]]:
+    """Lazily create ``n`` messages with one timestamp per minute
+
+    :param n: number of messages to create
+    :param seed: seed of the random number generator
+
+    :return: an iterator of ``(message, timestamp)``
+    """
+    rng = random.Random(seed)
+    for i in range(n):
+        yield random_msg(rng), START + i * 60
+
+
+def make_measurements(n: int, seed: int = 42) -> list[Measurement]:
+    """Create ``n`` measurements by parsing synthetic messages
+
+    :param n: number of measurements to create
+    :param seed: seed of the random number generator
+
+    :return: the measurements ordered by their timestamp
+    """
+    return [
+        Measurement.from_msg(msg=msg, timestamp=ts)
+        for msg, ts in iter_msgs(n, seed=seed)
+    ]
+
+
+def populate_db(db: sqlite3.Connection, data: list[Measurement]) -> None:
+    """Bulk-insert measurements into a database using a single transaction
+
+    :param db: an open connection to the sqlite database
+    :param data: the measurements to insert
+    """
+    with db:
+        db.execute(MEASUREMENT_TABLE)
+        db.executemany(INSERT_MEASUREMENT, (m._asdict() for m in data))
@@ -0,0 +1,209 @@
+"""Benchmark the throughput and memory usage of the hot paths for parsing,
+storing, reading and serializing measurements. Run it from the root of the
+repository:
+
+.. code-block:: console
+
+    python -m benchmarks.hot_paths --sizes 1000 100000 1000000 -o new.json
+    python -m benchmarks.compare baseline.json new.json
+
+``to_db`` opens a connection and commits for every single measurement like
+the logger does, so it is only run for a sample of ``--to-db-sample`` rows.
+``parse_many``, ``query_all`` and ``query_fields`` are only run if NumPy is
+installed. ``parse_generic`` runs the parser ``parse`` falls back to for
+messages not in the standard format. ``query_all`` reads the same rows as
+``read_all`` into a structured array instead of a list of dicts.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from collections.abc import Sequence
+
+from benchmarks.data import iter_msgs
+from benchmarks.data import make_measurements
+from benchmarks.data import populate_db
+from benchmarks.results import Result
+from benchmarks.results import write_results
+from vpf_730.sender import select_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# the default max_req_len of the sender
+PAGE_SIZE = 512
+
+
+def _time(f: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _peak_memory(f: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        f()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - base
+
+
+def _benchmarks(
+        size: int,
+        tmpdir: str,
+        to_db_sample: int,
+) -> dict[str, tuple[int, Callable[[], object]]]:
+    msgs = list(iter_msgs(size))
+    data = make_measurements(size)
+    rows = [m._asdict() for m in data]
+    db_path = os.path.join(tmpdir, f'read_{size}.db')
+    with connect(db_path) as db:
+        populate_db(db, data)
+
+    counter = 0
+
+    def _new_db() -> str:
+        nonlocal counter
+        counter += 1
+        return os.path.join(tmpdir, f'insert_{size}_{counter}.db')
+
+    def parse() -> list[Measurement]:
+        return [
+            Measurement.from_msg(msg=msg, timestamp=ts) for msg, ts in msgs
+        ]
+
+    def parse_generic() -> list[Measurement]:
+        return [
+            Measurement._from_msg_generic(msg=msg, timestamp=ts)
+            for msg, ts in msgs
+        ]
+
+    buffer = b''.join(msg + b'\r\n' for msg, _ in msgs)
+    timestamps = [ts for _, ts in msgs]
+
+    def parse_many() -> None:
+        Measurement.parse_many(buffer, timestamps=timestamps)
+
+    def to_db() -> None:
+        path = _new_db()
+        for m in data[:to_db_sample]:
+            m.to_db(path)
+
+    def insert_bulk() -> None:
+        with connect(_new_db()) as db:
+            populate_db(db, data)
+
+    def read_paginated() -> None:
+        start = 0
+        with connect(db_path) as db:
+            while page := select_measurements(db, start, limit=PAGE_SIZE):
+                start = page[-1]['timestamp']
+
+    def read_all() -> None:
+        with connect(db_path) as db:
+            select_measurements(db, start=0)
+
+    def query_all() -> None:
+        from vpf_730.query import query
+
+        query(db_path, start=0)
+
+    def query_fields() -> None:
+        from vpf_730.query import query
+
+        query(db_path, start=0, fields=['water_in_precip', 'temp'])
+
+    def json_encode() -> None:
+        for idx in range(0, len(rows), PAGE_SIZE):
+            json.dumps({'data': rows[idx:idx + PAGE_SIZE]}).encode()
+
+    benchmarks: dict[str, tuple[int, Callable[[], object]]] = {
+        'parse': (size, parse),
+        'parse_generic': (size, parse_generic),
+        'parse_many': (size, parse_many),
+        'to_db': (min(size, to_db_sample), to_db),
+        'insert_bulk': (size, insert_bulk),
+        'read_paginated': (size, read_paginated),
+        'read_all': (size, read_all),
+        'query_all': (size, query_all),
+        'query_fields': (size, query_fields),
+        'json_encode': (size, json_encode),
+    }
+    if importlib.util.find_spec('numpy') is None:
+        for name in ('parse_many', 'query_all', 'query_fields'):
+            del benchmarks[name]
+    return benchmarks
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes',
+        nargs='+',
+        type=int,
+        default=[1000, 100_000, 1_000_000],
+        help='number of rows to run the benchmarks with',
+    )
+    parser.add_argument(
+        '--only',
+        nargs='+',
+        help='only run these benchmarks e.g. parse json_encode',
+    )
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--to-db-sample', type=int, default=1000)
+    parser.add_argument(
+        '--no-memory',
+        action='store_true',
+        help='do not run a second pass measuring the memory using tracemalloc',
+    )
+    parser.add_argument('-o', '--output', help='write the results to a file')
+    args = parser.parse_args(argv)
+
+    results = []
+    seen = set()
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            benchmarks = _benchmarks(
+                size=size,
+                tmpdir=tmpdir,
+                to_db_sample=args.to_db_sample,
+            )
+            for name, (n, f) in benchmarks.items():
+                if (args.only and name not in args.only) or (name, n) in seen:
+                    continue
+
+                seen.add((name, n))
+                seconds = _time(f, repeat=args.repeat)
+                peak = None if args.no_memory else _peak_memory(f)
+                result = Result(
+                    name=name,
+                    size=n,
+                    seconds=seconds,
+                    peak_bytes=peak,
+                )
+                results.append(result)
+                mem = '' if peak is None else f'{peak / 1024 ** 2:10.2f} MiB'
+                print(
+                    f'{result.key:<24} {seconds:10.4f} s '
+                    f'{result.rows_per_second:14,.0f} rows/s {mem}',
+                )
+
+    if args.output:
+        write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
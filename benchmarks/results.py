@@ -0,0 +1,104 @@
+"""A common format for saving benchmark results, so runs can be compared
+with :mod:`benchmarks.compare`.
+
+.. code-block:: json
+
+    {
+        "meta": {"python": "3.11.2", "platform": "...", "commit": "...", ...},
+        "results": [
+            {"name": "parse", "size": 1000, "seconds": 0.004, ...}
+        ]
+    }
+"""
+from __future__ import annotations
+
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import NamedTuple
+
+
+class Result(NamedTuple):
+    """The result of a single benchmark
+
+    :param name: name of the benchmark e.g. ``parse``
+    :param size: number of rows processed
+    :param seconds: the median of the timings in seconds
+    :param peak_bytes: peak memory allocated while running as reported by
+        :mod:`tracemalloc` or ``None`` if not measured
+    """
+    name: str
+    size: int
+    seconds: float
+    peak_bytes: int | None = None
+
+    @property
+    def key(self) -> str:
+        return f'{self.name}[{self.size}]'
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.size / self.seconds if self.seconds else float('inf')
+
+
+def _commit() -> str | None:
+    try:
+        ret = subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return ret.stdout.decode().strip()
+
+
+def write_results(path: str, results: list[Result]) -> None:
+    """Write results together with information about the environment
+
+    :param path: path of the ``.json`` file to write
+    :param results: the results of the benchmarks
+    """
+    data: dict[str, Any] = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': sys.implementation.name,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'commit': _commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+        },
+        'results': [
+            {**r._asdict(), 'rows_per_second': r.rows_per_second}
+            for r in results
+        ],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+
+
+def read_results(path: str) -> dict[str, Result]:
+    """Read results written by :func:`write_results`
+
+    :param path: path of the ``.json`` file to read
+
+    :return: the results by their :attr:`Result.key`
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    ret = {}
+    for r in data['results']:
+        result = Result(
+            name=r['name'],
+            size=r['size'],
+            seconds=r['seconds'],
+            peak_bytes=r.get('peak_bytes'),
+        )
+        ret[result.key] = result
+    return ret
@@ -0,0 +1,130 @@
+"""Measure the end-to-end throughput of reading, parsing and storing
+measurements and the recovery time after faults, using a simulated sensor on
+a pseudo-terminal (see :mod:`vpf_730.simulator`). Run it from the root of the
+repository:
+
+.. code-block:: console
+
+    python -m benchmarks.simulated_logger -n 1000 --fault-rate 0.05
+
+Every fault (garbage, a cut-off message or no answer at all) costs at least
+one read, a cut-off message or no answer also cost the read ``--timeout``.
+The recovery time is the time from the first failed read to the next
+successful one.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Sequence
+
+from benchmarks.data import START
+from benchmarks.results import Result
+from benchmarks.results import write_results
+from vpf_730.simulator import Simulator
+from vpf_730.simulator import SimulatorConfig
+from vpf_730.vpf_730 import VPF730
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=1000, help='number of reads')
+    parser.add_argument(
+        '--fault-rate',
+        type=float,
+        default=0,
+        help='probability for each of the three kinds of faults',
+    )
+    parser.add_argument(
+        '--automatic',
+        action='store_true',
+        help='read automatic messages (OSAM1) instead of polling with D?',
+    )
+    parser.add_argument(
+        '--speedup',
+        type=float,
+        default=600,
+        help='acceleration of the automatic messages sent every 60 s',
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=.5,
+        help='read timeout of the serial port in seconds',
+    )
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('-o', '--output', help='write the results to a file')
+    args = parser.parse_args(argv)
+
+    cfg = SimulatorConfig(
+        automatic=args.automatic,
+        speedup=args.speedup,
+        garbled_rate=args.fault_rate,
+        partial_rate=args.fault_rate,
+        timeout_rate=args.fault_rate,
+        seed=args.seed,
+    )
+    outcomes: Counter[str] = Counter()
+    recovery_times = []
+    failed_since = None
+    with Simulator(cfg=cfg) as sim, tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, 'simulated.db')
+        vpf730 = VPF730(port=sim.port, timeout=args.timeout)
+        start = time.perf_counter()
+        for _ in range(args.n):
+            read_start = time.perf_counter()
+            try:
+                measurement = vpf730.measure(polled_mode=not args.automatic)
+            except (ValueError, IndexError) as e:
+                outcomes[type(e).__name__] += 1
+                measurement = None
+            else:
+                if measurement is None:
+                    outcomes['no data'] += 1
+
+            if measurement is None:
+                if failed_since is None:
+                    failed_since = read_start
+                continue
+
+            # many measurements are read per second, but stored once a minute
+            timestamp = START + outcomes['ok'] * 60
+            measurement._replace(timestamp=timestamp).to_db(db_path)
+            outcomes['ok'] += 1
+            if failed_since is not None:
+                recovery_times.append(time.perf_counter() - failed_since)
+                failed_since = None
+
+        seconds = time.perf_counter() - start
+
+    print(f'{args.n} reads in {seconds:.2f} s')
+    for outcome, count in outcomes.most_common():
+        print(f'  {outcome:<20} {count:8}')
+    print(f'stored measurements per second: {outcomes["ok"] / seconds:.1f}')
+    if recovery_times:
+        print(
+            f'recovery time median: {statistics.median(recovery_times):.3f} '
+            f's max: {max(recovery_times):.3f} s',
+        )
+
+    if args.output:
+        name = 'simulated_automatic' if args.automatic else 'simulated_poll'
+        results = [Result(name=name, size=outcomes['ok'], seconds=seconds)]
+        if recovery_times:
+            results.append(
+                Result(
+                    name=f'{name}_recovery',
+                    size=len(recovery_times),
+                    seconds=statistics.median(recovery_times),
+                ),
+            )
+        write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,200 @@
+"""Simulate months of operation of the ``logger`` or the combined ``run``
+command in minutes, using a :class:`vpf_730.clock.VirtualClock`, a simulated
+sensor (see :mod:`vpf_730.simulator`) and for ``run``, a local
+:class:`vpf_730.receiver.Receiver`. Run it from the root of the repository:
+
+.. code-block:: console
+
+    python -m benchmarks.simulated_year --days 365 --command logger
+
+Every simulated ``--sample-days``, the size of the local database, the peak
+memory (max RSS) and the consumed CPU time are printed.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import NamedTuple
+
+from benchmarks.results import Result
+from benchmarks.results import write_results
+from vpf_730.clock import VirtualClock
+from vpf_730.daemon import Daemon
+from vpf_730.daemon import DaemonConfig
+from vpf_730.logger import Logger
+from vpf_730.logger import LoggerConfig
+from vpf_730.receiver import Receiver
+from vpf_730.receiver import ReceiverConfig
+from vpf_730.sender import SenderConfig
+from vpf_730.simulator import Simulator
+from vpf_730.simulator import SimulatorConfig
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+class Sample(NamedTuple):
+    simulated: datetime
+    wall_seconds: float
+    cpu_seconds: float
+    db_bytes: int
+    max_rss_bytes: int
+
+
+def _max_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class _Sampler:
+    def __init__(
+            self,
+            clock: VirtualClock,
+            db_path: str,
+            end: datetime,
+            every: timedelta,
+    ) -> None:
+        self.clock = clock
+        self.db_path = db_path
+        self.end = end.timestamp()
+        self.every = every.total_seconds()
+        self.next_sample = clock.timestamp() + self.every
+        self.samples: list[Sample] = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def running(self) -> bool:
+        now = self.clock.timestamp()
+        if now >= self.next_sample:
+            self.sample()
+            self.next_sample += self.every
+        return now < self.end
+
+    def sample(self) -> None:
+        s = Sample(
+            simulated=self.clock.now(),
+            wall_seconds=time.perf_counter() - self._wall_start,
+            cpu_seconds=time.process_time() - self._cpu_start,
+            db_bytes=os.path.getsize(self.db_path),
+            max_rss_bytes=_max_rss(),
+        )
+        self.samples.append(s)
+        print(
+            f'{s.simulated:%Y-%m-%d}  wall: {s.wall_seconds:8.1f} s  '
+            f'cpu: {s.cpu_seconds:8.1f} s  '
+            f'db: {s.db_bytes / 1024 ** 2:8.2f} MiB  '
+            f'max rss: {s.max_rss_bytes / 1024 ** 2:8.2f} MiB',
+            flush=True,
+        )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--sample-days', type=float, default=30)
+    parser.add_argument(
+        '--command',
+        choices=('logger', 'run'),
+        default='logger',
+        help='the command to simulate (default: %(default)s)',
+    )
+    parser.add_argument('--log-interval', type=int, default=1)
+    parser.add_argument('--send-interval', type=int, default=5)
+    parser.add_argument('-o', '--output', help='write the results to a file')
+    args = parser.parse_args(argv)
+
+    clock = VirtualClock(start=START)
+    end = START + timedelta(days=args.days)
+    with (
+        tempfile.TemporaryDirectory() as tmpdir,
+        Simulator(cfg=SimulatorConfig(seed=42)) as sim,
+    ):
+        db_path = os.path.join(tmpdir, 'local.db')
+        sampler = _Sampler(
+            clock=clock,
+            db_path=db_path,
+            end=end,
+            every=timedelta(days=args.sample_days),
+        )
+        logger_cfg = LoggerConfig(
+            local_db=db_path,
+            serial_port=sim.port,
+            log_interval=args.log_interval,
+        )
+        if args.command == 'logger':
+            class SimulatedLogger(Logger):
+                @property
+                def _logging(self) -> bool:
+                    return sampler.running()
+
+            SimulatedLogger(cfg=logger_cfg, clock=clock).run()
+        else:
+            receiver = Receiver(
+                cfg=ReceiverConfig(
+                    db=os.path.join(tmpdir, 'receiver.db'),
+                    host='127.0.0.1',
+                    port=0,
+                    api_key='deadbeef',
+                ),
+            )
+            t = threading.Thread(target=receiver.run, daemon=True)
+            t.start()
+            host, port = receiver.server_address
+            sender_cfg = SenderConfig(
+                local_db=db_path,
+                send_interval=args.send_interval,
+                get_endpoint=f'http://{host}:{port}/vpf-730/status',
+                post_endpoint=f'http://{host}:{port}/vpf-730/data',
+                max_req_len=512,
+                api_key='deadbeef',
+            )
+
+            class SimulatedDaemon(Daemon):
+                @property
+                def _running(self) -> bool:
+                    return sampler.running()
+
+            try:
+                SimulatedDaemon(
+                    cfg=DaemonConfig(logger=logger_cfg, sender=sender_cfg),
+                    clock=clock,
+                ).run()
+            finally:
+                receiver.stop()
+                t.join()
+
+        if not sampler.samples or sampler.samples[-1].simulated != clock.now():
+            sampler.sample()
+
+    last = sampler.samples[-1]
+    minutes = args.days * 24 * 60
+    print(
+        f'simulated {args.days:g} days in {last.wall_seconds:.1f} s '
+        f'({minutes * 60 / last.wall_seconds:,.0f}x real time)',
+    )
+    if args.output:
+        write_results(
+            args.output,
+            [
+                Result(
+                    name=f'simulated_{args.command}_days',
+                    size=int(minutes // args.log_interval),
+                    seconds=last.wall_seconds,
+                    peak_bytes=last.max_rss_bytes,
+                ),
+            ],
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
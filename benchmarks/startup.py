@@ -0,0 +1,97 @@
+"""Benchmark the startup time of the ``vpf-730`` CLI.
+
+The ``comm`` command is e.g. called from cron jobs or shell scripts, so it
+should not pay for importing what only the long-running commands need. Run
+it from the root of the repository:
+
+.. code-block:: console
+
+    python -m benchmarks.startup --max-overhead 0.15
+
+The process exits with ``1``, if the overhead of the ``comm`` path compared
+to starting a bare interpreter exceeds ``--max-overhead`` seconds.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Sequence
+
+from benchmarks.results import Result
+from benchmarks.results import write_results
+
+# a sensor is not needed, pyserial is patched, so only the startup is timed
+COMM_CODE = '''\
+from unittest import mock
+from serial import Serial
+from vpf_730.main import main
+with (
+    mock.patch.object(Serial, 'open'),
+    mock.patch.object(Serial, 'write'),
+    mock.patch.object(Serial, 'read_until', return_value=b'OK'),
+):
+    main(['comm', '--serial-port', '/dev/ttyS0', 'R?'])
+'''
+BASELINE_CODE = '''\
+from unittest import mock
+from serial import Serial
+'''
+
+
+def _time_cmd(cmd: Sequence[str], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument(
+        '--max-overhead',
+        type=float,
+        default=None,
+        help='maximum allowed overhead of the comm path in seconds',
+    )
+    parser.add_argument('-o', '--output', help='write the results to a file')
+    args = parser.parse_args(argv)
+
+    cmds = {
+        'baseline': (sys.executable, '-c', BASELINE_CODE),
+        'comm': (sys.executable, '-c', COMM_CODE),
+        'help': (sys.executable, '-m', 'vpf_730', '--help'),
+    }
+    medians = {}
+    for name, cmd in cmds.items():
+        timings = _time_cmd(cmd, repeat=args.repeat)
+        medians[name] = statistics.median(timings)
+        print(
+            f'{name:<10} median: {medians[name] * 1000:8.2f} ms '
+            f'min: {min(timings) * 1000:8.2f} ms',
+        )
+
+    if args.output:
+        write_results(
+            args.output,
+            [
+                Result(name=f'startup_{k}', size=1, seconds=v)
+                for k, v in medians.items()
+            ],
+        )
+
+    overhead = medians['comm'] - medians['baseline']
+    print(f'comm overhead: {overhead * 1000:.2f} ms')
+    if args.max_overhead is not None and overhead > args.max_overhead:
+        print(f'comm overhead exceeds {args.max_overhead * 1000:.2f} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+import os
+import zlib
+from datetime import datetime
+from datetime import timezone
+from unittest import mock
+
+import pytest
+from serial import Serial
+
+from vpf_730 import LoggerConfig
+from vpf_730 import VPF730
+from vpf_730.archive import BlockIndexEntry
+from vpf_730.archive import RawArchive
+from vpf_730.archive import RawArchiveError
+from vpf_730.clock import VirtualClock
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+
+
+def _msgs(n, start=START, step=60):
+    return [
+        (start + i * step + .5, f'PW01,{i:04d}\r\n'.encode())
+        for i in range(n)
+    ]
+
+
+def test_append_and_read_all(tmpdir):
+    data = _msgs(25)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data:
+            archive.append(*r)
+
+        assert list(archive.read()) == data
+        path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+        assert archive.index(path) == [
+            BlockIndexEntry(START + .5, START + 540.5, 0),
+            BlockIndexEntry(START + 600.5, START + 1140.5, mock.ANY),
+        ]
+
+    assert sorted(os.listdir(tmpdir)) == [
+        '2023-01-01.vpfraw',
+        '2023-01-01.vpfraw.idx',
+        '2023-01-01.vpfraw.journal',
+    ]
+
+
+def test_range_read_only_decompresses_overlapping_blocks(tmpdir):
+    data = _msgs(100)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data:
+            archive.append(*r)
+
+        with mock.patch.object(
+            zlib, 'decompress', wraps=zlib.decompress,
+        ) as decompress:
+            ret = list(archive.read(start=START + 1260, end=START + 1800))
+
+    assert ret == data[21:30]
+    assert decompress.call_count == 1
+
+
+def test_rotation_by_day_compresses_the_previous_file(tmpdir):
+    data = _msgs(4, start=START - 120)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data:
+            archive.append(*r)
+
+        assert list(archive.read()) == data
+        prev_day = os.path.join(tmpdir, '2022-12-31.vpfraw')
+        assert len(archive.index(prev_day)) == 1
+        assert os.path.getsize(f'{prev_day}.journal') == 0
+
+
+def test_journal_is_recovered_after_restart(tmpdir):
+    data = _msgs(15)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data[:5]:
+            archive.append(*r)
+
+    # e.g. the logger was restarted
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        assert list(archive.read()) == data[:5]
+        for r in data[5:]:
+            archive.append(*r)
+
+        path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+        assert len(archive.index(path)) == 1
+        assert list(archive.read()) == data
+
+
+def test_interrupted_block_write_is_repaired(tmpdir):
+    data = _msgs(20)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data[:10]:
+            archive.append(*r)
+
+    path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+    # a partially written block and the index was never written
+    with open(path, 'ab') as f:
+        f.write(b'VPFB\x01')
+    os.remove(f'{path}.idx')
+
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        # the index is rebuilt from the block headers, when reading
+        assert list(archive.read()) == data[:10]
+        for r in data[10:]:
+            archive.append(*r)
+
+        assert list(archive.read()) == data
+
+
+def test_partially_written_journal_record_is_truncated(tmpdir):
+    data = _msgs(8)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data[:3]:
+            archive.append(*r)
+
+    path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+    # the logger crashed while appending to the journal
+    with open(f'{path}.journal', 'ab') as f:
+        f.write(b'\x00\x00\x00\x80\xd2')
+
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data[3:]:
+            archive.append(*r)
+        assert list(archive.read()) == data
+
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        assert list(archive.read()) == data
+
+
+def test_journal_records_already_in_a_block_are_skipped(tmpdir):
+    data = _msgs(10)
+    path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data[:9]:
+            archive.append(*r)
+        with open(f'{path}.journal', 'rb') as f:
+            journal = f.read()
+        archive.append(*data[9])
+
+    # the block was written, but the journal was not truncated afterwards
+    with open(f'{path}.journal', 'wb') as f:
+        f.write(journal)
+
+    assert list(RawArchive(str(tmpdir)).read()) == data
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        archive.append(*_msgs(1, start=START + 600)[0])
+        assert list(archive.read())[:10] == data
+        assert len(list(archive.read())) == 11
+
+
+def test_corrupt_index_raises(tmpdir):
+    data = _msgs(10)
+    with RawArchive(str(tmpdir), block_len=10) as archive:
+        for r in data:
+            archive.append(*r)
+
+    path = os.path.join(tmpdir, '2023-01-01.vpfraw')
+    with open(f'{path}.idx', 'r+b') as f:
+        # point the offset of the first block to the middle of it
+        f.seek(16)
+        f.write((3).to_bytes(8, 'little'))
+
+    with pytest.raises(RawArchiveError):
+        list(RawArchive(str(tmpdir)).read())
+
+
+def test_vpf730_read_appends_to_archive(tmpdir, test_msg):
+    archive = RawArchive(str(tmpdir))
+    vpf730 = VPF730(port='/dev/ttyUSB0', archive=archive)
+    with (
+        mock.patch.object(Serial, 'open'),
+        mock.patch.object(Serial, 'write'),
+        mock.patch.object(
+            Serial, 'read_until', side_effect=[test_msg + b'\r\n', b''],
+        ),
+    ):
+        assert vpf730.measure() is not None
+        # nothing is archived, if the sensor does not answer
+        assert vpf730.measure() is None
+
+    (timestamp, msg), = archive.read()
+    assert msg == test_msg + b'\r\n'
+
+
+def test_vpf730_archives_the_poll_time(tmpdir, test_msg):
+    archive = RawArchive(str(tmpdir))
+    clock = VirtualClock(
+        datetime(2023, 1, 1, 0, 0, 59, 500000, tzinfo=timezone.utc),
+        resolution=0,
+    )
+    vpf730 = VPF730(port='/dev/ttyUSB0', archive=archive, clock=clock)
+
+    def _read_until(expected):
+        # the sensor answers after the next second started
+        clock.sleep(1.2)
+        return test_msg + b'\r\n'
+
+    with (
+        mock.patch.object(Serial, 'open'),
+        mock.patch.object(Serial, 'write'),
+        mock.patch.object(Serial, 'read_until', side_effect=_read_until),
+    ):
+        measurement = vpf730.measure()
+
+    assert measurement is not None
+    (timestamp, _), = archive.read()
+    assert timestamp == START + 59.5
+    # replaying the message results in the same measurement
+    assert int(timestamp) == measurement.timestamp
+
+
+def test_logger_config_raw_archive_from_env():
+    environ = {
+        'VPF730_LOCAL_DB': 'local.db',
+        'VPF730_PORT': '/dev/ttyS0',
+        'VPF730_LOG_INTERVAL': '1',
+        'VPF730_RAW_ARCHIVE': 'raw',
+    }
+    with mock.patch.dict(os.environ, environ):
+        cfg = LoggerConfig.from_env()
+
+    assert cfg.raw_archive == 'raw'
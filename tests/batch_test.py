@@ -0,0 +1,184 @@
+import array
+import json
+import sys
+import urllib.request
+from unittest import mock
+
+import pytest
+
+from vpf_730.batch import MeasurementBatch
+from vpf_730.sender import select_measurements
+from vpf_730.sender import Sender
+from vpf_730.sender import SenderConfig
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+
+
+def test_batch_round_trip(make_measurements):
+    measurements = make_measurements(5000, START)
+    batch = MeasurementBatch(measurements)
+
+    assert len(batch) == 5000
+    assert list(batch) == measurements
+    assert batch[0] == measurements[0]
+    assert batch[-1] == measurements[-1]
+    assert type(batch[1]) is Measurement
+    assert batch[1].temp == measurements[1].temp
+
+
+def test_batch_append_dicts_and_tuples(measurement):
+    batch = MeasurementBatch()
+    batch.append(measurement._asdict())
+    batch.append(tuple(measurement._replace(self_test='XOX')))
+
+    assert list(batch) == [measurement, measurement._replace(self_test='XOX')]
+    assert batch.column('self_test') == ['OOO', 'XOX']
+
+
+def test_batch_is_smaller_than_list(make_measurements):
+    measurements = make_measurements(1000, START)
+    batch = MeasurementBatch(measurements)
+
+    assert batch.nbytes == 1000 * (9 * 8 + 4 * 8 + 3 * 2)
+    assert batch.nbytes < sum(sys.getsizeof(m) for m in measurements)
+
+
+def test_batch_slice_does_not_copy(make_measurements):
+    measurements = make_measurements(100, START)
+    batch = MeasurementBatch(measurements)
+    view = batch[10:20]
+
+    assert len(view) == 10
+    assert list(view) == measurements[10:20]
+    assert view[-1] == measurements[19]
+    assert list(view[5:]) == measurements[15:20]
+    assert len(batch[200:]) == 0
+    # the columns are shared
+    assert view._columns is batch._columns
+    assert view.column('timestamp') == array.array(
+        'q',
+        [m.timestamp for m in measurements[10:20]],
+    )
+
+
+def test_batch_slice_errors(measurement):
+    batch = MeasurementBatch([measurement] * 3)
+    with pytest.raises(ValueError) as exc_info:
+        batch[::2]
+
+    msg, = exc_info.value.args
+    assert msg == 'slicing a MeasurementBatch requires a step of 1'
+
+    with pytest.raises(TypeError) as type_exc_info:
+        batch[:2].append(measurement)
+
+    msg, = type_exc_info.value.args
+    assert msg == 'a slice of a MeasurementBatch is read-only'
+
+    with pytest.raises(IndexError):
+        batch[3]
+
+
+@pytest.mark.parametrize(
+    'row',
+    (
+        pytest.param((1, 2, 3), id='too short'),
+        pytest.param((None,) * 16, id='none'),
+    ),
+)
+def test_batch_bad_rows_are_not_added(measurement, row):
+    batch = MeasurementBatch([measurement])
+    with pytest.raises((ValueError, TypeError)):
+        batch.extend([measurement, row])
+
+    assert list(batch) == [measurement]
+
+
+def test_batch_select_and_to_db(tmpdir, make_measurements):
+    measurements = make_measurements(100, START)
+    db_path = str(tmpdir.join('batch.db'))
+    assert MeasurementBatch(measurements).to_db(db_path) == 100
+
+    with connect(db_path) as db:
+        batch = MeasurementBatch.select(db, start=START, limit=50)
+        dicts = select_measurements(db, start=START, limit=50)
+
+    assert list(batch) == measurements[1:51]
+    assert batch.to_dicts() == dicts
+    assert json.loads(batch.to_json()) == dicts
+
+
+def test_batch_to_csv(tmpdir, measurement):
+    batch = MeasurementBatch([measurement, measurement._replace(timestamp=1)])
+    assert batch.to_csv(sep=';') == (
+        f'{measurement.to_csv(sep=";")}\n'
+        f'{measurement._replace(timestamp=1).to_csv(sep=";")}'
+    )
+
+    csv_file = tmpdir.join('batch.csv')
+    batch.to_csv(str(csv_file))
+    batch[1:].to_csv(str(csv_file))
+    header, *lines = csv_file.read().splitlines()
+    assert header == measurement.csv_header()
+    assert lines == [
+        measurement.to_csv(),
+        measurement._replace(timestamp=1).to_csv(),
+        measurement._replace(timestamp=1).to_csv(),
+    ]
+
+
+def test_batch_to_numpy(make_measurements):
+    np = pytest.importorskip('numpy')
+    measurements = make_measurements(100, START)
+    data = MeasurementBatch(measurements)[10:90].to_numpy()
+
+    assert len(data) == 80
+    assert [tuple(r) for r in data.tolist()] == measurements[10:90]
+    assert data['temp'].dtype == np.float64
+
+
+def test_sender_send_batch_in_chunks(make_measurements):
+    cfg = SenderConfig(
+        local_db='local.db',
+        send_interval=5,
+        get_endpoint='https://api.example/com/vpf-730/s',
+        post_endpoint='https://api.example/com/vpf-730/i',
+        max_req_len=40,
+        api_key='deadbeef',
+    )
+    measurements = make_measurements(100, START)
+    with mock.patch.object(urllib.request, 'urlopen') as m:
+        Sender(cfg=cfg).send(MeasurementBatch(measurements))
+
+    sent = [json.loads(c.args[0].data)['data'] for c in m.call_args_list]
+    assert [len(i) for i in sent] == [40, 40, 20]
+    assert sent[2][-1] == measurements[-1]._asdict()
+
+
+def test_batch_extend_columns(measurement):
+    batch = MeasurementBatch([measurement])
+    columns = {
+        name: [value, value] for name, value in measurement._asdict().items()
+    }
+    columns['timestamp'] = [1, 2]
+    batch.extend_columns(columns)
+    assert list(batch) == [
+        measurement,
+        measurement._replace(timestamp=1),
+        measurement._replace(timestamp=2),
+    ]
+
+    del columns['temp']
+    with pytest.raises(ValueError) as exc_info:
+        batch.extend_columns(columns)
+
+    msg, = exc_info.value.args
+    assert msg == 'missing columns: temp'
+
+    columns['temp'] = [1.0]
+    with pytest.raises(ValueError):
+        batch.extend_columns(columns)
+    assert len(batch) == 3
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import zlib
+
+import pytest
+from freezegun import freeze_time
+
+from vpf_730.batch import MeasurementBatch
+from vpf_730.chunks import ChunkError
+from vpf_730.chunks import compact_days
+from vpf_730.chunks import decode_chunk
+from vpf_730.chunks import encode_chunk
+from vpf_730.chunks import select_range
+from vpf_730.main import main
+from vpf_730.sender import select_measurements
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+DAY = 86400
+
+
+@pytest.fixture
+def measurements(make_measurements):
+    # 3 days and 12 hours
+    return make_measurements(84 * 60, START)
+
+
+@pytest.fixture
+def db_path(measurements, make_db):
+    return make_db('chunks.db', measurements)
+
+
+def _decoded(data):
+    batch = MeasurementBatch()
+    batch.extend_columns(decode_chunk(data))
+    return list(batch)
+
+
+def test_encode_decode_chunk_round_trip(measurements):
+    data = encode_chunk(MeasurementBatch(measurements))
+    assert _decoded(data) == measurements
+
+
+def test_encode_decode_values_without_fixed_precision(measurement):
+    measurements = [
+        measurement,
+        measurement._replace(timestamp=1, temp=20.123, self_test='XOX'),
+        measurement._replace(timestamp=2, temp=float('nan'), sensor_id=-5),
+    ]
+    decoded = _decoded(encode_chunk(MeasurementBatch(measurements)))
+    assert decoded[:2] == measurements[:2]
+    assert decoded[2]._replace(temp=0) == measurements[2]._replace(temp=0)
+    assert decoded[2].temp != decoded[2].temp
+
+
+def test_chunk_is_smaller_than_the_values(measurement):
+    measurements = [
+        measurement._replace(timestamp=START + i * 60, temp=i % 50 / 10)
+        for i in range(1440)
+    ]
+    data = encode_chunk(MeasurementBatch(measurements))
+    assert len(data) * 50 < MeasurementBatch(measurements).nbytes
+
+
+@pytest.mark.parametrize(
+    'data',
+    (
+        pytest.param(b'not a chunk', id='not compressed'),
+        pytest.param(zlib.compress(b'VPFC'), id='too short'),
+        pytest.param(zlib.compress(b'VPFX\x01\x00\x00\x00\x00\x00'), id='magic'),  # noqa: E501
+    ),
+)
+def test_decode_chunk_corrupt(data):
+    with pytest.raises(ChunkError):
+        decode_chunk(data)
+
+
+def test_compact_days(db_path, measurements):
+    size = os.path.getsize(db_path)
+    with connect(db_path) as db:
+        # in the middle of the 3rd day, so only two days are complete
+        assert compact_days(db, before=START + 2 * DAY + 3600) == 2
+        ret = db.execute('SELECT min(timestamp), count(*) FROM measurements')
+        assert tuple(ret.fetchone()) == (START + 2 * DAY, 36 * 60)
+        ret = db.execute(
+            'SELECT day, first_timestamp, last_timestamp, count '
+            'FROM measurement_chunks ORDER BY day',
+        )
+        assert [tuple(r) for r in ret] == [
+            (START // DAY, START, START + DAY - 60, 1440),
+            (START // DAY + 1, START + DAY, START + 2 * DAY - 60, 1440),
+        ]
+        # nothing left to compact
+        assert compact_days(db, before=START + 2 * DAY + 3600) == 0
+
+        assert list(select_range(db, start=0)) == measurements
+        assert select_measurements(db, start=0) == [
+            m._asdict() for m in measurements
+        ]
+        db.execute('VACUUM')
+
+    assert os.path.getsize(db_path) < size * .6
+
+
+@pytest.mark.parametrize(
+    ('start', 'end', 'limit', 'exp'),
+    (
+        pytest.param(START + 60, START + 300, None, slice(2, 6), id='chunk'),
+        pytest.param(START + DAY - 120, START + DAY + 60, None, slice(1439, 1442), id='two chunks'),  # noqa: E501
+        pytest.param(START + 2 * DAY - 120, None, 4, slice(2879, 2883), id='chunk and rows'),  # noqa: E501
+        pytest.param(0, None, 3, slice(0, 3), id='limit'),
+        pytest.param(START + 3 * DAY, START + 3 * DAY + 60, None, slice(4321, 4322), id='rows'),  # noqa: E501
+    ),
+)
+def test_select_range(db_path, measurements, start, end, limit, exp):
+    with connect(db_path) as db:
+        compact_days(db, before=START + 2 * DAY)
+        batch = select_range(db, start=start, end=end, limit=limit)
+    assert list(batch) == measurements[exp]
+
+
+def test_select_range_without_chunks(db_path, measurements):
+    with connect(db_path) as db:
+        batch = select_range(db, start=START, limit=2)
+    assert list(batch) == measurements[1:3]
+
+
+def test_insert_into_compacted_day(db_path, measurements):
+    late = measurements[10]._replace(timestamp=START + 30, sensor_id=1337)
+    replaced = measurements[20]._replace(sensor_id=1337)
+    with connect(db_path) as db:
+        compact_days(db, before=START + DAY)
+        insert_measurements(db, [late, replaced])
+
+        exp = sorted([*measurements[:20], late, replaced, *measurements[21:]])
+        assert list(select_range(db, start=0)) == exp
+        assert select_measurements(db, start=START, limit=2) == [
+            late._asdict(), measurements[1]._asdict(),
+        ]
+
+        # the new measurements are merged into the chunk
+        assert compact_days(db, before=START + DAY) == 1
+        ret = db.execute('SELECT count(*) FROM measurement_chunks')
+        assert ret.fetchone()[0] == 1
+        assert list(select_range(db, start=0)) == exp
+
+
+def test_compact_days_compact_schema(db_path, measurements):
+    migrate_db(db_path)
+    with connect(db_path) as db:
+        assert compact_days(db, before=START + DAY) == 1
+        ret = db.execute('SELECT count(*) FROM measurements_compact')
+        assert ret.fetchone()[0] == 84 * 60 - 1440
+        assert list(select_range(db, start=0)) == measurements
+
+
+def test_compact_days_bad_rows_are_kept(tmpdir, measurement):
+    db_path = str(tmpdir.join('bad.db'))
+    with connect(db_path) as db:
+        insert_measurements(db, [measurement._replace(temp=None)])
+        assert compact_days(db, before=measurement.timestamp + DAY) == 0
+        ret = db.execute('SELECT count(*) FROM measurements')
+        assert ret.fetchone()[0] == 1
+
+
+@freeze_time('2023-01-04 12:00:00')
+def test_main_compact_days(db_path, capsys):
+    assert main(['compact-days', '--local-db', db_path, '--vacuum']) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith(f'compacted 0 days of {db_path} (')
+
+    argv = ['compact-days', '--local-db', db_path, '--older-than-days', '1']
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith(f'compacted 2 days of {db_path} (')
+    with sqlite3.connect(db_path) as db:
+        ret = db.execute('SELECT count(*) FROM measurement_chunks')
+        assert ret.fetchone()[0] == 2
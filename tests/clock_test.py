@@ -0,0 +1,104 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+
+import pytest
+
+from vpf_730 import LoggerConfig
+from vpf_730 import SenderConfig
+from vpf_730.clock import SystemClock
+from vpf_730.clock import VirtualClock
+from vpf_730.logger import Logger
+from vpf_730.sender import Sender
+from vpf_730.utils import connect
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def test_system_clock():
+    clock = SystemClock()
+    before = datetime.now(timezone.utc)
+    assert before <= clock.now() <= datetime.now(timezone.utc)
+    with mock.patch('time.sleep') as sleep:
+        clock.sleep(.1)
+    sleep.assert_called_once_with(.1)
+
+
+def test_virtual_clock_sleep_is_aligned_to_resolution():
+    clock = VirtualClock(start=START + timedelta(seconds=.5))
+    clock.sleep(.1)
+    assert clock.now() == START + timedelta(seconds=1)
+    clock.sleep(.1)
+    assert clock.now() == START + timedelta(seconds=2)
+    clock.sleep(61)
+    assert clock.now() == START + timedelta(seconds=63)
+
+
+def test_virtual_clock_without_resolution():
+    clock = VirtualClock(start=START, resolution=0)
+    clock.sleep(.25)
+    assert clock.now() == START + timedelta(seconds=.25)
+    assert clock.timestamp() == START.timestamp() + .25
+
+
+def test_virtual_clock_start_must_be_timezone_aware():
+    with pytest.raises(ValueError) as exc_info:
+        VirtualClock(start=datetime(2023, 1, 1))
+
+    msg, = exc_info.value.args
+    assert msg == 'start must be a timezone-aware datetime'
+
+
+def test_logger_with_virtual_clock(tmpdir, mock_vpf):
+    db_path = str(tmpdir.join('virtual.db'))
+    cfg = LoggerConfig(local_db=db_path, serial_port='', log_interval=5)
+    clock = VirtualClock(start=START)
+    end = START + timedelta(days=1)
+    logger = Logger(cfg=cfg, clock=clock)
+    logger.vpf_730 = mock_vpf
+    mock_vpf.clock = clock
+    with mock.patch.object(
+        Logger, '_logging',
+        new_callable=mock.PropertyMock,
+        side_effect=lambda: clock.now() < end,
+    ):
+        logger.run()
+
+    with connect(db_path) as db:
+        ret = db.execute(
+            'SELECT min(timestamp), max(timestamp), count(*) '
+            'FROM measurements',
+        )
+        first, last, count = ret.fetchone()
+
+    # a whole day, every 5 minutes. The loop sleeps before it checks the time
+    assert count == 288
+    assert first == (START + timedelta(minutes=5)).timestamp()
+    assert last == end.timestamp()
+
+
+def test_sender_with_virtual_clock():
+    cfg = SenderConfig(
+        local_db='',
+        send_interval=15,
+        get_endpoint='https://api.example/com/vpf-730/s',
+        post_endpoint='https://api.example/com/vpf-730/i',
+        max_req_len=512,
+        api_key='deadbeef',
+    )
+    clock = VirtualClock(start=START)
+    end = START + timedelta(hours=2)
+    with (
+        mock.patch.object(
+            Sender, '_sending',
+            new_callable=mock.PropertyMock,
+            side_effect=lambda: clock.now() < end,
+        ),
+        mock.patch.object(Sender, 'get_remote_timestamp', return_value=0),
+        mock.patch.object(Sender, 'get_data_from_db', return_value=[]),
+        mock.patch.object(Sender, 'send') as send,
+    ):
+        Sender(cfg=cfg, clock=clock).run()
+
+    assert send.call_count == 8
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from vpf_730.main import main
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+np = pytest.importorskip('numpy')
+from vpf_730.columnar import ColumnarStore  # noqa: E402
+from vpf_730.columnar import ColumnarStoreError  # noqa: E402
+from vpf_730.columnar import HEADER_SIZE  # noqa: E402
+from vpf_730.query import query  # noqa: E402
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+
+
+@pytest.fixture
+def db_path(make_measurements, make_db):
+    return make_db('local.db', make_measurements(1000, START))
+
+
+@pytest.fixture
+def store(tmpdir):
+    return ColumnarStore(str(tmpdir.join('columnar')))
+
+
+def _rows(columns):
+    return list(zip(*(columns[name].tolist() for name in Measurement._fields)))
+
+
+def test_empty_store(store):
+    assert len(store) == 0
+    assert len(store.column('temp')) == 0
+    assert all(len(v) == 0 for v in store.range(start=0).values())
+    with pytest.raises(KeyError):
+        store.column('tmp')
+
+
+def test_sync_and_range(store, db_path, make_measurements):
+    measurements = make_measurements(1000, START)
+    assert store.sync(db_path) == 1000
+    assert len(store) == 1000
+    # nothing new
+    assert store.sync(db_path) == 0
+
+    data = store.range(start=START + 60, end=START + 3600)
+    assert _rows(data) == measurements[1:60]
+    assert data['temp'].dtype == np.float64
+    assert _rows(store.range(start=START + 999 * 60)) == measurements[999:]
+
+    # the slices are views of the memory-mapped files
+    assert isinstance(data['temp'].base, np.memmap)
+    assert not data['temp'].flags.writeable
+
+
+def test_files_are_valid_npy_files(store, db_path):
+    store.sync(db_path)
+    temp = np.load(os.path.join(store.directory, 'temp.npy'))
+    assert temp.tolist() == store.column('temp').tolist()
+    self_test = np.load(os.path.join(store.directory, 'self_test.npy'))
+    assert self_test.dtype == np.dtype('<U3')
+
+
+def test_sync_appends_new_measurements(store, db_path, make_measurements):
+    store.sync(db_path)
+    temp = store.column('temp')
+
+    new = make_measurements(10, START + 1000 * 60)
+    with connect(db_path) as db:
+        insert_measurements(db, new)
+    assert store.sync(db_path) == 10
+    assert len(store.column('temp')) == 1010
+    assert _rows(store.range(start=START + 1000 * 60)) == new
+    # a range obtained before is still valid
+    assert len(temp) == 1000
+
+
+def test_sync_partitioned(store, tmpdir, make_measurements):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    measurements = make_measurements(2 * 1440, START)
+    with PartitionedDB(db_path) as db:
+        for m in measurements:
+            db.insert(m)
+
+    assert store.sync(db_path) == 2 * 1440
+    data = query(db_path, start=0)
+    assert _rows(store.range(start=0)) == [tuple(r) for r in data.tolist()]
+
+
+def test_append_must_be_ordered(store, db_path):
+    data = query(db_path, start=0)
+    with pytest.raises(ValueError):
+        store.append(data[::-1])
+
+    store.append(data[10:])
+    with pytest.raises(ValueError):
+        store.append(data[:10])
+    assert store.append(data[:0]) == 0
+
+
+def test_interrupted_append_is_ignored(store, db_path):
+    data = query(db_path, start=0)
+    store.append(data[:100])
+    # only the temp column was written, before the process was killed
+    with open(os.path.join(store.directory, 'temp.npy'), 'ab') as f:
+        f.write(data['temp'][100:200].tobytes())
+
+    assert len(store.column('temp')) == 100
+    store.append(data[100:])
+    assert _rows(store.range(start=0)) == [tuple(r) for r in data.tolist()]
+    size = os.path.getsize(os.path.join(store.directory, 'temp.npy'))
+    assert size == HEADER_SIZE + 1000 * 8
+
+
+def test_missing_column_file(store, db_path):
+    data = query(db_path, start=0)
+    store.append(data[:100])
+    os.remove(os.path.join(store.directory, 'temp.npy'))
+    with pytest.raises(ColumnarStoreError):
+        store.append(data[100:])
+
+
+def test_main_sync_columnar(db_path, tmpdir, capsys):
+    store = str(tmpdir.join('columnar'))
+    argv = ['sync-columnar', '--local-db', db_path, '--store', store]
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out == f'appended 1,000 measurements to {store} (1,000 in total)\n'
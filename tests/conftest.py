@@ -1,3 +1,4 @@
+import random
 from unittest import mock
 
 import pytest
@@ -5,6 +6,8 @@ from serial import Serial
 
 from vpf_730 import Measurement
 from vpf_730 import VPF730
+from vpf_730.simulator import random_msg
+from vpf_730.storage import insert_measurements
 from vpf_730.utils import connect
 from vpf_730.vpf_730 import MEASUREMENT_TABLE
 
@@ -105,3 +108,43 @@ def test_db_many_records(tmpdir):
         ).to_db(db_path)
 
     return db_path
+
+
+@pytest.fixture
+def make_msgs():
+    def _make_msgs(n, start, *, interval=60, seed=42):
+        """Reproducible random messages, ``interval`` seconds apart"""
+        rng = random.Random(seed)
+        offsets = range(n) if isinstance(n, int) else n
+        return [(start + i * interval, random_msg(rng)) for i in offsets]
+
+    return _make_msgs
+
+
+@pytest.fixture
+def make_measurements(make_msgs):
+    def _make_measurements(n, start, *, interval=60, seed=42, sensor_id=None):
+        """Reproducible random measurements, ``interval`` seconds apart"""
+        ret = [
+            Measurement.from_msg(msg, timestamp=timestamp)
+            for timestamp, msg in make_msgs(
+                n, start, interval=interval, seed=seed,
+            )
+        ]
+        if sensor_id is not None:
+            ret = [m._replace(sensor_id=sensor_id) for m in ret]
+        return ret
+
+    return _make_measurements
+
+
+@pytest.fixture
+def make_db(tmpdir):
+    def _make_db(name, measurements):
+        """Insert ``measurements`` into a new database in ``tmpdir``"""
+        db_path = str(tmpdir.join(name))
+        with connect(db_path) as db:
+            insert_measurements(db, measurements)
+        return db_path
+
+    return _make_db
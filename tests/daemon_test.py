@@ -0,0 +1,275 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+
+import pytest
+from freezegun import freeze_time
+
+import vpf_730.daemon
+from vpf_730 import LoggerConfig
+from vpf_730 import Measurement
+from vpf_730 import SenderConfig
+from vpf_730.clock import VirtualClock
+from vpf_730.daemon import Daemon
+from vpf_730.daemon import DaemonConfig
+from vpf_730.partitions import PartitionedDB
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import VPF730
+
+
+@pytest.fixture
+def daemon_cfg(test_db):
+    return DaemonConfig(
+        logger=LoggerConfig(
+            local_db=test_db,
+            serial_port='/dev/ttyS0',
+            log_interval=1,
+        ),
+        sender=SenderConfig(
+            local_db=test_db,
+            send_interval=1,
+            get_endpoint='https://api.example/com/vpf-730/s',
+            post_endpoint='https://api.example/com/vpf-730/i',
+            max_req_len=512,
+            api_key='deadbeef',
+        ),
+    )
+
+
+def _remote(*latest_dates):
+    ret = mock.MagicMock()
+    ret.read.side_effect = [
+        json.dumps({'latest_date': d}).encode() for d in latest_dates
+    ]
+    return ret
+
+
+def _posted_timestamps(m):
+    return [
+        [i['timestamp'] for i in json.loads(c.args[0].data)['data']]
+        for c in m.call_args_list if c.args[0].data is not None
+    ]
+
+
+def test_daemon_config_from_env():
+    environ = {
+        'VPF730_LOCAL_DB': 'local.db',
+        'VPF730_PORT': '/dev/ttyS0',
+        'VPF730_LOG_INTERVAL': '1',
+        'VPF730_SEND_INTERVAL': '5',
+        'VPF730_GET_ENDPOINT': 'https://api.example/com/vpf-730/s',
+        'VPF730_POST_ENDPOINT': 'https://api.example/com/vpf-730/i',
+        'VPF730_MAX_REQ_LEN': '69',
+        'VPF730_API_KEY': 'deadbeef',
+    }
+    with mock.patch.dict(os.environ, environ):
+        cfg = DaemonConfig.from_env()
+
+    assert cfg == DaemonConfig(
+        logger=LoggerConfig(
+            local_db='local.db',
+            serial_port='/dev/ttyS0',
+            log_interval=1,
+        ),
+        sender=SenderConfig(
+            local_db='local.db',
+            send_interval=5,
+            get_endpoint='https://api.example/com/vpf-730/s',
+            post_endpoint='https://api.example/com/vpf-730/i',
+            max_req_len=69,
+            api_key='deadbeef',
+        ),
+    )
+
+
+def test_daemon_catches_up_from_disk_then_sends_from_memory(
+        daemon_cfg,
+        measurement,
+):
+    daemon = Daemon(cfg=daemon_cfg)
+    new_measurement = measurement._replace(timestamp=1658759037)
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen',
+            return_value=_remote(0, 1658758978),
+        ) as m,
+        mock.patch.object(VPF730, 'measure', return_value=new_measurement),
+        connect(daemon_cfg.logger.local_db) as db,
+    ):
+        # the remote is empty, so we need to catch up from disk
+        daemon.send(db=db)
+        daemon.log(db=db)
+        with mock.patch.object(
+            vpf_730.daemon, 'select_measurements',
+        ) as select:
+            daemon.send(db=db)
+
+    select.assert_not_called()
+    assert _posted_timestamps(m) == [[1658758977, 1658758978], [1658759037]]
+    assert not daemon.queue
+    with connect(daemon_cfg.logger.local_db) as db:
+        nr, = db.execute('SELECT count(*) FROM measurements').fetchone()
+    assert nr == 3
+
+
+def test_daemon_remote_out_of_sync_reads_from_disk(daemon_cfg, measurement):
+    daemon = Daemon(cfg=daemon_cfg)
+    daemon._synced_until = 1658758978
+    new_measurement = measurement._replace(timestamp=1658759037)
+    # the remote lost data, everything needs to be sent again
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen', return_value=_remote(1658758977),
+        ) as m,
+        mock.patch.object(VPF730, 'measure', return_value=new_measurement),
+        connect(daemon_cfg.logger.local_db) as db,
+    ):
+        daemon.log(db=db)
+        daemon.send(db=db)
+
+    assert _posted_timestamps(m) == [[1658758978, 1658759037]]
+    assert daemon._synced_until == 1658759037
+
+
+@freeze_time('2022-12-18 22:55:00')
+def test_daemon_running_failed_send_does_not_stop_logging(
+        daemon_cfg,
+        measurement,
+        caplog,
+):
+    new_measurement = measurement._replace(timestamp=1671404100)
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen',
+            side_effect=urllib.error.URLError('network is unreachable'),
+        ),
+        mock.patch.object(VPF730, 'measure', return_value=new_measurement),
+        mock.patch(
+            'vpf_730.daemon.Daemon._running',
+            new_callable=mock.PropertyMock,
+        ) as _running,
+    ):
+        _running.side_effect = [True, True, False]
+        daemon = Daemon(cfg=daemon_cfg)
+        daemon.run()
+
+    assert caplog.messages == ['failed sending data']
+    assert daemon._synced_until is None
+    assert not daemon.queue
+    with connect(daemon_cfg.logger.local_db) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp DESC')
+        latest = ret.fetchone()
+
+    assert Measurement(**dict(latest)) == new_measurement
+
+
+@freeze_time('2022-12-18 22:55:00')
+def test_daemon_running_writes_file_sink(tmpdir, daemon_cfg, measurement):
+    directory = str(tmpdir.join('export'))
+    cfg = daemon_cfg._replace(
+        logger=daemon_cfg.logger._replace(file_sink=directory),
+    )
+    new_measurement = measurement._replace(timestamp=1671404100)
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen', return_value=_remote(1671404100),
+        ),
+        mock.patch.object(VPF730, 'measure', return_value=new_measurement),
+        mock.patch(
+            'vpf_730.daemon.Daemon._running',
+            new_callable=mock.PropertyMock,
+        ) as _running,
+    ):
+        _running.side_effect = [True, True, False]
+        daemon = Daemon(cfg=cfg)
+        daemon.run()
+
+    with open(os.path.join(directory, '2022-12-18.csv')) as f:
+        lines = f.read().splitlines()
+    assert lines == [new_measurement.csv_header(), new_measurement.to_csv()]
+
+
+def test_daemon_keeps_logging_while_sending(daemon_cfg, measurement):
+    # 2022-07-25 14:23:00 UTC
+    start = datetime(2022, 7, 25, 14, 23, tzinfo=timezone.utc)
+    clock = VirtualClock(start=start)
+    end = start + timedelta(minutes=3, seconds=1)
+    release = threading.Event()
+
+    def _urlopen(req, timeout):
+        # the remote hangs until logging finished
+        assert release.wait(timeout=5)
+        return _remote(1658758978)
+
+    def _running():
+        if clock.now() < end:
+            return True
+        release.set()
+        return False
+
+    measurements = [
+        measurement._replace(timestamp=int(start.timestamp()) + i * 60)
+        for i in range(1, 4)
+    ]
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen', side_effect=_urlopen,
+        ) as urlopen,
+        mock.patch.object(VPF730, 'measure', side_effect=measurements),
+        mock.patch(
+            'vpf_730.daemon.Daemon._running',
+            new_callable=mock.PropertyMock,
+            side_effect=_running,
+        ),
+    ):
+        daemon = Daemon(cfg=daemon_cfg, clock=clock)
+        daemon.run()
+
+    # the measurements of every minute were taken while sending hung
+    with connect(daemon_cfg.logger.local_db) as db:
+        nr, = db.execute('SELECT count(*) FROM measurements').fetchone()
+    assert nr == 5
+    assert _posted_timestamps(urlopen)[0] == [
+        m.timestamp for m in measurements
+    ]
+
+
+def test_daemon_partitioned_catches_up_and_prunes(
+        tmpdir,
+        daemon_cfg,
+        measurement,
+):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    cfg = DaemonConfig(
+        logger=daemon_cfg.logger._replace(local_db=db_path),
+        sender=daemon_cfg.sender._replace(local_db=db_path, retention_days=1),
+    )
+    daemon = Daemon(cfg=cfg)
+    # 2022-06-30 23:59:00 UTC and 2022-07-25 14:22:57 UTC
+    measurements = (
+        measurement._replace(timestamp=1656633540),
+        measurement,
+    )
+    with (
+        mock.patch.object(
+            urllib.request, 'urlopen',
+            return_value=_remote(0),
+        ) as m,
+        mock.patch.object(VPF730, 'measure', side_effect=measurements),
+        PartitionedDB(db_path) as db,
+    ):
+        daemon.log(db=db)
+        daemon.log(db=db)
+        # the remote is empty, so we need to catch up from the partitions
+        daemon.queue.clear()
+        daemon.send(db=db)
+
+        assert _posted_timestamps(m) == [[1656633540, 1658758977]]
+        # the June partition was sent and is older than a day
+        assert [p.month for p in db.partitions()] == ['2022-07']
@@ -0,0 +1,154 @@
+import random
+
+import pytest
+
+from vpf_730.archive import RawArchive
+from vpf_730.chunks import compact_days
+from vpf_730.gaps import create_gap_index
+from vpf_730.gaps import find_gaps
+from vpf_730.gaps import find_partitioned_gaps
+from vpf_730.gaps import Gap
+from vpf_730.gaps import has_gap_index
+from vpf_730.gaps import rebuild_gap_index
+from vpf_730.main import main
+from vpf_730.partitions import PartitionedDB
+from vpf_730.replay import replay
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+DAY = 86400
+
+
+# missing: 10-19, 100, 1440-1499
+MINUTES = [
+    i for i in range(2 * 1440)
+    if not (10 <= i < 20 or i == 100 or 1440 <= i < 1500)
+]
+EXP = [
+    Gap(start=START + 10 * 60, end=START + 20 * 60),
+    Gap(start=START + 100 * 60, end=START + 101 * 60),
+    Gap(start=START + DAY, end=START + DAY + 3600),
+    Gap(start=START + 2 * DAY, end=START + 2 * DAY + 3600),
+]
+
+
+@pytest.fixture
+def db_path(make_measurements, make_db):
+    return make_db('gaps.db', make_measurements(MINUTES, START))
+
+
+def _coverage(db):
+    ret = db.execute('SELECT * FROM coverage ORDER BY first_minute')
+    return [tuple(r) for r in ret.fetchall()]
+
+
+def test_find_gaps_without_index(db_path):
+    with connect(db_path) as db:
+        assert has_gap_index(db) is False
+        gaps = find_gaps(db, start=START, end=START + 2 * DAY + 3600)
+    assert gaps == EXP
+    assert [gap.minutes for gap in gaps] == [10, 1, 60, 60]
+
+
+def test_find_gaps(db_path):
+    with connect(db_path) as db:
+        create_gap_index(db)
+        assert has_gap_index(db) is True
+        assert len(_coverage(db)) == 4
+        gaps = find_gaps(db, start=START, end=START + 2 * DAY + 3600)
+        assert gaps == EXP
+        # the range is extended to whole minutes
+        gaps = find_gaps(db, start=START + 630, end=START + 6001)
+        assert gaps == [EXP[0]._replace(start=START + 600), EXP[1]]
+        assert find_gaps(db, start=START + 1200, end=START + 6000) == []
+        assert find_gaps(db, start=START - 60, end=START) == [
+            Gap(start=START - 60, end=START),
+        ]
+
+
+def test_gap_index_is_updated_on_insert(tmpdir, make_measurements):
+    db_path = str(tmpdir.join('gaps.db'))
+    with connect(db_path) as db:
+        create_gap_index(db)
+    # measurements arrive out of order, including duplicates
+    minutes = MINUTES + MINUTES[::7]
+    random.Random(1).shuffle(minutes)
+    with connect(db_path) as db:
+        for m in make_measurements(minutes, START):
+            insert_measurements(db, [m], on_conflict='replace')
+        exp = _coverage(db)
+        rebuild_gap_index(db)
+        assert _coverage(db) == exp
+        gaps = find_gaps(db, start=START, end=START + 2 * DAY + 3600)
+    assert gaps == EXP
+
+    # the gaps are filled
+    for m in make_measurements(range(10, 20), START):
+        m.to_db(db_path)
+    with connect(db_path) as db:
+        gaps = find_gaps(db, start=START, end=START + 2 * DAY + 3600)
+    assert gaps == EXP[1:]
+
+
+def test_gap_index_compacted_and_compact_schema(db_path, make_measurements):
+    with connect(db_path) as db:
+        compact_days(db, before=START + DAY)
+    migrate_db(db_path)
+    with connect(db_path) as db:
+        create_gap_index(db)
+        insert_measurements(db, make_measurements(range(1440, 1500), START))
+        gaps = find_gaps(db, start=START, end=START + 2 * DAY)
+    assert gaps == EXP[:2]
+
+
+def test_find_partitioned_gaps(tmpdir, make_measurements):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    with PartitionedDB(db_path) as db:
+        # 2023-01 and 2023-02
+        for m in make_measurements(MINUTES, START):
+            db.insert(m)
+    db = PartitionedDB(db_path)
+    assert find_partitioned_gaps(
+        db, start=START, end=START + 2 * DAY + 3600,
+    ) == EXP
+    # a month without a partition
+    gaps = find_partitioned_gaps(db, start=START - 40 * DAY, end=START)
+    assert gaps == [Gap(start=START - 40 * DAY, end=START)]
+
+
+def test_replay_gaps_only(tmpdir, db_path, make_msgs):
+    archive_dir = str(tmpdir.join('raw'))
+    with RawArchive(archive_dir, block_len=50) as archive:
+        for timestamp, msg in make_msgs(3 * 1440, START + .5):
+            archive.append(timestamp, msg)
+
+    with connect(db_path) as db:
+        create_gap_index(db)
+    stats = replay(
+        sources=[archive_dir],
+        db_path=db_path,
+        jobs=1,
+        end=START + 2 * DAY + 3600,
+        gaps_only=True,
+    )
+    assert stats.inserted == 131
+    with connect(db_path) as db:
+        assert find_gaps(db, start=START, end=START + 2 * DAY + 3600) == []
+
+
+def test_main_gaps(db_path, capsys):
+    argv = [
+        'gaps', '--local-db', db_path, '--create-index',
+        '--start', str(START), '--end', str(START + 2 * DAY),
+    ]
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out == (
+        '2023-01-31 00:10 - 2023-01-31 00:20 UTC: 10 minutes\n'
+        '2023-01-31 01:40 - 2023-01-31 01:41 UTC: 1 minutes\n'
+        '2023-02-01 00:00 - 2023-02-01 01:00 UTC: 60 minutes\n'
+        '3 gaps, 71 minutes missing\n'
+    )
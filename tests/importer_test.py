@@ -0,0 +1,277 @@
+import time
+
+import pytest
+
+from vpf_730.batch import MeasurementBatch
+from vpf_730.gaps import create_gap_index
+from vpf_730.gaps import drop_gap_index_trigger
+from vpf_730.gaps import find_gaps
+from vpf_730.importer import IMPORT_RUNNING_TABLE
+from vpf_730.importer import import_files
+from vpf_730.main import main
+from vpf_730.rollups import create_rollups
+from vpf_730.rollups import drop_rollup_trigger
+from vpf_730.rollups import select_rollups
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+
+
+@pytest.fixture
+def measurements(make_measurements):
+    return make_measurements(1000, START)
+
+
+@pytest.fixture
+def csv_path(tmpdir, measurements):
+    csv_path = str(tmpdir.join('measurements.csv'))
+    batch = MeasurementBatch()
+    batch.extend(measurements)
+    batch.to_csv(csv_path)
+    return csv_path
+
+
+@pytest.fixture
+def capture_path(tmpdir, make_msgs):
+    capture_path = str(tmpdir.join('capture.txt'))
+    msgs = make_msgs(500, START + 86400 + .25, seed=1)
+    with open(capture_path, 'wb') as f:
+        for i, (timestamp, msg) in enumerate(msgs):
+            msg = b'\x00garbage' if i == 100 else msg.strip()
+            f.write(b'%.2f,%s\n' % (timestamp, msg))
+    return capture_path
+
+
+def _select(db_path):
+    with connect(db_path) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp')
+        return [Measurement(*row) for row in ret.fetchall()]
+
+
+def test_import_csv(tmpdir, csv_path, measurements):
+    db_path = str(tmpdir.join('import.db'))
+    stats = import_files([csv_path], db_path=db_path, batch_size=300)
+    assert stats.files == 1
+    assert stats.read == stats.inserted == 1000
+    assert stats.failed == stats.skipped == 0
+    assert stats.rows_per_second > 0
+    assert _select(db_path) == measurements
+
+
+def test_import_capture(tmpdir, capture_path):
+    db_path = str(tmpdir.join('import.db'))
+    stats = import_files([capture_path], db_path=db_path)
+    assert (stats.read, stats.failed, stats.inserted) == (500, 1, 499)
+    measurements = _select(db_path)
+    assert len(measurements) == 499
+    assert measurements[0].timestamp == START + 86400
+
+
+def test_import_csv_columns_in_any_order(tmpdir, measurements):
+    csv_path = str(tmpdir.join('reordered.csv'))
+    fields = (*reversed(Measurement._fields), 'station')
+    with open(csv_path, 'w') as f:
+        f.write(f'{";".join(fields)}\n')
+        for m in measurements[:10]:
+            values = (*reversed([str(v) for v in m]), 'foo')
+            f.write(f'{";".join(values)}\n')
+
+    db_path = str(tmpdir.join('import.db'))
+    import_files([csv_path], db_path=db_path, sep=';')
+    assert _select(db_path) == measurements[:10]
+
+
+def test_import_csv_missing_columns(tmpdir):
+    csv_path = str(tmpdir.join('missing.csv'))
+    with open(csv_path, 'w') as f:
+        f.write('timestamp,sensor_id,temp\n1672531200,1,12.5\n')
+    with pytest.raises(ValueError) as excinfo:
+        import_files([csv_path], db_path=str(tmpdir.join('import.db')))
+    assert 'backscatter_exco' in str(excinfo.value)
+
+
+def test_import_skips_duplicates(tmpdir, csv_path, measurements):
+    db_path = str(tmpdir.join('import.db'))
+    with connect(db_path) as db:
+        create_rollups(db)
+    measurements[0]._replace(temp=-99.5).to_db(db_path)
+
+    stats = import_files([csv_path], db_path=db_path, batch_size=300)
+    assert (stats.inserted, stats.skipped) == (999, 1)
+    assert _select(db_path)[0].temp == -99.5
+
+    stats = import_files(
+        [csv_path],
+        db_path=db_path,
+        on_conflict='replace',
+        resume=False,
+    )
+    assert (stats.inserted, stats.skipped) == (1000, 0)
+    assert _select(db_path)[0].temp == measurements[0].temp
+
+
+def test_import_resumes(
+        tmpdir,
+        csv_path,
+        measurements,
+        monkeypatch,
+        make_measurements,
+):
+    db_path = str(tmpdir.join('import.db'))
+    # the import is interrupted after the first batch is committed
+    batches: list[object] = []
+
+    def _insert(db, rows, on_conflict):
+        if batches:
+            raise KeyboardInterrupt
+        batches.append(rows)
+        return insert_measurements(db, rows, on_conflict=on_conflict)
+
+    with monkeypatch.context() as m:
+        m.setattr('vpf_730.importer.insert_measurements', _insert)
+        with pytest.raises(KeyboardInterrupt):
+            import_files([csv_path], db_path=db_path, batch_size=300)
+    assert len(_select(db_path)) == 300
+
+    assert import_files([csv_path], db_path=db_path).read == 700
+    assert import_files([csv_path], db_path=db_path).read == 0
+
+    # new lines appended to the file are imported
+    new = make_measurements(10, START + 1000 * 60)
+    with open(csv_path, 'a') as f:
+        f.writelines(f'{m.to_csv()}\n' for m in new)
+        # a line that is still being written
+        f.write(new[0].to_csv()[:20])
+    stats = import_files([csv_path], db_path=db_path)
+    assert (stats.read, stats.failed, stats.inserted) == (11, 1, 10)
+    assert _select(db_path) == measurements + new
+
+    # the file was replaced
+    with open(csv_path, 'w') as f:
+        f.write(f'{new[0].csv_header()}\n')
+        f.writelines(f'{m.to_csv()}\n' for m in make_measurements(1000, START))
+    assert import_files([csv_path], db_path=db_path).read == 1000
+
+
+def test_import_rebuilds_rollups_and_gap_index(
+        tmpdir,
+        csv_path,
+        capture_path,
+):
+    db_path = str(tmpdir.join('import.db'))
+    with connect(db_path) as db:
+        create_rollups(db)
+        create_gap_index(db)
+    import_files([csv_path, capture_path], db_path=db_path, batch_size=100)
+
+    with connect(db_path) as db:
+        rollups = select_rollups(
+            db, start=START, end=START + 2 * 86400, interval=86400,
+        )
+        gaps = find_gaps(db, start=START, end=START + 86400 + 500 * 60)
+        # the triggers were recreated
+        triggers = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "ORDER BY name",
+        ).fetchall()
+    assert [r.nr_measurements for r in rollups] == [1000, 499]
+    assert [(g.start, g.minutes) for g in gaps] == [
+        (START + 1000 * 60, 440),
+        (START + 86400 + 100 * 60, 1),
+    ]
+    assert [t[0] for t in triggers] == [
+        'measurements_coverage',
+        'measurements_rollup',
+    ]
+
+
+def _hour_count(db_path, timestamp):
+    start = timestamp - timestamp % 3600
+    with connect(db_path) as db:
+        rollups = select_rollups(
+            db, start=start, end=start + 3600, interval=3600,
+        )
+    return sum(r.nr_measurements for r in rollups)
+
+
+def test_import_rebuilds_rollups_of_concurrent_writes(
+        tmpdir,
+        csv_path,
+        monkeypatch,
+        make_measurements,
+):
+    db_path = str(tmpdir.join('import.db'))
+    with connect(db_path) as db:
+        create_rollups(db)
+    now = int(time.time())
+    logged = make_measurements(1, now - now % 60)[0]
+    batches: list[object] = []
+
+    def _insert(db, rows, on_conflict):
+        if not batches:
+            # the logger inserts a measurement while the trigger is missing
+            logged.to_db(db_path)
+        batches.append(rows)
+        return insert_measurements(db, rows, on_conflict=on_conflict)
+
+    monkeypatch.setattr('vpf_730.importer.insert_measurements', _insert)
+    import_files([csv_path], db_path=db_path, batch_size=300)
+    assert _hour_count(db_path, logged.timestamp) == 1
+
+
+def test_import_repairs_a_killed_import(tmpdir, csv_path, make_measurements):
+    db_path = str(tmpdir.join('import.db'))
+    now = int(time.time())
+    logged = make_measurements(1, now - now % 60 - 7200)[0]
+    with connect(db_path) as db:
+        create_rollups(db)
+        create_gap_index(db)
+        # an import was killed before it recreated the triggers
+        with db:
+            db.execute(IMPORT_RUNNING_TABLE)
+            db.execute(
+                'INSERT INTO import_running(started) VALUES (?)',
+                (logged.timestamp - 60,),
+            )
+            drop_rollup_trigger(db)
+            drop_gap_index_trigger(db)
+    logged.to_db(db_path)
+    assert _hour_count(db_path, logged.timestamp) == 0
+
+    import_files([csv_path], db_path=db_path)
+    assert _hour_count(db_path, logged.timestamp) == 1
+    with connect(db_path) as db:
+        running = db.execute('SELECT * FROM import_running').fetchall()
+        gaps = find_gaps(
+            db, start=logged.timestamp, end=logged.timestamp + 60,
+        )
+    assert running == []
+    assert gaps == []
+
+
+def test_import_compact_schema(tmpdir, csv_path, measurements):
+    db_path = str(tmpdir.join('import.db'))
+    migrate_db(db_path)
+    import_files([csv_path], db_path=db_path)
+    assert _select(db_path) == measurements
+
+
+def test_import_partitioned_db(tmpdir, csv_path):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    with pytest.raises(ValueError):
+        import_files([csv_path], db_path=db_path)
+
+
+def test_main_import(tmpdir, csv_path, capsys):
+    db_path = str(tmpdir.join('import.db'))
+    argv = ['import', csv_path, '--local-db', db_path, '--batch-size', '100']
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith('imported 1,000 rows of 1 files in ')
+    assert out.endswith(
+        'rows/s): 1,000 stored, 0 already stored, 0 failed to parse\n',
+    )
@@ -1,17 +1,26 @@
 import os
+import subprocess
+import sys
 from unittest import mock
 
 import pytest
 
+import vpf_730.daemon
+import vpf_730.logger
 import vpf_730.main
+import vpf_730.receiver
+import vpf_730.sender
+import vpf_730.vpf_730
 from vpf_730 import LoggerConfig
+from vpf_730 import ReceiverConfig
 from vpf_730 import SenderConfig
+from vpf_730.daemon import DaemonConfig
 from vpf_730.logger import LoggerConfigError
 from vpf_730.main import main
 
 
 def test_main_logger_from_cli_args_defaults():
-    with mock.patch.object(vpf_730.main, 'Logger') as logger:
+    with mock.patch.object(vpf_730.logger, 'Logger') as logger:
         main(['logger', '--serial-port', '/dev/ttyS0'])
 
     exp_logger_cfg = LoggerConfig(
@@ -23,7 +32,7 @@ def test_main_logger_from_cli_args_defaults():
 
 
 def test_main_logger_all_args_via_cli():
-    with mock.patch.object(vpf_730.main, 'Logger') as logger:
+    with mock.patch.object(vpf_730.logger, 'Logger') as logger:
         main([
             'logger',
             '--local-db', 'local_test.db',
@@ -60,7 +69,7 @@ def test_main_logger_all_args_via_cli():
     ),
 )
 def test_main_logger_invalid_args(args, err):
-    with mock.patch.object(vpf_730.main, 'Logger'):
+    with mock.patch.object(vpf_730.logger, 'Logger'):
         with pytest.raises(LoggerConfigError) as exc_info:
             main(['logger', *args])
 
@@ -76,7 +85,7 @@ def test_main_logger_config_from_env():
     }
     with (
         mock.patch.dict(os.environ, environ),
-        mock.patch.object(vpf_730.main, 'Logger') as logger,
+        mock.patch.object(vpf_730.logger, 'Logger') as logger,
     ):
         main(['logger'])
 
@@ -91,7 +100,7 @@ def test_main_logger_config_from_env():
 def test_main_logger_config_from_file(tmpdir):
     with (
         tmpdir.as_cwd(),
-        mock.patch.object(vpf_730.main, 'Logger') as logger,
+        mock.patch.object(vpf_730.logger, 'Logger') as logger,
     ):
         test_cfg = tmpdir.join('test_config.ini')
         test_cfg.write(
@@ -115,7 +124,7 @@ log_interval=15
 def test_main_sender_from_cli_args_defaults():
     with (
         mock.patch.dict(os.environ, {'VPF730_API_KEY': 'test-api-key'}),
-        mock.patch.object(vpf_730.main, 'Sender') as sender,
+        mock.patch.object(vpf_730.sender, 'Sender') as sender,
     ):
         main([
             'sender',
@@ -137,7 +146,7 @@ def test_main_sender_from_cli_args_defaults():
 def test_main_sender_all_args_via_cli():
     with (
         mock.patch.dict(os.environ, {'VPF730_API_KEY': 'test-api-key'}),
-        mock.patch.object(vpf_730.main, 'Sender') as sender,
+        mock.patch.object(vpf_730.sender, 'Sender') as sender,
     ):
         main([
             'sender',
@@ -192,7 +201,7 @@ def test_main_sender_config_from_env():
     }
     with (
         mock.patch.dict(os.environ, environ),
-        mock.patch.object(vpf_730.main, 'Sender') as sender,
+        mock.patch.object(vpf_730.sender, 'Sender') as sender,
     ):
         main(['sender'])
 
@@ -210,7 +219,7 @@ def test_main_sender_config_from_env():
 def test_main_sender_config_from_file(tmpdir):
     with (
         tmpdir.as_cwd(),
-        mock.patch.object(vpf_730.main, 'Sender') as sender,
+        mock.patch.object(vpf_730.sender, 'Sender') as sender,
     ):
         test_cfg = tmpdir.join('test_config_sender.ini')
         test_cfg.write(
@@ -243,7 +252,7 @@ SELF_TEST_RET = b'100,2.509,24.1,12.3,5.01,12.5,00.00,00.00,100,105,107,00,00,00
 def test_main_comm_from_cli_args(capsys):
     ret = mock.MagicMock()
     ret.send_command.return_value = SELF_TEST_RET
-    with mock.patch.object(vpf_730.main, 'VPF730', return_value=ret) as vpf:
+    with mock.patch.object(vpf_730.vpf_730, 'VPF730', return_value=ret) as vpf:
         main(['comm', '--serial-port', '/dev/ttyS0', 'R?'])
 
     out, _ = capsys.readouterr()
@@ -255,7 +264,7 @@ def test_main_comm_from_env(capsys):
     with (
         mock.patch.dict(os.environ, {'VPF730_PORT': '/dev/USB0'}),
         mock.patch.object(
-            vpf_730.main.VPF730, 'send_command',
+            vpf_730.vpf_730.VPF730, 'send_command',
             return_value=SELF_TEST_RET,
         ) as cmd,
     ):
@@ -271,7 +280,7 @@ def test_main_comm_from_file(tmpdir, capsys):
     ret.send_command.return_value = SELF_TEST_RET
     with (
         tmpdir.as_cwd(),
-        mock.patch.object(vpf_730.main, 'VPF730', return_value=ret) as vpf,
+        mock.patch.object(vpf_730.vpf_730, 'VPF730', return_value=ret) as vpf,
     ):
         test_cfg = tmpdir.join('test_config.ini')
         test_cfg.write(
@@ -285,3 +294,117 @@ serial_port=/dev/ttyS0
     out, _ = capsys.readouterr()
     assert out == '100,2.509,24.1,12.3,5.01,12.5,00.00,00.00,100,105,107,00,00,00,+021.0,4063\n'  # noqa: E501
     vpf.assert_called_once_with(port='/dev/ttyS0')
+
+
+def test_main_receiver_from_cli_args():
+    with (
+        mock.patch.dict(os.environ, {'VPF730_API_KEY': 'test-api-key'}),
+        mock.patch.object(vpf_730.receiver, 'Receiver') as receiver,
+    ):
+        main(['receiver', '--port', '8080'])
+
+    exp_receiver_cfg = ReceiverConfig(
+        db='vpf_730_receiver.db',
+        host='127.0.0.1',
+        port=8080,
+        api_key='test-api-key',
+    )
+    receiver.assert_called_once_with(cfg=exp_receiver_cfg)
+
+
+def test_main_receiver_config_from_env():
+    environ = {
+        'VPF730_RECEIVER_DB': 'env_receiver.db',
+        'VPF730_RECEIVER_HOST': '0.0.0.0',
+        'VPF730_API_KEY': 'deadbeef',
+    }
+    with (
+        mock.patch.dict(os.environ, environ),
+        mock.patch.object(vpf_730.receiver, 'Receiver') as receiver,
+    ):
+        main(['receiver'])
+
+    exp_receiver_cfg = ReceiverConfig(
+        db='env_receiver.db',
+        host='0.0.0.0',
+        port=5000,
+        api_key='deadbeef',
+    )
+    receiver.assert_called_once_with(cfg=exp_receiver_cfg)
+
+
+def test_main_run_from_cli_args():
+    with (
+        mock.patch.dict(os.environ, {'VPF730_API_KEY': 'test-api-key'}),
+        mock.patch.object(vpf_730.daemon, 'Daemon') as daemon,
+    ):
+        main([
+            'run',
+            '--serial-port', '/dev/ttyS0',
+            '--get-endpoint', 'https://api.example.com/vpf-730/status',
+            '--post-endpoint', 'https://api.example.com/vpf-730/data',
+        ])
+
+    exp_daemon_cfg = DaemonConfig(
+        logger=LoggerConfig(
+            local_db='vpf_730_local.db',
+            serial_port='/dev/ttyS0',
+            log_interval=1,
+        ),
+        sender=SenderConfig(
+            local_db='vpf_730_local.db',
+            send_interval=5,
+            get_endpoint='https://api.example.com/vpf-730/status',
+            post_endpoint='https://api.example.com/vpf-730/data',
+            max_req_len=512,
+            api_key='test-api-key',
+        ),
+    )
+    daemon.assert_called_once_with(cfg=exp_daemon_cfg)
+
+
+def test_main_run_cli_arg_missing(capsys):
+    with pytest.raises(SystemExit):
+        main(['run', '--serial-port', '/dev/ttyS0'])
+
+    _, err = capsys.readouterr()
+    assert 'must set --get-endpoint' in err
+
+
+def test_main_comm_only_imports_what_it_needs():
+    code = """\
+import sys
+from unittest import mock
+from serial import Serial
+from vpf_730.main import main
+with (
+    mock.patch.object(Serial, 'open'),
+    mock.patch.object(Serial, 'write'),
+    mock.patch.object(Serial, 'read_until', return_value=b'OK'),
+):
+    main(['comm', '--serial-port', '/dev/ttyS0', 'R?'])
+print(' '.join(sys.modules))
+"""
+    out = subprocess.check_output((sys.executable, '-c', code))
+    modules = set(out.decode().splitlines()[-1].split())
+    assert 'vpf_730.vpf_730' in modules
+    assert not modules & {
+        'sentry_sdk', 'urllib.request', 'http.server', 'vpf_730.daemon',
+        'vpf_730.logger', 'vpf_730.receiver', 'vpf_730.sender',
+        'multiprocessing', 'concurrent.futures.process', 'vpf_730.metrics',
+        'vpf_730.clock',
+    }
+
+
+def test_main_sentry_only_initialized_for_long_running_commands():
+    ret = mock.MagicMock()
+    ret.send_command.return_value = SELF_TEST_RET
+    with (
+        mock.patch.object(vpf_730.main, 'init_sentry') as init_sentry,
+        mock.patch.object(vpf_730.vpf_730, 'VPF730', return_value=ret),
+        mock.patch.object(vpf_730.logger, 'Logger'),
+    ):
+        main(['comm', '--serial-port', '/dev/ttyS0', 'R?'])
+        init_sentry.assert_not_called()
+        main(['logger', '--serial-port', '/dev/ttyS0'])
+        init_sentry.assert_called_once_with()
@@ -0,0 +1,129 @@
+
+import pytest
+
+from vpf_730.chunks import compact_days
+from vpf_730.main import main
+from vpf_730.merge import make_tasks
+from vpf_730.merge import merge
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+DAY = 86400
+
+
+@pytest.fixture
+def sources(tmpdir, make_measurements):
+    sources = []
+    for sensor_id in (1, 2):
+        db_path = str(tmpdir.join(f'station_{sensor_id}.db'))
+        measurements = make_measurements(
+            3000, START, seed=sensor_id, sensor_id=sensor_id,
+        )
+        with connect(db_path) as db:
+            insert_measurements(db, measurements)
+        sources.append(db_path)
+    return sources
+
+
+def _select(archive_path):
+    ret: list[Measurement] = []
+    for conn in PartitionedDB(archive_path).attached(start=0):
+        rows = conn.execute(
+            'SELECT * FROM measurements ORDER BY sensor_id, timestamp',
+        )
+        ret.extend(Measurement(*row) for row in rows)
+    return sorted(ret, key=lambda m: (m.sensor_id, m.timestamp))
+
+
+def test_make_tasks(tmpdir, sources):
+    archive = PartitionedDB(str(tmpdir.join('archive_{month}.db')))
+    empty = str(tmpdir.join('empty.db'))
+    tasks = make_tasks([*sources, empty], archive)
+    # ordered by month
+    assert [(t.path, t.start) for t in tasks] == [
+        (sources[0], START - 30 * DAY),
+        (sources[1], START - 30 * DAY),
+        (sources[0], START + DAY),
+        (sources[1], START + DAY),
+    ]
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_merge(tmpdir, sources, jobs, make_measurements):
+    archive_path = str(tmpdir.join('archive_{month}.db'))
+    progress = []
+    stats = merge(
+        sources,
+        archive_path,
+        jobs=jobs,
+        progress=lambda stats, total: progress.append((stats.tasks, total)),
+    )
+    assert (stats.sources, stats.tasks) == (2, 4)
+    assert stats.read == stats.inserted == 6000
+    assert stats.duplicates == 0
+    assert stats.rows_per_second > 0
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert _select(archive_path) == [
+        *make_measurements(3000, START, seed=1, sensor_id=1),
+        *make_measurements(3000, START, seed=2, sensor_id=2),
+    ]
+    assert [p.month for p in PartitionedDB(archive_path).partitions()] == [
+        '2023-01', '2023-02',
+    ]
+
+
+def test_merge_deduplicates(tmpdir, sources, make_measurements):
+    archive_path = str(tmpdir.join('archive_{month}.db'))
+    merge(sources[:1], archive_path, jobs=1)
+
+    # a copy of the first station with more recent measurements, packed
+    # days and the compact schema
+    copy = str(tmpdir.join('copy.db'))
+    migrate_db(copy)
+    with connect(copy) as db:
+        insert_measurements(
+            db, make_measurements(3100, START, seed=1, sensor_id=1),
+        )
+        compact_days(db, before=START + 2 * DAY)
+    stats = merge([*sources, copy], archive_path, jobs=1)
+    assert (stats.read, stats.inserted) == (9100, 3100)
+    assert stats.duplicates == 6000
+    assert _select(archive_path) == [
+        *make_measurements(3100, START, seed=1, sensor_id=1),
+        *make_measurements(3000, START, seed=2, sensor_id=2),
+    ]
+
+
+def test_merge_partitioned_source(tmpdir, make_measurements):
+    source = str(tmpdir.join('station_{month}.db'))
+    measurements = make_measurements(3000, START, seed=1, sensor_id=1)
+    with PartitionedDB(source) as db:
+        for m in measurements:
+            db.insert(m)
+    archive_path = str(tmpdir.join('archive_{month}.db'))
+    stats = merge([source], archive_path, jobs=1)
+    assert (stats.sources, stats.inserted) == (2, 3000)
+    assert _select(archive_path) == measurements
+
+
+def test_merge_archive_not_partitioned(tmpdir, sources):
+    with pytest.raises(ValueError) as excinfo:
+        merge(sources, str(tmpdir.join('archive.db')))
+    assert 'must contain' in str(excinfo.value)
+
+
+def test_main_merge(tmpdir, sources, capsys):
+    archive_path = str(tmpdir.join('archive_{month}.db'))
+    argv = ['merge', *sources, '--archive', archive_path, '-j', '1']
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith('[1/4] 1,440 read, 1,440 new (')
+    assert lines[-1].startswith('merged 6,000 measurements of 2 databases in ')
+    assert lines[-1].endswith('rows/s): 6,000 stored, 0 duplicates')
@@ -0,0 +1,148 @@
+import os
+import urllib.request
+from unittest import mock
+
+import pytest
+from serial import Serial
+
+import vpf_730.logger
+import vpf_730.main
+from vpf_730 import VPF730
+from vpf_730.main import main
+from vpf_730.metrics import Counter
+from vpf_730.metrics import Gauge
+from vpf_730.metrics import Histogram
+from vpf_730.metrics import PARSE_FAILURES
+from vpf_730.metrics import Registry
+from vpf_730.metrics import SERIAL_EMPTY_READS
+from vpf_730.metrics import SERIAL_ROUNDTRIP_SECONDS
+from vpf_730.metrics import start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_and_gauge_render(registry):
+    c = Counter('test_total', 'a test counter', registry=registry)
+    c.inc()
+    c.inc(2)
+    g = Gauge('test_pending', 'a test gauge', registry=registry)
+    g.set(10)
+    g.dec(3)
+    assert registry.render() == '''\
+# HELP test_total a test counter
+# TYPE test_total counter
+test_total 3
+# HELP test_pending a test gauge
+# TYPE test_pending gauge
+test_pending 7
+'''
+
+
+def test_histogram_with_labels_render(registry):
+    h = Histogram(
+        'test_seconds',
+        'a test histogram',
+        labelnames=('code',),
+        buckets=(.1, 1),
+        registry=registry,
+    )
+    h.labels(200).observe(.05)
+    h.labels(200).observe(.5)
+    h.labels(500).observe(5)
+    assert registry.render() == '''\
+# HELP test_seconds a test histogram
+# TYPE test_seconds histogram
+test_seconds_bucket{code="200",le="0.1"} 1
+test_seconds_bucket{code="200",le="1"} 2
+test_seconds_bucket{code="200",le="+Inf"} 2
+test_seconds_sum{code="200"} 0.55
+test_seconds_count{code="200"} 2
+test_seconds_bucket{code="500",le="0.1"} 0
+test_seconds_bucket{code="500",le="1"} 0
+test_seconds_bucket{code="500",le="+Inf"} 1
+test_seconds_sum{code="500"} 5
+test_seconds_count{code="500"} 1
+'''
+
+
+def test_label_values_are_escaped(registry):
+    c = Counter('test_total', 'doc', labelnames=('path',), registry=registry)
+    c.labels('C:\\data\n"raw"').inc()
+    assert registry.render().splitlines()[-1] == (
+        r'test_total{path="C:\\data\n\"raw\""} 1'
+    )
+
+
+def test_metric_label_errors(registry):
+    c = Counter('test_total', 'doc', labelnames=('a',), registry=registry)
+    with pytest.raises(ValueError) as exc_info:
+        c.inc()
+    assert exc_info.value.args[0] == 'test_total requires labels'
+
+    with pytest.raises(ValueError):
+        c.labels('a', 'b')
+
+    with pytest.raises(ValueError) as exc_info:
+        Counter('test_total', 'doc', registry=registry)
+    msg, = exc_info.value.args
+    assert msg == "metric 'test_total' is already registered"
+
+
+def test_metrics_server(registry):
+    Counter('test_total', 'a test counter', registry=registry).inc()
+    server = start_metrics_server(port=0, registry=registry)
+    try:
+        port = server.server_address[1]
+        resp = urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics')
+        assert resp.headers['Content-Type'].startswith('text/plain')
+        assert resp.read().decode() == registry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_measure_updates_metrics(test_msg):
+    vpf730 = VPF730(port='/dev/ttyUSB0')
+    roundtrips = SERIAL_ROUNDTRIP_SECONDS._unlabeled().count
+    empty_reads = SERIAL_EMPTY_READS._unlabeled().value
+    parse_failures = PARSE_FAILURES._unlabeled().value
+    with (
+        mock.patch.object(Serial, 'write'),
+        mock.patch.object(
+            Serial, 'read_until',
+            side_effect=[
+                b'', test_msg, b'PW01,0', test_msg.replace(b'NP ', b'IV '),
+            ],
+        ),
+        mock.patch.object(Serial, 'open'),
+    ):
+        vpf730.measure()
+        vpf730.measure()
+        # a truncated message
+        with pytest.raises(IndexError):
+            vpf730.measure()
+        # an unknown precipitation type
+        with pytest.raises(ValueError):
+            vpf730.measure()
+
+    assert SERIAL_ROUNDTRIP_SECONDS._unlabeled().count == roundtrips + 4
+    assert SERIAL_EMPTY_READS._unlabeled().value == empty_reads + 1
+    assert PARSE_FAILURES._unlabeled().value == parse_failures + 2
+
+
+def test_main_starts_metrics_server():
+    with (
+        mock.patch.object(vpf_730.logger, 'Logger'),
+        mock.patch.object(vpf_730.main, 'init_sentry'),
+        mock.patch('vpf_730.metrics.start_metrics_server') as server,
+    ):
+        main(['logger', '--serial-port', '/dev/ttyS0'])
+        server.assert_not_called()
+        with mock.patch.dict(os.environ, {'VPF730_METRICS_PORT': '9730'}):
+            main(['logger', '--serial-port', '/dev/ttyS0'])
+        server.assert_called_once_with(port=9730)
+        main(['logger', '--serial-port', '/dev/ttyS0', '--metrics-port', '1'])
+        server.assert_called_with(port=1)
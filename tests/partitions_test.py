@@ -0,0 +1,243 @@
+import os
+import sqlite3
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+
+import pytest
+
+from vpf_730.clock import VirtualClock
+from vpf_730.gaps import create_gap_index
+from vpf_730.gaps import has_gap_index
+from vpf_730.logger import Logger
+from vpf_730.logger import LoggerConfig
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import Partition
+from vpf_730.partitions import PartitionedDB
+from vpf_730.rollups import create_rollups
+from vpf_730.rollups import has_rollups
+from vpf_730.sender import select_partitioned
+from vpf_730.sender import Sender
+from vpf_730.sender import SenderConfig
+from vpf_730.storage import is_compact
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+
+# 2022-12-31 23:00:00 UTC
+START = 1672527600
+
+
+@pytest.fixture
+def db_path(tmpdir):
+    return str(tmpdir.join('vpf_730_{month}.db'))
+
+
+@pytest.fixture
+def partitioned(db_path, measurement):
+    with PartitionedDB(db_path) as db:
+        # 2022-12, 2023-01 and 2023-02
+        for i in range(0, 60 * 24 * 40, 60):
+            db.insert(measurement._replace(timestamp=START + i * 60))
+    return db_path
+
+
+def test_is_partitioned(db_path):
+    assert is_partitioned(db_path) is True
+    assert is_partitioned('vpf_730_local.db') is False
+    with pytest.raises(ValueError):
+        PartitionedDB('vpf_730_local.db')
+
+
+def test_partition_of_timestamp(db_path):
+    db = PartitionedDB(db_path)
+    assert db.partition(START) == Partition(
+        month='2022-12',
+        path=db_path.replace('{month}', '2022-12'),
+        start=1669852800,
+        end=1672531200,
+    )
+    assert db.partition(1672531200).month == '2023-01'
+
+
+def test_insert_creates_one_file_per_month(partitioned, tmpdir):
+    tmpdir.join('vpf_730_backup.db').write('')
+    db = PartitionedDB(partitioned)
+    partitions = db.partitions()
+
+    assert [p.month for p in partitions] == ['2022-12', '2023-01', '2023-02']
+    with sqlite3.connect(partitions[1].path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+        # incremental
+        assert conn.execute('PRAGMA auto_vacuum').fetchone() == (2,)
+        ret = conn.execute(
+            'SELECT min(timestamp), max(timestamp), count(*) '
+            'FROM measurements',
+        )
+        assert ret.fetchone() == (1672531200, 1675206000, 744)
+
+
+def test_writer_with_schema(db_path):
+    schema = ('CREATE TABLE events(timestamp INT)',)
+    with PartitionedDB(db_path, schema=schema) as db:
+        writer = db.writer(START)
+        # the connection is reused within the month
+        assert db.writer(START + 60) is writer
+        with writer:
+            writer.execute('INSERT INTO events VALUES (?)', (START,))
+        db.writer(START + 3600)
+
+    for partition in PartitionedDB(db_path).partitions():
+        with sqlite3.connect(partition.path) as conn:
+            tables = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'",
+            ).fetchall()
+        assert tables == [('events',)]
+
+
+@pytest.mark.parametrize('compact', (True, False))
+def test_new_partition_is_set_up_like_the_newest(
+        db_path,
+        measurement,
+        compact,
+):
+    with PartitionedDB(db_path) as db:
+        db.insert(measurement._replace(timestamp=START))
+    december = PartitionedDB(db_path).partition(START).path
+    if compact:
+        migrate_db(december)
+    with connect(december) as conn:
+        create_rollups(conn)
+        create_gap_index(conn)
+
+    with PartitionedDB(db_path) as db:
+        db.insert(measurement._replace(timestamp=START + 60))
+        # 2023-01-01 00:00:00 UTC
+        db.insert(measurement._replace(timestamp=START + 3600))
+
+    january = PartitionedDB(db_path).partition(START + 3600).path
+    with connect(january) as conn:
+        assert is_compact(conn) is compact
+        assert has_rollups(conn) is True
+        assert has_gap_index(conn) is True
+        # the triggers update the rollups and the gap index
+        ret = conn.execute('SELECT sum(count) FROM rollup_hourly')
+        assert ret.fetchone()[0] == 1
+        assert conn.execute('SELECT count(*) FROM coverage').fetchone()[0] == 1
+
+
+def test_select_partitioned_spans_partitions(partitioned):
+    db = PartitionedDB(partitioned)
+    data = select_partitioned(db, start=START + 1800)
+    timestamps = [m['timestamp'] for m in data]
+    assert len(timestamps) == 24 * 40 - 1
+    assert timestamps == sorted(timestamps)
+
+    data = select_partitioned(db, start=1672531200 - 1, limit=3)
+    assert [m['timestamp'] for m in data] == [
+        1672531200, 1672531200 + 3600, 1672531200 + 7200,
+    ]
+    # after 2023-02-01 00:00:00 UTC
+    assert len(select_partitioned(db, start=1675209600)) == 214
+
+
+def test_prune_keeps_newer_and_current_partitions(partitioned, measurement):
+    with PartitionedDB(partitioned) as db:
+        # 2022-12 is currently written to
+        db.insert(measurement._replace(timestamp=START + 1))
+        # 2023-02-01 00:00:00 UTC
+        assert db.prune(before=1675209600) == [db.partition(1672531200)]
+        assert [p.month for p in db.partitions()] == ['2022-12', '2023-02']
+
+
+def test_maintain_checkpoints_the_write_ahead_log(db_path, measurement):
+    with PartitionedDB(db_path) as db:
+        db.maintain()
+        for i in range(1000):
+            db.insert(measurement._replace(timestamp=START + i))
+        wal = f'{db.partition(START).path}-wal'
+        # no automatic checkpoint after 1000 pages
+        size = os.path.getsize(wal)
+        assert size > 1000 * 4096
+
+        db.maintain()
+        # the log is written from the start again after a checkpoint
+        for i in range(1000, 1100):
+            db.insert(measurement._replace(timestamp=START + i))
+        assert os.path.getsize(wal) == size
+
+    # the wal is checkpointed and removed when closing
+    assert not os.path.exists(wal)
+
+
+def _sender(db_path, retention_days):
+    cfg = SenderConfig(
+        local_db=db_path,
+        send_interval=5,
+        get_endpoint='https://api.example/com/vpf-730/s',
+        post_endpoint='https://api.example/com/vpf-730/i',
+        max_req_len=100,
+        api_key='deadbeef',
+        retention_days=retention_days,
+    )
+    clock = VirtualClock(start=datetime(2023, 3, 15, tzinfo=timezone.utc))
+    return Sender(cfg=cfg, clock=clock)
+
+
+def test_sender_get_data_from_partitions(partitioned):
+    sender = _sender(partitioned, retention_days=None)
+    assert len(sender.get_data_from_db(start=0)) == 24 * 40
+
+
+@pytest.mark.parametrize(
+    ('retention_days', 'sent_until', 'exp'),
+    (
+        pytest.param(None, 1677628800, ['2022-12', '2023-01', '2023-02'], id='no retention'),  # noqa: E501
+        pytest.param(30, 1677628800, ['2023-02'], id='30 days'),
+        pytest.param(60, 1677628800, ['2023-01', '2023-02'], id='60 days'),
+        pytest.param(30, 1672531200, ['2023-01', '2023-02'], id='not sent'),
+    ),
+)
+def test_sender_prune(partitioned, retention_days, sent_until, exp):
+    sender = _sender(partitioned, retention_days=retention_days)
+    sender.prune(sent_until=sent_until)
+    db = PartitionedDB(partitioned)
+    assert [p.month for p in db.partitions()] == exp
+
+
+def test_sender_config_retention_days_from_env():
+    environ = {
+        'VPF730_LOCAL_DB': 'vpf_730_{month}.db',
+        'VPF730_SEND_INTERVAL': '13',
+        'VPF730_GET_ENDPOINT': 'https://api.example/com/vpf-730/status',
+        'VPF730_POST_ENDPOINT': 'https://api.example/com/vpf-730/data',
+        'VPF730_MAX_REQ_LEN': '69',
+        'VPF730_API_KEY': 'deadbeef',
+        'VPF730_RETENTION_DAYS': '365',
+    }
+    with mock.patch.dict(os.environ, environ):
+        assert SenderConfig.from_env().retention_days == 365
+
+
+def test_logger_with_partitions(db_path, mock_vpf):
+    cfg = LoggerConfig(local_db=db_path, serial_port='', log_interval=30)
+    start = datetime(2023, 1, 31, 12, tzinfo=timezone.utc)
+    clock = VirtualClock(start=start)
+    end = start + timedelta(days=1)
+    logger = Logger(cfg=cfg, clock=clock)
+    logger.vpf_730 = mock_vpf
+    mock_vpf.clock = clock
+    with (
+        mock.patch.object(
+            Logger, '_logging',
+            new_callable=mock.PropertyMock,
+            side_effect=lambda: clock.now() < end,
+        ),
+        mock.patch.object(PartitionedDB, 'maintain') as maintain,
+    ):
+        logger.run()
+
+    db = PartitionedDB(db_path)
+    assert [p.month for p in db.partitions()] == ['2023-01', '2023-02']
+    assert len(select_partitioned(db, start=0)) == 48
+    assert maintain.call_count == 24 * 60
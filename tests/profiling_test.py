@@ -0,0 +1,93 @@
+import os
+import pstats
+import time
+import tracemalloc
+from unittest import mock
+
+import vpf_730.logger
+import vpf_730.main
+from vpf_730.main import main
+from vpf_730.profiling import Profiler
+from vpf_730.profiling import ProfilerConfig
+
+
+def test_profiler_dump_and_rotate(tmpdir):
+    cfg = ProfilerConfig(
+        directory=str(tmpdir),
+        cprofile=True,
+        tracemalloc=True,
+        keep=2,
+        top_n=5,
+    )
+    with Profiler(cfg=cfg) as profiler:
+        leak = [bytearray(1024) for _ in range(100)]
+        for _ in range(2):
+            profiler.dump()
+
+    assert not tracemalloc.is_tracing()
+    files = sorted(os.listdir(tmpdir))
+    # 3 of each were written, only the newest 2 are kept
+    assert [f.split('-')[0] for f in files] == [
+        'cprofile', 'cprofile', 'tracemalloc', 'tracemalloc',
+    ]
+    stats = pstats.Stats(os.path.join(tmpdir, files[0]))
+    assert stats.total_calls > 0  # type: ignore[attr-defined]
+    with open(os.path.join(tmpdir, files[-1])) as f:
+        report = f.read()
+    assert report.startswith('traced memory: current ')
+    assert 'top 5 differences to the previous snapshot:' in report
+    assert 'top 5 allocations:' in report
+    assert len(leak) == 100
+
+
+def test_profiler_dumps_periodically(tmpdir):
+    cfg = ProfilerConfig(directory=str(tmpdir), interval=.05, cprofile=True)
+    with Profiler(cfg=cfg):
+        end = time.monotonic() + .3
+        while time.monotonic() < end:
+            time.sleep(.01)
+
+    # at least one periodic dump plus the one when stopping
+    assert len(os.listdir(tmpdir)) >= 2
+
+
+def test_main_profiling_disabled_by_default():
+    with (
+        mock.patch.object(vpf_730.logger, 'Logger'),
+        mock.patch.object(vpf_730.main, 'init_sentry'),
+        mock.patch('vpf_730.profiling.Profiler') as profiler,
+    ):
+        main(['logger', '--serial-port', '/dev/ttyS0'])
+
+    profiler.assert_not_called()
+
+
+def test_main_profiling_from_cli_and_env(tmpdir):
+    with (
+        mock.patch.object(vpf_730.logger, 'Logger'),
+        mock.patch.object(vpf_730.main, 'init_sentry'),
+        mock.patch('vpf_730.profiling.Profiler') as profiler,
+    ):
+        main([
+            'logger', '--serial-port', '/dev/ttyS0', '--cprofile',
+            '--profile-dir', str(tmpdir), '--profile-interval', '60',
+        ])
+        profiler.assert_called_once_with(
+            cfg=ProfilerConfig(
+                directory=str(tmpdir),
+                interval=60,
+                cprofile=True,
+            ),
+        )
+        profiler.return_value.__enter__.assert_called_once()
+        profiler.return_value.__exit__.assert_called_once()
+        environ = {'VPF730_TRACEMALLOC': '1'}
+        with mock.patch.dict(os.environ, environ):
+            main(['logger', '--serial-port', '/dev/ttyS0'])
+
+        profiler.assert_called_with(
+            cfg=ProfilerConfig(
+                directory='vpf_730_profiles',
+                tracemalloc=True,
+            ),
+        )
@@ -0,0 +1,94 @@
+
+import pytest
+
+from vpf_730.chunks import compact_days
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+np = pytest.importorskip('numpy')
+from vpf_730.query import query  # noqa: E402
+from vpf_730.query import query_frame  # noqa: E402
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+DAY = 86400
+
+
+@pytest.fixture
+def measurements(make_measurements):
+    # 2 days
+    return make_measurements(2 * 1440, START)
+
+
+@pytest.fixture
+def db_path(measurements, make_db):
+    return make_db('query.db', measurements)
+
+
+def _rows(data):
+    return [tuple(row) for row in data.tolist()]
+
+
+def test_query_all_fields(db_path, measurements):
+    data = query(db_path, start=START + 60, end=START + 3600, batch_size=7)
+    assert _rows(data) == measurements[1:60]
+    assert data.dtype.names == Measurement._fields
+
+
+def test_query_fields(db_path, measurements):
+    data = query(db_path, start=START, fields=['temp', 'self_test', 'temp'])
+    assert data.dtype.names == ('timestamp', 'temp', 'self_test')
+    assert data['temp'].dtype == np.float64
+    assert _rows(data) == [
+        (m.timestamp, m.temp, m.self_test) for m in measurements
+    ]
+
+
+def test_query_unknown_field(db_path):
+    with pytest.raises(ValueError) as exc_info:
+        query(db_path, start=START, fields=['tmp'])
+
+    msg, = exc_info.value.args
+    assert msg == "unknown field: 'tmp'"
+
+
+def test_query_empty(db_path):
+    data = query(db_path, start=0, end=START, fields=['temp'])
+    assert len(data) == 0
+    assert data.dtype.names == ('timestamp', 'temp')
+
+
+def test_query_compacted_days(db_path, measurements):
+    late = measurements[5]._replace(sensor_id=1337)
+    migrate_db(db_path)
+    with connect(db_path) as db:
+        compact_days(db, before=START + DAY)
+        insert_measurements(db, [late])
+
+    data = query(db_path, start=START + 60, end=START + DAY + 120)
+    assert _rows(data) == [
+        *measurements[1:5], late, *measurements[6:1442],
+    ]
+
+
+def test_query_partitioned(tmpdir, measurements):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    with PartitionedDB(db_path) as db:
+        for m in measurements:
+            db.insert(m)
+
+    # 2023-01 and 2023-02
+    assert len(PartitionedDB(db_path).partitions()) == 2
+    data = query(db_path, start=START + DAY - 120, end=START + DAY + 120)
+    assert _rows(data) == measurements[1438:1442]
+
+
+def test_query_frame(db_path, measurements):
+    pd = pytest.importorskip('pandas')
+    df = query_frame(db_path, start=START, end=START + 120, fields=['temp'])
+    assert list(df.columns) == ['temp']
+    assert df.index[0] == pd.Timestamp('2023-01-31 00:00:00', tz='UTC')
+    assert df['temp'].tolist() == [m.temp for m in measurements[:2]]
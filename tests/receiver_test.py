@@ -0,0 +1,276 @@
+import http.client
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from argparse import Namespace
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+import vpf_730.receiver
+from vpf_730 import Receiver
+from vpf_730 import ReceiverConfig
+from vpf_730 import Sender
+from vpf_730 import SenderConfig
+from vpf_730.receiver import _Writer
+from vpf_730.utils import connect
+
+
+@pytest.fixture
+def receiver(tmpdir):
+    cfg = ReceiverConfig(
+        db=str(tmpdir.join('receiver.db')),
+        host='127.0.0.1',
+        port=0,
+        api_key='deadbeef',
+    )
+    receiver = Receiver(cfg=cfg)
+    t = threading.Thread(target=receiver.run)
+    t.start()
+    yield receiver
+    receiver.stop()
+    t.join()
+
+
+def _sender(receiver, test_db, api_key='deadbeef'):
+    host, port = receiver.server_address
+    return Sender(
+        cfg=SenderConfig(
+            local_db=test_db,
+            send_interval=1,
+            get_endpoint=f'http://{host}:{port}/vpf-730/status',
+            post_endpoint=f'http://{host}:{port}/vpf-730/data',
+            max_req_len=512,
+            api_key=api_key,
+        ),
+    )
+
+
+def test_receiver_config_from_env():
+    environ = {
+        'VPF730_RECEIVER_DB': 'receiver.db',
+        'VPF730_RECEIVER_PORT': '8080',
+        'VPF730_API_KEY': 'deadbeef',
+    }
+    with mock.patch.dict(os.environ, environ):
+        cfg = ReceiverConfig.from_env()
+
+    assert cfg == ReceiverConfig(
+        db='receiver.db',
+        host='127.0.0.1',
+        port=8080,
+        api_key='deadbeef',
+    )
+
+
+def test_receiver_config_from_file(tmpdir):
+    ini_file = tmpdir.join('config.ini')
+    ini_file.write(
+        '''\
+[vpf_730]
+receiver_db=receiver.db
+host=0.0.0.0
+port=5001
+api_key=cafecafe
+''',
+    )
+    cfg = ReceiverConfig.from_file(str(ini_file))
+    assert cfg == ReceiverConfig(
+        db='receiver.db',
+        host='0.0.0.0',
+        port=5001,
+        api_key='cafecafe',
+    )
+
+
+def test_receiver_config_from_argparse():
+    argparse_ns = Namespace(receiver_db=None, host=None, port=5002)
+    with mock.patch.dict(os.environ, {'VPF730_API_KEY': 'deadbeef'}):
+        cfg = ReceiverConfig.from_argparse(argparse_ns)
+
+    assert cfg == ReceiverConfig(
+        db='vpf_730_receiver.db',
+        host='127.0.0.1',
+        port=5002,
+        api_key='deadbeef',
+    )
+
+
+def test_receiver_config_repr():
+    cfg = ReceiverConfig(
+        db='receiver.db',
+        host='127.0.0.1',
+        port=5000,
+        api_key='deadbeef',
+    )
+    assert repr(cfg) == (
+        "ReceiverConfig(db='receiver.db', host='127.0.0.1', port=5000, "
+        'api_key=***, max_batch_len=64)'
+    )
+
+
+def test_receiver_no_data_yet(receiver, test_db):
+    sender = _sender(receiver, test_db)
+    assert sender.get_remote_timestamp() == 0
+
+
+def test_receiver_round_trip_with_sender(receiver, test_db):
+    sender = _sender(receiver, test_db)
+    data = sender.get_data_from_db(start=0)
+    sender.post_data_to_remote(data=data)
+    assert sender.get_remote_timestamp() == 1658758978
+
+    with connect(receiver.cfg.db) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp')
+        assert [dict(i) for i in ret.fetchall()] == data
+
+
+def test_receiver_inserts_are_idempotent(receiver, test_db, measurement):
+    sender = _sender(receiver, test_db)
+    for _ in range(3):
+        # the sender may also post plain measurements serialized as lists
+        sender.post_data_to_remote(data=[measurement])
+
+    with connect(receiver.cfg.db) as db:
+        nr, = db.execute('SELECT count(*) FROM measurements').fetchone()
+
+    assert nr == 1
+
+
+def test_receiver_latest_date_by_sensor_id(receiver, measurement):
+    receiver.insert([measurement, measurement._replace(sensor_id=2)])
+    receiver.insert([measurement._replace(sensor_id=2, timestamp=1)])
+    host, port = receiver.server_address
+    req = urllib.request.Request(
+        url=f'http://{host}:{port}/vpf-730/status?sensor_id=2',
+        headers={'Authorization': 'deadbeef'},
+    )
+    resp = urllib.request.urlopen(req)
+    assert json.loads(resp.read()) == {'latest_date': 1658758977}
+
+
+def test_receiver_sender_behind_other_stations(
+        receiver,
+        test_db,
+        measurement,
+):
+    # another station already sent newer measurements
+    receiver.insert([measurement._replace(sensor_id=2, timestamp=2 ** 31)])
+    sender = _sender(receiver, test_db)
+    assert sender.get_remote_timestamp() == 0
+    assert sender.sensor_id == 1
+
+    sender.post_data_to_remote(data=sender.get_data_from_db(start=0))
+    assert sender.get_remote_timestamp() == 1658758978
+
+
+def test_receiver_concurrent_senders(receiver, measurement):
+    host, port = receiver.server_address
+
+    def post(i):
+        data = [
+            measurement._replace(sensor_id=i, timestamp=t)._asdict()
+            for t in range(100)
+        ]
+        req = urllib.request.Request(
+            url=f'http://{host}:{port}/vpf-730/data',
+            data=json.dumps({'data': data}).encode(),
+            headers={'Authorization': 'deadbeef'},
+        )
+        return json.loads(urllib.request.urlopen(req).read())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(post, range(16)))
+
+    assert results == [{'received': 100, 'inserted': 100}] * 16
+    with connect(receiver.cfg.db) as db:
+        nr, = db.execute('SELECT count(*) FROM measurements').fetchone()
+
+    assert nr == 1600
+
+
+def test_receiver_invalid_api_key(receiver, test_db, caplog):
+    sender = _sender(receiver, test_db, api_key='cafecafe')
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        sender.get_remote_timestamp()
+
+    assert exc_info.value.code == 401
+
+
+@pytest.mark.parametrize(
+    ('body', 'msg'),
+    (
+        (b'not json', 'body must be json of the form {"data": [...]}'),
+        (b'{"data": 1}', 'data must be a list of measurements'),
+        (b'{"data": [[1, 2]]}', 'measurement 0 is malformed'),
+        (
+            b'{"data": [{"timestamp": 1}]}',
+            'measurement 0 is missing the field sensor_id',
+        ),
+    ),
+)
+def test_receiver_invalid_body(receiver, body, msg):
+    host, port = receiver.server_address
+    req = urllib.request.Request(
+        url=f'http://{host}:{port}/vpf-730/data',
+        data=body,
+        headers={'Authorization': 'deadbeef'},
+    )
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        urllib.request.urlopen(req)
+
+    assert exc_info.value.code == 400
+    assert json.loads(exc_info.value.read()) == {'code': 400, 'message': msg}
+
+
+def test_receiver_unknown_endpoint(receiver):
+    host, port = receiver.server_address
+    req = urllib.request.Request(
+        url=f'http://{host}:{port}/unknown',
+        headers={'Authorization': 'deadbeef'},
+    )
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        urllib.request.urlopen(req)
+
+    assert exc_info.value.code == 404
+
+
+def test_receiver_body_too_large(receiver):
+    host, port = receiver.server_address
+    conn = http.client.HTTPConnection(host, port)
+    conn.putrequest('POST', '/vpf-730/data')
+    conn.putheader('Authorization', 'deadbeef')
+    conn.putheader('Content-Length', str(2 ** 40))
+    conn.endheaders()
+    resp = conn.getresponse()
+    assert resp.status == 413
+    conn.close()
+
+
+def test_receiver_write_timeout(receiver, measurement):
+    with (
+        mock.patch.object(vpf_730.receiver, 'WRITE_TIMEOUT', 0),
+        mock.patch.object(_Writer, 'submit', return_value=Future()),
+    ):
+        sender = _sender(receiver, 'unused.db')
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            sender.post_data_to_remote(data=[measurement])
+
+    assert exc_info.value.code == 503
+
+
+def test_receiver_writer_fails_pending_rows(tmpdir, measurement):
+    # the database cannot be opened, since it is a directory
+    writer = _Writer(str(tmpdir), max_batch_len=64)
+    fut = writer.submit([tuple(measurement)])
+    writer.start()
+    writer.join()
+
+    with pytest.raises(RuntimeError):
+        fut.result(timeout=5)
+    with pytest.raises(RuntimeError):
+        writer.submit([tuple(measurement)]).result(timeout=5)
@@ -0,0 +1,148 @@
+import sqlite3
+
+import pytest
+
+from vpf_730.archive import RawArchive
+from vpf_730.main import main
+from vpf_730.replay import make_tasks
+from vpf_730.replay import replay
+from vpf_730.replay import ReplayTask
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+
+
+@pytest.fixture
+def archive_dir(tmpdir, make_msgs):
+    directory = str(tmpdir.join('raw'))
+    with RawArchive(directory, block_len=50) as archive:
+        # two days, with some garbage in between
+        for i, (timestamp, msg) in enumerate(make_msgs(2880, START + .25)):
+            archive.append(timestamp, b'\x00garbage' if i % 1000 == 0 else msg)
+    return directory
+
+
+def _count(db_path):
+    with connect(db_path) as db:
+        ret = db.execute(
+            'SELECT min(timestamp), max(timestamp), count(*) '
+            'FROM measurements',
+        )
+        return tuple(ret.fetchone())
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_replay_archive(tmpdir, archive_dir, jobs):
+    db_path = str(tmpdir.join('replay.db'))
+    stats = replay(sources=[archive_dir], db_path=db_path, jobs=jobs)
+
+    assert stats.read == 2880
+    assert stats.failed == 3
+    assert stats.inserted == 2877
+    assert stats.messages_per_second > 0
+    assert _count(db_path) == (START + 60, START + 2879 * 60, 2877)
+
+
+def test_replay_time_range(tmpdir, archive_dir):
+    db_path = str(tmpdir.join('replay.db'))
+    stats = replay(
+        sources=[archive_dir],
+        db_path=db_path,
+        jobs=1,
+        start=START + 86400,
+        end=START + 86400 + 3600,
+    )
+    assert stats.read == 60
+    assert _count(db_path) == (START + 86400, START + 86400 + 59 * 60, 60)
+
+
+def test_replay_capture_file_split_into_chunks(tmpdir, make_msgs):
+    capture = tmpdir.join('capture.csv')
+    data = make_msgs(500, START + .25)
+    lines = [f'{ts},'.encode() + msg + b'\r\n' for ts, msg in data]
+    lines.insert(100, b'not a timestamp\r\n')
+    lines.insert(200, b'\r\n')
+    capture.write_binary(b''.join(lines))
+
+    tasks = make_tasks(sources=[str(capture)], chunk_bytes=1000)
+    assert len(tasks) > 10
+    assert tasks[0] == ReplayTask(
+        kind='capture',
+        path=str(capture),
+        length=1000,
+    )
+
+    db_path = str(tmpdir.join('replay.db'))
+    stats = replay(
+        sources=[str(capture)],
+        db_path=db_path,
+        jobs=2,
+        chunk_bytes=1000,
+    )
+    # every line is parsed exactly once, even if split between chunks
+    assert stats.read == 501
+    assert stats.failed == 1
+    assert _count(db_path) == (START, START + 499 * 60, 500)
+    with connect(db_path) as db:
+        row = db.execute(
+            'SELECT * FROM measurements WHERE timestamp = ?',
+            (START + 60 * 250,),
+        ).fetchone()
+    exp = Measurement.from_msg(data[250][1], timestamp=START + 60 * 250)
+    assert tuple(row) == pytest.approx(tuple(exp))
+
+
+def test_replay_partitioned_db(tmpdir, archive_dir):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    with pytest.raises(ValueError) as excinfo:
+        replay(sources=[archive_dir], db_path=db_path, jobs=1)
+    assert 'partitioned by month' in str(excinfo.value)
+    assert not tmpdir.join('vpf_730_{month}.db').exists()
+
+
+@pytest.mark.parametrize(
+    ('on_conflict', 'exp'),
+    (('replace', 'replayed'), ('ignore', 'stored')),
+)
+def test_replay_on_conflict(tmpdir, on_conflict, exp, make_msgs):
+    capture = tmpdir.join('capture.csv')
+    ts, msg = make_msgs(1, START + .25)[0]
+    capture.write_binary(f'{ts},'.encode() + msg + b'\n')
+    db_path = str(tmpdir.join('replay.db'))
+    m = Measurement.from_msg(msg, timestamp=START)
+    with connect(db_path) as db:
+        insert_measurements(db, [m._replace(sensor_id=1337)])
+
+    replay(
+        sources=[str(capture)],
+        db_path=db_path,
+        jobs=1,
+        on_conflict=on_conflict,
+    )
+    with connect(db_path) as db:
+        ret = db.execute('SELECT sensor_id FROM measurements')
+        sensor_id, = ret.fetchone()
+
+    exp_ids = {'replayed': m.sensor_id, 'stored': 1337}
+    assert sensor_id == exp_ids[exp]
+
+
+def test_insert_measurements_abort_on_conflict(tmpdir, make_measurements):
+    db_path = str(tmpdir.join('storage.db'))
+    m, = make_measurements(1, START)
+    with connect(db_path) as db:
+        assert insert_measurements(db, [m, m._replace(timestamp=1)]) == 2
+        with pytest.raises(sqlite3.IntegrityError):
+            insert_measurements(db, [m])
+
+
+def test_main_replay(tmpdir, archive_dir, capsys):
+    db_path = str(tmpdir.join('replay.db'))
+    argv = ['replay', archive_dir, '--local-db', db_path, '-j', '1']
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith('replayed 2880 messages in ')
+    assert out.endswith('2877 stored, 3 failed to parse\n')
@@ -0,0 +1,216 @@
+
+import pytest
+
+from vpf_730.chunks import compact_days
+from vpf_730.main import main
+from vpf_730.rollups import create_rollups
+from vpf_730.rollups import has_rollups
+from vpf_730.rollups import rebuild_rollups
+from vpf_730.rollups import Rollup
+from vpf_730.rollups import select_rollups
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+DAY = 86400
+
+
+@pytest.fixture
+def measurements(make_measurements):
+    # 2 days
+    return make_measurements(2 * 1440, START)
+
+
+@pytest.fixture
+def db_path(measurements, make_db):
+    return make_db('rollups.db', measurements)
+
+
+def _approx(rollups):
+    return [pytest.approx(tuple(r)) for r in rollups]
+
+
+def _raw(db_path, start, end, interval):
+    # the database without rollups is aggregated from the measurements
+    with connect(db_path) as db:
+        return select_rollups(db, start=start, end=end, interval=interval)
+
+
+def test_select_rollups_from_measurements(db_path, measurements):
+    hour = [m for m in measurements if m.timestamp < START + 3600]
+    rollups = _raw(db_path, start=START, end=START + 7200, interval=3600)
+    exp = Rollup(
+        start=START,
+        nr_measurements=60,
+        water_in_precip_sum=sum(m.water_in_precip for m in hour),
+        optical_range_min=min(m.optical_range for m in hour),
+        optical_range_mean=sum(m.optical_range for m in hour) / 60,
+        optical_range_max=max(m.optical_range for m in hour),
+        temp_min=min(m.temp for m in hour),
+        temp_mean=sum(m.temp for m in hour) / 60,
+        temp_max=max(m.temp for m in hour),
+        precipitation_type_msg=max(
+            sorted({m.precipitation_type_msg for m in hour}),
+            key=[m.precipitation_type_msg for m in hour].count,
+        ),
+    )
+    assert rollups[0] == pytest.approx(tuple(exp))
+    assert [r.start for r in rollups] == [START, START + 3600]
+
+
+@pytest.mark.parametrize(
+    ('start', 'end', 'interval'),
+    (
+        pytest.param(START, START + 2 * DAY, DAY, id='daily'),
+        pytest.param(START, START + DAY, 3600, id='hourly'),
+        pytest.param(START + 1800, START + 7200, 600, id='10 min'),
+        pytest.param(START, START + DAY, 7200, id='2 hours'),
+        pytest.param(START + 60, START + 3660, 300, id='unaligned'),
+    ),
+)
+def test_create_rollups(db_path, start, end, interval):
+    exp = _raw(db_path, start=start, end=end, interval=interval)
+    with connect(db_path) as db:
+        create_rollups(db)
+        assert has_rollups(db) is True
+        rollups = select_rollups(db, start=start, end=end, interval=interval)
+    assert rollups == _approx(exp)
+
+
+def test_rollups_are_updated_on_insert(tmpdir, measurements):
+    db_path = str(tmpdir.join('rollups.db'))
+    with connect(db_path) as db:
+        create_rollups(db)
+    for m in measurements[:180]:
+        m.to_db(db_path)
+
+    with connect(db_path) as db:
+        # the same measurement replaced with different values
+        insert_measurements(
+            db,
+            [measurements[0]._replace(temp=-99.5)],
+            on_conflict='replace',
+        )
+        insert_measurements(
+            db,
+            [measurements[1]._replace(temp=99.5)],
+            on_conflict='ignore',
+        )
+        rollups = select_rollups(
+            db, start=START, end=START + DAY, interval=DAY,
+        )
+        exp = _raw(db_path, start=START, end=START + DAY, interval=300)
+
+    rollup, = rollups
+    assert rollup.nr_measurements == 180
+    assert rollup.temp_min == -99.5
+    assert rollup.temp_max != 99.5
+    assert sum(r.nr_measurements for r in exp) == 180
+    assert rollup.water_in_precip_sum == pytest.approx(
+        sum(r.water_in_precip_sum for r in exp),
+    )
+
+
+def test_select_rollups_uses_the_coarsest_rollup(db_path):
+    with connect(db_path) as db:
+        create_rollups(db)
+        db.execute('UPDATE rollup_hourly SET count = count + 1000')
+
+        # the hourly rollup answers hours and days
+        day, = select_rollups(db, start=START, end=START + DAY, interval=DAY)
+        assert day.nr_measurements == 1440
+        hours = select_rollups(
+            db, start=START, end=START + DAY, interval=3600,
+        )
+        assert hours[0].nr_measurements == 1060
+        # the 10 minute rollup
+        two, = select_rollups(
+            db, start=START, end=START + 1200, interval=1200,
+        )
+        assert two.nr_measurements == 20
+
+        with pytest.raises(ValueError):
+            select_rollups(db, start=START, end=START + DAY, interval=0)
+
+
+def test_rebuild_rollups(db_path):
+    with connect(db_path) as db:
+        create_rollups(db)
+        db.execute('UPDATE rollup_10min SET count = 0')
+        assert rebuild_rollups(db, start=START + 300, end=START + 1200) == 3
+        ret = db.execute('SELECT count FROM rollup_10min ORDER BY bucket')
+        assert [c for c, in ret.fetchall()][:4] == [10, 10, 10, 0]
+
+
+def test_rollups_compact_schema(db_path, measurements, tmpdir):
+    exp = _raw(db_path, start=START, end=START + 2 * DAY, interval=3600)
+    compact_db = str(tmpdir.join('compact.db'))
+    with connect(compact_db) as db:
+        insert_measurements(db, measurements[:1440])
+        create_rollups(db)
+    migrate_db(compact_db)
+
+    # the trigger is recreated on the compact table
+    with connect(compact_db) as db:
+        insert_measurements(db, measurements[1440:-1])
+    measurements[-1].to_db(compact_db)
+    with connect(compact_db) as db:
+        rollups = select_rollups(
+            db, start=START, end=START + 2 * DAY, interval=3600,
+        )
+    assert rollups == _approx(exp)
+
+
+def test_rollups_keep_compacted_days(db_path, measurements):
+    exp = _raw(db_path, start=START, end=START + 2 * DAY, interval=DAY)
+    with connect(db_path) as db:
+        create_rollups(db)
+        compact_days(db, before=START + DAY)
+        rebuild_rollups(db)
+        # a measurement inserted into a packed day does not replace the rollup
+        late = measurements[0]._replace(timestamp=START + 1)
+        insert_measurements(db, [late])
+        rollups = select_rollups(
+            db, start=START, end=START + 2 * DAY, interval=DAY,
+        )
+    assert rollups == _approx(exp)
+
+
+@pytest.mark.parametrize('rollups', (True, False))
+def test_select_rollups_unaligned_over_compacted_days(db_path, rollups):
+    start, end = START + 60, START + 2 * DAY - 60
+    exp = _raw(db_path, start=start, end=end, interval=21601)
+    with connect(db_path) as db:
+        if rollups:
+            create_rollups(db)
+        compact_days(db, before=START + DAY)
+        ret = select_rollups(db, start=start, end=end, interval=21601)
+        assert not db.in_transaction
+    assert len(ret) == 8
+    assert ret == _approx(exp)
+
+
+def test_main_rollups(db_path, capsys):
+    assert main(['rollups', '--local-db', db_path]) == 0
+    out, _ = capsys.readouterr()
+    assert out == f'created the rollups of {db_path}\n'
+
+    argv = ['rollups', '--local-db', db_path, '--start', str(START)]
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out == f'rebuilt 288 10-minute rollups of {db_path}\n'
+
+
+@pytest.mark.parametrize('on_conflict', ('abort', 'ignore', 'replace'))
+def test_rollups_insert_conflict_clause(tmpdir, measurements, on_conflict):
+    db_path = str(tmpdir.join('rollups.db'))
+    with connect(db_path) as db:
+        create_rollups(db)
+        insert_measurements(db, measurements[:30], on_conflict=on_conflict)
+        insert_measurements(db, measurements[30:60], on_conflict=on_conflict)
+        hour, = select_rollups(
+            db, start=START, end=START + 3600, interval=3600,
+        )
+    assert hour.nr_measurements == 60
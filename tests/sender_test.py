@@ -13,6 +13,8 @@ from freezegun import freeze_time
 import vpf_730
 from vpf_730 import Sender
 from vpf_730 import SenderConfig
+from vpf_730.sender import select_measurements
+from vpf_730.utils import connect
 
 
 def test_sender_config_from_env():
@@ -100,7 +102,8 @@ def test_sender_config_repr():
         "get_endpoint='https://api.example/com/vpf-730/s', "
         "post_endpoint='https://api.example/com/vpf-730/i', "
         'max_req_len=69, '
-        'api_key=***)'
+        'api_key=***, '
+        'retention_days=None)'
     )
 
 
@@ -121,6 +124,8 @@ def test_sender_get_remote_timestamp():
 
     assert ts == 1671404640
     req, = m.call_args.args
+    # the local database does not exist yet, so the sensor is unknown
+    assert req.full_url == 'https://api.example/com/vpf-730/s'
     assert req.headers == {
         'Authorization': 'deadbeef',
         'Content-type': 'application/json',
@@ -255,6 +260,20 @@ def test_sender_get_data_from_db_one_record(test_db):
     }]
 
 
+def test_select_measurements_paginated(test_db_many_records):
+    pages = []
+    start = 0
+    with connect(test_db_many_records) as db:
+        while page := select_measurements(db=db, start=start, limit=4):
+            pages.append([i['timestamp'] for i in page])
+            start = page[-1]['timestamp']
+
+    assert pages == [
+        [1658758977, 1658759037, 1658759097, 1658759157],
+        [1658759217, 1658759277],
+    ]
+
+
 @freeze_time('2022-12-18 22:55:00')
 def test_sender_running_no_data_to_send(test_db):
     cfg = SenderConfig(
@@ -280,7 +299,9 @@ def test_sender_running_no_data_to_send(test_db):
 
     assert m.call_count == 1
     get_req, = m .call_args_list[0].args
-    assert get_req.full_url == 'https://api.example/com/vpf-730/s'
+    assert get_req.full_url == (
+        'https://api.example/com/vpf-730/s?sensor_id=1'
+    )
 
 
 @freeze_time('2022-12-18 22:55:00')
@@ -309,7 +330,9 @@ def test_sender_running_data_fits_one_req(test_db):
     assert m.call_count == 2
     get_req, = m .call_args_list[0].args
     post_req, = m.call_args_list[1].args
-    assert get_req.full_url == 'https://api.example/com/vpf-730/s'
+    assert get_req.full_url == (
+        'https://api.example/com/vpf-730/s?sensor_id=1'
+    )
     assert post_req.full_url == 'https://api.example/com/vpf-730/i'
     data = json.loads(post_req.data)['data']
     assert len(data) == 2
@@ -342,7 +365,9 @@ def test_sender_running_data_fits_multiple_requests_only(test_db_many_records):
     assert m.call_count == 3
     get_req, = m .call_args_list[0].args
     p = m.call_args_list[1:]
-    assert get_req.full_url == 'https://api.example/com/vpf-730/s'
+    assert get_req.full_url == (
+        'https://api.example/com/vpf-730/s?sensor_id=1'
+    )
 
     assert [t['timestamp'] for t in json.loads(p[0].args[0].data)['data']] == [
         1658758977, 1658759037, 1658759097, 1658759157,
@@ -381,7 +406,9 @@ def test_sender_running_only_sent_when_minute_matches(
     assert m.call_count == 3
     get_req, = m .call_args_list[0].args
     p = m.call_args_list[1:]
-    assert get_req.full_url == 'https://api.example/com/vpf-730/s'
+    assert get_req.full_url == (
+        'https://api.example/com/vpf-730/s?sensor_id=1'
+    )
 
     assert [t['timestamp'] for t in json.loads(p[0].args[0].data)['data']] == [
         1658758977, 1658759037, 1658759097,
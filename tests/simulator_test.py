@@ -0,0 +1,83 @@
+import sys
+from unittest import mock
+
+import pytest
+
+from vpf_730.main import main
+from vpf_730.simulator import REMOTE_SELF_TEST
+from vpf_730.simulator import Simulator
+from vpf_730.simulator import SimulatorConfig
+from vpf_730.vpf_730 import VPF730
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == 'win32',
+    reason='pseudo-terminals are not available on windows',
+)
+
+
+def test_simulator_answers_polls_and_commands():
+    with Simulator(cfg=SimulatorConfig(sensor_id=7, seed=1)) as sim:
+        vpf730 = VPF730(port=sim.port, timeout=1)
+        measurements = [vpf730.measure() for _ in range(3)]
+        assert vpf730.send_command('R?') == REMOTE_SELF_TEST + b'\r\n'
+        # unknown commands are not answered
+        assert VPF730(port=sim.port, timeout=.1).send_command('XY') == b''
+
+    assert all(m is not None and m.sensor_id == 7 for m in measurements)
+    # the values change from one message to the next
+    assert len({m.temp for m in measurements if m is not None}) == 3
+
+
+def test_simulator_automatic_messages():
+    cfg = SimulatorConfig(interval=60, speedup=600, seed=1)
+    with Simulator(cfg=cfg) as sim:
+        vpf730 = VPF730(port=sim.port, timeout=.5)
+        # nothing is sent without polling
+        assert vpf730.measure(polled_mode=False) is None
+        assert vpf730.send_command('OSAM1') == b'OK\r\n'
+        assert sim.automatic is True
+        assert vpf730.measure(polled_mode=False) is not None
+        assert vpf730.send_command('OSAM0') == b'OK\r\n'
+
+    assert sim.automatic is False
+
+
+def test_simulator_fault_timeout():
+    with Simulator(cfg=SimulatorConfig(timeout_rate=1)) as sim:
+        vpf730 = VPF730(port=sim.port, timeout=.2)
+        assert vpf730.measure() is None
+
+
+def test_simulator_fault_garbled():
+    with Simulator(cfg=SimulatorConfig(garbled_rate=1, seed=3)) as sim:
+        vpf730 = VPF730(port=sim.port, timeout=.2)
+        with pytest.raises((ValueError, IndexError)):
+            for _ in range(5):
+                vpf730.measure()
+
+
+def test_simulator_fault_partial():
+    with Simulator(cfg=SimulatorConfig(partial_rate=1, seed=1)) as sim:
+        vpf730 = VPF730(port=sim.port, timeout=.2)
+        msg = vpf730.send_command('D?')
+
+    assert msg.startswith(b'PW01')
+    assert not msg.endswith(b'\r\n')
+
+
+def test_simulator_port_not_started():
+    with pytest.raises(RuntimeError):
+        Simulator(cfg=SimulatorConfig()).port
+
+
+def test_main_simulate(capsys):
+    with mock.patch('vpf_730.simulator.Simulator') as simulator:
+        simulator.return_value.port = '/dev/pts/69'
+        simulator.return_value.running = False
+        ret = main(['simulate', '--speedup', '60', '--timeout-rate', '.1'])
+
+    assert ret == 0
+    simulator.assert_called_once_with(
+        cfg=SimulatorConfig(speedup=60, timeout_rate=.1),
+    )
+    assert capsys.readouterr().out == '/dev/pts/69\n'
@@ -0,0 +1,478 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+
+import pytest
+
+from vpf_730.chunks import compact_days
+from vpf_730.clock import VirtualClock
+from vpf_730.importer import import_files
+from vpf_730.logger import Logger
+from vpf_730.logger import LoggerConfig
+from vpf_730.main import main
+from vpf_730.metrics import SINK_DROPPED
+from vpf_730.partitions import PartitionedDB
+from vpf_730.sinks import BLOCK_TIMEOUT
+from vpf_730.sinks import DBSink
+from vpf_730.sinks import export
+from vpf_730.sinks import FileSink
+from vpf_730.sinks import PERIODS
+from vpf_730.sinks import QueuedSink
+from vpf_730.sinks import read_watermark
+from vpf_730.sinks import Sink
+from vpf_730.sinks import SinkPipeline
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+
+
+@pytest.fixture
+def db_path(make_measurements, make_db):
+    return make_db('local.db', make_measurements(3000, START))
+
+
+def _read_csv(directory):
+    db_path = os.path.join(directory, 'read.db')
+    files = sorted(
+        os.path.join(directory, f) for f in os.listdir(directory)
+        if f.endswith('.csv')
+    )
+    import_files(files, db_path=db_path, resume=False)
+    with connect(db_path) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp')
+        measurements = [Measurement(*row) for row in ret.fetchall()]
+    os.remove(db_path)
+    return measurements
+
+
+def test_file_sink_csv(tmpdir, make_measurements):
+    measurements = make_measurements(3000, START)
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory) as sink:
+        assert sink.write_many(measurements[:2000]) == 2000
+    # the header is only written once
+    with FileSink(directory) as sink:
+        assert sink.write_many(measurements) == 1000
+
+    assert sorted(os.listdir(directory)) == [
+        '2023-01-31.csv', '2023-02-01.csv', '2023-02-02.csv',
+    ]
+    with open(os.path.join(directory, '2023-01-31.csv')) as f:
+        assert f.readline() == f'{measurements[0].csv_header()}\n'
+        assert f.readline() == f'{measurements[0].to_csv()}\n'
+    assert _read_csv(directory) == measurements
+
+
+def test_file_sink_csv_hourly(tmpdir, make_measurements):
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory, period=PERIODS['hourly'], sep=';') as sink:
+        sink.write_many(make_measurements(90, START))
+    assert sorted(os.listdir(directory)) == [
+        '2023-01-31T00.csv', '2023-01-31T01.csv',
+    ]
+    with open(os.path.join(directory, '2023-01-31T01.csv')) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 31
+    assert lines[0].startswith('timestamp;sensor_id;')
+
+
+def test_file_sink_csv_repairs_partial_line(tmpdir, make_measurements):
+    measurements = make_measurements(10, START)
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory) as sink:
+        sink.write_many(measurements[:5])
+    path = os.path.join(directory, '2023-01-31.csv')
+    # the computer crashed while writing the sixth measurement
+    with open(path, 'a') as f:
+        f.write(measurements[5].to_csv()[:20])
+
+    with FileSink(directory) as sink:
+        assert sink.write_many(measurements) == 5
+    assert _read_csv(directory) == measurements
+
+
+def test_file_sink_fsync_interval(tmpdir, monkeypatch, make_measurements):
+    synced: list[int] = []
+    monkeypatch.setattr('vpf_730.sinks.os.fsync', synced.append)
+    directory = str(tmpdir.join('export'))
+    sink = FileSink(directory, fsync_interval=0)
+    sink.write_many(make_measurements(3, START))
+    assert len(synced) == 3
+    # the data was written to the file
+    assert len(_read_csv(directory)) == 3
+    sink.close()
+
+
+def test_file_sink_invalid_format(tmpdir):
+    with pytest.raises(ValueError) as excinfo:
+        FileSink(str(tmpdir), format='json')  # type: ignore[arg-type]
+    assert str(excinfo.value) == (
+        "format must be one of: csv, parquet, got: 'json'"
+    )
+
+
+def test_file_sink_parquet(tmpdir, make_measurements):
+    pq = pytest.importorskip('pyarrow.parquet')
+    measurements = make_measurements(3000, START)
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory, format='parquet', row_group_size=500) as sink:
+        sink.write_many(measurements[:1000])
+        # not readable until it is closed
+        assert os.listdir(directory) == ['2023-01-31.parquet.tmp']
+        sink.write_many(measurements[1000:2000])
+    with FileSink(directory, format='parquet') as sink:
+        assert sink.write_many(measurements) == 1000
+
+    assert sorted(os.listdir(directory)) == [
+        '2023-01-31.parquet', '2023-02-01.1.parquet', '2023-02-01.parquet',
+        '2023-02-02.parquet',
+    ]
+    meta = pq.read_metadata(os.path.join(directory, '2023-01-31.parquet'))
+    assert (meta.num_rows, meta.num_row_groups) == (1440, 3)
+    table = pq.read_table(directory)
+    assert table.column_names == list(Measurement._fields)
+    rows = sorted(zip(*(table[f].to_pylist() for f in Measurement._fields)))
+    assert [Measurement(*row) for row in rows] == measurements
+
+
+def test_export(db_path, tmpdir, make_measurements):
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory) as sink:
+        stats = export(db_path, sink, chunk_size=700)
+    assert stats.exported == 3000
+    assert stats.watermark == read_watermark(directory) == START + 2999 * 60
+    assert stats.rows_per_second > 0
+
+    # new measurements are appended, including packed days
+    with connect(db_path) as db:
+        insert_measurements(db, make_measurements(100, START + 3000 * 60))
+        compact_days(db, before=START + 3 * 86400)
+    with FileSink(directory) as sink:
+        stats = export(db_path, sink)
+    assert (stats.exported, stats.watermark) == (100, START + 3099 * 60)
+    # exporting the same range again does not duplicate measurements
+    with FileSink(directory) as sink:
+        assert export(db_path, sink, since=START + 1000 * 60).exported == 0
+
+    assert _read_csv(directory) == [
+        *make_measurements(3000, START),
+        *make_measurements(100, START + 3000 * 60),
+    ]
+
+
+def test_export_partitioned(tmpdir, make_measurements):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    measurements = make_measurements(3000, START)
+    with PartitionedDB(db_path) as db:
+        # 2023-01 and 2023-02
+        for m in measurements:
+            db.insert(m)
+    directory = str(tmpdir.join('export'))
+    with FileSink(directory) as sink:
+        assert export(db_path, sink, chunk_size=1000).exported == 3000
+    assert _read_csv(directory) == measurements
+
+
+def test_export_interrupted(db_path, tmpdir, monkeypatch, make_measurements):
+    directory = str(tmpdir.join('export'))
+    chunks: list[object] = []
+    write_many = FileSink.write_many
+
+    def _write_many(self, measurements):
+        if chunks:
+            raise KeyboardInterrupt
+        chunks.append(measurements)
+        return write_many(self, measurements)
+
+    with monkeypatch.context() as m:
+        m.setattr(FileSink, 'write_many', _write_many)
+        with pytest.raises(KeyboardInterrupt):
+            with FileSink(directory) as sink:
+                export(db_path, sink, chunk_size=1000)
+    assert read_watermark(directory) == START + 999 * 60
+
+    with FileSink(directory) as sink:
+        assert export(db_path, sink).exported == 2000
+    assert _read_csv(directory) == make_measurements(3000, START)
+
+
+def test_main_export(db_path, tmpdir, capsys, make_measurements):
+    directory = str(tmpdir.join('export'))
+    argv = ['export', '--local-db', db_path, '--dest', directory]
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith(f'exported 3,000 measurements to {directory} in ')
+    assert out.endswith(f'rows/s), watermark: {START + 2999 * 60}\n')
+
+    assert main([*argv, '--period', 'hourly']) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith('exported 0 measurements')
+    assert _read_csv(directory) == make_measurements(3000, START)
+
+
+class _ListSink(Sink):
+    """A sink keeping the batches in memory, which can be blocked or fail"""
+
+    def __init__(self, block=False, fail=False, error=None):
+        self.batches = []
+        self.error = error or OSError('the broker is down')
+        self.maintained = 0
+        self.closed = False
+        self.fail = fail
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def write_many(self, measurements):
+        self.writing.set()
+        self.release.wait()
+        if self.fail:
+            raise self.error
+        self.batches.append(list(measurements))
+        return len(measurements)
+
+    def maintain(self):
+        self.maintained += 1
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def written(self):
+        return [m for batch in self.batches for m in batch]
+
+
+def _blocked(overflow, measurements, **kwargs):
+    """A started sink that is blocked writing the first measurement"""
+    sink = _ListSink(block=True)
+    queued = QueuedSink(sink, overflow=overflow, queue_size=2, **kwargs)
+    queued.start()
+    queued.put(measurements[0])
+    assert sink.writing.wait(timeout=5)
+    return sink, queued
+
+
+def test_queued_sink_batches(make_measurements):
+    sink = _ListSink()
+    measurements = make_measurements(150, START)
+    with SinkPipeline([QueuedSink(sink, batch_size=60)]) as pipeline:
+        sink.release.clear()
+        for m in measurements:
+            pipeline.put(m)
+        pipeline.maintain()
+        sink.release.set()
+    assert sink.written == measurements
+    assert max(len(batch) for batch in sink.batches) == 60
+    assert sink.maintained == 1
+    assert sink.closed is True
+
+
+@pytest.mark.parametrize(
+    ('overflow', 'exp'),
+    (
+        ('drop_newest', [0, 1, 2]),
+        ('drop_oldest', [0, 8, 9]),
+        ('block', [0, 1, 2]),
+    ),
+)
+def test_queued_sink_drops(overflow, exp, make_measurements):
+    name = f'test-{overflow}'
+    kwargs = {'block_timeout': .01} if overflow == 'block' else {}
+    measurements = make_measurements(10, START)
+    sink, queued = _blocked(overflow, measurements, name=name, **kwargs)
+    for m in measurements[1:]:
+        queued.put(m)
+    sink.release.set()
+    queued.close()
+    assert sink.written == [measurements[i] for i in exp]
+    assert SINK_DROPPED.labels(name).value == 7
+
+
+def test_queued_sink_blocks_for_a_bounded_time(make_measurements):
+    measurements = make_measurements(4, START)
+    sink, queued = _blocked('block', measurements, name='test-bounded')
+    for m in measurements[1:3]:
+        queued.put(m)
+    # the sink is stuck and the queue is full
+    start = time.monotonic()
+    queued.put(measurements[3])
+    assert time.monotonic() - start < BLOCK_TIMEOUT + 1
+    assert SINK_DROPPED.labels('test-bounded').value == 1
+    sink.release.set()
+    queued.close()
+    assert sink.written == measurements[:3]
+
+
+def test_queued_sink_drop_oldest_keeps_stop_and_maintain(make_measurements):
+    measurements = make_measurements(10, START)
+    sink, queued = _blocked('drop_oldest', measurements)
+    queued.put(measurements[1])
+    queued.maintain()
+    queued.stop()
+    # the queue is full, so older measurements are dropped
+    for m in measurements[2:]:
+        queued.put(m)
+    sink.release.set()
+    queued.join(timeout=5)
+    assert not queued.is_alive()
+    assert sink.written == [measurements[i] for i in (0, 8, 9)]
+    assert sink.maintained == 1
+    assert sink.closed is True
+
+
+def test_queued_sink_spills(tmpdir, make_measurements):
+    spill_path = str(tmpdir.join('sink.spill'))
+    measurements = make_measurements(10, START)
+    sink, queued = _blocked('spill', measurements, spill_path=spill_path)
+    for m in measurements[1:]:
+        queued.put(m)
+    with open(spill_path) as f:
+        assert len(f.readlines()) == 7
+    sink.release.set()
+    queued.close()
+    assert sink.written == measurements
+    assert not os.path.exists(spill_path)
+
+
+def test_queued_sink_spills_failed_batches(tmpdir, make_measurements):
+    spill_path = str(tmpdir.join('sink.spill'))
+    measurements = make_measurements(5, START)
+    failing = QueuedSink(
+        _ListSink(fail=True),
+        overflow='spill',
+        spill_path=spill_path,
+    )
+    with SinkPipeline([failing]) as pipeline:
+        for m in measurements[:3]:
+            pipeline.put(m)
+    with open(spill_path, 'a') as f:
+        # the logger crashed while spilling
+        f.write('[1675')
+
+    # the spilled measurements are written when the logger is restarted
+    sink = _ListSink()
+    with SinkPipeline(
+        [QueuedSink(sink, overflow='spill', spill_path=spill_path)],
+    ) as pipeline:
+        for m in measurements[3:]:
+            pipeline.put(m)
+    assert sink.written == measurements
+    assert not os.path.exists(spill_path)
+
+
+def test_queued_sink_drops_failed_batches(make_measurements):
+    sink = _ListSink(fail=True)
+    with SinkPipeline([QueuedSink(sink, name='test-failing')]) as pipeline:
+        for m in make_measurements(3, START):
+            pipeline.put(m)
+    assert SINK_DROPPED.labels('test-failing').value == 3
+    assert sink.closed is True
+
+
+def test_queued_sink_drops_permanently_failing_batches(
+        tmpdir,
+        make_measurements,
+):
+    spill_path = str(tmpdir.join('sink.spill'))
+    sink = _ListSink(fail=True, error=sqlite3.IntegrityError('UNIQUE'))
+    queued = QueuedSink(
+        sink,
+        overflow='spill',
+        spill_path=spill_path,
+        name='test-integrity',
+    )
+    with SinkPipeline([queued]) as pipeline:
+        for m in make_measurements(3, START):
+            pipeline.put(m)
+    # retrying would fail forever, so nothing is spilled
+    assert SINK_DROPPED.labels('test-integrity').value == 3
+    assert not os.path.exists(spill_path)
+
+
+@pytest.mark.parametrize('name', ('local.db', 'local_{month}.db'))
+def test_db_sink_skips_duplicates(tmpdir, name, make_measurements):
+    db_path = str(tmpdir.join(name))
+    spill_path = str(tmpdir.join('local.db.spill'))
+    measurements = make_measurements(9, START)
+    queued = QueuedSink(
+        DBSink(db_path),
+        overflow='spill',
+        spill_path=spill_path,
+    )
+    with SinkPipeline([queued]) as pipeline:
+        # the same measurement twice e.g. after a restart
+        pipeline.put(measurements[0])
+        for m in measurements:
+            pipeline.put(m)
+
+    if '{month}' in name:
+        db_path = PartitionedDB(db_path).partition(START).path
+    with connect(db_path) as db:
+        ret = db.execute('SELECT timestamp FROM measurements').fetchall()
+    assert sorted(t for t, in ret) == [m.timestamp for m in measurements]
+    assert not os.path.exists(spill_path)
+
+
+def test_queued_sink_invalid_config(tmpdir):
+    with pytest.raises(ValueError) as excinfo:
+        QueuedSink(_ListSink(), overflow='wait')  # type: ignore[arg-type]
+    assert str(excinfo.value) == (
+        'overflow must be one of: block, drop_oldest, drop_newest, spill, '
+        "got: 'wait'"
+    )
+    with pytest.raises(ValueError):
+        QueuedSink(_ListSink(), overflow='spill')
+    with pytest.raises(ValueError):
+        QueuedSink(_ListSink(), spill_path=str(tmpdir.join('sink.spill')))
+
+
+def test_logger_config_file_sink_from_env():
+    environ = {
+        'VPF730_LOCAL_DB': 'local.db',
+        'VPF730_PORT': '/dev/ttyS0',
+        'VPF730_LOG_INTERVAL': '1',
+        'VPF730_FILE_SINK': 'export',
+    }
+    with mock.patch.dict(os.environ, environ):
+        assert LoggerConfig.from_env().file_sink == 'export'
+
+
+def test_logger_with_sinks(tmpdir, mock_vpf):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    directory = str(tmpdir.join('export'))
+    cfg = LoggerConfig(
+        local_db=db_path,
+        serial_port='',
+        log_interval=30,
+        file_sink=directory,
+    )
+    start = datetime(2023, 1, 31, 12, tzinfo=timezone.utc)
+    clock = VirtualClock(start=start)
+    end = start + timedelta(days=1)
+    sink = _ListSink()
+    logger = Logger(cfg=cfg, clock=clock, sinks=[QueuedSink(sink)])
+    logger.vpf_730 = mock_vpf
+    mock_vpf.clock = clock
+    with mock.patch.object(
+        Logger, '_logging',
+        new_callable=mock.PropertyMock,
+        side_effect=lambda: clock.now() < end,
+    ):
+        logger.run()
+
+    assert len(sink.written) == 48
+    assert sink.maintained == 24 * 60
+    assert sink.closed is True
+    assert _read_csv(directory) == sink.written
+    with connect(db_path.replace('{month}', '2023-02')) as db:
+        ret = db.execute('SELECT count(*) FROM measurements').fetchone()
+    assert ret[0] == 25
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+
+import pytest
+
+from vpf_730.chunks import compact_days
+from vpf_730.main import main
+from vpf_730.partitions import PartitionedDB
+from vpf_730.snapshot import backup_db
+from vpf_730.snapshot import snapshot
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+
+# 2023-01-31 00:00:00 UTC
+START = 1675123200
+
+
+@pytest.fixture
+def db_path(make_measurements, make_db):
+    return make_db('local.db', make_measurements(3000, START))
+
+
+def _select(db_path):
+    with connect(db_path) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp')
+        return [tuple(row) for row in ret.fetchall()]
+
+
+def _write_during_backup(monkeypatch, db_path, measurements):
+    """Insert a measurement between the first steps of the backup"""
+    new = iter(measurements)
+
+    def _sleep(seconds):
+        m = next(new, None)
+        if m is not None:
+            m.to_db(db_path)
+
+    monkeypatch.setattr('vpf_730.snapshot.time.sleep', _sleep)
+
+
+def test_backup_db(db_path, tmpdir):
+    dest = str(tmpdir.join('snapshot.db'))
+    backup_db(db_path, dest, pages=1)
+    assert _select(dest) == _select(db_path)
+    assert not os.path.exists(f'{dest}.tmp')
+
+
+def test_backup_db_wal_is_consistent(
+        db_path,
+        tmpdir,
+        monkeypatch,
+        make_measurements,
+):
+    with sqlite3.connect(db_path) as db:
+        db.execute('PRAGMA journal_mode = WAL')
+    exp = _select(db_path)
+    new = make_measurements(5, START + 10000 * 60)
+    _write_during_backup(monkeypatch, db_path, new)
+
+    dest = str(tmpdir.join('snapshot.db'))
+    backup_db(db_path, dest, pages=1)
+    # the measurements written during the backup are not part of it
+    assert _select(dest) == exp
+    assert len(_select(db_path)) == 3005
+    with sqlite3.connect(dest) as db:
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+
+
+def test_backup_db_restarts(db_path, tmpdir, monkeypatch, make_measurements):
+    new = make_measurements(1, START + 10000 * 60)
+    _write_during_backup(monkeypatch, db_path, new)
+    dest = str(tmpdir.join('snapshot.db'))
+    backup_db(db_path, dest, pages=1)
+    assert _select(dest) == _select(db_path)
+    assert len(_select(dest)) == 3001
+
+
+def test_snapshot_incremental(db_path, tmpdir, make_measurements):
+    dest = str(tmpdir.join('snapshot.db'))
+    stats = snapshot(db_path, dest, incremental=True)
+    assert (stats.copied, stats.skipped, stats.appended) == (1, 0, 0)
+
+    with connect(db_path) as db:
+        insert_measurements(db, make_measurements(3000, START + 3000 * 60))
+        # the new days are packed before the next snapshot
+        compact_days(db, before=START + 4 * 86400)
+    stats = snapshot(db_path, dest, incremental=True)
+    assert (stats.copied, stats.skipped, stats.appended) == (0, 0, 3000)
+    with connect(dest) as db:
+        ret = db.execute('SELECT count(*) FROM measurements').fetchone()
+    assert ret[0] == 6000
+
+    # nothing new
+    assert snapshot(db_path, dest, incremental=True).appended == 0
+
+
+def test_snapshot_partitioned(tmpdir, make_measurements):
+    db_path = str(tmpdir.join('vpf_730_{month}.db'))
+    dest = str(tmpdir.join('snapshot_{month}.db'))
+    with PartitionedDB(db_path) as db:
+        # 2023-01 and 2023-02
+        for m in make_measurements(2 * 1440, START):
+            db.insert(m)
+
+    stats = snapshot(db_path, dest, incremental=True)
+    assert (stats.copied, stats.skipped) == (2, 0)
+    for month in ('2023-01', '2023-02'):
+        path = dest.replace('{month}', month)
+        assert _select(path) == _select(db_path.replace('{month}', month))
+
+    with PartitionedDB(db_path) as db:
+        db.insert(make_measurements(1, START + 3 * 86400)[0])
+    stats = snapshot(db_path, dest, incremental=True)
+    assert (stats.copied, stats.skipped) == (1, 1)
+    assert len(_select(dest.replace('{month}', '2023-02'))) == 1441
+
+    # everything is copied again
+    assert snapshot(db_path, dest).copied == 2
+
+    with pytest.raises(ValueError):
+        snapshot(db_path, str(tmpdir.join('snapshot.db')))
+
+
+def test_main_snapshot(db_path, tmpdir, capsys):
+    dest = str(tmpdir.join('snapshot.db'))
+    argv = ['snapshot', '--local-db', db_path, '--dest', dest]
+    assert main(argv) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith(f'took a snapshot of {db_path} in ')
+    assert out.endswith(
+        ': 1 files copied, 0 unchanged, 0 measurements appended\n',
+    )
+    assert _select(dest) == _select(db_path)
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+
+import pytest
+
+from vpf_730.batch import MeasurementBatch
+from vpf_730.main import main
+from vpf_730.sender import select_measurements
+from vpf_730.storage import insert_measurements
+from vpf_730.storage import is_compact
+from vpf_730.storage import migrate_db
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+# 2023-01-01 00:00:00 UTC
+START = 1672531200
+
+
+@pytest.fixture
+def plain_db(make_measurements, make_db):
+    return make_db('plain.db', make_measurements(2000, START))
+
+
+def test_migrate_db_round_trip(plain_db):
+    with connect(plain_db) as db:
+        exp = select_measurements(db, start=0)
+    size = os.path.getsize(plain_db)
+
+    assert migrate_db(plain_db) is True
+    assert os.path.getsize(plain_db) < size * .6
+    with connect(plain_db) as db:
+        assert is_compact(db) is True
+        assert select_measurements(db, start=0) == exp
+        assert MeasurementBatch.select(db, start=0).to_dicts() == exp
+
+    assert migrate_db(plain_db, schema='plain') is True
+    with connect(plain_db) as db:
+        assert is_compact(db) is False
+        assert select_measurements(db, start=0) == exp
+
+
+def test_migrate_db_already_migrated(plain_db):
+    assert migrate_db(plain_db, schema='plain') is False
+    assert migrate_db(plain_db) is True
+    assert migrate_db(plain_db) is False
+
+
+def test_compact_db_insert_single_measurement(tmpdir, measurement):
+    db_path = str(tmpdir.join('compact.db'))
+    migrate_db(db_path)
+    measurement.to_db(db_path)
+    # a value that is not in the lookup table yet
+    m = measurement._replace(timestamp=1, self_test='XOX', temp=-0.5)
+    m.to_db(db_path)
+    with pytest.raises(sqlite3.IntegrityError):
+        m.to_db(db_path)
+
+    with connect(db_path) as db:
+        ret = db.execute('SELECT * FROM measurements ORDER BY timestamp')
+        assert [Measurement(*row) for row in ret] == [m, measurement]
+        ret = db.execute('SELECT temp, self_test FROM measurements_compact')
+        assert [tuple(row) for row in ret] == [(-5, 2), (205, 1)]
+
+
+@pytest.mark.parametrize(
+    ('on_conflict', 'exp_inserted', 'exp_id'),
+    (('ignore', 50, 1), ('replace', 100, 1337)),
+)
+def test_compact_db_insert_measurements(
+        tmpdir,
+        on_conflict,
+        exp_inserted,
+        exp_id,
+        make_measurements,
+):
+    db_path = str(tmpdir.join('compact.db'))
+    migrate_db(db_path)
+    measurements = make_measurements(100, START, sensor_id=1)
+    new = [m._replace(sensor_id=1337) for m in measurements]
+    with connect(db_path) as db:
+        assert insert_measurements(db, measurements[:50]) == 50
+        with pytest.raises(sqlite3.IntegrityError):
+            insert_measurements(db, new)
+
+        inserted = insert_measurements(db, new, on_conflict=on_conflict)
+        assert inserted == exp_inserted
+        ret = db.execute(
+            'SELECT sensor_id FROM measurements WHERE timestamp = ?',
+            (START,),
+        )
+        sensor_id, = ret.fetchone()
+        assert sensor_id == exp_id
+
+
+def test_main_migrate_db(plain_db, capsys):
+    assert main(['migrate-db', '--local-db', plain_db]) == 0
+    out, _ = capsys.readouterr()
+    assert out.startswith(f'converted {plain_db} to the compact schema (')
+
+    assert main(['migrate-db', '--local-db', plain_db]) == 0
+    out, _ = capsys.readouterr()
+    assert out == f'{plain_db} already uses the compact schema\n'
@@ -1,4 +1,9 @@
+import math
+
+import pytest
+
 from vpf_730.utils import FrozenDict
+from vpf_730.utils import process_map
 
 
 def test_fdict():
@@ -12,3 +17,10 @@ def test_fdict():
     assert list(fdict.keys()) == ['test']
     assert list(fdict.items()) == [('test', 123)]
     assert repr(fdict) == "FrozenDict({'test': 123})"
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_process_map_keeps_the_order(jobs):
+    tasks = range(20)
+    ret = list(process_map(math.factorial, tasks, jobs=jobs))
+    assert ret == [math.factorial(i) for i in tasks]
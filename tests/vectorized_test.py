@@ -0,0 +1,96 @@
+import pytest
+
+from vpf_730.vpf_730 import Measurement
+
+np = pytest.importorskip('numpy')
+
+
+def _parse_one_by_one(msgs):
+    ret = []
+    bad = []
+    for i, msg in enumerate(msgs):
+        try:
+            ret.append(tuple(Measurement.from_msg(msg, timestamp=i)))
+        except (ValueError, IndexError):
+            bad.append(i)
+    return ret, bad
+
+
+def test_parse_many_same_as_from_msg(make_msgs):
+    msgs = [msg for _, msg in make_msgs(1000, 0)]
+    buffer = b'\r\n'.join(msgs) + b'\r\n'
+    ret = Measurement.parse_many(buffer, timestamps=range(len(msgs)))
+
+    exp, bad = _parse_one_by_one(msgs)
+    assert bad == []
+    assert ret.bad_lines.tolist() == []
+    assert ret.data.dtype.names == Measurement._fields
+    assert [tuple(r) for r in ret.data.tolist()] == exp
+
+
+def test_parse_many_as_measurement(test_msg):
+    ret = Measurement.parse_many(test_msg, timestamps=[1658758977])
+    assert Measurement(*ret.data[0].tolist()) == Measurement(
+        timestamp=1658758977,
+        sensor_id=1,
+        last_measurement_period=60,
+        time_since_report=0,
+        optical_range=1.19,
+        precipitation_type_msg='NP',
+        obstruction_to_vision='HZ',
+        receiver_bg_illumination=0.06,
+        water_in_precip=0.0,
+        temp=20.5,
+        nr_precip_particles=0,
+        transmission_eq=2.51,
+        exco_less_precip_particle=2.51,
+        backscatter_exco=11.1,
+        self_test='OOO',
+        total_exco=2.51,
+    )
+
+
+@pytest.mark.parametrize(
+    ('msg', 'is_bad'),
+    (
+        pytest.param(b'garbage', True, id='garbage'),
+        pytest.param(b'', True, id='empty'),
+        pytest.param(b'PW01,0060,0000,001.19 XX', True, id='truncated'),
+        # non-standard widths are parsed by from_msg
+        pytest.param(b'PW1,60,0,1.19 KM,NP ,HZ,0.06,0,+20.5 C,0,2.51,2.51,+11.1,0,0,OOO,2.51', False, id='short'),  # noqa: E501
+        pytest.param(b'  PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51 ', False, id='padded'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,FOO,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', True, id='unknown precip'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP , X,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', True, id='unknown obstruction'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM, NP,  ,00.06,00.0000,-000.0 C,0000,002.51,002.51,-011.10,  0000,000,OOO,002.51', False, id='padding and signs'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,*020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', True, id='invalid sign'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0,00,000,OOO,002.51', True, id='extra separator'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,\xff\xffO,002.51', True, id='not utf-8'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,0_1.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', False, id='underscore'),  # noqa: E501
+    ),
+)
+def test_parse_many_bad_lines_are_reported(test_msg, msg, is_bad):
+    msgs = [test_msg, msg, test_msg]
+    ret = Measurement.parse_many(b'\n'.join(msgs), timestamps=[0, 1, 2])
+
+    exp, bad = _parse_one_by_one(msgs)
+    assert bad == ([1] if is_bad else [])
+    assert ret.bad_lines.tolist() == bad
+    assert [tuple(r) for r in ret.data.tolist()] == exp
+    # the sign of zero is the same as with float()
+    assert np.signbit(ret.data['temp']).tolist() == [
+        str(r[9]).startswith('-') for r in exp
+    ]
+
+
+def test_parse_many_empty_buffer():
+    ret = Measurement.parse_many(b'', timestamps=[])
+    assert len(ret.data) == 0
+    assert len(ret.bad_lines) == 0
+
+
+def test_parse_many_wrong_number_of_timestamps(test_msg):
+    with pytest.raises(ValueError) as exc_info:
+        Measurement.parse_many(test_msg + b'\r\n' + test_msg, timestamps=[1])
+
+    msg, = exc_info.value.args
+    assert msg == 'expected 2 timestamps (one per line), got 1'
@@ -31,6 +31,42 @@ def test_measurement_from_msg_obstruction_invalid():
     )
 
 
+def test_measurement_from_msg_fast_path_same_as_generic(make_msgs):
+    for _, msg in make_msgs(1000, 0):
+        assert Measurement.from_msg(msg, 1) == Measurement._from_msg_generic(
+            msg, 1,
+        )
+
+
+@pytest.mark.parametrize(
+    'msg',
+    (
+        pytest.param(b'PW1,60,0,1.19 KM,NP,,0.06,0,+20.5 C,0,2.51,2.51,+11.1,0,0,OOO,2.51', id='short'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP , HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', id='padded code'),  # noqa: E501
+        pytest.param(b'PWP1,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', id='lstrip'),  # noqa: E501
+        pytest.param(b'\x1cPW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51\x1f', id='str whitespace'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,\xc3\xa9,OOO,002.51', id='unicode'),  # noqa: E501
+        pytest.param('PW01,0060,0000,001.19 KM,NP\u2003,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51'.encode(), id='unicode whitespace'),  # noqa: E501
+    ),
+)
+def test_measurement_from_msg_non_standard_format(msg):
+    exp = Measurement._from_msg_generic(msg, 1)
+    assert Measurement.from_msg(msg, 1) == exp
+
+
+@pytest.mark.parametrize(
+    ('msg', 'exc'),
+    (
+        pytest.param(b'garbage', IndexError, id='garbage'),
+        pytest.param(b'PW01,0060,0000,001.19 KX,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,000,OOO,002.51', ValueError, id='unit'),  # noqa: E501
+        pytest.param(b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,002.51,+011.10,  0000,\xff,OOO,002.51', UnicodeDecodeError, id='not utf-8'),  # noqa: E501
+    ),
+)
+def test_measurement_from_msg_invalid(msg, exc):
+    with pytest.raises(exc):
+        Measurement.from_msg(msg, 1)
+
+
 @pytest.mark.parametrize(
     ('abbrev', 'readable'),
     (
@@ -1,14 +1,62 @@
-from .logger import Logger
-from .logger import LoggerConfig
-from .sender import Sender
-from .sender import SenderConfig
-from .vpf_730 import Measurement
-from .vpf_730 import OBSTRUCTION_TO_VISION
-from .vpf_730 import PRECIP_TYPES
-from .vpf_730 import VPF730
+from __future__ import annotations
+
+import importlib
+from typing import Any
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .daemon import Daemon
+    from .daemon import DaemonConfig
+    from .logger import Logger
+    from .logger import LoggerConfig
+    from .receiver import Receiver
+    from .receiver import ReceiverConfig
+    from .sender import Sender
+    from .sender import SenderConfig
+    from .vpf_730 import Measurement
+    from .vpf_730 import OBSTRUCTION_TO_VISION
+    from .vpf_730 import PRECIP_TYPES
+    from .vpf_730 import VPF730
 
 
 __all__ = [
-    'Logger', 'LoggerConfig', 'Sender', 'SenderConfig', 'Measurement',
+    'Daemon', 'DaemonConfig', 'Logger', 'LoggerConfig', 'Receiver',
+    'ReceiverConfig', 'Sender', 'SenderConfig', 'Measurement',
     'OBSTRUCTION_TO_VISION', 'PRECIP_TYPES', 'VPF730',
 ]
+
+# the submodules (and with them e.g. pyserial or urllib) are only imported
+# when accessed, so short-lived commands like ``vpf-730 comm`` start fast
+_LAZY_IMPORTS = {
+    'Daemon': 'daemon',
+    'DaemonConfig': 'daemon',
+    'Logger': 'logger',
+    'LoggerConfig': 'logger',
+    'Receiver': 'receiver',
+    'ReceiverConfig': 'receiver',
+    'Sender': 'sender',
+    'SenderConfig': 'sender',
+    'Measurement': 'vpf_730',
+    'OBSTRUCTION_TO_VISION': 'vpf_730',
+    'PRECIP_TYPES': 'vpf_730',
+    'VPF730': 'vpf_730',
+}
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _LAZY_IMPORTS[name]
+    except KeyError:
+        raise AttributeError(
+            f'module {__name__!r} has no attribute {name!r}',
+        ) from None
+
+    module = importlib.import_module(f'.{module_name}', __name__)
+    value = getattr(module, name)
+    # cache it, so __getattr__ is only called once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
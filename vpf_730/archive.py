@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import glob
+import os
+import struct
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from datetime import timezone
+from types import TracebackType
+from typing import BinaryIO
+from typing import NamedTuple
+
+BLOCK_MAGIC = b'VPFB'
+# magic, number of records, min timestamp, max timestamp, compressed length
+BLOCK_HEADER = struct.Struct('<4sIddI')
+# min timestamp, max timestamp, offset of the block in the data file
+INDEX_ENTRY = struct.Struct('<ddQ')
+# receive timestamp, length of the message
+RECORD_HEADER = struct.Struct('<dI')
+
+DATA_SUFFIX = '.vpfraw'
+INDEX_SUFFIX = '.idx'
+JOURNAL_SUFFIX = '.journal'
+
+
+class RawArchiveError(Exception):
+    """Exception that is raised when an archive file is corrupt"""
+    pass
+
+
+class BlockIndexEntry(NamedTuple):
+    """An entry of the sparse index, one per compressed block
+
+    :param min_ts: the smallest receive timestamp in the block
+    :param max_ts: the largest receive timestamp in the block
+    :param offset: the offset of the block header in the data file
+    """
+    min_ts: float
+    max_ts: float
+    offset: int
+
+
+def _encode_record(timestamp: float, msg: bytes) -> bytes:
+    return RECORD_HEADER.pack(timestamp, len(msg)) + msg
+
+
+def _decode_records(data: bytes) -> Iterator[tuple[float, bytes]]:
+    """Decode records, a truncated record at the end is ignored"""
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        timestamp, length = RECORD_HEADER.unpack_from(data, pos)
+        pos += RECORD_HEADER.size
+        if pos + length > len(data):
+            break
+        yield timestamp, data[pos:pos + length]
+        pos += length
+
+
+def _scan_blocks(f: BinaryIO) -> tuple[list[BlockIndexEntry], int]:
+    """Read the block headers of a data file
+
+    :return: the index entries and the end of the last complete block
+    """
+    entries = []
+    size = os.fstat(f.fileno()).st_size
+    offset = 0
+    while offset + BLOCK_HEADER.size <= size:
+        f.seek(offset)
+        magic, _, min_ts, max_ts, length = BLOCK_HEADER.unpack(
+            f.read(BLOCK_HEADER.size),
+        )
+        end = offset + BLOCK_HEADER.size + length
+        if magic != BLOCK_MAGIC or end > size:
+            break
+        entries.append(BlockIndexEntry(min_ts, max_ts, offset))
+        offset = end
+    return entries, offset
+
+
+def _read_index(path: str) -> list[BlockIndexEntry] | None:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) % INDEX_ENTRY.size:
+        return None
+    return [BlockIndexEntry(*e) for e in INDEX_ENTRY.iter_unpack(data)]
+
+
+class RawArchive:
+    """An append-only archive of the raw messages read from the sensor,
+    together with the time they were received.
+
+    The messages are stored in files rotated by time, one per ``period``
+    (a :func:`datetime.strftime` pattern, daily by default). Each file
+    consists of zlib-compressed blocks of ``block_len`` messages. A sparse
+    index next to each file stores the time range and offset of every block,
+    so a range read only decompresses the blocks that overlap it.
+
+    Messages that are not yet part of a block are appended to a journal,
+    which is read back when the archive is opened again e.g. after a crash.
+
+    .. code-block:: python
+
+        with RawArchive('raw') as archive:
+            archive.append(1672531200.35, b'PW01,0060,...')
+            for timestamp, msg in archive.read(start=1672531200):
+                ...
+
+    :param directory: the directory the archive files are stored in
+    :param block_len: number of messages that are compressed into one block
+    :param period: :func:`datetime.strftime` pattern of the receive time (UTC)
+        naming the files, e.g. ``%Y-%m`` for monthly files
+    :param level: the zlib compression level
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            block_len: int = 60,
+            period: str = '%Y-%m-%d',
+            level: int = 6,
+    ) -> None:
+        self.directory = directory
+        self.block_len = block_len
+        self.period = period
+        self.level = level
+        self._key: str | None = None
+        self._buffer: list[tuple[float, bytes]] = []
+        self._journal: BinaryIO | None = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}{DATA_SUFFIX}')
+
+    def _key_for(self, timestamp: float) -> str:
+        dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return dt.strftime(self.period)
+
+    def append(self, timestamp: float, msg: bytes) -> None:
+        """Append a raw message to the archive
+
+        :param timestamp: unix timestamp (UTC) when the message was received
+        :param msg: the raw message as read from the sensor
+        """
+        key = self._key_for(timestamp)
+        if key != self._key:
+            # the previous file is complete, so compress what is left
+            self.flush()
+            self._open(key)
+
+        assert self._journal is not None
+        self._journal.write(_encode_record(timestamp, msg))
+        self._journal.flush()
+        self._buffer.append((timestamp, msg))
+        if len(self._buffer) >= self.block_len:
+            self.flush()
+
+    def _open(self, key: str) -> None:
+        self.close()
+        path = self._path(key)
+        # repair the data file and the index, in case writing was interrupted
+        with open(path, 'ab+') as f:
+            entries, end = _scan_blocks(f)
+            f.truncate(end)
+        if _read_index(f'{path}{INDEX_SUFFIX}') != entries:
+            with open(f'{path}{INDEX_SUFFIX}', 'wb') as f:
+                f.write(b''.join(INDEX_ENTRY.pack(*e) for e in entries))
+
+        journal_path = f'{path}{JOURNAL_SUFFIX}'
+        if os.path.exists(journal_path):
+            with open(journal_path, 'rb+') as f:
+                records = list(_decode_records(f.read()))
+                # a record that was only partially written would corrupt the
+                # records appended after it
+                f.truncate(
+                    sum(RECORD_HEADER.size + len(r[1]) for r in records),
+                )
+            # records already in a block if it was written, but the journal
+            # was not truncated afterwards
+            max_ts = max((e.max_ts for e in entries), default=float('-inf'))
+            self._buffer = [r for r in records if r[0] > max_ts]
+        # records that are already in a block are kept, they are skipped when
+        # reading and the journal is truncated with the next block
+        self._journal = open(journal_path, 'ab')
+        self._key = key
+
+    def flush(self) -> None:
+        """Compress all buffered messages into a block and add it to the
+        index, even if the block is not full yet.
+        """
+        if not self._buffer or self._key is None:
+            return
+
+        path = self._path(self._key)
+        payload = zlib.compress(
+            b''.join(_encode_record(*r) for r in self._buffer),
+            self.level,
+        )
+        timestamps = [r[0] for r in self._buffer]
+        header = BLOCK_HEADER.pack(
+            BLOCK_MAGIC,
+            len(self._buffer),
+            min(timestamps),
+            max(timestamps),
+            len(payload),
+        )
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(header + payload)
+        with open(f'{path}{INDEX_SUFFIX}', 'ab') as f:
+            f.write(INDEX_ENTRY.pack(min(timestamps), max(timestamps), offset))
+
+        assert self._journal is not None
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._buffer = []
+
+    def close(self) -> None:
+        """Close the journal. The buffered messages are not compressed, but
+        are kept in the journal and are read back when appending to the same
+        file again, so blocks are not fragmented by restarts.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            self._buffer = []
+            self._key = None
+
+    def __enter__(self) -> RawArchive:
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def index(self, path: str) -> list[BlockIndexEntry]:
+        """Get the sparse index of a data file, it is rebuilt from the block
+        headers if it is missing or corrupt.
+
+        :param path: path to a data file of the archive
+
+        :return: the index entries of all blocks in the file
+        """
+        entries = _read_index(f'{path}{INDEX_SUFFIX}')
+        if entries is None:
+            with open(path, 'rb') as f:
+                entries, _ = _scan_blocks(f)
+        return entries
+
+    def files(self) -> list[str]:
+        """Get the data files of the archive
+
+        :return: the paths of the data files, ordered by their time period
+        """
+        return sorted(
+            glob.glob(
+                os.path.join(glob.escape(self.directory), f'*{DATA_SUFFIX}'),
+            ),
+        )
+
+    def read(
+            self,
+            start: float | None = None,
+            end: float | None = None,
+    ) -> Iterator[tuple[float, bytes]]:
+        """Read the messages received in ``[start, end)``. Only the blocks
+        overlapping the range are read and decompressed.
+
+        :param start: optional - unix timestamp (UTC) to start at (inclusive)
+        :param end: optional - unix timestamp (UTC) to stop at (exclusive)
+
+        :return: an iterator of ``(timestamp, message)`` ordered by the file
+            and the time they were appended
+        """
+        for path in self.files():
+            yield from self.read_file(path, start=start, end=end)
+
+    def read_file(
+            self,
+            path: str,
+            start: float | None = None,
+            end: float | None = None,
+    ) -> Iterator[tuple[float, bytes]]:
+        """Read the messages received in ``[start, end)`` from a single data
+        file of the archive (see :func:`RawArchive.read`).
+
+        :param path: path to a data file of the archive
+        :param start: optional - unix timestamp (UTC) to start at (inclusive)
+        :param end: optional - unix timestamp (UTC) to stop at (exclusive)
+
+        :return: an iterator of ``(timestamp, message)`` ordered by the time
+            they were appended
+        """
+        lo = float('-inf') if start is None else start
+        hi = float('inf') if end is None else end
+        entries = self.index(path)
+        with open(path, 'rb') as f:
+            for entry in entries:
+                if entry.max_ts < lo or entry.min_ts >= hi:
+                    continue
+                f.seek(entry.offset)
+                magic, _, _, _, length = BLOCK_HEADER.unpack(
+                    f.read(BLOCK_HEADER.size),
+                )
+                if magic != BLOCK_MAGIC:
+                    raise RawArchiveError(
+                        f'no block at offset {entry.offset} in {path!r}',
+                    )
+                data = zlib.decompress(f.read(length))
+                for r in _decode_records(data):
+                    if lo <= r[0] < hi:
+                        yield r
+
+        try:
+            with open(f'{path}{JOURNAL_SUFFIX}', 'rb') as f:
+                journal = f.read()
+        except FileNotFoundError:
+            return
+        # skip records already in a block, if writing was interrupted
+        max_ts = max((e.max_ts for e in entries), default=float('-inf'))
+        for r in _decode_records(journal):
+            if r[0] > max_ts and lo <= r[0] < hi:
+                yield r
+
+
+def open_archive(directory: str | None) -> RawArchive | None:
+    """Open a :func:`RawArchive` if a directory is configured
+
+    :param directory: the directory of the archive or ``None``
+
+    :return: the archive or ``None``
+    """
+    return RawArchive(directory) if directory else None
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import array
+import json
+import sqlite3
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Mapping
+from collections.abc import Sequence
+from itertools import islice
+from typing import Any
+from typing import Literal
+from typing import overload
+from typing import TYPE_CHECKING
+
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import OBSTRUCTION_TO_VISION
+from vpf_730.vpf_730 import PRECIP_TYPES
+
+if TYPE_CHECKING:
+    import numpy as np
+    import numpy.typing as npt
+
+    from vpf_730.sender import MeasurementDict
+
+# the typecode of the array.array storing each field. Categorical fields are
+# stored as codes indexing into the categories of the batch
+_TYPECODES = {
+    'timestamp': 'q',
+    'sensor_id': 'q',
+    'last_measurement_period': 'q',
+    'time_since_report': 'q',
+    'optical_range': 'd',
+    'precipitation_type_msg': 'H',
+    'obstruction_to_vision': 'H',
+    'receiver_bg_illumination': 'd',
+    'water_in_precip': 'd',
+    'temp': 'd',
+    'nr_precip_particles': 'q',
+    'transmission_eq': 'd',
+    'exco_less_precip_particle': 'd',
+    'backscatter_exco': 'd',
+    'self_test': 'H',
+    'total_exco': 'd',
+}
+# the categorical fields and their initial categories, others are added when
+# they first occur
+_CATEGORICAL = {
+    'precipitation_type_msg': tuple(PRECIP_TYPES),
+    'obstruction_to_vision': tuple(OBSTRUCTION_TO_VISION),
+    'self_test': (),
+}
+# rows are transposed into columns in chunks of this size when extending
+_EXTEND_CHUNK = 4096
+
+_SELECT = (
+    f'SELECT {", ".join(Measurement._fields)} FROM measurements '
+    f'WHERE timestamp > ? ORDER BY timestamp LIMIT ?'
+)
+
+
+class _Categories:
+    """The values of a categorical field, the code is the index of the value"""
+
+    def __init__(self, values: Iterable[str]) -> None:
+        self.values: list[str] = []
+        self.codes: dict[str, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        try:
+            return self.codes[value]
+        except KeyError:
+            if not isinstance(value, str):
+                raise TypeError(
+                    f'categorical values must be str, not {type(value)}',
+                ) from None
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+
+class MeasurementBatch(Sequence[Measurement]):
+    """A compact, column-oriented container of many measurements. Every field
+    is stored in a typed :func:`array.array` (8 bytes for numbers, 2 bytes for
+    categorical fields like ``precipitation_type_msg``), which takes a
+    fraction of the memory of a list of
+    :func:`vpf_730.vpf_730.Measurement` or
+    :func:`vpf_730.sender.MeasurementDict`.
+
+    Iterating or indexing the batch yields
+    :func:`vpf_730.vpf_730.Measurement`. Slices share the columns with the
+    batch they were taken from, hence they do not copy any data. For this
+    reason, slices are read-only and only support a step of ``1``.
+
+    .. code-block:: python
+
+        with connect('vpf_730_local.db') as db:
+            batch = MeasurementBatch.select(db, start=1672531200)
+
+        print(batch.nbytes, batch[-1].temp)
+        batch[:1000].to_csv('first_1000.csv')
+
+    :param measurements: optional - measurements or tuples with the values in
+        the order of :func:`vpf_730.vpf_730.Measurement._fields` to add
+    """
+
+    def __init__(
+            self,
+            measurements: Iterable[Sequence[Any] | Mapping[str, Any]] = (),
+    ) -> None:
+        self._columns = {
+            name: array.array(typecode)
+            for name, typecode in _TYPECODES.items()
+        }
+        self._categories = {
+            name: _Categories(values) for name, values in _CATEGORICAL.items()
+        }
+        self._start = 0
+        # the end of a slice, None if this batch owns the columns
+        self._stop: int | None = None
+        self.extend(measurements)
+
+    @classmethod
+    def select(
+            cls,
+            db: sqlite3.Connection,
+            start: int,
+            limit: int | None = None,
+    ) -> MeasurementBatch:
+        """Select all measurements after ``start`` into a new batch, without
+        creating an intermediate object per measurement. Days packed by
+        :func:`vpf_730.chunks.compact_days` are only included by
+        :func:`vpf_730.chunks.select_range`.
+
+        :param db: an open connection to the sqlite database
+        :param start: unix timestamp (UTC) after which to get data
+        :param limit: optional - only select the first ``limit`` measurements
+
+        :return: a new batch ordered by the timestamp
+        """
+        cur = db.cursor()
+        # plain tuples are the fastest to create
+        cur.row_factory = None
+        # a negative limit means no limit in sqlite
+        cur.execute(_SELECT, (start, -1 if limit is None else limit))
+        return cls(cur)
+
+    def _check_writable(self) -> None:
+        if self._stop is not None:
+            raise TypeError('a slice of a MeasurementBatch is read-only')
+
+    def append(self, measurement: Sequence[Any] | Mapping[str, Any]) -> None:
+        """Add a measurement to the end of the batch
+
+        :param measurement: a measurement, a tuple with the values in the
+            order of :func:`vpf_730.vpf_730.Measurement._fields` or a
+            :func:`vpf_730.sender.MeasurementDict`
+        """
+        self.extend((measurement,))
+
+    def extend(
+            self,
+            measurements: Iterable[Sequence[Any] | Mapping[str, Any]],
+    ) -> None:
+        """Add measurements to the end of the batch. If a value cannot be
+        stored, e.g. because it is ``None``, no measurement of the chunk it is
+        part of is added.
+
+        :param measurements: measurements, tuples with the values in the
+            order of :func:`vpf_730.vpf_730.Measurement._fields` or
+            :func:`vpf_730.sender.MeasurementDict`
+        """
+        self._check_writable()
+        it = iter(measurements)
+        while True:
+            rows = [
+                [row[name] for name in _TYPECODES]
+                if isinstance(row, Mapping) else row
+                for row in islice(it, _EXTEND_CHUNK)
+            ]
+            if not rows:
+                break
+            for row in rows:
+                if len(row) != len(_TYPECODES):
+                    raise ValueError(
+                        f'expected {len(_TYPECODES)} values per measurement, '
+                        f'got {len(row)}',
+                    )
+
+            # convert all values first, so a bad row cannot leave the columns
+            # with different lengths
+            values = []
+            for name, column in zip(_TYPECODES, zip(*rows)):
+                if name in self._categories:
+                    codes = map(self._categories[name].code, column)
+                    values.append(array.array(_TYPECODES[name], codes))
+                else:
+                    values.append(array.array(_TYPECODES[name], column))
+            for name, column_values in zip(_TYPECODES, values):
+                self._columns[name].extend(column_values)
+
+    def extend_columns(self, columns: Mapping[str, Sequence[Any]]) -> None:
+        """Add measurements given as one sequence of values per field, which
+        avoids transposing rows. An :func:`array.array` with the typecode of
+        the field is copied as a whole.
+
+        :param columns: the values of every field by its name, strings for
+            the categorical fields
+        """
+        self._check_writable()
+        missing = [name for name in _TYPECODES if name not in columns]
+        if missing:
+            raise ValueError(f'missing columns: {", ".join(missing)}')
+        if len({len(columns[name]) for name in _TYPECODES}) > 1:
+            raise ValueError('all columns must have the same length')
+
+        values = []
+        for name, typecode in _TYPECODES.items():
+            if name in self._categories:
+                codes = map(self._categories[name].code, columns[name])
+                values.append(array.array(typecode, codes))
+            else:
+                values.append(array.array(typecode, columns[name]))
+        for name, column_values in zip(_TYPECODES, values):
+            self._columns[name].extend(column_values)
+
+    def __len__(self) -> int:
+        if self._stop is None:
+            return len(self._columns['timestamp']) - self._start
+        else:
+            return self._stop - self._start
+
+    def _range(self) -> slice:
+        return slice(self._start, self._start + len(self))
+
+    @overload
+    def __getitem__(self, idx: int) -> Measurement: ...
+    @overload
+    def __getitem__(self, idx: slice) -> MeasurementBatch: ...
+
+    def __getitem__(
+            self,
+            idx: int | slice,
+    ) -> Measurement | MeasurementBatch:
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError(
+                    'slicing a MeasurementBatch requires a step of 1',
+                )
+            view = object.__new__(type(self))
+            view._columns = self._columns
+            view._categories = self._categories
+            view._start = self._start + start
+            view._stop = self._start + max(start, stop)
+            return view
+
+        length = len(self)
+        if idx < 0:
+            idx += length
+        if not 0 <= idx < length:
+            raise IndexError('MeasurementBatch index out of range')
+        pos = self._start + idx
+        return tuple.__new__(
+            Measurement,
+            (
+                self._categories[name].values[column[pos]]
+                if name in self._categories else column[pos]
+                for name, column in self._columns.items()
+            ),
+        )
+
+    def __iter__(self) -> Iterator[Measurement]:
+        columns = [self.column(name) for name in _TYPECODES]
+        for row in zip(*columns):
+            yield tuple.__new__(Measurement, row)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(<{len(self)} measurements>)'
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes used by the values of this batch"""
+        return sum(
+            len(self) * column.itemsize for column in self._columns.values()
+        )
+
+    def column(self, name: str) -> array.array[Any] | list[str]:
+        """Get a copy of the values of a single field
+
+        :param name: the name of the field e.g. ``temp``
+
+        :return: an :func:`array.array` for numeric fields and a list of
+            strings for categorical fields
+        """
+        try:
+            values = self._columns[name][self._range()]
+        except KeyError:
+            raise KeyError(f'unknown field: {name!r}') from None
+
+        if name in self._categories:
+            return list(map(self._categories[name].values.__getitem__, values))
+        else:
+            return values
+
+    def to_numpy(self) -> npt.NDArray[np.void]:
+        """Convert the batch to a structured NumPy array. This requires numpy
+        to be installed.
+
+        :return: a structured array with the dtype
+            :const:`vpf_730.vectorized.MEASUREMENT_DTYPE`
+        """
+        import numpy as np
+
+        from vpf_730.vectorized import MEASUREMENT_DTYPE
+
+        data = np.empty(len(self), dtype=MEASUREMENT_DTYPE)
+        rng = self._range()
+        for name, column in self._columns.items():
+            # a view of the buffer of the array.array, so only the values of
+            # this batch are copied
+            values = np.frombuffer(column, dtype=column.typecode)[rng]
+            if name in self._categories:
+                categories = np.array(self._categories[name].values or [''])
+                data[name] = categories[values]
+            else:
+                data[name] = values
+        return data
+
+    def to_db(
+            self,
+            db_path: str,
+            on_conflict: Literal['abort', 'ignore', 'replace'] = 'abort',
+    ) -> int:
+        """Insert all measurements into a sqlite database using a single
+        transaction.
+
+        :param db_path: path to the sqlite database
+        :param on_conflict: how to handle already stored measurements, see
+            :func:`vpf_730.storage.insert_measurements`
+
+        :return: the number of rows inserted or replaced
+        """
+        with connect(db_path) as db:
+            with db:
+                return insert_measurements(db, self, on_conflict=on_conflict)
+
+    def to_csv(self, fname: str | None = None, sep: str = ',') -> str | None:
+        """Convert the batch to csv formatted lines in the format of
+        :func:`vpf_730.vpf_730.Measurement.to_csv`.
+
+        if ``fname`` is set, write it to a file (using append mode) with a
+        header if the file is new.
+
+        :param fname: optional - a filename to write the data to
+        :param sep: separator to use for the csv, default: ``,``
+
+        :return: a string containing the measurements formatted as csv, one
+            per line or ``None`` when written to a file.
+        """
+        lines = (sep.join(str(i) for i in row) for row in self)
+        if fname is not None:
+            with open(fname, 'a') as f:
+                # a brand new file, write the header
+                if f.tell() == 0:
+                    f.write(f'{sep.join(Measurement._fields)}\n')
+                f.writelines(f'{line}\n' for line in lines)
+            return None
+        else:
+            return '\n'.join(lines)
+
+    def to_dicts(self) -> list[MeasurementDict]:
+        """Convert the batch to a list of dictionaries as returned by
+        :func:`vpf_730.sender.select_measurements`
+
+        :return: one dictionary per measurement
+        """
+        fields = Measurement._fields
+        # https://github.com/python/mypy/issues/8890
+        return [dict(zip(fields, row)) for row in self]  # type: ignore[misc]
+
+    def to_json(self) -> str:
+        """Convert the batch to a JSON array of objects as sent by
+        :func:`vpf_730.sender.Sender`
+
+        :return: the JSON encoded measurements
+        """
+        return json.dumps(self.to_dicts())
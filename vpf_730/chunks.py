@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import array
+import bisect
+import json
+import logging
+import sqlite3
+import struct
+import sys
+import zlib
+from collections.abc import Sequence
+from itertools import accumulate
+from typing import Any
+
+from vpf_730.batch import MeasurementBatch
+from vpf_730.storage import COMPACT_SCALES
+from vpf_730.storage import is_compact
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TABLE = '''\
+        CREATE TABLE IF NOT EXISTS measurement_chunks(
+            day INTEGER PRIMARY KEY,
+            first_timestamp INTEGER NOT NULL,
+            last_timestamp INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    '''
+CHUNK_MAGIC = b'VPFC'
+CHUNK_VERSION = 1
+# magic, version, length of the JSON header describing the columns
+CHUNK_HEADER = struct.Struct('<4sHI')
+SECONDS_PER_DAY = 86400
+ZLIB_LEVEL = 9
+
+_FIELDS = ', '.join(Measurement._fields)
+_SELECT_DAY = (
+    f'SELECT {_FIELDS} FROM measurements '
+    f'WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp'
+)
+_SELECT_RANGE = (
+    f'SELECT {_FIELDS} FROM measurements '
+    f'WHERE timestamp > ? AND timestamp <= ? ORDER BY timestamp LIMIT ?'
+)
+# larger than any timestamp, the range of a query without an end
+_MAX_TIMESTAMP = 2**63 - 1
+
+
+class ChunkError(Exception):
+    """Exception that is raised when a chunk cannot be decoded"""
+    pass
+
+
+def _to_bytes(values: array.array[Any]) -> bytes:
+    # the chunks are always stored little-endian
+    if sys.byteorder == 'big':  # pragma: no cover
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array.array[Any]:
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':  # pragma: no cover
+        values.byteswap()
+    return values
+
+
+def _delta(values: Sequence[int]) -> array.array[int]:
+    return array.array(
+        'q',
+        [values[0], *(b - a for a, b in zip(values, values[1:]))],
+    )
+
+
+def _scaled(values: Sequence[float], scale: int) -> list[int] | None:
+    # only if every value can be restored exactly
+    try:
+        scaled = [round(v * scale) for v in values]
+    except (ValueError, OverflowError):
+        return None
+    if all(s / scale == v for s, v in zip(scaled, values)):
+        return scaled
+    else:
+        return None
+
+
+def encode_chunk(batch: MeasurementBatch) -> bytes:
+    """Encode measurements as a compressed columnar blob. Integers are delta
+    encoded, which turns the timestamps into a constant and slowly changing
+    values into small numbers. Floats with a fixed precision (see
+    :const:`vpf_730.storage.COMPACT_SCALES`) are stored as delta encoded
+    scaled integers if this is lossless, categorical fields as codes into a
+    list of their values. All columns are compressed together using
+    :mod:`zlib`.
+
+    :param batch: the measurements to encode, ordered by the timestamp
+
+    :return: the encoded chunk
+    """
+    columns: list[dict[str, Any]] = []
+    buffers = []
+    for name in Measurement._fields:
+        values = batch.column(name)
+        if isinstance(values, list):
+            categories = sorted(set(values))
+            codes = {value: code for code, value in enumerate(categories)}
+            columns.append(
+                {'name': name, 'encoding': 'dict', 'values': categories},
+            )
+            buffers.append(array.array('H', map(codes.__getitem__, values)))
+        elif values.typecode == 'q':
+            columns.append({'name': name, 'encoding': 'delta'})
+            buffers.append(_delta(values) if values else values)
+        else:
+            scale = COMPACT_SCALES.get(name)
+            scaled = None if scale is None else _scaled(values, scale)
+            if scaled is not None:
+                columns.append(
+                    {'name': name, 'encoding': 'scaled', 'scale': scale},
+                )
+                buffers.append(_delta(scaled) if scaled else values)
+            else:
+                columns.append({'name': name, 'encoding': 'float'})
+                buffers.append(values)
+
+    header = json.dumps(
+        {'count': len(batch), 'columns': columns},
+        separators=(',', ':'),
+    ).encode()
+    data = b''.join([
+        CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, len(header)),
+        header,
+        *(_to_bytes(b) for b in buffers),
+    ])
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decode_chunk(data: bytes) -> dict[str, Sequence[Any]]:
+    """Decode a chunk encoded by :func:`encode_chunk`.
+
+    :param data: the encoded chunk
+
+    :return: the values of every field by its name, in the format expected
+        by :func:`vpf_730.batch.MeasurementBatch.extend_columns`
+    """
+    try:
+        raw = zlib.decompress(data)
+        magic, version, header_len = CHUNK_HEADER.unpack_from(raw)
+    except (zlib.error, struct.error) as e:
+        raise ChunkError(f'corrupt chunk: {e}') from e
+    if magic != CHUNK_MAGIC or version != CHUNK_VERSION:
+        raise ChunkError(f'unsupported chunk: {magic!r} version {version}')
+
+    pos = CHUNK_HEADER.size + header_len
+    header = json.loads(raw[CHUNK_HEADER.size:pos])
+    count = header['count']
+    columns: dict[str, Sequence[Any]] = {}
+    for column in header['columns']:
+        encoding = column['encoding']
+        typecode = {'dict': 'H', 'float': 'd'}.get(encoding, 'q')
+        size = count * array.array(typecode).itemsize
+        values = _from_bytes(typecode, raw[pos:pos + size])
+        pos += size
+        if encoding == 'dict':
+            columns[column['name']] = [column['values'][i] for i in values]
+        elif encoding == 'delta':
+            columns[column['name']] = array.array('q', accumulate(values))
+        elif encoding == 'scaled':
+            scale = column['scale']
+            columns[column['name']] = array.array(
+                'd',
+                (v / scale for v in accumulate(values)),
+            )
+        else:
+            columns[column['name']] = values
+    if pos != len(raw) or len(columns) != len(Measurement._fields):
+        raise ChunkError('corrupt chunk: unexpected length')
+    return columns
+
+
+def compact_days(db: sqlite3.Connection, before: int) -> int:
+    """Pack every complete day (UTC) before ``before`` into a single row of
+    the ``measurement_chunks`` table using :func:`encode_chunk` and delete the
+    measurements of that day. Every day is compacted in its own transaction,
+    so the database is only locked briefly. Measurements inserted into an
+    already compacted day are merged into its chunk.
+
+    :param db: an open connection to the sqlite database
+    :param before: unix timestamp (UTC), only days ending before or at it are
+        compacted
+
+    :return: the number of days compacted
+    """
+    db.execute(CHUNK_TABLE)
+    if is_compact(db):
+        table = 'measurements_compact'
+    else:
+        db.execute(MEASUREMENT_TABLE)
+        table = 'measurements'
+    ret = db.execute(
+        f'SELECT DISTINCT timestamp / {SECONDS_PER_DAY} FROM {table} '
+        f'WHERE timestamp < ? ORDER BY 1',
+        (before // SECONDS_PER_DAY * SECONDS_PER_DAY,),
+    )
+    days = [day for day, in ret.fetchall()]
+
+    compacted = 0
+    for day in days:
+        start = day * SECONDS_PER_DAY
+        end = start + SECONDS_PER_DAY
+        cur = db.cursor()
+        cur.row_factory = None
+        with db:
+            cur.execute(_SELECT_DAY, (start, end))
+            try:
+                batch = MeasurementBatch(cur)
+            except (TypeError, ValueError) as e:
+                logger.warning('cannot compact day %s: %s', day, e)
+                continue
+
+            ret = cur.execute(
+                'SELECT data FROM measurement_chunks WHERE day = ?',
+                (day,),
+            )
+            existing = ret.fetchone()
+            if existing is not None:
+                # measurements inserted later replace the ones in the chunk
+                merged = MeasurementBatch()
+                merged.extend_columns(decode_chunk(existing[0]))
+                rows = {m.timestamp: m for m in merged}
+                rows.update((m.timestamp, m) for m in batch)
+                batch = MeasurementBatch(sorted(rows.values()))
+
+            timestamps = batch.column('timestamp')
+            db.execute(
+                'INSERT OR REPLACE INTO measurement_chunks'
+                '(day, first_timestamp, last_timestamp, count, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (
+                    day, timestamps[0], timestamps[-1], len(batch),
+                    encode_chunk(batch),
+                ),
+            )
+            db.execute(
+                f'DELETE FROM {table} WHERE timestamp >= ? AND timestamp < ?',
+                (start, end),
+            )
+        logger.info('compacted %s measurements of day %s', len(batch), day)
+        compacted += 1
+    return compacted
+
+
+def select_range(
+        db: sqlite3.Connection,
+        start: int,
+        end: int | None = None,
+        limit: int | None = None,
+) -> MeasurementBatch:
+    """Select the measurements with ``start < timestamp <= end`` from the
+    ``measurements`` table and the chunks created by :func:`compact_days`,
+    which are decoded transparently.
+
+    :param db: an open connection to the sqlite database
+    :param start: unix timestamp (UTC) after which to get data
+    :param end: optional - unix timestamp (UTC) up to which to get data
+    :param limit: optional - only select the first ``limit`` measurements
+
+    :return: a batch of the measurements ordered by the timestamp
+    """
+    stop = _MAX_TIMESTAMP if end is None else end
+    batch = MeasurementBatch()
+    try:
+        chunks = db.execute(
+            'SELECT data FROM measurement_chunks '
+            'WHERE last_timestamp > ? AND first_timestamp <= ? ORDER BY day',
+            (start, stop),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # nothing was compacted yet
+        chunks = []
+    for data, in chunks:
+        columns = decode_chunk(data)
+        timestamps = columns['timestamp']
+        lo = bisect.bisect_right(timestamps, start)
+        hi = bisect.bisect_right(timestamps, stop)
+        batch.extend_columns(
+            {name: values[lo:hi] for name, values in columns.items()},
+        )
+        if limit is not None and len(batch) >= limit:
+            # a measurement after this one cannot be part of the result
+            stop = batch[limit - 1].timestamp
+            break
+
+    cur = db.cursor()
+    cur.row_factory = None
+    cur.execute(_SELECT_RANGE, (start, stop, -1 if limit is None else limit))
+    rows = MeasurementBatch(cur)
+    if not batch:
+        return rows
+    if rows and rows[0].timestamp <= batch[-1].timestamp:
+        # measurements were inserted into compacted days
+        merged = {m.timestamp: m for m in batch}
+        merged.update((m.timestamp, m) for m in rows)
+        batch = MeasurementBatch(sorted(merged.values()))
+    else:
+        batch.extend(rows)
+    return batch if limit is None else batch[:limit]
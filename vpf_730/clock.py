@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import math
+import time
+from datetime import datetime
+from datetime import timezone
+
+
+class Clock:
+    """Base class for the clocks used by :func:`vpf_730.logger.Logger`,
+    :func:`vpf_730.sender.Sender` and :func:`vpf_730.vpf_730.VPF730` for
+    getting the current time and sleeping.
+    """
+
+    def now(self) -> datetime:
+        """Get the current time
+
+        :return: the current time as a timezone-aware ``datetime`` in UTC
+        """
+        raise NotImplementedError
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep for ``seconds``
+
+        :param seconds: the number of seconds to sleep
+        """
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """A clock using the system time. This is the default."""
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """A clock that does not actually sleep, but advances its time instantly,
+    so e.g. months of operation of the logger can be simulated in minutes.
+
+    The run loops poll the time many times per second. To not waste time on
+    polling, every sleep advances the clock to the next multiple of
+    ``resolution`` seconds (since the epoch). With the default of ``1``
+    second, every scheduled second is still observed, but there is only one
+    iteration per second.
+
+    .. code-block:: python
+
+        clock = VirtualClock(start=datetime(2023, 1, 1, tzinfo=timezone.utc))
+        logger = Logger(cfg=cfg, clock=clock)
+
+    :param start: the time the clock starts at, must be timezone-aware
+    :param resolution: the sleeps are aligned to multiples of ``resolution``
+        seconds, ``0`` disables the alignment
+    """
+
+    def __init__(self, start: datetime, resolution: float = 1) -> None:
+        if start.tzinfo is None:
+            raise ValueError('start must be a timezone-aware datetime')
+        self._now = start.timestamp()
+        self.resolution = resolution
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._now, tz=timezone.utc)
+
+    def timestamp(self) -> float:
+        """Get the current time as a unix timestamp, this is cheaper than
+        :func:`now`.
+        """
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        target = self._now + seconds
+        if self.resolution:
+            target = math.ceil(target / self.resolution) * self.resolution
+        self._now = target
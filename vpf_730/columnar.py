@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import os
+import struct
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        'the columnar store requires numpy, install it using: '
+        'pip install vpf-730[numpy]',
+    ) from e
+
+from vpf_730.vectorized import MEASUREMENT_DTYPE
+
+COLUMN_SUFFIX = '.npy'
+# the size of the .npy header, which is rewritten in place after appending.
+# It is padded with spaces, so the shape always fits
+HEADER_SIZE = 128
+# the number of measurements copied from the local database at once
+SYNC_BATCH = 262144
+
+
+class ColumnarStoreError(Exception):
+    """Exception that is raised when the files of the store are not
+    consistent
+    """
+    pass
+
+
+def _header(dtype: np.dtype[np.generic], length: int) -> bytes:
+    header = repr({
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (length,),
+    }).encode('latin1')
+    # magic string and version, followed by the length of the header
+    magic = np.lib.format.magic(1, 0)
+    header = header.ljust(HEADER_SIZE - len(magic) - 3) + b'\n'
+    return magic + struct.pack('<H', len(header)) + header
+
+
+def _read_length(path: str) -> int:
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        if f.tell() != HEADER_SIZE:
+            raise ColumnarStoreError(f'unexpected header size of {path}')
+    length, = shape
+    return int(length)
+
+
+class ColumnarStore:
+    """A column-oriented copy of the measurements for analyses spanning many
+    years. Every field is stored in its own ``.npy`` file in ``directory``,
+    which can be memory-mapped. Hence reading a time range only touches the
+    pages of the fields and rows needed and processes reading the same store
+    share these pages via the page cache.
+
+    The store is append-only and ordered by the timestamp. New measurements
+    are appended to the end of every file, before the shape in the header is
+    updated. The ``timestamp`` file is updated last, hence it defines the
+    number of measurements in the store. Data appended after it, e.g. when
+    appending was interrupted, is ignored and overwritten by the next append.
+
+    .. code-block:: python
+
+        store = ColumnarStore('columnar')
+        store.sync('vpf_730_local.db')
+        data = store.range(start=1672531200, end=1704067200)
+        print(data['temp'].mean())
+
+    :param directory: the directory the column files are stored in
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._columns: dict[str, npt.NDArray[np.generic]] = {}
+        self._length = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}{COLUMN_SUFFIX}')
+
+    def __len__(self) -> int:
+        try:
+            return _read_length(self._path('timestamp'))
+        except FileNotFoundError:
+            return 0
+
+    def _mapped(self) -> dict[str, npt.NDArray[np.generic]]:
+        length = len(self)
+        if length != self._length or not self._columns:
+            # the files grew, so they are mapped again
+            self._columns = {}
+            names = MEASUREMENT_DTYPE.names or ()
+            for name in names if length else ():
+                path = self._path(name)
+                if not os.path.exists(path):
+                    raise ColumnarStoreError(f'missing column file: {path}')
+                self._columns[name] = np.load(path, mmap_mode='r')
+            self._length = length
+        return self._columns
+
+    def column(self, name: str) -> npt.NDArray[np.generic]:
+        """Get all values of a single field, without reading them
+
+        :param name: the name of the field e.g. ``temp``
+
+        :return: a read-only memory-mapped array
+        """
+        return self._slice(name, self._mapped(), slice(None))
+
+    def _slice(
+            self,
+            name: str,
+            columns: dict[str, npt.NDArray[np.generic]],
+            rng: slice,
+    ) -> npt.NDArray[np.generic]:
+        if name not in (MEASUREMENT_DTYPE.names or ()):
+            raise KeyError(f'unknown field: {name!r}')
+        if name not in columns:
+            return np.empty(0, dtype=MEASUREMENT_DTYPE[name])
+        # the file may contain data of an interrupted append after the end
+        return columns[name][:self._length][rng]
+
+    def range(
+            self,
+            start: int,
+            end: int | None = None,
+    ) -> dict[str, npt.NDArray[np.generic]]:
+        """Get the measurements with ``start <= timestamp < end``. The range
+        is found using a binary search of the timestamps and the values are
+        zero-copy slices of the memory-mapped files.
+
+        :param start: unix timestamp (UTC), the start of the range
+        :param end: optional - unix timestamp (UTC), the (exclusive) end of
+            the range
+
+        :return: a read-only array of the values of every field by its name
+        """
+        columns = self._mapped()
+        timestamps = self._slice('timestamp', columns, slice(None))
+        lo = int(np.searchsorted(timestamps, start, side='left'))
+        if end is None:
+            hi = len(timestamps)
+        else:
+            hi = int(np.searchsorted(timestamps, end, side='left'))
+        return {
+            name: self._slice(name, columns, slice(lo, hi))
+            for name in MEASUREMENT_DTYPE.names or ()
+        }
+
+    def append(self, data: npt.NDArray[np.void]) -> int:
+        """Append measurements to the end of the store
+
+        :param data: a structured array with the dtype
+            :const:`vpf_730.vectorized.MEASUREMENT_DTYPE`, ordered by the
+            timestamp and newer than the last measurement in the store
+
+        :return: the number of measurements appended
+        """
+        if len(data) == 0:
+            return 0
+        timestamps = data['timestamp']
+        last = self.column('timestamp')[-1:]
+        if (
+                np.any(timestamps[1:] <= timestamps[:-1]) or
+                (len(last) and timestamps[0] <= last[0])
+        ):
+            raise ValueError(
+                'measurements must be ordered by the timestamp and newer '
+                'than the last one in the store',
+            )
+
+        os.makedirs(self.directory, exist_ok=True)
+        length = len(self)
+        # files that are mapped cannot be truncated on some platforms
+        self._columns = {}
+        names = [n for n in MEASUREMENT_DTYPE.names or () if n != 'timestamp']
+        for name in (*names, 'timestamp'):
+            dtype = MEASUREMENT_DTYPE[name]
+            path = self._path(name)
+            with open(path, 'ab+') as f:
+                if f.tell() == 0 and length == 0:
+                    f.write(_header(dtype, 0))
+                elif f.tell() == 0 or _read_length(path) < length:
+                    raise ColumnarStoreError(
+                        f'{path} contains less than {length} measurements',
+                    )
+                # remove data of an interrupted append
+                f.truncate(HEADER_SIZE + length * dtype.itemsize)
+            with open(path, 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(data[name], dtype=dtype).data)
+                f.flush()
+                f.seek(0)
+                f.write(_header(dtype, length + len(data)))
+        return len(data)
+
+    def sync(self, db_path: str | os.PathLike[str]) -> int:
+        """Append all measurements of the local database newer than the last
+        one in the store, in batches of :const:`SYNC_BATCH`.
+
+        :param db_path: path to the sqlite database, which may contain
+            ``{month}``
+
+        :return: the number of measurements appended
+        """
+        from vpf_730.query import query
+
+        last = self.column('timestamp')[-1:]
+        start = int(last[0]) + 1 if len(last) else 0
+        timestamps = query(db_path, start=start, fields=())['timestamp']
+        appended = 0
+        for idx in range(0, len(timestamps), SYNC_BATCH):
+            batch = timestamps[idx:idx + SYNC_BATCH]
+            data = query(
+                db_path,
+                start=int(batch[0]),
+                end=int(batch[-1]) + 1,
+            )
+            appended += self.append(data)
+        return appended
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import logging
+import queue
+import sqlite3
+import threading
+from collections import deque
+from collections.abc import Sequence
+from datetime import datetime
+from typing import NamedTuple
+
+from vpf_730.archive import open_archive
+from vpf_730.clock import Clock
+from vpf_730.clock import SystemClock
+from vpf_730.logger import LoggerConfig
+from vpf_730.logger import MAINTENANCE_SECOND
+from vpf_730.metrics import DB_WRITE_SECONDS
+from vpf_730.metrics import MEASUREMENTS
+from vpf_730.metrics import ROWS_PENDING_UPLOAD
+from vpf_730.metrics import SCHEDULER_OVERRUNS
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import PartitionedDB
+from vpf_730.sender import MeasurementDict
+from vpf_730.sender import select_measurements
+from vpf_730.sender import select_partitioned
+from vpf_730.sender import Sender
+from vpf_730.sender import SenderConfig
+from vpf_730.sinks import FileSink
+from vpf_730.sinks import QueuedSink
+from vpf_730.sinks import SinkPipeline
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import INSERT_MEASUREMENT
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+from vpf_730.vpf_730 import VPF730
+
+logger = logging.getLogger(__name__)
+
+_scheduler_overruns = SCHEDULER_OVERRUNS.labels('daemon')
+
+
+class DaemonConfig(NamedTuple):
+    """A class representing the configuration of the daemon, running the
+    logger and the sender in a single process.
+
+    :param logger: the configuration of the logging part
+    :param sender: the configuration of the sending part
+    """
+    logger: LoggerConfig
+    sender: SenderConfig
+
+    @classmethod
+    def from_env(cls) -> DaemonConfig:
+        """Constructs a new :func:`DaemonConfig` from environment variables.
+        See :func:`LoggerConfig.from_env` and :func:`SenderConfig.from_env`
+        for the variables that need to be set.
+
+        :return: a new instance of :func:`DaemonConfig` created from
+            environment variables.
+        """
+        return cls(
+            logger=LoggerConfig.from_env(),
+            sender=SenderConfig.from_env(),
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> DaemonConfig:
+        """Constructs a new :func:`DaemonConfig` from a provided ``.ini``
+        config file, containing all keys of the logger and sender config:
+
+            .. code-block:: ini
+
+                [vpf_730]
+                local_db=local.db
+                serial_port=/dev/ttyS0
+                log_interval=1
+                send_interval=5
+                get_endpoint=https://api.example/com/vpf-730/status
+                post_endpoint=https://api.example/com/vpf-730/data
+                max_req_len=512
+                api_key=deadbeef
+
+        :param path: path to the ``.ini`` config file with the structure above
+
+        :return: a new instance of :func:`DaemonConfig` created from a config
+            file
+        """
+        return cls(
+            logger=LoggerConfig.from_file(path=path),
+            sender=SenderConfig.from_file(path=path),
+        )
+
+    @classmethod
+    def from_argparse(cls, args: argparse.Namespace) -> DaemonConfig:
+        """Constructs a new :func:`DaemonConfig` from an
+        :func:`argparse.Namespace`, created by the argument parser returned by
+        :func:`vpf_730.main.build_parser`.
+
+        :param args: arguments returned from the argument parser created by
+            :func:`vpf_730.main.build_parser`
+
+        :return: a new instance of :func:`DaemonConfig` created from CLI
+            arguments
+        """
+        return cls(
+            logger=LoggerConfig.from_argparse(args=args),
+            sender=SenderConfig.from_argparse(args=args),
+        )
+
+
+class Daemon:
+    """Run the logger and the sender in a single process, sharing one
+    scheduler and one database connection.
+
+    New measurements are stored in the local database and at the same time
+    handed to the sending part via an in-memory queue. The local database is
+    only read, when the remote is not known to be in sync e.g. after a start
+    or when sending failed and a backlog needs to be caught up. Hence it is
+    written to directly, whereas the other sinks run on their own threads
+    (see :mod:`vpf_730.sinks`).
+
+    Sending runs on its own thread as well, so a slow remote or catching up a
+    long backlog never delays taking the next measurement. When sending is
+    due while the previous upload is still running, it is done once that
+    finished.
+
+    :param cfg: the configuration of the daemon
+    :param clock: the clock used for scheduling and the timestamps of the
+        measurements, defaults to the system time (see :mod:`vpf_730.clock`)
+    :param sinks: additional sinks e.g. for a message broker, besides the
+        csv files configured by ``file_sink``
+    """
+
+    def __init__(
+            self,
+            cfg: DaemonConfig,
+            clock: Clock | None = None,
+            sinks: Sequence[QueuedSink] = (),
+    ) -> None:
+        self.cfg = cfg
+        self.clock = clock if clock is not None else SystemClock()
+        self.running = True
+        self.vpf_730 = VPF730(
+            port=cfg.logger.serial_port,
+            clock=self.clock,
+            archive=open_archive(cfg.logger.raw_archive),
+        )
+        self.sender = Sender(cfg=cfg.sender, clock=self.clock)
+        file_sinks = []
+        if cfg.logger.file_sink is not None:
+            file_sinks.append(
+                QueuedSink(
+                    FileSink(cfg.logger.file_sink),
+                    overflow='drop_oldest',
+                ),
+            )
+        self.sinks = SinkPipeline([*file_sinks, *sinks])
+        self.queue: deque[Measurement] = deque()
+        # timestamp of the latest measurement we know the remote has
+        self._synced_until: int | None = None
+        # ``True`` requests an upload and ``False`` stops the upload thread
+        self._uploads: queue.Queue[bool] = queue.Queue(maxsize=1)
+
+    @property
+    def _running(self) -> bool:
+        # this is a hack for being able to test this
+        return self.running  # pragma: no cover
+
+    def run(self) -> None:
+        with self.sinks:
+            local_db = self.cfg.logger.local_db
+            uploader = threading.Thread(
+                target=self._run_uploads,
+                name='vpf-730-upload',
+                daemon=True,
+            )
+            try:
+                if is_partitioned(local_db):
+                    with PartitionedDB(local_db) as partitioned_db:
+                        uploader.start()
+                        self._run(db=partitioned_db)
+                else:
+                    with connect(local_db) as db:
+                        db.execute(MEASUREMENT_TABLE)
+                        uploader.start()
+                        self._run(db=db)
+            finally:
+                if uploader.is_alive():
+                    self._uploads.put(False)
+                    uploader.join()
+
+    def _run_uploads(self) -> None:
+        # the connection of the logging thread cannot be used by this thread
+        local_db = self.cfg.logger.local_db
+        if is_partitioned(local_db):
+            with PartitionedDB(local_db) as partitioned_db:
+                self._upload(db=partitioned_db)
+        else:
+            with connect(local_db) as db:
+                self._upload(db=db)
+
+    def _upload(self, db: sqlite3.Connection | PartitionedDB) -> None:
+        while self._uploads.get():
+            try:
+                self.send(db=db)
+            except Exception:
+                # the error is logged, but the thread has to continue, since
+                # logging continues as well
+                logger.exception('failed sending data')
+
+    def _run(self, db: sqlite3.Connection | PartitionedDB) -> None:
+        prev_log_minute = -1
+        prev_send_minute = -1
+        prev_maintenance_minute = -1
+        prev_now: datetime | None = None
+        while self._running is True:
+            self.clock.sleep(.1)
+            now = self.clock.now()
+            # we woke up too late, so a scheduled second may have been missed
+            if prev_now and (now - prev_now).total_seconds() > 1:
+                _scheduler_overruns.inc()
+            prev_now = now
+            if (
+                    now.second == MAINTENANCE_SECOND and
+                    now.minute != prev_maintenance_minute
+            ):
+                if isinstance(db, PartitionedDB):
+                    db.maintain()
+                self.sinks.maintain()
+                prev_maintenance_minute = now.minute
+            if now.second != 0:
+                continue
+
+            # logging comes first, so a new measurement can be sent right away
+            # when both intervals match
+            if (
+                    now.minute % self.cfg.logger.log_interval == 0 and
+                    now.minute != prev_log_minute
+            ):
+                self.log(db=db)
+                prev_log_minute = now.minute
+
+            if (
+                    now.minute % self.cfg.sender.send_interval == 0 and
+                    now.minute != prev_send_minute
+            ):
+                # an upload is already due, if the previous one still runs
+                with contextlib.suppress(queue.Full):
+                    self._uploads.put_nowait(True)
+                prev_send_minute = now.minute
+
+    def log(self, db: sqlite3.Connection | PartitionedDB) -> None:
+        """Take a measurement, store it in the local database and queue it
+        for sending.
+
+        :param db: an open connection to the local database or the
+            partitioned local database
+        """
+        measurement = self.vpf_730.measure()
+        if measurement is not None:  # pragma: no branch
+            with DB_WRITE_SECONDS.time():
+                if isinstance(db, PartitionedDB):
+                    db.insert(measurement)
+                else:
+                    with db:
+                        db.execute(INSERT_MEASUREMENT, measurement._asdict())
+            MEASUREMENTS.inc()
+            self.queue.append(measurement)
+            self.sinks.put(measurement)
+
+    def send(self, db: sqlite3.Connection | PartitionedDB) -> None:
+        """Send all data the remote does not have yet. Queued measurements are
+        sent directly from memory, if the remote is in sync, otherwise the
+        data is read from the local database. Afterwards, old partitions are
+        pruned (see :func:`vpf_730.sender.Sender.prune`).
+
+        :param db: an open connection to the local database or the
+            partitioned local database
+        """
+        # take everything queued so far, if sending fails the local database
+        # still has it and is used for catching up the next time. New
+        # measurements may be queued by the logging thread in the meantime
+        queued = []
+        while self.queue:
+            queued.append(self.queue.popleft())
+        synced_until, self._synced_until = self._synced_until, None
+
+        last_date = self.sender.get_remote_timestamp()
+        data: list[MeasurementDict]
+        if last_date == synced_until:
+            # https://github.com/python/mypy/issues/8890
+            data = [
+                m._asdict()  # type: ignore[misc]
+                for m in queued if m.timestamp > last_date
+            ]
+        else:
+            logger.info('catching up data after %i from disk', last_date)
+            if isinstance(db, PartitionedDB):
+                data = select_partitioned(db=db, start=last_date)
+            else:
+                data = select_measurements(db=db, start=last_date)
+
+        ROWS_PENDING_UPLOAD.set(len(data))
+        self.sender.send(data=data)
+        self._synced_until = data[-1]['timestamp'] if data else last_date
+        self.sender.prune(sent_until=self._synced_until)
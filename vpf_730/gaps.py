@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import NamedTuple
+
+from vpf_730.chunks import CHUNK_TABLE
+from vpf_730.chunks import decode_chunk
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import is_compact
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+
+# the resolution of the index in seconds, one measurement per minute is
+# expected
+MINUTE = 60
+"""
+The coverage intervals, each from the first to the last minute (UTC) of
+consecutive minutes with at least one measurement. Intervals neither overlap
+nor touch, so there is a gap of at least one minute in between.
+"""
+COVERAGE_TABLE = '''\
+CREATE TABLE IF NOT EXISTS coverage(
+    first_minute INTEGER PRIMARY KEY,
+    last_minute INTEGER NOT NULL
+)
+'''
+_TRIGGER = 'measurements_coverage'
+# the interval starting at or before the minute of the new measurement
+_PREVIOUS = (
+    '(SELECT max(first_minute) FROM coverage WHERE first_minute <= {m})'
+)
+# the islands of consecutive minutes with measurements, where the difference
+# between the minute and its rank is the same
+_ISLANDS = f'''\
+SELECT min(minute), max(minute) FROM (
+    SELECT minute, minute / {MINUTE} - row_number() OVER (ORDER BY minute)
+        AS island
+    FROM (
+        SELECT DISTINCT timestamp - timestamp % {MINUTE} AS minute
+        FROM measurements WHERE timestamp >= ? AND timestamp < ?
+    )
+)
+GROUP BY island ORDER BY 1
+'''
+
+
+class Gap(NamedTuple):
+    """A range of minutes without measurements
+
+    :param start: unix timestamp (UTC) of the first missing minute
+    :param end: unix timestamp (UTC) of the first minute after the gap, which
+        is either the next minute with a measurement or the end of the range
+        queried
+    """
+    start: int
+    end: int
+
+    @property
+    def minutes(self) -> int:
+        """The number of missing minutes"""
+        return (self.end - self.start) // MINUTE
+
+
+def _trigger(table: str) -> str:
+    """A trigger adding the minute of a new measurement to the coverage. The
+    interval ending in the minute before is extended, otherwise a new
+    interval is inserted. Then the interval starting in the minute after is
+    merged into it. Every statement looks up a single interval by its
+    primary key.
+    """
+    m = f'(NEW.timestamp - NEW.timestamp % {MINUTE})'
+    previous = _PREVIOUS.format(m=m)
+    statements = (
+        f'UPDATE coverage SET last_minute = {m} '
+        f'WHERE first_minute = {previous} AND last_minute = {m} - {MINUTE}',
+        f'INSERT INTO coverage(first_minute, last_minute) SELECT {m}, {m} '
+        f'WHERE coalesce((SELECT last_minute FROM coverage '
+        f'WHERE first_minute = {previous}), {m} - {MINUTE}) < {m}',
+        f'UPDATE coverage SET last_minute = ('
+        f'SELECT last_minute FROM coverage '
+        f'WHERE first_minute = {m} + {MINUTE}) '
+        f'WHERE first_minute = {previous} AND last_minute = {m} AND EXISTS ('
+        f'SELECT 1 FROM coverage WHERE first_minute = {m} + {MINUTE})',
+        f'DELETE FROM coverage WHERE first_minute = {m} + {MINUTE} AND ('
+        f'SELECT last_minute FROM coverage WHERE first_minute = {previous}'
+        f') > {m}',
+    )
+    body = ';\n'.join(statements)
+    return (
+        f'CREATE TRIGGER IF NOT EXISTS {_TRIGGER} AFTER INSERT ON {table}\n'
+        f'BEGIN\n{body};\nEND'
+    )
+
+
+def _merge(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Merge overlapping and touching intervals"""
+    merged: list[tuple[int, int]] = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + MINUTE:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _intervals(
+        db: sqlite3.Connection,
+        start: int,
+        end: int,
+) -> list[tuple[int, int]]:
+    """Compute the coverage intervals of the minutes in ``[start, end)`` from
+    the ``measurements`` table and the chunks created by
+    :func:`vpf_730.chunks.compact_days`
+    """
+    try:
+        rows = db.execute(_ISLANDS, (start, end)).fetchall()
+    except sqlite3.OperationalError:
+        # nothing was stored yet
+        rows = []
+    intervals = [(first, last) for first, last in rows]
+    try:
+        chunks = db.execute(
+            'SELECT data FROM measurement_chunks '
+            'WHERE last_timestamp >= ? AND first_timestamp < ?',
+            (start, end),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # nothing was compacted yet
+        chunks = []
+    for data, in chunks:
+        for timestamp in decode_chunk(data)['timestamp']:
+            if start <= timestamp < end:
+                minute = timestamp - timestamp % MINUTE
+                intervals.append((minute, minute))
+    return _merge(intervals)
+
+
+def has_gap_index(db: sqlite3.Connection) -> bool:
+    """Check whether the database contains the gap index
+
+    :param db: an open connection to the sqlite database
+
+    :return: ``True`` if :func:`create_gap_index` was called for the
+        database
+    """
+    try:
+        db.execute('SELECT 1 FROM coverage LIMIT 0')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def create_gap_index(db: sqlite3.Connection) -> None:
+    """Create the ``coverage`` table and the trigger, which adds the minute of
+    every measurement inserted, and build it from the existing measurements.
+    Calling it again recreates the trigger, e.g. after
+    :func:`vpf_730.storage.migrate_db`.
+
+    :param db: an open connection to the sqlite database
+    """
+    new = not has_gap_index(db)
+    with db:
+        if is_compact(db):
+            table = 'measurements_compact'
+        else:
+            db.execute(MEASUREMENT_TABLE)
+            table = 'measurements'
+        db.execute(COVERAGE_TABLE)
+        db.execute(f'DROP TRIGGER IF EXISTS {_TRIGGER}')
+        db.execute(_trigger(table))
+    if new:
+        rebuild_gap_index(db)
+
+
+def drop_gap_index_trigger(db: sqlite3.Connection) -> None:
+    """Drop the trigger updating the gap index e.g. before bulk-inserting many
+    measurements. Afterwards the index must be rebuilt using
+    :func:`rebuild_gap_index` and the trigger recreated using
+    :func:`create_gap_index`.
+
+    :param db: an open connection to the sqlite database
+    """
+    db.execute(f'DROP TRIGGER IF EXISTS {_TRIGGER}')
+
+
+def rebuild_gap_index(db: sqlite3.Connection) -> int:
+    """Recompute the coverage from all measurements e.g. after measurements
+    were deleted, since the trigger only adds minutes. Days packed by
+    :func:`vpf_730.chunks.compact_days` stay covered.
+
+    :param db: an open connection to the sqlite database
+
+    :return: the number of coverage intervals
+    """
+    with db:
+        db.execute(CHUNK_TABLE)
+        intervals = _intervals(db, start=-2**62, end=2**62)
+        db.execute('DELETE FROM coverage')
+        db.executemany(
+            'INSERT INTO coverage(first_minute, last_minute) VALUES (?, ?)',
+            intervals,
+        )
+    return len(intervals)
+
+
+def find_gaps(db: sqlite3.Connection, start: int, end: int) -> list[Gap]:
+    """Find the minutes without measurements overlapping ``[start, end)``.
+    With the gap index (see :func:`create_gap_index`) only the coverage
+    intervals in the range are read, otherwise the measurements are scanned.
+
+    .. code-block:: python
+
+        with connect('vpf_730_local.db') as db:
+            for gap in find_gaps(db, start=1672531200, end=1704067200):
+                print(gap.start, gap.minutes)
+
+    :param db: an open connection to the sqlite database
+    :param start: unix timestamp (UTC), the start of the range
+    :param end: unix timestamp (UTC), the (exclusive) end of the range
+
+    :return: the gaps ordered by their start
+    """
+    lo = start - start % MINUTE
+    hi = end + -end % MINUTE
+    if has_gap_index(db):
+        intervals = db.execute(
+            f'SELECT first_minute, last_minute FROM coverage '
+            f'WHERE first_minute = {_PREVIOUS.format(m="?")} '
+            f'UNION ALL '
+            f'SELECT first_minute, last_minute FROM coverage '
+            f'WHERE first_minute > ? AND first_minute < ? '
+            f'ORDER BY first_minute',
+            (lo, lo, hi),
+        ).fetchall()
+    else:
+        intervals = _intervals(db, start=lo, end=hi)
+
+    gaps = []
+    minute = lo
+    for first, last in intervals:
+        if first > minute:
+            gaps.append(Gap(start=minute, end=min(first, hi)))
+        minute = max(minute, last + MINUTE)
+    if minute < hi:
+        gaps.append(Gap(start=minute, end=hi))
+    return gaps
+
+
+def find_partitioned_gaps(
+        db: PartitionedDB,
+        start: int,
+        end: int,
+) -> list[Gap]:
+    """Find the minutes without measurements overlapping ``[start, end)`` in a
+    database partitioned by month, see :func:`find_gaps`. Every partition is
+    queried separately and months without a partition are missing entirely.
+
+    :param db: the partitioned database
+    :param start: unix timestamp (UTC), the start of the range
+    :param end: unix timestamp (UTC), the (exclusive) end of the range
+
+    :return: the gaps ordered by their start
+    """
+    lo = start - start % MINUTE
+    hi = end + -end % MINUTE
+    gaps: list[Gap] = []
+    minute = lo
+    for partition in db.partitions():
+        if partition.end <= lo or partition.start >= hi:
+            continue
+        if minute < partition.start:
+            gaps.append(Gap(start=minute, end=partition.start))
+        with connect(partition.path) as conn:
+            gaps.extend(
+                find_gaps(
+                    conn,
+                    start=max(lo, partition.start),
+                    end=min(hi, partition.end),
+                ),
+            )
+        minute = min(hi, partition.end)
+    if minute < hi:
+        gaps.append(Gap(start=minute, end=hi))
+
+    # gaps spanning the end of a month
+    merged: list[Gap] = []
+    for gap in gaps:
+        if merged and merged[-1].end == gap.start:
+            merged[-1] = merged[-1]._replace(end=gap.end)
+        else:
+            merged.append(gap)
+    return merged
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from operator import itemgetter
+from typing import Any
+from typing import BinaryIO
+from typing import Literal
+from typing import NamedTuple
+
+from vpf_730.gaps import create_gap_index
+from vpf_730.gaps import drop_gap_index_trigger
+from vpf_730.gaps import has_gap_index
+from vpf_730.gaps import rebuild_gap_index
+from vpf_730.partitions import is_partitioned
+from vpf_730.rollups import create_rollups
+from vpf_730.rollups import drop_rollup_trigger
+from vpf_730.rollups import has_rollups
+from vpf_730.rollups import rebuild_rollups
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+logger = logging.getLogger(__name__)
+
+# the number of rows inserted per transaction
+DEFAULT_BATCH_SIZE = 50000
+IMPORT_TABLE = '''\
+CREATE TABLE IF NOT EXISTS imports(
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    size INTEGER NOT NULL
+)
+'''
+# the start of an import that dropped the triggers, until they are recreated,
+# so an import killed before recreating them is repaired by the next one
+IMPORT_RUNNING_TABLE = '''\
+CREATE TABLE IF NOT EXISTS import_running(
+    started INTEGER NOT NULL
+)
+'''
+# relaxed while importing, since an interrupted import is simply resumed. They
+# only apply to the connection of the import and are restored afterwards
+_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': '-262144',
+    'temp_store': 'MEMORY',
+}
+_INT_FIELDS = frozenset((
+    'timestamp',
+    'sensor_id',
+    'last_measurement_period',
+    'time_since_report',
+    'nr_precip_particles',
+))
+_STR_FIELDS = frozenset((
+    'precipitation_type_msg',
+    'obstruction_to_vision',
+    'self_test',
+))
+
+
+class ImportStats(NamedTuple):
+    """Statistics of an import
+
+    :param files: the number of files read
+    :param read: the number of lines read, excluding csv headers
+    :param failed: the number of lines that could not be parsed
+    :param inserted: the number of measurements inserted or replaced
+    :param seconds: the wall time the import took
+    """
+    files: int
+    read: int
+    failed: int
+    inserted: int
+    seconds: float
+
+    @property
+    def skipped(self) -> int:
+        """The number of measurements that were already stored"""
+        return self.read - self.failed - self.inserted
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds else float('inf')
+
+
+def _converter(name: str) -> Callable[[str], Any]:
+    if name in _STR_FIELDS:
+        # an empty string is a valid value e.g. no obstruction to vision
+        return lambda value: None if value == 'None' else value
+
+    convert = int if name in _INT_FIELDS else float
+    # the csv of a measurement read from the database may contain NULLs
+    return lambda value: None if value in ('', 'None') else convert(value)
+
+
+def _csv_parser(
+        header: bytes,
+        sep: str,
+) -> Callable[[bytes], tuple[Any, ...]]:
+    columns = header.decode().strip().split(sep)
+    missing = set(Measurement._fields) - set(columns)
+    if missing:
+        raise ValueError(
+            f'the csv header is missing the columns: '
+            f'{", ".join(sorted(missing))}',
+        )
+    # the columns may be in any order, additional ones are ignored
+    idx = [columns.index(name) for name in Measurement._fields]
+    converters = [_converter(name) for name in Measurement._fields]
+
+    def _parse(line: bytes) -> tuple[Any, ...]:
+        values = line.decode().rstrip('\r\n').split(sep)
+        if len(values) != len(columns):
+            raise ValueError(
+                f'expected {len(columns)} columns, got {len(values)}',
+            )
+        return tuple(
+            convert(values[i]) for i, convert in zip(idx, converters)
+        )
+
+    return _parse
+
+
+def _parse_raw(line: bytes) -> tuple[Any, ...]:
+    timestamp, _, msg = line.partition(b',')
+    m = Measurement.from_msg(msg=msg, timestamp=int(float(timestamp)))
+    return tuple(m)
+
+
+def _read_batches(
+        f: BinaryIO,
+        parse: Callable[[bytes], tuple[Any, ...]],
+        batch_size: int,
+) -> Iterator[tuple[list[tuple[Any, ...]], int, int]]:
+    """Parse the lines of a file from the current position
+
+    :return: the parsed rows of a batch ordered by the timestamp, the number
+        of lines that failed and the offset after the last complete line of
+        the batch
+    """
+    rows = []
+    failed = 0
+    offset = f.tell()
+    while True:
+        line = f.readline()
+        if line.strip():
+            try:
+                rows.append(parse(line))
+            except (ValueError, IndexError) as e:
+                failed += 1
+                logger.debug('failed parsing %r: %s', line, e)
+        # a last line without a newline may still be written, so it is read
+        # again when the import is resumed
+        if line.endswith(b'\n'):
+            offset = f.tell()
+        if not line or len(rows) + failed >= batch_size:
+            # inserting in the order of the primary key is the fastest
+            rows.sort(key=itemgetter(0))
+            yield rows, failed, offset
+            rows = []
+            failed = 0
+        if not line:
+            return
+
+
+def _resume_offset(
+        db: sqlite3.Connection,
+        f: BinaryIO,
+        path: str,
+        size: int,
+) -> int:
+    """The offset after the lines that were imported before, or ``0`` if the
+    file was not imported yet or was replaced in the meantime
+    """
+    ret = db.execute(
+        'SELECT offset, size FROM imports WHERE path = ?', (path,),
+    ).fetchone()
+    if ret is None:
+        return 0
+    offset, last_size = ret
+    if size < last_size or offset <= 0:
+        return 0
+    # the offset must be the start of a line, otherwise the file was replaced
+    f.seek(offset - 1)
+    if f.read(1) != b'\n':
+        logger.warning('%s changed since it was imported, restarting', path)
+        return 0
+    return offset
+
+
+def _import_file(
+        db: sqlite3.Connection,
+        path: str,
+        batch_size: int,
+        on_conflict: Literal['abort', 'ignore', 'replace'],
+        resume: bool,
+        sep: str,
+) -> Iterator[tuple[list[tuple[Any, ...]], int, int]]:
+    """Import a file, one transaction per batch
+
+    :return: the rows of a batch, the number of lines that failed and the
+        number of measurements inserted
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        parse: Callable[[bytes], tuple[Any, ...]]
+        # the lines of capture files start with the timestamp
+        if header[:1].isalpha():
+            parse = _csv_parser(header, sep=sep)
+            offset = f.tell()
+        else:
+            parse = _parse_raw
+            offset = 0
+        if resume:
+            offset = max(offset, _resume_offset(db, f, path=path, size=size))
+        f.seek(offset)
+
+        for rows, failed, offset in _read_batches(f, parse, batch_size):
+            with db:
+                inserted = insert_measurements(
+                    db,
+                    rows,
+                    on_conflict=on_conflict,
+                )
+                db.execute(
+                    'INSERT OR REPLACE INTO imports(path, offset, size) '
+                    'VALUES (?, ?, ?)',
+                    (path, offset, size),
+                )
+            yield rows, failed, inserted
+    logger.info('imported %s', path)
+
+
+def import_files(
+        sources: Sequence[str],
+        db_path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        on_conflict: Literal['abort', 'ignore', 'replace'] = 'ignore',
+        resume: bool = True,
+        sep: str = ',',
+) -> ImportStats:
+    """Import csv files written by :func:`vpf_730.vpf_730.Measurement.to_csv`
+    or capture files with one ``<unix timestamp>,<message>`` per line into
+    the ``measurements`` table. Files starting with a header are read as csv,
+    its columns may be in any order.
+
+    The lines are streamed, parsed in batches of ``batch_size`` and every
+    batch is bulk-inserted by :func:`vpf_730.storage.insert_measurements` in
+    its own transaction. The durability of the transactions is relaxed while
+    importing. The offset after the last imported line of every file is
+    stored in the ``imports`` table with the batch, so an interrupted import
+    is resumed where it stopped and a file that grew only has its new lines
+    imported. The trigger updating the rollups (see
+    :func:`vpf_730.rollups.create_rollups`) is dropped while importing and
+    the rollups of the imported range are rebuilt at once afterwards. The
+    same applies to the gap index, see :func:`vpf_730.gaps.create_gap_index`.
+
+    The local database can be imported into while the logger is running.
+    Since the triggers are missing meanwhile, the rollups from the start of
+    the import until it finished are rebuilt as well, which covers the
+    measurements the logger inserted. If the import is killed before the
+    triggers are recreated, the next import does this for the whole time
+    since the killed one was started.
+
+    .. code-block:: python
+
+        stats = import_files(['2022.csv', '2023.csv'], 'vpf_730_local.db')
+        print(f'{stats.rows_per_second:.0f} rows/s')
+
+    :param sources: paths to csv or capture files
+    :param db_path: path to the sqlite database
+    :param batch_size: the number of lines inserted per transaction
+    :param on_conflict: how to handle already stored measurements, see
+        :func:`vpf_730.storage.insert_measurements`. By default they are
+        skipped
+    :param resume: continue the import of files after the lines imported
+        before, otherwise they are imported from the start
+    :param sep: the separator used in the csv files
+
+    :return: the statistics of the import
+    """
+    if is_partitioned(db_path):
+        raise ValueError(
+            f'importing into a database partitioned by month is not '
+            f'supported, got: {db_path!r}',
+        )
+    t0 = time.perf_counter()
+    read = failed = inserted = 0
+    # the range of the imported measurements, whose rollups are rebuilt
+    lo: int | None = None
+    hi: int | None = None
+    started = int(time.time())
+    with connect(db_path) as db:
+        db.execute(IMPORT_TABLE)
+        db.execute(IMPORT_RUNNING_TABLE)
+        db.commit()
+        pragmas = {
+            name: db.execute(f'PRAGMA {name}').fetchone()[0]
+            for name in _PRAGMAS
+        }
+        rollups = has_rollups(db)
+        gap_index = has_gap_index(db)
+        try:
+            for name, value in _PRAGMAS.items():
+                db.execute(f'PRAGMA {name} = {value}')
+            with db:
+                killed, = db.execute(
+                    'SELECT min(started) FROM import_running',
+                ).fetchone()
+                if killed is not None:
+                    started = min(started, killed)
+                db.execute('DELETE FROM import_running')
+                db.execute(
+                    'INSERT INTO import_running(started) VALUES (?)',
+                    (started,),
+                )
+                if rollups:
+                    drop_rollup_trigger(db)
+                if gap_index:
+                    drop_gap_index_trigger(db)
+
+            for source in sources:
+                batches = _import_file(
+                    db,
+                    path=os.path.realpath(source),
+                    batch_size=batch_size,
+                    on_conflict=on_conflict,
+                    resume=resume,
+                    sep=sep,
+                )
+                for rows, nr_failed, nr_inserted in batches:
+                    read += len(rows) + nr_failed
+                    failed += nr_failed
+                    inserted += nr_inserted
+                    if rows:
+                        first, last = rows[0][0], rows[-1][0]
+                        lo = first if lo is None else min(lo, first)
+                        hi = last if hi is None else max(hi, last)
+        finally:
+            if rollups:
+                if lo is not None and hi is not None:
+                    rebuild_rollups(db, start=lo, end=hi + 1)
+                # the measurements inserted by others while importing
+                rebuild_rollups(db, start=started, end=int(time.time()) + 1)
+                create_rollups(db)
+            if gap_index:
+                create_gap_index(db)
+                rebuild_gap_index(db)
+            with db:
+                db.execute('DELETE FROM import_running')
+            for name, value in pragmas.items():
+                db.execute(f'PRAGMA {name} = {value}')
+
+    return ImportStats(
+        files=len(sources),
+        read=read,
+        failed=failed,
+        inserted=inserted,
+        seconds=time.perf_counter() - t0,
+    )
@@ -3,13 +3,26 @@ from __future__ import annotations
 import argparse
 import configparser
 import os
-import time
+from collections.abc import Sequence
 from datetime import datetime
-from datetime import timezone
 from typing import NamedTuple
 
+from vpf_730.archive import open_archive
+from vpf_730.clock import Clock
+from vpf_730.clock import SystemClock
+from vpf_730.metrics import SCHEDULER_OVERRUNS
+from vpf_730.sinks import DBSink
+from vpf_730.sinks import FileSink
+from vpf_730.sinks import QueuedSink
+from vpf_730.sinks import SinkPipeline
 from vpf_730.vpf_730 import VPF730
 
+_scheduler_overruns = SCHEDULER_OVERRUNS.labels('logger')
+
+# the sinks e.g. a partitioned local database are maintained at this second
+# of every minute, far away from the measurements taken at second 0
+MAINTENANCE_SECOND = 30
+
 
 class LoggerError(Exception):
     """Base class for errors raised by the logger"""
@@ -25,13 +38,21 @@ class LoggerConfig(NamedTuple):
     """A class representing the configuration of logger.
 
     :param local_db: path to the local sqlite database, where the measurements
-        are stored
+        are stored. If it contains ``{month}`` e.g. ``vpf_730_{month}.db``, one
+        file per month is used (see :func:`vpf_730.partitions.PartitionedDB`)
     :param serial_port: serial port that the VPF-730 sensor is connected to
     :param log_interval: the log interval in minutes (between 0 and 30)
+    :param raw_archive: optional - directory of a
+        :func:`vpf_730.archive.RawArchive` every raw message is appended to
+    :param file_sink: optional - directory the measurements are additionally
+        written to as csv files, one per day (see
+        :func:`vpf_730.sinks.FileSink`)
     """
     local_db: str
     serial_port: str
     log_interval: int
+    raw_archive: str | None = None
+    file_sink: str | None = None
 
     @classmethod
     def from_env(cls) -> LoggerConfig:
@@ -40,6 +61,8 @@ class LoggerConfig(NamedTuple):
         * ``VPF730_LOCAL_DB`` - path to the sqlite database which is used as  queue
         * ``VPF730_PORT`` - serial port that the VPF-730 sensor is connected to
         * ``VPF730_LOG_INTERVAL`` - interval used for logging e.g. 1 for every minute
+        * ``VPF730_RAW_ARCHIVE`` - optional directory to archive the raw messages in
+        * ``VPF730_FILE_SINK`` - optional directory to write daily csv files to
 
         :return: a new instance of :func:`LoggerConfig` created from
             environment variables.
@@ -48,6 +71,8 @@ class LoggerConfig(NamedTuple):
             local_db=os.environ['VPF730_LOCAL_DB'],
             serial_port=os.environ['VPF730_PORT'],
             log_interval=int(os.environ['VPF730_LOG_INTERVAL']),
+            raw_archive=os.environ.get('VPF730_RAW_ARCHIVE'),
+            file_sink=os.environ.get('VPF730_FILE_SINK'),
         )
 
     @classmethod
@@ -61,6 +86,9 @@ class LoggerConfig(NamedTuple):
                 local_db=local.db
                 serial_port=/dev/ttyS0
                 log_interval=1
+                # optional
+                raw_archive=raw
+                file_sink=export
 
         :param path: path to the ``.ini`` config file with the structure above
 
@@ -73,6 +101,8 @@ class LoggerConfig(NamedTuple):
             config['vpf_730']['local_db'],
             config['vpf_730']['serial_port'],
             int(config['vpf_730']['log_interval']),
+            config['vpf_730'].get('raw_archive'),
+            config['vpf_730'].get('file_sink'),
         )
 
     @classmethod
@@ -95,14 +125,63 @@ class LoggerConfig(NamedTuple):
             local_db=args.local_db,
             serial_port=args.serial_port,
             log_interval=args.log_interval,
+            raw_archive=getattr(args, 'raw_archive', None),
+            file_sink=getattr(args, 'file_sink', None),
         )
 
 
+def make_sinks(cfg: LoggerConfig) -> list[QueuedSink]:
+    """Create the sinks configured for the logger. The local database spills
+    to a file next to it when it cannot keep up (e.g. while it is locked by
+    another process), so no measurement is lost. The csv files drop the
+    oldest queued measurements, since they can be recreated from the local
+    database using ``vpf-730 export``.
+
+    :param cfg: the configuration of the logger
+
+    :return: the sinks, which are not started yet
+    """
+    sinks = [
+        QueuedSink(
+            DBSink(cfg.local_db),
+            overflow='spill',
+            spill_path=f'{os.fspath(cfg.local_db)}.spill',
+        ),
+    ]
+    if cfg.file_sink is not None:
+        sinks.append(
+            QueuedSink(FileSink(cfg.file_sink), overflow='drop_oldest'),
+        )
+    return sinks
+
+
 class Logger:
-    def __init__(self, cfg: LoggerConfig) -> None:
+    """Take a measurement every ``log_interval`` minutes and hand it to the
+    sinks (see :mod:`vpf_730.sinks`), which write it on their own threads,
+    so the next measurement is never delayed by a slow sink.
+
+    :param cfg: the configuration of the logger
+    :param clock: the clock used for scheduling and the timestamps of the
+        measurements, defaults to the system time (see :mod:`vpf_730.clock`)
+    :param sinks: additional sinks e.g. for a message broker, besides the
+        ones configured (see :func:`make_sinks`)
+    """
+
+    def __init__(
+            self,
+            cfg: LoggerConfig,
+            clock: Clock | None = None,
+            sinks: Sequence[QueuedSink] = (),
+    ) -> None:
         self.cfg = cfg
+        self.clock = clock if clock is not None else SystemClock()
         self.logging = True
-        self.vpf_730 = VPF730(port=cfg.serial_port)
+        self.vpf_730 = VPF730(
+            port=cfg.serial_port,
+            clock=self.clock,
+            archive=open_archive(cfg.raw_archive),
+        )
+        self.sinks = SinkPipeline([*make_sinks(cfg), *sinks])
 
     @property
     def _logging(self) -> bool:
@@ -110,10 +189,23 @@ class Logger:
         return self.logging  # pragma: no cover
 
     def run(self) -> None:
+        self.sinks.start()
+        try:
+            self._run()
+        finally:
+            self.sinks.close()
+
+    def _run(self) -> None:
         prev_minute = -1
+        prev_maintenance_minute = -1
+        prev_now: datetime | None = None
         while self._logging is True:
-            time.sleep(.1)
-            now = datetime.now(timezone.utc)
+            self.clock.sleep(.1)
+            now = self.clock.now()
+            # we woke up too late, so a scheduled second may have been missed
+            if prev_now and (now - prev_now).total_seconds() > 1:
+                _scheduler_overruns.inc()
+            prev_now = now
             # don't accidentally log the same timestamp twice
             if (
                     now.minute % self.cfg.log_interval == 0 and
@@ -122,6 +214,12 @@ class Logger:
             ):
                 measurement = self.vpf_730.measure()
                 if measurement is not None:  # pragma: no branch
-                    measurement.to_db(db_path=self.cfg.local_db)
+                    self.sinks.put(measurement)
 
                 prev_minute = now.minute
+            elif (
+                    now.second == MAINTENANCE_SECOND and
+                    now.minute != prev_maintenance_minute
+            ):
+                self.sinks.maintain()
+                prev_maintenance_minute = now.minute
@@ -7,30 +7,122 @@ import os
 import sys
 from argparse import RawDescriptionHelpFormatter
 from collections.abc import Sequence
+from contextlib import AbstractContextManager
+from contextlib import nullcontext
+
+loglevel = os.environ.get('VPF730_LOGLEVEL', logging.ERROR)
+logger = logging.getLogger(__name__)
+logger.setLevel(loglevel)
+hdlr = logging.StreamHandler(sys.stdout)
+logger.addHandler(hdlr)
 
-from vpf_730.logger import Logger
-from vpf_730.logger import LoggerConfig
-from vpf_730.sender import Sender
-from vpf_730.sender import SenderConfig
-from vpf_730.vpf_730 import VPF730
 
-# VPF730_SENTRY_DSN and VPF730_SENTRY_SAMPLE_RATE env var need to be set for
-# monitoring
-try:
-    import sentry_sdk
+def init_sentry() -> None:
+    """Initialize sentry for error monitoring, if the sentry SDK is installed.
+    This is only done for long-running commands, since importing and
+    initializing the SDK takes a considerable amount of time.
+    """
+    # VPF730_SENTRY_DSN and VPF730_SENTRY_SAMPLE_RATE env var need to be set
+    # for monitoring
+    try:
+        import sentry_sdk
+    except ImportError:  # pragma: no cover
+        return
+
     sample_rate = int(os.environ.get('VPF730_SENTRY_SAMPLE_RATE', 0))
     sentry_sdk.init(
         dsn=os.environ.get('VPF730_SENTRY_DSN'),
         traces_sample_rate=sample_rate,
     )
-except ImportError:  # pragma: no cover
-    pass
 
-loglevel = os.environ.get('VPF730_LOGLEVEL', logging.ERROR)
-logger = logging.getLogger(__name__)
-logger.setLevel(loglevel)
-hdlr = logging.StreamHandler(sys.stdout)
-logger.addHandler(hdlr)
+
+def add_metrics_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--metrics-port',
+        help=(
+            'Serve metrics in the Prometheus text format on '
+            'http://127.0.0.1:<port>/metrics. Can also be set via the '
+            'environment variable VPF730_METRICS_PORT'
+        ),
+        type=int,
+    )
+
+
+def start_metrics(port: int | None) -> None:
+    """Start the metrics endpoint in a background thread, if a port is set
+    via the CLI or the ``VPF730_METRICS_PORT`` environment variable.
+
+    :param port: the port passed via the CLI
+    """
+    if port is None:
+        if 'VPF730_METRICS_PORT' not in os.environ:
+            return
+        port = int(os.environ['VPF730_METRICS_PORT'])
+
+    from vpf_730.metrics import start_metrics_server
+    start_metrics_server(port=port)
+    logger.info('serving metrics on http://127.0.0.1:%i/metrics', port)
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser) -> None:
+    profiling = parser.add_argument_group('profiling')
+    profiling.description = (
+        'Periodically write profiles of the running process to a directory. '
+        'Only the newest files are kept'
+    )
+    profiling.add_argument(
+        '--cprofile',
+        help=(
+            'Periodically dump cProfile statistics of the run loop. Can also '
+            'be enabled via the environment variable VPF730_CPROFILE=1'
+        ),
+        action='store_true',
+    )
+    profiling.add_argument(
+        '--tracemalloc',
+        help=(
+            'Periodically take tracemalloc snapshots and write the top '
+            'allocations and the difference to the previous snapshot. Can '
+            'also be enabled via the environment variable VPF730_TRACEMALLOC=1'
+        ),
+        action='store_true',
+    )
+    profiling.add_argument(
+        '--profile-dir',
+        help=(
+            'Directory the profiles are written to (default: '
+            'vpf_730_profiles). Can also be set via the environment variable '
+            'VPF730_PROFILE_DIR'
+        ),
+    )
+    profiling.add_argument(
+        '--profile-interval',
+        help=(
+            'Interval in seconds between writing profiles (default: 3600). '
+            'Can also be set via the environment variable '
+            'VPF730_PROFILE_INTERVAL'
+        ),
+        type=float,
+    )
+
+
+def start_profiling(
+        args: argparse.Namespace,
+) -> AbstractContextManager[object]:
+    """Create a context manager profiling the enclosed block, if profiling is
+    enabled via the CLI or the environment variables.
+
+    :param args: the parsed arguments of a long-running command
+    """
+    from vpf_730.profiling import Profiler
+    from vpf_730.profiling import ProfilerConfig
+
+    cfg = ProfilerConfig.from_argparse(args=args)
+    if not cfg.enabled:
+        return nullcontext()
+
+    logger.info('writing profiles to %s', cfg.directory)
+    return Profiler(cfg=cfg)
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -86,12 +178,29 @@ def build_parser() -> argparse.ArgumentParser:
     logger_cli_config.add_argument(
         '--local-db',
         default='vpf_730_local.db',
-        help='Path to the local database',
+        help=(
+            'Path to the local database, use e.g. vpf_730_{month}.db for one '
+            'file per month'
+        ),
     )
     logger_cli_config.add_argument(
         '--serial-port',
         help='Serial port the VPF-730 sensor is connected to, e.g /dev/ttyS0',
     )
+    logger_cli_config.add_argument(
+        '--raw-archive',
+        help=(
+            'Directory to archive every raw message read from the sensor in, '
+            'compressed and rotated daily'
+        ),
+    )
+    logger_cli_config.add_argument(
+        '--file-sink',
+        help=(
+            'Directory to additionally write the measurements to as csv '
+            'files, one per day'
+        ),
+    )
     logger_cli_config.add_argument(
         '--log-interval',
         help=(
@@ -102,6 +211,8 @@ def build_parser() -> argparse.ArgumentParser:
         metavar='[1-30]',
         type=int,
     )
+    add_metrics_argument(logger_parser)
+    add_profiling_arguments(logger_parser)
     file_config = logger_parser.add_argument_group('config from file')
     file_config.description = (
         'Reads the configuration from a file and overrides all previous CLI '
@@ -117,6 +228,8 @@ def build_parser() -> argparse.ArgumentParser:
         '  - VPF730_LOCAL_DB\n'
         '  - VPF730_PORT\n'
         '  - VPF730_LOG_INTERVAL\n'
+        '  - VPF730_RAW_ARCHIVE (optional)\n'
+        '  - VPF730_FILE_SINK (optional)\n'
         'For variable descriptions see the CLI arguments above'
     )
 
@@ -132,7 +245,10 @@ def build_parser() -> argparse.ArgumentParser:
     sender_parser.add_argument(
         '--local-db',
         default='vpf_730_local.db',
-        help='Path to the local database',
+        help=(
+            'Path to the local database, use e.g. vpf_730_{month}.db for one '
+            'file per month'
+        ),
     )
     sender_parser.add_argument(
         '--send-interval',
@@ -170,6 +286,17 @@ def build_parser() -> argparse.ArgumentParser:
         default=512,
         type=int,
     )
+    sender_parser.add_argument(
+        '--retention-days',
+        help=(
+            'Delete the monthly partitions of the local database once they '
+            'were sent and are older than this number of days. Only used if '
+            'the --local-db contains {month}'
+        ),
+        type=int,
+    )
+    add_metrics_argument(sender_parser)
+    add_profiling_arguments(sender_parser)
     file_config = sender_parser.add_argument_group('config from file')
     file_config.description = (
         'Reads the configuration from a file and overrides all previous CLI '
@@ -188,15 +315,593 @@ def build_parser() -> argparse.ArgumentParser:
         '  - VPF730_POST_ENDPOINT\n'
         '  - VPF730_MAX_REQ_LEN\n'
         '  - VPF730_API_KEY\n'
+        '  - VPF730_RETENTION_DAYS (optional)\n'
         'For variable descriptions see the CLI arguments above'
     )
+
+    # set up the parser for running logger and sender in a single process
+    run_parser = subparsers.add_parser(
+        'run',
+        help=(
+            'Run the logger and the sender in a single process. New '
+            'measurements are handed to the sender in memory, the local '
+            'database is only read when catching up a backlog'
+        ),
+        formatter_class=RawDescriptionHelpFormatter,
+    )
+    run_cli_config = run_parser.add_argument_group('config from CLI')
+    run_cli_config.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help=(
+            'Path to the local database, use e.g. vpf_730_{month}.db for one '
+            'file per month'
+        ),
+    )
+    run_cli_config.add_argument(
+        '--serial-port',
+        help='Serial port the VPF-730 sensor is connected to, e.g /dev/ttyS0',
+    )
+    run_cli_config.add_argument(
+        '--raw-archive',
+        help=(
+            'Directory to archive every raw message read from the sensor in, '
+            'compressed and rotated daily'
+        ),
+    )
+    run_cli_config.add_argument(
+        '--file-sink',
+        help=(
+            'Directory to additionally write the measurements to as csv '
+            'files, one per day'
+        ),
+    )
+    run_cli_config.add_argument(
+        '--log-interval',
+        help=(
+            'the interval to be used for logging e.g. 1 for every minute '
+            '(minimum), 30 for 30 minutes (maximum)'
+        ),
+        default=1,
+        metavar='[1-30]',
+        type=int,
+    )
+    run_cli_config.add_argument(
+        '--send-interval',
+        help=(
+            'The interval in which data should be send to the remote server '
+            '1, every minute (minimum), 30 for 30 minutes (maximum)'
+        ),
+        metavar='[1-30]',
+        type=int,
+        default=5,
+    )
+    run_cli_config.add_argument(
+        '--get-endpoint',
+        help=(
+            'API endpoint to get the status of the remote server i.e. what is '
+            'the latest data e.g. https://api.example/com/vpf-730/status. The '
+            'API-Key must be provided as an environment variable '
+            'VPF730_API_KEY=mykey'
+        ),
+    )
+    run_cli_config.add_argument(
+        '--post-endpoint',
+        help=(
+            'API endpoint to send the data to e.g. '
+            'https://api.example/com/vpf-730/data. The API-Key must be '
+            'provided as an environment variable VPF730_API_KEY=mykey'
+        ),
+    )
+    run_cli_config.add_argument(
+        '--max-req-len',
+        help=(
+            'the maximum number of measurements that are allowed to be send '
+            'in a single request'
+        ),
+        default=512,
+        type=int,
+    )
+    run_cli_config.add_argument(
+        '--retention-days',
+        help=(
+            'Delete the monthly partitions of the local database once they '
+            'were sent and are older than this number of days. Only used if '
+            'the --local-db contains {month}'
+        ),
+        type=int,
+    )
+    add_metrics_argument(run_parser)
+    add_profiling_arguments(run_parser)
+    file_config = run_parser.add_argument_group('config from file')
+    file_config.description = (
+        'Reads the configuration from a file and overrides all previous CLI '
+        'options'
+    )
+    file_config.add_argument(
+        '-c', '--config',
+        help='Path to an .ini config file',
+    )
+    run_parser.epilog = (
+        'If no arguments are provided, the configuration will be read from '
+        'the environment variables of the logger and the sender.\n'
+        '  - VPF730_LOCAL_DB\n'
+        '  - VPF730_PORT\n'
+        '  - VPF730_LOG_INTERVAL\n'
+        '  - VPF730_RAW_ARCHIVE (optional)\n'
+        '  - VPF730_FILE_SINK (optional)\n'
+        '  - VPF730_SEND_INTERVAL\n'
+        '  - VPF730_GET_ENDPOINT\n'
+        '  - VPF730_POST_ENDPOINT\n'
+        '  - VPF730_MAX_REQ_LEN\n'
+        '  - VPF730_API_KEY\n'
+        '  - VPF730_RETENTION_DAYS (optional)\n'
+        'For variable descriptions see the CLI arguments above'
+    )
+
+    # set up the parser for the receiver
+    receiver_parser = subparsers.add_parser(
+        'receiver',
+        help=(
+            'Run a http server receiving and storing data sent by one or '
+            'many senders'
+        ),
+        formatter_class=RawDescriptionHelpFormatter,
+    )
+    receiver_parser.add_argument(
+        '--receiver-db',
+        help=(
+            'Path to the database the received data is stored in '
+            '(default: vpf_730_receiver.db)'
+        ),
+    )
+    receiver_parser.add_argument(
+        '--host',
+        help='The host the server binds to (default: 127.0.0.1)',
+    )
+    receiver_parser.add_argument(
+        '--port',
+        help='The port the server listens on (default: 5000)',
+        type=int,
+    )
+    file_config = receiver_parser.add_argument_group('config from file')
+    file_config.description = (
+        'Reads the configuration from a file and overrides all previous CLI '
+        'options'
+    )
+    file_config.add_argument(
+        '-c', '--config',
+        help='Path to an .ini config file',
+    )
+    receiver_parser.epilog = (
+        'The receiver serves the endpoints GET /vpf-730/status and '
+        'POST /vpf-730/data. The API-Key must be provided as an environment '
+        'variable VPF730_API_KEY=mykey.\n'
+        'If no arguments are provided, the configuration will be read from '
+        'the environment variables.\n'
+        '  - VPF730_RECEIVER_DB\n'
+        '  - VPF730_RECEIVER_HOST\n'
+        '  - VPF730_RECEIVER_PORT\n'
+        '  - VPF730_API_KEY\n'
+        'For variable descriptions see the CLI arguments above'
+    )
+    # set up the parser for the simulator
+    simulate_parser = subparsers.add_parser(
+        'simulate',
+        help=(
+            'Simulate a VPF-730 sensor on a pseudo-terminal for testing the '
+            'logger without a sensor'
+        ),
+    )
+    simulate_parser.add_argument(
+        '--sensor-id',
+        help='The sensor id sent in the messages (default: %(default)s)',
+        type=int,
+        default=1,
+    )
+    simulate_parser.add_argument(
+        '--automatic',
+        help=(
+            'Start with automatic message transmission enabled, like after '
+            'sending OSAM1 to the sensor'
+        ),
+        action='store_true',
+    )
+    simulate_parser.add_argument(
+        '--interval',
+        help=(
+            'Interval in seconds between automatic messages '
+            '(default: %(default)s)'
+        ),
+        type=float,
+        default=60,
+    )
+    simulate_parser.add_argument(
+        '--speedup',
+        help=(
+            'Factor to accelerate the automatic messages e.g. 60 sends a '
+            'message every second with an interval of 60 '
+            '(default: %(default)s)'
+        ),
+        type=float,
+        default=1,
+    )
+    simulate_parser.add_argument(
+        '--garbled-rate',
+        help='Probability of a message containing garbage (default: 0)',
+        type=float,
+        default=0,
+    )
+    simulate_parser.add_argument(
+        '--partial-rate',
+        help=(
+            'Probability of a message being cut off without the trailing '
+            'line break (default: 0)'
+        ),
+        type=float,
+        default=0,
+    )
+    simulate_parser.add_argument(
+        '--timeout-rate',
+        help='Probability of not answering a poll at all (default: 0)',
+        type=float,
+        default=0,
+    )
+    simulate_parser.add_argument(
+        '--seed',
+        help='Seed to make the messages and faults reproducible',
+        type=int,
+    )
+
+    # set up the parser for replaying raw messages
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help=(
+            'Parse captured raw messages again and store them in the local '
+            'database e.g. after a bug in the parser was fixed'
+        ),
+    )
+    replay_parser.add_argument(
+        'sources',
+        help=(
+            'Directories of a raw message archive (see --raw-archive of the '
+            'logger) or capture files with one <unix timestamp>,<message> per '
+            'line'
+        ),
+        nargs='+',
+    )
+    replay_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database',
+    )
+    replay_parser.add_argument(
+        '-j', '--jobs',
+        help='Number of worker processes (default: number of CPUs)',
+        type=int,
+    )
+    replay_parser.add_argument(
+        '--start',
+        help=(
+            'Only replay messages received at or after this unix timestamp '
+            '(UTC)'
+        ),
+        type=float,
+    )
+    replay_parser.add_argument(
+        '--end',
+        help='Only replay messages received before this unix timestamp (UTC)',
+        type=float,
+    )
+    replay_parser.add_argument(
+        '--on-conflict',
+        help=(
+            'How to handle measurements that are already stored '
+            '(default: %(default)s)'
+        ),
+        choices=('replace', 'ignore'),
+        default='replace',
+    )
+    replay_parser.add_argument(
+        '--gaps-only',
+        help=(
+            'Only replay messages received in minutes missing from the local '
+            'database'
+        ),
+        action='store_true',
+    )
+
+    # set up the parser for importing historic files
+    import_parser = subparsers.add_parser(
+        'import',
+        help=(
+            'Import csv files written by Measurement.to_csv or capture files '
+            'with one <unix timestamp>,<message> per line into the local '
+            'database'
+        ),
+    )
+    import_parser.add_argument(
+        'sources',
+        help='The csv or capture files to import',
+        nargs='+',
+    )
+    import_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database',
+    )
+    import_parser.add_argument(
+        '--batch-size',
+        help='Number of rows inserted per transaction (default: %(default)s)',
+        type=int,
+        default=50000,
+    )
+    import_parser.add_argument(
+        '--on-conflict',
+        help=(
+            'How to handle measurements that are already stored '
+            '(default: %(default)s)'
+        ),
+        choices=('ignore', 'replace'),
+        default='ignore',
+    )
+    import_parser.add_argument(
+        '--no-resume',
+        help=(
+            'Import the files from the start, instead of after the lines '
+            'imported before'
+        ),
+        action='store_true',
+    )
+
+    # set up the parser for converting the schema of the local database
+    migrate_parser = subparsers.add_parser(
+        'migrate-db',
+        help=(
+            'Convert the local database to the compact schema, which stores '
+            'the measurements as integers and takes less space, or back'
+        ),
+    )
+    migrate_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database',
+    )
+    migrate_parser.add_argument(
+        '--schema',
+        help='The schema to convert to (default: %(default)s)',
+        choices=('compact', 'plain'),
+        default='compact',
+    )
+
+    # set up the parser for packing old days of the local database
+    compact_days_parser = subparsers.add_parser(
+        'compact-days',
+        help=(
+            'Pack every complete day older than --older-than-days of the '
+            'local database into a single compressed row. This can run while '
+            'the logger is running e.g. once a day'
+        ),
+    )
+    compact_days_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    compact_days_parser.add_argument(
+        '--older-than-days',
+        type=int,
+        default=28,
+        help='Only compact days older than this (default: %(default)s)',
+    )
+    compact_days_parser.add_argument(
+        '--vacuum',
+        action='store_true',
+        help='Vacuum the database afterwards, so the file shrinks',
+    )
+
+    # set up the parser for the rollups of the local database
+    rollups_parser = subparsers.add_parser(
+        'rollups',
+        help=(
+            'Create the 10-minute, hourly and daily rollup tables of the '
+            'local database, which are updated whenever a measurement is '
+            'inserted, or rebuild them for a time range'
+        ),
+    )
+    rollups_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    rollups_parser.add_argument(
+        '--start',
+        help='Only rebuild rollups at or after this unix timestamp (UTC)',
+        type=int,
+    )
+    rollups_parser.add_argument(
+        '--end',
+        help='Only rebuild rollups before this unix timestamp (UTC)',
+        type=int,
+    )
+
+    # set up the parser for syncing the columnar store
+    sync_columnar_parser = subparsers.add_parser(
+        'sync-columnar',
+        help=(
+            'Append the new measurements of the local database to a '
+            'memory-mappable columnar store for analyses. This requires numpy'
+        ),
+    )
+    sync_columnar_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    sync_columnar_parser.add_argument(
+        '--store',
+        required=True,
+        help='Directory of the columnar store, created if it does not exist',
+    )
+
+    # set up the parser for listing the gaps in the local database
+    gaps_parser = subparsers.add_parser(
+        'gaps',
+        help='List the minutes without measurements in the local database',
+    )
+    gaps_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    gaps_parser.add_argument(
+        '--start',
+        help='Unix timestamp (UTC) to list the gaps from',
+        type=int,
+        required=True,
+    )
+    gaps_parser.add_argument(
+        '--end',
+        help='Unix timestamp (UTC) to list the gaps until (default: now)',
+        type=int,
+    )
+    gaps_parser.add_argument(
+        '--create-index',
+        help=(
+            'Create the gap index, which is updated on every insert and makes '
+            'listing gaps fast, or rebuild it'
+        ),
+        action='store_true',
+    )
+
+    # set up the parser for copying the local database
+    snapshot_parser = subparsers.add_parser(
+        'snapshot',
+        help=(
+            'Copy the local database for analyses while the logger keeps '
+            'writing to it'
+        ),
+    )
+    snapshot_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    snapshot_parser.add_argument(
+        '--dest',
+        required=True,
+        help=(
+            'Path to the snapshot, which must contain {month} if the local '
+            'database does'
+        ),
+    )
+    snapshot_parser.add_argument(
+        '--incremental',
+        help=(
+            'Only copy the partitions that changed or append the new '
+            'measurements to an existing snapshot'
+        ),
+        action='store_true',
+    )
+    snapshot_parser.add_argument(
+        '--pages',
+        help='Number of pages copied per step (default: %(default)s)',
+        type=int,
+        default=256,
+    )
+    snapshot_parser.add_argument(
+        '--sleep',
+        help='Seconds to sleep between two steps (default: %(default)s)',
+        type=float,
+        default=0.01,
+    )
+
+    # set up the parser for exporting the local database to files
+    export_parser = subparsers.add_parser(
+        'export',
+        help=(
+            'Export the measurements of the local database to csv or parquet '
+            'files rotated by time, continuing after the last export'
+        ),
+    )
+    export_parser.add_argument(
+        '--local-db',
+        default='vpf_730_local.db',
+        help='Path to the local database, which may contain {month}',
+    )
+    export_parser.add_argument(
+        '--dest',
+        required=True,
+        help='Directory of the files, created if it does not exist',
+    )
+    export_parser.add_argument(
+        '--format',
+        help=(
+            'Format of the files, parquet requires pyarrow '
+            '(default: %(default)s)'
+        ),
+        choices=('csv', 'parquet'),
+        default='csv',
+    )
+    export_parser.add_argument(
+        '--period',
+        help='Period covered by each file (default: %(default)s)',
+        choices=('hourly', 'daily'),
+        default='daily',
+    )
+    export_parser.add_argument(
+        '--since',
+        help=(
+            'Only export measurements after this unix timestamp (UTC) '
+            '(default: the newest measurement of the last export)'
+        ),
+        type=int,
+    )
+    export_parser.add_argument(
+        '--chunk-size',
+        help=(
+            'Number of measurements read from the database at once '
+            '(default: %(default)s)'
+        ),
+        type=int,
+        default=65536,
+    )
+
+    # set up the parser for merging the databases of many stations
+    merge_parser = subparsers.add_parser(
+        'merge',
+        help=(
+            'Merge the local databases of many stations into a central '
+            'archive partitioned by month, skipping measurements with the '
+            'same sensor_id and timestamp'
+        ),
+    )
+    merge_parser.add_argument(
+        'sources',
+        help='The local databases of the stations, which may contain {month}',
+        nargs='+',
+    )
+    merge_parser.add_argument(
+        '--archive',
+        required=True,
+        help='Path to the central archive, which must contain {month}',
+    )
+    merge_parser.add_argument(
+        '-j', '--jobs',
+        help='Number of worker processes (default: number of CPUs)',
+        type=int,
+    )
     return parser
 
 
 def main(argv: Sequence[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    # only import what is needed by the command, so e.g. comm starts fast
     if args.command == 'logger':
+        from vpf_730.logger import Logger
+        from vpf_730.logger import LoggerConfig
+
         if args.config:
             logger_cfg = LoggerConfig.from_file(path=args.config)
         elif args.serial_port:
@@ -204,16 +909,24 @@ def main(argv: Sequence[str] | None = None) -> int:
         else:
             logger_cfg = LoggerConfig.from_env()
 
+        init_sentry()
+        start_metrics(port=args.metrics_port)
         vpf_logger = Logger(cfg=logger_cfg)
-        try:
-            logger.info('starting logger with configuration: %s', logger_cfg)
-            vpf_logger.run()
-        except KeyboardInterrupt:
-            logger.info('logger received shutdown signal...')
-            vpf_logger.logging = False
-            return 0
+        with start_profiling(args=args):
+            try:
+                logger.info(
+                    'starting logger with configuration: %s', logger_cfg,
+                )
+                vpf_logger.run()
+            except KeyboardInterrupt:
+                logger.info('logger received shutdown signal...')
+                vpf_logger.logging = False
+                return 0
 
     elif args.command == 'sender':
+        from vpf_730.sender import Sender
+        from vpf_730.sender import SenderConfig
+
         if args.config:
             sender_cfg = SenderConfig.from_file(path=args.config)
         elif args.get_endpoint or args.post_endpoint:
@@ -229,15 +942,294 @@ def main(argv: Sequence[str] | None = None) -> int:
         else:
             sender_cfg = SenderConfig.from_env()
 
+        init_sentry()
+        start_metrics(port=args.metrics_port)
         sender = Sender(cfg=sender_cfg)
+        with start_profiling(args=args):
+            try:
+                logger.info(
+                    'starting sender with configuration: %s', sender_cfg,
+                )
+                sender.run()
+            except KeyboardInterrupt:
+                logger.info('sender received shutdown signal...')
+                sender.sending = False
+                return 0
+    elif args.command == 'run':
+        from vpf_730.daemon import Daemon
+        from vpf_730.daemon import DaemonConfig
+
+        if args.config:
+            daemon_cfg = DaemonConfig.from_file(path=args.config)
+        elif args.serial_port or args.get_endpoint or args.post_endpoint:
+            for arg in ('serial_port', 'get_endpoint', 'post_endpoint'):
+                if getattr(args, arg) is None:
+                    raise parser.error(
+                        f'must set --{arg.replace("_", "-")} when '
+                        f'configuring via CLI',
+                    )
+            daemon_cfg = DaemonConfig.from_argparse(args=args)
+        else:
+            daemon_cfg = DaemonConfig.from_env()
+
+        init_sentry()
+        start_metrics(port=args.metrics_port)
+        daemon = Daemon(cfg=daemon_cfg)
+        with start_profiling(args=args):
+            try:
+                logger.info(
+                    'starting daemon with configuration: %s', daemon_cfg,
+                )
+                daemon.run()
+            except KeyboardInterrupt:
+                logger.info('daemon received shutdown signal...')
+                daemon.running = False
+                return 0
+    elif args.command == 'receiver':
+        from vpf_730.receiver import Receiver
+        from vpf_730.receiver import ReceiverConfig
+
+        if args.config:
+            receiver_cfg = ReceiverConfig.from_file(path=args.config)
+        elif args.receiver_db or args.host or args.port is not None:
+            receiver_cfg = ReceiverConfig.from_argparse(args=args)
+        else:
+            receiver_cfg = ReceiverConfig.from_env()
+
+        receiver = Receiver(cfg=receiver_cfg)
         try:
-            logger.info('starting sender with configuration: %s', sender_cfg)
-            sender.run()
+            logger.info(
+                'starting receiver with configuration: %s', receiver_cfg,
+            )
+            receiver.run()
         except KeyboardInterrupt:
-            logger.info('sender received shutdown signal...')
-            sender.sending = False
+            logger.info('receiver received shutdown signal...')
             return 0
+    elif args.command == 'simulate':
+        import time
+
+        from vpf_730.simulator import Simulator
+        from vpf_730.simulator import SimulatorConfig
+
+        simulator = Simulator(cfg=SimulatorConfig.from_argparse(args=args))
+        with simulator:
+            # printed, so the port can be passed to e.g. vpf-730 logger
+            print(simulator.port, flush=True)
+            try:
+                while simulator.running:
+                    time.sleep(.5)
+            except KeyboardInterrupt:
+                logger.info('simulator received shutdown signal...')
+                return 0
+    elif args.command == 'replay':
+        from vpf_730.replay import replay
+
+        stats = replay(
+            sources=args.sources,
+            db_path=args.local_db,
+            jobs=args.jobs,
+            start=args.start,
+            end=args.end,
+            on_conflict=args.on_conflict,
+            gaps_only=args.gaps_only,
+        )
+        print(
+            f'replayed {stats.read} messages in {stats.seconds:.1f} s '
+            f'({stats.messages_per_second:,.0f} messages/s): '
+            f'{stats.inserted} stored, {stats.failed} failed to parse',
+        )
+    elif args.command == 'import':
+        from vpf_730.importer import import_files
+
+        import_stats = import_files(
+            sources=args.sources,
+            db_path=args.local_db,
+            batch_size=args.batch_size,
+            on_conflict=args.on_conflict,
+            resume=not args.no_resume,
+        )
+        print(
+            f'imported {import_stats.read:,} rows of {import_stats.files} '
+            f'files in {import_stats.seconds:.1f} s '
+            f'({import_stats.rows_per_second:,.0f} rows/s): '
+            f'{import_stats.inserted:,} stored, {import_stats.skipped:,} '
+            f'already stored, {import_stats.failed:,} failed to parse',
+        )
+    elif args.command == 'migrate-db':
+        from vpf_730.storage import migrate_db
+
+        if migrate_db(db_path=args.local_db, schema=args.schema):
+            print(
+                f'converted {args.local_db} to the {args.schema} schema '
+                f'({os.path.getsize(args.local_db):,} bytes)',
+            )
+        else:
+            print(f'{args.local_db} already uses the {args.schema} schema')
+    elif args.command == 'compact-days':
+        import time
+
+        from vpf_730.chunks import compact_days
+        from vpf_730.partitions import is_partitioned
+        from vpf_730.partitions import PartitionedDB
+        from vpf_730.utils import connect
+
+        if is_partitioned(args.local_db):
+            paths = [p.path for p in PartitionedDB(args.local_db).partitions()]
+        else:
+            paths = [args.local_db]
+
+        before = int(time.time()) - args.older_than_days * 24 * 60 * 60
+        for path in paths:
+            with connect(path) as db:
+                days = compact_days(db, before=before)
+                if args.vacuum:
+                    db.execute('VACUUM')
+            print(
+                f'compacted {days} days of {path} '
+                f'({os.path.getsize(path):,} bytes)',
+            )
+    elif args.command == 'rollups':
+        from vpf_730.partitions import is_partitioned
+        from vpf_730.partitions import PartitionedDB
+        from vpf_730.rollups import create_rollups
+        from vpf_730.rollups import has_rollups
+        from vpf_730.rollups import rebuild_rollups
+        from vpf_730.utils import connect
+
+        if is_partitioned(args.local_db):
+            paths = [p.path for p in PartitionedDB(args.local_db).partitions()]
+        else:
+            paths = [args.local_db]
+
+        for path in paths:
+            with connect(path) as db:
+                if has_rollups(db):
+                    buckets = rebuild_rollups(
+                        db, start=args.start, end=args.end,
+                    )
+                    print(f'rebuilt {buckets} 10-minute rollups of {path}')
+                else:
+                    create_rollups(db)
+                    print(f'created the rollups of {path}')
+    elif args.command == 'sync-columnar':
+        from vpf_730.columnar import ColumnarStore
+
+        store = ColumnarStore(args.store)
+        appended = store.sync(args.local_db)
+        print(
+            f'appended {appended:,} measurements to {args.store} '
+            f'({len(store):,} in total)',
+        )
+    elif args.command == 'gaps':
+        import time
+        from datetime import datetime
+        from datetime import timezone
+
+        from vpf_730.gaps import create_gap_index
+        from vpf_730.gaps import find_gaps
+        from vpf_730.gaps import find_partitioned_gaps
+        from vpf_730.gaps import has_gap_index
+        from vpf_730.gaps import rebuild_gap_index
+        from vpf_730.partitions import is_partitioned
+        from vpf_730.partitions import PartitionedDB
+        from vpf_730.utils import connect
+
+        end = int(time.time()) if args.end is None else args.end
+        if is_partitioned(args.local_db):
+            partitioned = PartitionedDB(args.local_db)
+            paths = [p.path for p in partitioned.partitions()]
+        else:
+            paths = [args.local_db]
+
+        if args.create_index:
+            for path in paths:
+                with connect(path) as db:
+                    if has_gap_index(db):
+                        rebuild_gap_index(db)
+                    else:
+                        create_gap_index(db)
+
+        if is_partitioned(args.local_db):
+            gaps = find_partitioned_gaps(partitioned, args.start, end)
+        else:
+            with connect(args.local_db) as db:
+                gaps = find_gaps(db, start=args.start, end=end)
+        for gap in gaps:
+            gap_start = datetime.fromtimestamp(gap.start, tz=timezone.utc)
+            gap_end = datetime.fromtimestamp(gap.end, tz=timezone.utc)
+            print(
+                f'{gap_start:%Y-%m-%d %H:%M} - {gap_end:%Y-%m-%d %H:%M} UTC: '
+                f'{gap.minutes:,} minutes',
+            )
+        print(
+            f'{len(gaps)} gaps, {sum(g.minutes for g in gaps):,} minutes '
+            f'missing',
+        )
+    elif args.command == 'snapshot':
+        from vpf_730.snapshot import snapshot
+
+        snapshot_stats = snapshot(
+            db_path=args.local_db,
+            dest=args.dest,
+            incremental=args.incremental,
+            pages=args.pages,
+            sleep=args.sleep,
+        )
+        print(
+            f'took a snapshot of {args.local_db} in '
+            f'{snapshot_stats.seconds:.1f} s: {snapshot_stats.copied} files '
+            f'copied, {snapshot_stats.skipped} unchanged, '
+            f'{snapshot_stats.appended:,} measurements appended',
+        )
+    elif args.command == 'export':
+        from vpf_730.sinks import export
+        from vpf_730.sinks import FileSink
+        from vpf_730.sinks import PERIODS
+
+        with FileSink(
+                args.dest,
+                format=args.format,
+                period=PERIODS[args.period],
+        ) as sink:
+            export_stats = export(
+                db_path=args.local_db,
+                sink=sink,
+                since=args.since,
+                chunk_size=args.chunk_size,
+            )
+        print(
+            f'exported {export_stats.exported:,} measurements to {args.dest} '
+            f'in {export_stats.seconds:.1f} s '
+            f'({export_stats.rows_per_second:,.0f} rows/s), watermark: '
+            f'{export_stats.watermark}',
+        )
+    elif args.command == 'merge':
+        from vpf_730.merge import merge
+        from vpf_730.merge import MergeStats
+
+        def _progress(stats: MergeStats, total: int) -> None:
+            print(
+                f'[{stats.tasks}/{total}] {stats.read:,} read, '
+                f'{stats.inserted:,} new ({stats.rows_per_second:,.0f} '
+                f'rows/s)',
+            )
+
+        merge_stats = merge(
+            sources=args.sources,
+            archive_path=args.archive,
+            jobs=args.jobs,
+            progress=_progress,
+        )
+        print(
+            f'merged {merge_stats.read:,} measurements of '
+            f'{merge_stats.sources} databases in {merge_stats.seconds:.1f} s '
+            f'({merge_stats.rows_per_second:,.0f} rows/s): '
+            f'{merge_stats.inserted:,} stored, {merge_stats.duplicates:,} '
+            f'duplicates',
+        )
     elif args.command == 'comm':
+        from vpf_730.vpf_730 import VPF730
+
         if args.config:
             config = configparser.ConfigParser()
             config.read(args.config)
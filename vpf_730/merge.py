@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+from collections.abc import Sequence
+from operator import itemgetter
+from typing import Any
+from typing import NamedTuple
+
+from vpf_730.chunks import select_range
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import MONTH_PLACEHOLDER
+from vpf_730.partitions import PartitionedDB
+from vpf_730.receiver import INSERT_OR_IGNORE
+from vpf_730.receiver import RECEIVER_TABLE
+from vpf_730.receiver import RECEIVER_TIMESTAMP_IDX
+from vpf_730.utils import connect
+from vpf_730.utils import process_map
+
+logger = logging.getLogger(__name__)
+
+
+class MergeTask(NamedTuple):
+    """One month of a source database, that is read by a single worker
+    process
+
+    :param path: path to the source database
+    :param start: unix timestamp (UTC) of the first second of the month
+    :param end: unix timestamp (UTC) of the first second of the next month
+    """
+    path: str
+    start: int
+    end: int
+
+
+class MergeChunk(NamedTuple):
+    """The result of a :func:`MergeTask`
+
+    :param task: the task that was run
+    :param rows: the measurements as tuples ordered by ``sensor_id`` and
+        ``timestamp``
+    """
+    task: MergeTask
+    rows: list[tuple[Any, ...]]
+
+
+class MergeStats(NamedTuple):
+    """Statistics of a merge
+
+    :param sources: the number of source databases
+    :param tasks: the number of months of a source database merged
+    :param read: the number of measurements read from the sources
+    :param inserted: the number of measurements that were not in the archive
+        yet
+    :param seconds: the wall time the merge took
+    """
+    sources: int
+    tasks: int
+    read: int
+    inserted: int
+    seconds: float
+
+    @property
+    def duplicates(self) -> int:
+        """The number of measurements that were already in the archive"""
+        return self.read - self.inserted
+
+    @property
+    def rows_per_second(self) -> float:
+        """The number of measurements read per second"""
+        return self.read / self.seconds if self.seconds else 0.0
+
+
+def _time_range(db_path: str) -> tuple[int, int] | None:
+    """The first and last timestamp of the measurements, including days
+    packed by :func:`vpf_730.chunks.compact_days`
+    """
+    ranges = []
+    with connect(db_path) as db:
+        for query in (
+                'SELECT min(timestamp), max(timestamp) FROM measurements',
+                'SELECT min(first_timestamp), max(last_timestamp) '
+                'FROM measurement_chunks',
+        ):
+            with contextlib.suppress(sqlite3.OperationalError):
+                ranges.append(db.execute(query).fetchone())
+    ranges = [r for r in ranges if r[0] is not None]
+    if not ranges:
+        return None
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+def make_tasks(
+        sources: Sequence[str],
+        archive: PartitionedDB,
+) -> list[MergeTask]:
+    """Split the source databases into one task per month
+
+    :param sources: paths to the source databases, which may contain
+        ``{month}``
+    :param archive: the central archive, partitioned by month
+
+    :return: the tasks ordered by their month, so the archive is written to
+        partition by partition
+    """
+    paths: list[str] = []
+    for source in sources:
+        if is_partitioned(source):
+            paths.extend(p.path for p in PartitionedDB(source).partitions())
+        else:
+            paths.append(source)
+
+    tasks = []
+    for path in paths:
+        time_range = _time_range(path)
+        if time_range is None:
+            logger.info('%s does not contain any measurements', path)
+            continue
+        first, last = time_range
+        partition = archive.partition(first)
+        while partition.start <= last:
+            tasks.append(MergeTask(path, partition.start, partition.end))
+            partition = archive.partition(partition.end)
+    return sorted(tasks, key=itemgetter(1))
+
+
+def _merge_task(task: MergeTask) -> MergeChunk:
+    with connect(task.path) as db:
+        batch = select_range(db, start=task.start - 1, end=task.end - 1)
+    rows = [tuple(m) for m in batch]
+    # inserting in the order of the primary key is the fastest
+    rows.sort(key=itemgetter(1, 0))
+    return MergeChunk(task=task, rows=rows)
+
+
+def merge(
+        sources: Sequence[str],
+        archive_path: str,
+        jobs: int | None = None,
+        progress: Callable[[MergeStats, int], None] | None = None,
+) -> MergeStats:
+    """Merge the local databases of many stations into a central archive
+    partitioned by month. Like the database of the
+    :func:`vpf_730.receiver.Receiver`, the archive can store the
+    measurements of many sensors, so a measurement is a duplicate if one with
+    the same ``sensor_id`` and ``timestamp`` is already stored. Duplicates
+    are skipped, hence merging the same database again only adds what is
+    new.
+
+    The sources are split into one task per month (see :func:`make_tasks`),
+    which are read in parallel by a process pool, including days packed by
+    :func:`vpf_730.chunks.compact_days`. The current process is the only one
+    writing to the archive and bulk-inserts the measurements of a task in one
+    transaction.
+
+    .. code-block:: python
+
+        merge(
+            sources=glob.glob('stations/*/vpf_730_local.db'),
+            archive_path='archive/vpf_730_{month}.db',
+        )
+
+    :param sources: paths to the source databases, which may contain
+        ``{month}``
+    :param archive_path: path to the central archive, which must contain
+        ``{month}``
+    :param jobs: the number of worker processes, defaults to the number of
+        CPUs. With ``1`` everything is run in the current process
+    :param progress: optional - a function called with the statistics so far
+        and the total number of tasks after every task
+
+    :return: the statistics of the merge
+    """
+    if not is_partitioned(archive_path):
+        raise ValueError(
+            f'the path of the archive must contain {MONTH_PLACEHOLDER!r}, '
+            f'got: {archive_path!r}',
+        )
+    t0 = time.perf_counter()
+    archive = PartitionedDB(
+        archive_path,
+        schema=(RECEIVER_TABLE, RECEIVER_TIMESTAMP_IDX),
+    )
+    tasks = make_tasks(sources, archive)
+    nr_sources = len({task.path for task in tasks})
+    done = read = inserted = 0
+    with archive:
+        for chunk in process_map(
+                _merge_task, tasks, jobs=jobs or os.cpu_count() or 1,
+        ):
+            db = archive.writer(chunk.task.start)
+            # a crash may lose the last transactions, but never corrupts the
+            # archive
+            db.execute('PRAGMA synchronous = NORMAL')
+            with db:
+                cur = db.executemany(INSERT_OR_IGNORE, chunk.rows)
+            archive.maintain()
+            inserted += cur.rowcount
+            done += 1
+            read += len(chunk.rows)
+            if progress is not None:
+                progress(
+                    MergeStats(
+                        sources=nr_sources,
+                        tasks=done,
+                        read=read,
+                        inserted=inserted,
+                        seconds=time.perf_counter() - t0,
+                    ),
+                    len(tasks),
+                )
+
+    return MergeStats(
+        sources=nr_sources,
+        tasks=done,
+        read=read,
+        inserted=inserted,
+        seconds=time.perf_counter() - t0,
+    )
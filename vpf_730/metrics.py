@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections.abc import Generator
+from collections.abc import Sequence
+from contextlib import AbstractContextManager
+from contextlib import contextmanager
+from typing import Any
+from typing import ClassVar
+from typing import Generic
+from typing import TYPE_CHECKING
+from typing import TypeVar
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (
+    .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10,
+)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    elif float(value).is_integer():
+        return str(int(value))
+    else:
+        return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return (
+        value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    )
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{k}="{_escape_label_value(v)}"' for k, v in zip(names, values)
+    )
+    return f'{{{pairs}}}'
+
+
+class _CounterChild:
+    def __init__(self) -> None:
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = (*buckets, math.inf)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sum += value
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[idx] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Generator[None]:
+        """Context manager observing the time it took in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        ret = []
+        total = 0
+        for bound, count in zip(self.buckets, self._counts):
+            total += count
+            ret.append((bound, total))
+        return ret
+
+
+C = TypeVar('C')
+
+
+class _Metric(Generic[C]):
+    kind: ClassVar[str]
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            registry: Registry | None = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], C] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self) -> C:
+        raise NotImplementedError
+
+    def labels(self, *values: object) -> C:
+        """Get the child of this metric for a combination of label values.
+        The child can be kept and used directly in hot code paths.
+
+        :param values: the values of the labels in the order of ``labelnames``
+        """
+        key = tuple(str(v) for v in values)
+        try:
+            return self._children[key]
+        except KeyError:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f'expected labels {self.labelnames!r}, got {key!r}',
+                )
+            with self._lock:
+                return self._children.setdefault(key, self._new_child())
+
+    def _unlabeled(self) -> C:
+        try:
+            return self._children[()]
+        except KeyError:
+            raise ValueError(f'{self.name} requires labels') from None
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+            *self._samples(),
+        ]
+        return '\n'.join(lines)
+
+
+class Counter(_Metric[_CounterChild]):
+    """A monotonically increasing counter e.g. the number of bytes sent."""
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabeled().inc(amount)
+
+    def _samples(self) -> list[str]:
+        return [
+            f'{self.name}{_fmt_labels(self.labelnames, k)} {_fmt(c.value)}'
+            for k, c in sorted(self._children.items())
+        ]
+
+
+class Gauge(_Metric[_GaugeChild]):
+    """A value that can go up and down e.g. the number of rows to upload."""
+    kind = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabeled().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._unlabeled().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._unlabeled().set(value)
+
+    def _samples(self) -> list[str]:
+        return [
+            f'{self.name}{_fmt_labels(self.labelnames, k)} {_fmt(c.value)}'
+            for k, c in sorted(self._children.items())
+        ]
+
+
+class Histogram(_Metric[_HistogramChild]):
+    """A histogram of observed values e.g. latencies in seconds."""
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+            registry: Registry | None = None,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(
+            name=name,
+            documentation=documentation,
+            labelnames=labelnames,
+            registry=registry,
+        )
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._unlabeled().observe(value)
+
+    def time(self) -> AbstractContextManager[None]:
+        """Context manager observing the time it took in seconds"""
+        return self._unlabeled().time()
+
+    def _samples(self) -> list[str]:
+        lines = []
+        label_names = (*self.labelnames, 'le')
+        for k, c in sorted(self._children.items()):
+            for bound, count in c.cumulative_counts():
+                labels = _fmt_labels(label_names, (*k, _fmt(bound)))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _fmt_labels(self.labelnames, k)
+            lines.append(f'{self.name}_sum{labels} {_fmt(c.sum)}')
+            lines.append(f'{self.name}_count{labels} {c.count}')
+        return lines
+
+
+class Registry:
+    """A collection of metrics that are exposed together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric[Any]] = {}
+
+    def register(self, metric: _Metric[Any]) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f'metric {metric.name!r} is already registered')
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format
+
+        :return: the metrics as text
+        """
+        return ''.join(f'{m.render()}\n' for m in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+
+def start_metrics_server(
+        port: int,
+        host: str = '127.0.0.1',
+        registry: Registry | None = None,
+) -> ThreadingHTTPServer:
+    """Start a http server in a background thread, serving the metrics in the
+    Prometheus text format on ``/metrics``.
+
+    :param port: the port to listen on
+    :param host: the host/interface to bind to, by default only local
+        connections are accepted
+    :param registry: the registry to expose, defaults to the global registry
+
+    :return: the running server, call ``shutdown()`` to stop it
+    """
+    # only imported when needed, this is not used by short-lived commands
+    from http.server import BaseHTTPRequestHandler
+    from http.server import ThreadingHTTPServer
+
+    reg = registry if registry is not None else REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = reg.render().encode()
+            self.send_response(200)
+            self.send_header(
+                'Content-Type', 'text/plain; version=0.0.4; charset=utf-8',
+            )
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    t = threading.Thread(
+        target=server.serve_forever,
+        name='vpf-730-metrics',
+        daemon=True,
+    )
+    t.start()
+    return server
+
+
+SERIAL_ROUNDTRIP_SECONDS = Histogram(
+    'vpf730_serial_roundtrip_seconds',
+    'Time between polling the sensor and receiving the message',
+    buckets=(.05, .1, .25, .5, 1, 1.5, 2, 3, 5),
+)
+SERIAL_EMPTY_READS = Counter(
+    'vpf730_serial_empty_reads_total',
+    'Number of reads, where the sensor did not send any data',
+)
+PARSE_FAILURES = Counter(
+    'vpf730_parse_failures_total',
+    'Number of messages from the sensor that could not be parsed',
+)
+MEASUREMENTS = Counter(
+    'vpf730_measurements_total',
+    'Number of measurements stored in the local database',
+)
+DB_WRITE_SECONDS = Histogram(
+    'vpf730_db_write_seconds',
+    'Time it took to write a measurement to the local database',
+)
+ROWS_PENDING_UPLOAD = Gauge(
+    'vpf730_rows_pending_upload',
+    'Number of measurements that still need to be sent to the remote',
+)
+BYTES_SENT = Counter(
+    'vpf730_bytes_sent_total',
+    'Number of bytes posted to the remote',
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'vpf730_http_request_seconds',
+    'Duration of http requests to the remote by endpoint and status code',
+    labelnames=('endpoint', 'code'),
+)
+SINK_WRITE_SECONDS = Histogram(
+    'vpf730_sink_write_seconds',
+    'Time it took a sink of the logger to write a batch of measurements',
+    labelnames=('sink',),
+)
+SINK_DROPPED = Counter(
+    'vpf730_sink_dropped_total',
+    'Number of measurements a sink of the logger dropped, since its queue '
+    'was full or writing failed',
+    labelnames=('sink',),
+)
+SINK_SPILLED = Counter(
+    'vpf730_sink_spilled_total',
+    'Number of measurements a sink of the logger spilled to disk, since its '
+    'queue was full or writing failed',
+    labelnames=('sink',),
+)
+SCHEDULER_OVERRUNS = Counter(
+    'vpf730_scheduler_overruns_total',
+    'Number of times a scheduler loop woke up late, so a scheduled slot may '
+    'have been missed',
+    labelnames=('process',),
+)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import contextlib
+import glob
+import logging
+import os
+import re
+import sqlite3
+from collections.abc import Iterator
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timezone
+from types import TracebackType
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from vpf_730.vpf_730 import Measurement
+
+logger = logging.getLogger(__name__)
+
+# a local_db containing this is split into one file per month
+MONTH_PLACEHOLDER = '{month}'
+# the number of free pages returned to the file system per maintenance
+VACUUM_PAGES = 256
+
+
+def is_partitioned(db_path: str | os.PathLike[str]) -> bool:
+    """Check whether the path of the local database is partitioned by month
+
+    :param db_path: path to the sqlite database
+
+    :return: ``True`` if ``db_path`` contains ``{month}``
+    """
+    return MONTH_PLACEHOLDER in os.fspath(db_path)
+
+
+class Partition(NamedTuple):
+    """A database file containing the measurements of one month
+
+    :param month: the month in the format ``YYYY-MM`` (UTC)
+    :param path: the path to the database file
+    :param start: unix timestamp (UTC) of the first second of the month
+    :param end: unix timestamp (UTC) of the first second of the next month
+    """
+    month: str
+    path: str
+    start: int
+    end: int
+
+
+class PartitionedDB:
+    """The local database split into one sqlite file per month, e.g.
+    ``data/vpf_730_{month}.db`` becomes ``data/vpf_730_2023-01.db``,
+    ``data/vpf_730_2023-02.db`` etc. Old data is removed by deleting whole
+    files, which needs neither ``DELETE`` nor a stalling ``VACUUM``.
+
+    Only the partition of the current month is kept open for writing. It uses
+    a write-ahead log without automatic checkpoints, so the checkpoints and
+    incremental vacuums only run when :func:`maintain` is called e.g. in
+    between two measurements. Partitions are attached for reading on demand.
+
+    .. code-block:: python
+
+        with PartitionedDB('data/vpf_730_{month}.db') as db:
+            db.insert(measurement)
+            for conn in db.attached(start=1672531200):
+                print(conn.execute('SELECT count(*) FROM measurements'))
+
+    :param db_path: path to the sqlite database files, containing ``{month}``
+    :param schema: optional - the statements creating the tables of a new
+        partition. By default a new partition is set up like the newest
+        existing one, i.e. with the compact schema, the rollups and the gap
+        index if it has them, or with the ``measurements`` table of the local
+        database
+    """
+
+    def __init__(
+            self,
+            db_path: str,
+            schema: Sequence[str] | None = None,
+    ) -> None:
+        if not is_partitioned(db_path):
+            raise ValueError(
+                f'a partitioned database path must contain '
+                f'{MONTH_PLACEHOLDER!r}, got: {db_path!r}',
+            )
+        self.db_path = db_path
+        self.schema = schema
+        prefix, _, suffix = db_path.partition(MONTH_PLACEHOLDER)
+        self._pattern = re.compile(
+            rf'{re.escape(prefix)}(\d{{4}}-\d{{2}}){re.escape(suffix)}',
+        )
+        self._glob = f'{glob.escape(prefix)}*{glob.escape(suffix)}'
+        self._writer: sqlite3.Connection | None = None
+        self._writer_path: str | None = None
+
+    def partition(self, timestamp: float) -> Partition:
+        """Get the partition a timestamp belongs to, the file may not exist
+
+        :param timestamp: unix timestamp (UTC)
+
+        :return: the partition containing ``timestamp``
+        """
+        d = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return self._partition(d.year, d.month)
+
+    def _partition(self, year: int, month: int) -> Partition:
+        start = datetime(year, month, 1, tzinfo=timezone.utc)
+        if month == 12:
+            end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        else:
+            end = datetime(year, month + 1, 1, tzinfo=timezone.utc)
+        name = f'{year:04}-{month:02}'
+        return Partition(
+            month=name,
+            path=self.db_path.replace(MONTH_PLACEHOLDER, name),
+            start=int(start.timestamp()),
+            end=int(end.timestamp()),
+        )
+
+    def partitions(self) -> list[Partition]:
+        """Get all existing partitions
+
+        :return: the partitions ordered by their month
+        """
+        ret = []
+        for path in glob.glob(self._glob):
+            match = self._pattern.fullmatch(path)
+            if match:
+                year, month = match[1].split('-')
+                ret.append(self._partition(int(year), int(month)))
+        return sorted(ret)
+
+    def _create_like_newest(self, db: sqlite3.Connection, path: str) -> None:
+        # imported here, so reading partitions does not import pyserial and
+        # gaps can import this module
+        from vpf_730.gaps import create_gap_index
+        from vpf_730.gaps import has_gap_index
+        from vpf_730.rollups import create_rollups
+        from vpf_730.rollups import has_rollups
+        from vpf_730.storage import create_compact_schema
+        from vpf_730.storage import is_compact
+        from vpf_730.vpf_730 import MEASUREMENT_TABLE
+
+        compact = rollups = gap_index = False
+        previous = [p.path for p in self.partitions() if p.path != path]
+        if previous:
+            with contextlib.closing(sqlite3.connect(previous[-1])) as prev:
+                compact = is_compact(prev)
+                rollups = has_rollups(prev)
+                gap_index = has_gap_index(prev)
+
+        with db:
+            if compact:
+                create_compact_schema(db)
+            else:
+                db.execute(MEASUREMENT_TABLE)
+        if rollups:
+            create_rollups(db)
+        if gap_index:
+            create_gap_index(db)
+
+    def _open_writer(self, path: str) -> sqlite3.Connection:
+        if self._writer is not None:
+            # closing the last connection checkpoints the write-ahead log
+            self._writer.close()
+            self._writer = self._writer_path = None
+
+        db = sqlite3.connect(path)
+        if db.execute('SELECT count(*) FROM sqlite_master').fetchone()[0] == 0:
+            # only possible before the first table is created
+            db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            db.execute('PRAGMA journal_mode = WAL')
+            if self.schema is not None:
+                for statement in self.schema:
+                    db.execute(statement)
+            else:
+                self._create_like_newest(db, path)
+            logger.info('created new partition %s', path)
+        db.execute('PRAGMA wal_autocheckpoint = 0')
+        self._writer = db
+        self._writer_path = path
+        return db
+
+    def writer(self, timestamp: float) -> sqlite3.Connection:
+        """Get the connection writing to the partition of a timestamp, which
+        is created if it does not exist yet. The connection of the partition
+        written to before is closed.
+
+        :param timestamp: unix timestamp (UTC)
+
+        :return: the open connection, which is closed by :func:`close`
+        """
+        path = self.partition(timestamp).path
+        if self._writer is not None and path == self._writer_path:
+            return self._writer
+        return self._open_writer(path)
+
+    def insert(self, measurement: Measurement) -> None:
+        """Insert a measurement into the partition of its month, which is
+        created if it does not exist yet.
+
+        :param measurement: the measurement to insert
+        """
+        from vpf_730.vpf_730 import INSERT_MEASUREMENT
+
+        db = self.writer(measurement.timestamp)
+        with db:
+            db.execute(INSERT_MEASUREMENT, measurement._asdict())
+
+    def attached(self, start: int) -> Iterator[sqlite3.Connection]:
+        """Attach the partitions that can contain measurements after
+        ``start`` one by one, in the order of their month. Every connection
+        yielded can be queried as if it was a single database with a
+        ``measurements`` table.
+
+        :param start: unix timestamp (UTC) after which to get data
+
+        :return: an iterator of open connections, the partition is detached
+            when the next one is requested
+        """
+        partitions = [p for p in self.partitions() if p.end > start + 1]
+        if not partitions:
+            return
+
+        with contextlib.closing(sqlite3.connect(':memory:')) as db:
+            db.row_factory = sqlite3.Row
+            for partition in partitions:
+                db.execute('ATTACH DATABASE ? AS part', (partition.path,))
+                try:
+                    yield db
+                finally:
+                    db.execute('DETACH DATABASE part')
+
+    def maintain(self) -> None:
+        """Checkpoint the write-ahead log and return free pages of the
+        partition currently written to the file system. This should be called
+        regularly when no measurement is due.
+        """
+        if self._writer is None:
+            return
+
+        self._writer.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        # the pages are freed one row at a time
+        self._writer.execute(
+            f'PRAGMA incremental_vacuum({VACUUM_PAGES})',
+        ).fetchall()
+
+    def prune(self, before: int) -> list[Partition]:
+        """Delete all partitions that only contain measurements before
+        ``before``, except the one currently written to.
+
+        :param before: unix timestamp (UTC)
+
+        :return: the deleted partitions
+        """
+        pruned = []
+        for partition in self.partitions():
+            if partition.end > before or partition.path == self._writer_path:
+                continue
+            for suffix in ('', '-wal', '-shm'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(f'{partition.path}{suffix}')
+            logger.info('pruned partition %s', partition.path)
+            pruned.append(partition)
+        return pruned
+
+    def close(self) -> None:
+        """Close the partition currently written to"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = self._writer_path = None
+
+    def __enter__(self) -> PartitionedDB:
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import argparse
+import cProfile
+import glob
+import linecache
+import logging
+import os
+import signal
+import threading
+import tracemalloc
+from datetime import datetime
+from datetime import timezone
+from types import FrameType
+from types import TracebackType
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class ProfilerConfig(NamedTuple):
+    """A class representing the configuration of the profiler.
+
+    :param directory: directory the profiles and reports are written to
+    :param interval: interval in seconds to write a new profile/report
+    :param cprofile: periodically dump ``cProfile`` statistics of the run loop
+    :param tracemalloc: periodically take ``tracemalloc`` snapshots and write
+        the top allocations and the difference to the previous snapshot
+    :param keep: number of files per kind that are kept in ``directory``, older
+        ones are deleted
+    :param top_n: number of entries in the ``tracemalloc`` reports
+    :param frames: number of frames ``tracemalloc`` stores per allocation
+    """
+    directory: str
+    interval: float = 3600
+    cprofile: bool = False
+    tracemalloc: bool = False
+    keep: int = 24
+    top_n: int = 25
+    frames: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.cprofile or self.tracemalloc
+
+    @classmethod
+    def from_argparse(cls, args: argparse.Namespace) -> ProfilerConfig:
+        """Constructs a new :func:`ProfilerConfig` from an
+        :func:`argparse.Namespace`, falling back to environment variables:
+
+        * ``VPF730_PROFILE_DIR`` - directory the profiles are written to
+        * ``VPF730_PROFILE_INTERVAL`` - interval in seconds between dumps
+        * ``VPF730_CPROFILE`` - set to ``1`` to enable ``cProfile``
+        * ``VPF730_TRACEMALLOC`` - set to ``1`` to enable ``tracemalloc``
+
+        :param args: arguments returned from the argument parser created by
+            :func:`vpf_730.main.build_parser`
+
+        :return: a new instance of :func:`ProfilerConfig`
+        """
+        return cls(
+            directory=(
+                args.profile_dir or
+                os.environ.get('VPF730_PROFILE_DIR', 'vpf_730_profiles')
+            ),
+            interval=(
+                args.profile_interval or
+                float(os.environ.get('VPF730_PROFILE_INTERVAL', 3600))
+            ),
+            cprofile=(
+                args.cprofile or os.environ.get('VPF730_CPROFILE') == '1'
+            ),
+            tracemalloc=(
+                args.tracemalloc or
+                os.environ.get('VPF730_TRACEMALLOC') == '1'
+            ),
+        )
+
+
+class Profiler:
+    """Periodically write ``cProfile`` statistics and ``tracemalloc``
+    reports of a long-running process to a directory, keeping only the newest
+    ``keep`` files of each kind.
+
+    The periodic dumps are triggered by a ``SIGALRM`` interval timer, so they
+    are written from the main thread, which runs the loop that is profiled.
+    If this is not possible (e.g. on Windows or outside the main thread), only
+    a single dump is written when the profiler is stopped.
+
+    It can be used as a context manager:
+
+    .. code-block:: python
+
+        with Profiler(ProfilerConfig('profiles', cprofile=True)):
+            logger.run()
+
+    :param cfg: the configuration of the profiler
+    """
+
+    def __init__(self, cfg: ProfilerConfig) -> None:
+        self.cfg = cfg
+        self._prof: cProfile.Profile | None = None
+        self._prev_snapshot: tracemalloc.Snapshot | None = None
+        self._timer = False
+
+    def start(self) -> None:
+        os.makedirs(self.cfg.directory, exist_ok=True)
+        if self.cfg.tracemalloc:
+            tracemalloc.start(self.cfg.frames)
+            self._prev_snapshot = self._take_snapshot()
+
+        if (
+                hasattr(signal, 'setitimer') and
+                threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGALRM, self._handle_alarm)
+            signal.setitimer(
+                signal.ITIMER_REAL, self.cfg.interval, self.cfg.interval,
+            )
+            self._timer = True
+        else:  # pragma: no cover
+            logger.warning('periodic profiling is not supported')
+
+        if self.cfg.cprofile:
+            self._prof = cProfile.Profile()
+            self._prof.enable()
+
+    def stop(self) -> None:
+        if self._timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            self._timer = False
+
+        self.dump()
+        if self._prof is not None:
+            self._prof.disable()
+            self._prof = None
+        if self.cfg.tracemalloc:
+            self._prev_snapshot = None
+            tracemalloc.stop()
+
+    def __enter__(self) -> Profiler:
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    def _handle_alarm(self, signum: int, frame: FrameType | None) -> None:
+        try:
+            self.dump()
+        except Exception:  # pragma: no cover
+            # profiling must never take down the process
+            logger.exception('failed writing profile')
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+
+    def dump(self) -> None:
+        """Write the ``cProfile`` statistics collected since the last dump
+        and a ``tracemalloc`` report to the directory.
+        """
+        now = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        if self._prof is not None:
+            self._prof.disable()
+            path = os.path.join(self.cfg.directory, f'cprofile-{now}.prof')
+            self._prof.dump_stats(path)
+            # every file contains the statistics of a single interval
+            self._prof = cProfile.Profile()
+            self._prof.enable()
+            self._rotate('cprofile-*.prof')
+
+        if self._prev_snapshot is not None:
+            snapshot = self._take_snapshot()
+            path = os.path.join(self.cfg.directory, f'tracemalloc-{now}.txt')
+            with open(path, 'w') as f:
+                f.write(self._tracemalloc_report(snapshot))
+            self._prev_snapshot = snapshot
+            self._rotate('tracemalloc-*.txt')
+
+    def _tracemalloc_report(self, snapshot: tracemalloc.Snapshot) -> str:
+        assert self._prev_snapshot is not None
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f'traced memory: current {current} B, peak {peak} B',
+            '',
+            f'top {self.cfg.top_n} differences to the previous snapshot:',
+            *(
+                str(i) for i in snapshot.compare_to(
+                    self._prev_snapshot, 'lineno',
+                )[:self.cfg.top_n]
+            ),
+            '',
+            f'top {self.cfg.top_n} allocations:',
+            *(
+                str(i)
+                for i in snapshot.statistics('lineno')[:self.cfg.top_n]
+            ),
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def _rotate(self, pattern: str) -> None:
+        # the timestamp in the name makes them sort chronologically
+        files = sorted(glob.glob(os.path.join(self.cfg.directory, pattern)))
+        for f in files[:-self.cfg.keep]:
+            os.remove(f)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+from vpf_730.chunks import decode_chunk
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import PartitionedDB
+from vpf_730.utils import connect
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        'querying measurements into arrays requires numpy, install it using: '
+        'pip install vpf-730[numpy]',
+    ) from e
+
+from vpf_730.vectorized import MEASUREMENT_DTYPE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# the number of rows fetched from sqlite at once
+DEFAULT_BATCH_SIZE = 65536
+
+
+def _dtype(fields: Iterable[str] | None) -> np.dtype[np.void]:
+    if fields is None:
+        return MEASUREMENT_DTYPE
+
+    names = ['timestamp']
+    for name in fields:
+        if name not in (MEASUREMENT_DTYPE.names or ()):
+            raise ValueError(f'unknown field: {name!r}')
+        if name not in names:
+            names.append(name)
+    return np.dtype([(name, MEASUREMENT_DTYPE[name]) for name in names])
+
+
+def _from_chunks(
+        db: sqlite3.Connection,
+        start: int,
+        end: int,
+        dtype: np.dtype[np.void],
+) -> list[npt.NDArray[np.void]]:
+    try:
+        ret = db.execute(
+            'SELECT data FROM measurement_chunks '
+            'WHERE last_timestamp >= ? AND first_timestamp < ? ORDER BY day',
+            (start, end),
+        )
+    except sqlite3.OperationalError:
+        # nothing was compacted yet
+        return []
+
+    parts = []
+    for data, in ret.fetchall():
+        columns = decode_chunk(data)
+        timestamps = np.asarray(columns['timestamp'])
+        lo, hi = np.searchsorted(timestamps, (start, end))
+        part = np.empty(hi - lo, dtype=dtype)
+        for name in dtype.names or ():
+            part[name] = columns[name][lo:hi]
+        parts.append(part)
+    return parts
+
+
+def _select(
+        db: sqlite3.Connection,
+        start: int,
+        end: int,
+        dtype: np.dtype[np.void],
+        batch_size: int,
+) -> list[npt.NDArray[np.void]]:
+    parts = _from_chunks(db, start=start, end=end, dtype=dtype)
+    cur = db.cursor()
+    # plain tuples are converted by numpy without any python code per row
+    cur.row_factory = None
+    cur.execute(
+        f'SELECT {", ".join(dtype.names or ())} FROM measurements '
+        f'WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+        (start, end),
+    )
+    while rows := cur.fetchmany(batch_size):
+        parts.append(np.array(rows, dtype=dtype))
+    return parts
+
+
+def query(
+        db_path: str | os.PathLike[str],
+        start: int,
+        end: int | None = None,
+        fields: Iterable[str] | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+) -> npt.NDArray[np.void]:
+    """Query the measurements with ``start <= timestamp < end`` into a
+    structured NumPy array. Only the requested fields are selected and they
+    are fetched in batches of ``batch_size`` rows without creating a Python
+    object per measurement. Days packed by
+    :func:`vpf_730.chunks.compact_days` and databases partitioned by month
+    are supported. This requires numpy to be installed.
+
+    .. code-block:: python
+
+        data = query('vpf_730_local.db', start=1672531200, fields=['temp'])
+        print(data['temp'].mean())
+
+    :param db_path: path to the sqlite database, which may contain ``{month}``
+    :param start: unix timestamp (UTC), the start of the range
+    :param end: optional - unix timestamp (UTC), the (exclusive) end of the
+        range
+    :param fields: optional - the fields to query, ``timestamp`` is always
+        included. All fields are queried by default.
+    :param batch_size: the number of rows fetched from sqlite at once
+
+    :return: a structured array ordered by the timestamp with a subset of
+        the fields of :const:`vpf_730.vectorized.MEASUREMENT_DTYPE`
+    """
+    dtype = _dtype(fields)
+    stop = 2**62 if end is None else end
+    parts = []
+    if is_partitioned(db_path):
+        for db in PartitionedDB(os.fspath(db_path)).attached(start=start - 1):
+            parts.extend(_select(db, start, stop, dtype, batch_size))
+    else:
+        with connect(os.fspath(db_path)) as db:
+            parts.extend(_select(db, start, stop, dtype, batch_size))
+
+    if not parts:
+        return np.empty(0, dtype=dtype)
+    data = np.concatenate(parts)
+    timestamps = data['timestamp']
+    if np.any(timestamps[1:] <= timestamps[:-1]):
+        # measurements were inserted into days packed into chunks, the ones
+        # in the measurements table come last and replace the others
+        data = data[np.argsort(timestamps, kind='stable')]
+        timestamps = data['timestamp']
+        data = data[np.append(timestamps[1:] != timestamps[:-1], True)]
+    return data
+
+
+def query_frame(
+        db_path: str | os.PathLike[str],
+        start: int,
+        end: int | None = None,
+        fields: Iterable[str] | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+) -> pd.DataFrame:
+    """Query the measurements like :func:`query` into a pandas DataFrame
+    indexed by the timestamp as a timezone-aware ``datetime64``. This
+    requires pandas to be installed.
+
+    :param db_path: path to the sqlite database, which may contain ``{month}``
+    :param start: unix timestamp (UTC), the start of the range
+    :param end: optional - unix timestamp (UTC), the (exclusive) end of the
+        range
+    :param fields: optional - the fields to query. All fields are queried by
+        default.
+    :param batch_size: the number of rows fetched from sqlite at once
+
+    :return: a DataFrame with one column per field
+    """
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError(
+            'querying measurements into a DataFrame requires pandas, install '
+            'it using: pip install vpf-730[pandas]',
+        ) from e
+
+    data = query(
+        db_path=db_path,
+        start=start,
+        end=end,
+        fields=fields,
+        batch_size=batch_size,
+    )
+    index = pd.to_datetime(data['timestamp'], unit='s', utc=True)
+    names = [name for name in data.dtype.names or () if name != 'timestamp']
+    return pd.DataFrame(
+        {name: data[name] for name in names},
+        index=pd.DatetimeIndex(index, name='timestamp'),
+    )
@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import configparser
+import hmac
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import urllib.parse
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import NamedTuple
+
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+logger = logging.getLogger(__name__)
+
+STATUS_PATH = '/vpf-730/status'
+DATA_PATH = '/vpf-730/data'
+# the largest body accepted, about 20 times a request of the default 512
+# measurements
+MAX_BODY_BYTES = 4 * 1024 * 1024
+# the seconds a request waits for its measurements to be committed
+WRITE_TIMEOUT = 30.0
+
+# the receiver collects data from many sensors, hence the timestamp alone is
+# not unique anymore
+RECEIVER_TABLE = '''\
+        CREATE TABLE IF NOT EXISTS measurements(
+            timestamp INT NOT NULL,
+            sensor_id INT NOT NULL,
+            last_measurement_period INT,
+            time_since_report INT,
+            optical_range NUMERIC,
+            precipitation_type_msg TEXT,
+            obstruction_to_vision TEXT,
+            receiver_bg_illumination NUMERIC,
+            water_in_precip NUMERIC,
+            temp NUMERIC,
+            nr_precip_particles INT,
+            transmission_eq NUMERIC,
+            exco_less_precip_particle NUMERIC,
+            backscatter_exco NUMERIC,
+            self_test VARCHAR(3),
+            total_exco NUMERIC,
+            PRIMARY KEY (sensor_id, timestamp)
+        )
+    '''
+RECEIVER_TIMESTAMP_IDX = '''\
+        CREATE INDEX IF NOT EXISTS idx_measurements_timestamp
+        ON measurements(timestamp)
+    '''
+
+INSERT_OR_IGNORE = f'''\
+        INSERT OR IGNORE INTO measurements({', '.join(Measurement._fields)})
+        VALUES ({', '.join('?' * len(Measurement._fields))})
+    '''
+
+
+class ReceiverConfig(NamedTuple):
+    """A class representing the configuration of the receiver.
+
+    :param db: path to the sqlite database, where the received measurements
+        are stored
+    :param host: the host/interface the http server binds to
+    :param port: the port the http server listens on
+    :param api_key: the API-key senders have to provide in the
+        ``Authorization`` header
+    :param max_batch_len: maximum number of requests, that are written to the
+        database in a single transaction
+    """
+    db: str
+    host: str
+    port: int
+    api_key: str
+    max_batch_len: int = 64
+
+    @classmethod
+    def from_env(cls) -> ReceiverConfig:
+        """Constructs a new :func:`ReceiverConfig` from environment variables.
+
+        * ``VPF730_RECEIVER_DB`` - path to the sqlite database the received data is stored in
+        * ``VPF730_RECEIVER_HOST`` - host the http server binds to (default: ``127.0.0.1``)
+        * ``VPF730_RECEIVER_PORT`` - port the http server listens on (default: ``5000``)
+        * ``VPF730_API_KEY`` - the API-key senders have to authenticate with
+
+        :return: a new instance of :func:`ReceiverConfig` created from
+            environment variables.
+        """  # noqa: E501
+        return cls(
+            db=os.environ['VPF730_RECEIVER_DB'],
+            host=os.environ.get('VPF730_RECEIVER_HOST', '127.0.0.1'),
+            port=int(os.environ.get('VPF730_RECEIVER_PORT', 5000)),
+            api_key=os.environ['VPF730_API_KEY'],
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> ReceiverConfig:
+        """Constructs a new :func:`ReceiverConfig` from a provided ``.ini``
+        config file with this format:
+
+            .. code-block:: ini
+
+                [vpf_730]
+                receiver_db=receiver.db
+                host=127.0.0.1
+                port=5000
+                api_key=deadbeef
+
+        :param path: path to the ``.ini`` config file with the structure above
+
+        :return: a new instance of :func:`ReceiverConfig` created from a config
+            file
+        """
+        config = configparser.ConfigParser()
+        config.read(path)
+        return cls(
+            config['vpf_730']['receiver_db'],
+            config['vpf_730'].get('host', '127.0.0.1'),
+            int(config['vpf_730'].get('port', '5000')),
+            config['vpf_730']['api_key'],
+        )
+
+    @classmethod
+    def from_argparse(cls, args: argparse.Namespace) -> ReceiverConfig:
+        """Constructs a new :func:`ReceiverConfig` from a
+        :func:`argparse.Namespace`, created by the argument parser returned by
+        :func:`vpf_730.main.build_parser`.
+
+        :param args: arguments returned from the argument parser created by
+            :func:`vpf_730.main.build_parser`
+
+        :return: a new instance of :func:`ReceiverConfig` created from CLI
+            arguments
+        """
+        return cls(
+            db=args.receiver_db or 'vpf_730_receiver.db',
+            host=args.host or '127.0.0.1',
+            port=args.port if args.port is not None else 5000,
+            api_key=os.environ['VPF730_API_KEY'],
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f'{type(self).__name__}('
+            f'db={self.db!r}, '
+            f'host={self.host!r}, '
+            f'port={self.port!r}, '
+            f'api_key=***, '
+            f'max_batch_len={self.max_batch_len!r})'
+        )
+
+
+class ReceiverError(Exception):
+    """Exception raised when a request sent to the receiver is invalid"""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _parse_rows(body: bytes) -> list[tuple[Any, ...]]:
+    """Parse the body of a ``POST`` request in the format ``{"data": [...]}``.
+    Each item may either be a json object (as sent by :func:`Sender.run`) or a
+    list in the order of the fields of :func:`Measurement`.
+    """
+    try:
+        data = json.loads(body)['data']
+    except (ValueError, KeyError, TypeError):
+        raise ReceiverError(
+            400, 'body must be json of the form {"data": [...]}',
+        )
+
+    if not isinstance(data, list):
+        raise ReceiverError(400, 'data must be a list of measurements')
+
+    rows = []
+    n_fields = len(Measurement._fields)
+    for idx, item in enumerate(data):
+        if isinstance(item, dict):
+            try:
+                row = tuple(item[f] for f in Measurement._fields)
+            except KeyError as e:
+                raise ReceiverError(
+                    400, f'measurement {idx} is missing the field {e.args[0]}',
+                )
+        elif isinstance(item, list) and len(item) == n_fields:
+            row = tuple(item)
+        else:
+            raise ReceiverError(400, f'measurement {idx} is malformed')
+
+        if not isinstance(row[0], int) or not isinstance(row[1], int):
+            raise ReceiverError(
+                400,
+                f'measurement {idx} has an invalid timestamp or sensor_id',
+            )
+        rows.append(row)
+
+    return rows
+
+
+class _Writer(threading.Thread):
+    """Single thread owning the write connection. Rows from concurrent
+    requests are queued and committed together in one transaction. When the
+    thread exits, e.g. since the database cannot be opened, the rows still
+    queued fail, so no request waits for them.
+    """
+
+    def __init__(self, db_path: str, max_batch_len: int) -> None:
+        super().__init__(name='vpf-730-receiver-writer', daemon=True)
+        self.db_path = db_path
+        self.max_batch_len = max_batch_len
+        self._queue: queue.Queue[
+            tuple[list[tuple[Any, ...]], Future[int]] | None
+        ] = queue.Queue()
+        self._stopped = False
+
+    def submit(self, rows: list[tuple[Any, ...]]) -> Future[int]:
+        fut: Future[int] = Future()
+        if self._stopped:
+            fut.set_exception(RuntimeError('the writer is not running'))
+        else:
+            self._queue.put((rows, fut))
+        return fut
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self.join()
+
+    def run(self) -> None:
+        try:
+            self._run()
+        except Exception:
+            logger.exception('the writer stopped')
+        finally:
+            self._stopped = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].set_exception(
+                        RuntimeError('the writer is not running'),
+                    )
+
+    def _run(self) -> None:
+        with connect(self.db_path) as db:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                while len(batch) < self.max_batch_len:
+                    try:
+                        nxt = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(nxt)
+
+                self._write(db, batch)
+
+    def _write(
+            self,
+            db: sqlite3.Connection,
+            batch: list[tuple[list[tuple[Any, ...]], Future[int]]],
+    ) -> None:
+        inserted = []
+        try:
+            with db:
+                for rows, _ in batch:
+                    cur = db.executemany(INSERT_OR_IGNORE, rows)
+                    inserted.append(cur.rowcount)
+        except Exception as e:
+            logger.exception('failed writing batch to the database')
+            for _, fut in batch:
+                fut.set_exception(e)
+        else:
+            for (_, fut), n in zip(batch, inserted):
+                fut.set_result(n)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: _ReceiverHTTPServer
+
+    def _send_json(self, code: int, payload: dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, code: int, message: str) -> None:
+        self._send_json(code, {'code': code, 'message': message})
+
+    def _authorized(self) -> bool:
+        key = self.headers.get('Authorization', '')
+        if hmac.compare_digest(
+                key.encode(), self.server.receiver.cfg.api_key.encode(),
+        ):
+            return True
+        else:
+            self._send_error(401, 'invalid API-key')
+            return False
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != STATUS_PATH:
+            return self._send_error(404, f'unknown endpoint {url.path!r}')
+        if not self._authorized():
+            return None
+
+        params = urllib.parse.parse_qs(url.query)
+        sensor_id: int | None
+        try:
+            sensor_id = int(params['sensor_id'][0])
+        except KeyError:
+            sensor_id = None
+        except ValueError:
+            return self._send_error(400, 'sensor_id must be an integer')
+
+        latest_date = self.server.receiver.latest_date(sensor_id=sensor_id)
+        self._send_json(200, {'latest_date': latest_date})
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != DATA_PATH:
+            return self._send_error(404, f'unknown endpoint {url.path!r}')
+        if not self._authorized():
+            return None
+
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            length = -1
+        if length < 0:
+            return self._send_error(411, 'Content-Length must be set')
+        if length > MAX_BODY_BYTES:
+            # the body is not read, so the connection cannot be reused
+            self.close_connection = True
+            return self._send_error(
+                413, f'the body must not exceed {MAX_BODY_BYTES} bytes',
+            )
+
+        try:
+            rows = _parse_rows(self.rfile.read(length))
+        except ReceiverError as e:
+            return self._send_error(e.code, e.message)
+
+        try:
+            inserted = self.server.receiver.insert(rows)
+        except concurrent.futures.TimeoutError:
+            return self._send_error(503, 'timed out storing measurements')
+        except Exception:
+            return self._send_error(500, 'failed to store measurements')
+
+        self._send_json(
+            201, {'received': len(rows), 'inserted': inserted},
+        )
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.info('%s - %s', self.address_string(), format % args)
+
+
+class _ReceiverHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # many senders may connect at the same time after e.g. a network outage
+    request_queue_size = 128
+
+    def __init__(self, receiver: Receiver) -> None:
+        self.receiver = receiver
+        super().__init__(
+            (receiver.cfg.host, receiver.cfg.port), _RequestHandler,
+        )
+
+
+class Receiver:
+    """A reference implementation of the http server, the :func:`Sender` sends
+    its data to. It serves two endpoints:
+
+    * ``GET /vpf-730/status`` returns ``{"latest_date": <timestamp>}``, the
+      timestamp of the latest measurement received. The query parameter
+      ``sensor_id`` can be used, to only consider a single sensor. The
+      :func:`Sender` always sets it, so a station is never told about the
+      measurements of another one.
+    * ``POST /vpf-730/data`` takes ``{"data": [...]}`` and stores the
+      measurements. Measurements that were already received are ignored, so
+      requests can safely be repeated.
+
+    Requests from concurrent senders are handled in separate threads, whereas
+    writing to the database is done by a single thread, batching the rows of
+    multiple requests into one transaction.
+
+    :param cfg: the configuration of the receiver
+    """
+
+    def __init__(self, cfg: ReceiverConfig) -> None:
+        self.cfg = cfg
+        with connect(cfg.db) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(RECEIVER_TABLE)
+            db.execute(RECEIVER_TIMESTAMP_IDX)
+
+        self._writer = _Writer(cfg.db, max_batch_len=cfg.max_batch_len)
+        self._server = _ReceiverHTTPServer(self)
+
+    @property
+    def server_address(self) -> tuple[str, int]:
+        """The address the receiver is listening on as ``(host, port)``"""
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def latest_date(self, sensor_id: int | None = None) -> int:
+        """Get the timestamp of the latest measurement received.
+
+        :param sensor_id: only consider measurements of this sensor
+
+        :return: the latest timestamp or ``0`` if no data was received yet
+        """
+        with connect(self.cfg.db) as db:
+            if sensor_id is None:
+                ret = db.execute('SELECT MAX(timestamp) FROM measurements')
+            else:
+                ret = db.execute(
+                    'SELECT MAX(timestamp) FROM measurements '
+                    'WHERE sensor_id = ?',
+                    (sensor_id,),
+                )
+            latest, = ret.fetchone()
+        return latest or 0
+
+    def insert(self, rows: list[tuple[Any, ...]]) -> int:
+        """Queue rows for insertion and wait until they are committed, for at
+        most :const:`WRITE_TIMEOUT` seconds.
+
+        :param rows: rows with values in the order of the fields of
+            :func:`Measurement`
+
+        :return: the number of rows that were actually inserted
+        """
+        return self._writer.submit(rows).result(timeout=WRITE_TIMEOUT)
+
+    def run(self) -> None:
+        self._writer.start()
+        try:
+            self._server.serve_forever(poll_interval=.1)
+        finally:
+            self._server.server_close()
+            self._writer.stop()
+
+    def stop(self) -> None:
+        """Stop a receiver, that was started using :func:`Receiver.run`
+        from a different thread.
+        """
+        self._server.shutdown()
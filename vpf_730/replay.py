@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import os
+import time
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from operator import itemgetter
+from typing import Any
+from typing import Literal
+from typing import NamedTuple
+
+from vpf_730.archive import JOURNAL_SUFFIX
+from vpf_730.archive import RawArchive
+from vpf_730.gaps import find_gaps
+from vpf_730.gaps import Gap
+from vpf_730.partitions import is_partitioned
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.utils import process_map
+from vpf_730.vpf_730 import Measurement
+
+logger = logging.getLogger(__name__)
+
+# capture files are split into chunks of roughly this size
+CHUNK_BYTES = 4 * 1024 * 1024
+
+
+class ReplayTask(NamedTuple):
+    """A part of a source that is parsed by a single worker process. Sources
+    are ordered by time, so every task covers a time range.
+
+    :param kind: ``archive`` for a data file of a
+        :func:`vpf_730.archive.RawArchive`, which is one task per file or
+        ``capture`` for a byte range of a capture file
+    :param path: path to the archive data file or the capture file
+    :param offset: the start of the byte range of a capture file
+    :param length: the length of the byte range of a capture file
+    :param start: optional - only replay messages received at or after this
+        unix timestamp (UTC)
+    :param end: optional - only replay messages received before this unix
+        timestamp (UTC)
+    :param gaps: optional - only replay messages received in these gaps of
+        the local database, ordered by their start
+    """
+    kind: Literal['archive', 'capture']
+    path: str
+    offset: int = 0
+    length: int = 0
+    start: float | None = None
+    end: float | None = None
+    gaps: tuple[Gap, ...] | None = None
+
+
+class ReplayChunk(NamedTuple):
+    """The result of a :func:`ReplayTask`
+
+    :param rows: the parsed measurements as tuples ordered by their timestamp
+    :param read: the number of messages read
+    :param failed: the number of messages that could not be parsed
+    """
+    rows: list[tuple[Any, ...]]
+    read: int
+    failed: int
+
+
+class ReplayStats(NamedTuple):
+    """Statistics of a replay
+
+    :param read: the number of messages read
+    :param failed: the number of messages that could not be parsed
+    :param inserted: the number of measurements inserted or replaced
+    :param seconds: the wall time the replay took
+    """
+    read: int
+    failed: int
+    inserted: int
+    seconds: float
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds else float('inf')
+
+
+def _iter_capture(task: ReplayTask) -> Iterator[tuple[bytes, bytes]]:
+    """Read the lines starting in the byte range of the task"""
+    end = task.offset + task.length
+    with open(task.path, 'rb') as f:
+        if task.offset > 0:
+            # skip the rest of the line the previous task ends with
+            f.seek(task.offset - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                timestamp, _, msg = line.partition(b',')
+                yield timestamp, msg
+
+
+def _replay_task(task: ReplayTask) -> ReplayChunk:
+    msgs: Iterable[tuple[float | bytes, bytes]]
+    if task.kind == 'archive':
+        archive = RawArchive(os.path.dirname(task.path))
+        msgs = archive.read_file(task.path, start=task.start, end=task.end)
+    else:
+        msgs = _iter_capture(task)
+
+    lo = float('-inf') if task.start is None else task.start
+    hi = float('inf') if task.end is None else task.end
+    gap_starts = [gap.start for gap in task.gaps or ()]
+    rows = []
+    failed = 0
+    for raw_timestamp, msg in msgs:
+        try:
+            timestamp = float(raw_timestamp)
+            if not lo <= timestamp < hi:
+                continue
+            if task.gaps is not None:
+                idx = bisect.bisect_right(gap_starts, timestamp) - 1
+                if idx < 0 or timestamp >= task.gaps[idx].end:
+                    continue
+            m = Measurement.from_msg(msg=msg, timestamp=int(timestamp))
+        except (ValueError, IndexError) as e:
+            failed += 1
+            logger.debug('failed parsing %r: %s', msg, e)
+        else:
+            rows.append(tuple(m))
+
+    # inserting in the order of the primary key is the fastest
+    rows.sort(key=itemgetter(0))
+    return ReplayChunk(rows=rows, read=len(rows) + failed, failed=failed)
+
+
+def _archive_gaps(
+        archive: RawArchive,
+        path: str,
+        gaps: tuple[Gap, ...],
+) -> tuple[Gap, ...]:
+    """The gaps overlapping the time range of an archive file"""
+    if os.path.exists(f'{path}{JOURNAL_SUFFIX}'):
+        # the time range of the messages in the journal is not indexed
+        return gaps
+    entries = archive.index(path)
+    lo = min((e.min_ts for e in entries), default=float('inf'))
+    hi = max((e.max_ts for e in entries), default=float('-inf'))
+    return tuple(gap for gap in gaps if gap.start <= hi and gap.end > lo)
+
+
+def make_tasks(
+        sources: Sequence[str],
+        start: float | None = None,
+        end: float | None = None,
+        chunk_bytes: int = CHUNK_BYTES,
+        gaps: Sequence[Gap] | None = None,
+) -> list[ReplayTask]:
+    """Split the sources into tasks, each covering a time range.
+
+    :param sources: directories of a :func:`vpf_730.archive.RawArchive` or
+        capture files with one ``<unix timestamp>,<message>`` per line
+    :param start: optional - only replay messages received at or after this
+        unix timestamp (UTC)
+    :param end: optional - only replay messages received before this unix
+        timestamp (UTC)
+    :param chunk_bytes: the approximate size of a task for capture files
+    :param gaps: optional - only replay messages received in these gaps,
+        ordered by their start. Archive files not overlapping any gap are
+        skipped
+
+    :return: the tasks in the order of the sources
+    """
+    tasks: list[ReplayTask] = []
+    task_gaps = None if gaps is None else tuple(gaps)
+    for source in sources:
+        if os.path.isdir(source):
+            archive = RawArchive(source)
+            for path in archive.files():
+                file_gaps = task_gaps
+                if task_gaps is not None:
+                    file_gaps = _archive_gaps(archive, path, task_gaps)
+                    if not file_gaps:
+                        continue
+                tasks.append(
+                    ReplayTask(
+                        kind='archive',
+                        path=path,
+                        start=start,
+                        end=end,
+                        gaps=file_gaps,
+                    ),
+                )
+        else:
+            size = os.path.getsize(source)
+            tasks.extend(
+                ReplayTask(
+                    kind='capture',
+                    path=source,
+                    offset=offset,
+                    length=min(chunk_bytes, size - offset),
+                    start=start,
+                    end=end,
+                    gaps=task_gaps,
+                )
+                for offset in range(0, size, chunk_bytes)
+            )
+    return tasks
+
+
+def replay(
+        sources: Sequence[str],
+        db_path: str,
+        jobs: int | None = None,
+        start: float | None = None,
+        end: float | None = None,
+        on_conflict: Literal['abort', 'ignore', 'replace'] = 'replace',
+        chunk_bytes: int = CHUNK_BYTES,
+        gaps_only: bool = False,
+) -> ReplayStats:
+    """Parse captured raw messages using
+    :func:`vpf_730.vpf_730.Measurement.from_msg` and store them in the
+    ``measurements`` table e.g. to rebuild it after a bug in the parser was
+    fixed.
+
+    The sources are split into tasks by time range (one per archive file or
+    chunk of a capture file), that are parsed in parallel by a process pool.
+    The results are bulk-inserted in the order of the tasks, one transaction
+    per task.
+
+    :param sources: directories of a :func:`vpf_730.archive.RawArchive` or
+        capture files with one ``<unix timestamp>,<message>`` per line
+    :param db_path: path to the sqlite database
+    :param jobs: the number of worker processes, defaults to the number of
+        CPUs. With ``1`` everything is run in the current process
+    :param start: optional - only replay messages received at or after this
+        unix timestamp (UTC)
+    :param end: optional - only replay messages received before this unix
+        timestamp (UTC)
+    :param on_conflict: how to handle already stored measurements, see
+        :func:`vpf_730.storage.insert_measurements`
+    :param chunk_bytes: the approximate size of a task for capture files
+    :param gaps_only: only replay messages received in the minutes missing
+        from the local database, found by :func:`vpf_730.gaps.find_gaps`.
+        Archive files without a gap are not even read
+
+    :return: the statistics of the replay
+    """
+    if is_partitioned(db_path):
+        raise ValueError(
+            f'replaying into a database partitioned by month is not '
+            f'supported, got: {db_path!r}',
+        )
+    t0 = time.perf_counter()
+    gaps = None
+    if gaps_only:
+        with connect(db_path) as db:
+            gaps = find_gaps(
+                db,
+                start=-2**62 if start is None else int(start),
+                end=2**62 if end is None else math.ceil(end),
+            )
+    tasks = make_tasks(
+        sources=sources,
+        start=start,
+        end=end,
+        chunk_bytes=chunk_bytes,
+        gaps=gaps,
+    )
+    read = failed = inserted = 0
+    with connect(db_path) as db:
+        for chunk in process_map(
+                _replay_task, tasks, jobs=jobs or os.cpu_count() or 1,
+        ):
+            read += chunk.read
+            failed += chunk.failed
+            with db:
+                inserted += insert_measurements(
+                    db,
+                    chunk.rows,
+                    on_conflict=on_conflict,
+                )
+
+    return ReplayStats(
+        read=read,
+        failed=failed,
+        inserted=inserted,
+        seconds=time.perf_counter() - t0,
+    )
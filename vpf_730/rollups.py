@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import NamedTuple
+
+from vpf_730.chunks import CHUNK_TABLE
+from vpf_730.chunks import SECONDS_PER_DAY
+from vpf_730.chunks import select_range
+from vpf_730.storage import is_compact
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+
+"""
+The rollup tables by the length of their buckets in seconds, from the finest
+to the coarsest. Every bucket starts at a multiple of its length (UTC).
+"""
+ROLLUPS = {
+    600: 'rollup_10min',
+    3600: 'rollup_hourly',
+    SECONDS_PER_DAY: 'rollup_daily',
+}
+# the columns of the rollup tables, by the aggregate computing them from the
+# measurements and the aggregate merging them from a finer rollup
+_COLUMNS = {
+    'count': ('count(*)', 'sum'),
+    'water_in_precip_sum': ('sum(water_in_precip)', 'sum'),
+    'optical_range_min': ('min(optical_range)', 'min'),
+    'optical_range_sum': ('sum(optical_range)', 'sum'),
+    'optical_range_max': ('max(optical_range)', 'max'),
+    'temp_min': ('min(temp)', 'min'),
+    'temp_sum': ('sum(temp)', 'sum'),
+    'temp_max': ('max(temp)', 'max'),
+}
+_TRIGGER = 'measurements_rollup'
+
+
+class Rollup(NamedTuple):
+    """Aggregated measurements of one interval
+
+    :param start: unix timestamp (UTC) of the start of the interval
+    :param nr_measurements: the number of measurements
+    :param water_in_precip_sum: the sum of ``water_in_precip`` in mm
+    :param optical_range_min: the minimum ``optical_range`` in km
+    :param optical_range_mean: the mean ``optical_range`` in km
+    :param optical_range_max: the maximum ``optical_range`` in km
+    :param temp_min: the minimum ``temp`` in °C
+    :param temp_mean: the mean ``temp`` in °C
+    :param temp_max: the maximum ``temp`` in °C
+    :param precipitation_type_msg: the most frequent
+        ``precipitation_type_msg``
+    """
+    start: int
+    nr_measurements: int
+    water_in_precip_sum: float | None
+    optical_range_min: float | None
+    optical_range_mean: float | None
+    optical_range_max: float | None
+    temp_min: float | None
+    temp_mean: float | None
+    temp_max: float | None
+    precipitation_type_msg: str | None
+
+
+def _levels() -> list[tuple[int, str, int | None, str]]:
+    """Every rollup with the length of the buckets and the table of the finer
+    rollup it is computed from, ``None`` for the measurements
+    """
+    ret = []
+    source: tuple[int | None, str] = (None, 'measurements')
+    for length, table in ROLLUPS.items():
+        ret.append((length, table, *source))
+        source = (length, table)
+    return ret
+
+
+def _aggregate(source_length: int | None, bucket: str) -> str:
+    if source_length is None:
+        aggregates = (raw for raw, _ in _COLUMNS.values())
+    else:
+        aggregates = (
+            f'{merge}({name})' for name, (_, merge) in _COLUMNS.items()
+        )
+    return f'{bucket}, {", ".join(aggregates)}'
+
+
+def _precip(source_length: int | None) -> str:
+    if source_length is None:
+        return 'coalesce(precipitation_type_msg, \'\'), count(*)'
+    else:
+        return 'precipitation_type_msg, sum(count)'
+
+
+def _schema() -> list[str]:
+    """The statements creating the rollup tables"""
+    columns = ', '.join(f'{name} NUMERIC' for name in _COLUMNS)
+    statements = []
+    for table in ROLLUPS.values():
+        statements.append(
+            f'CREATE TABLE IF NOT EXISTS {table}('
+            f'bucket INTEGER PRIMARY KEY, {columns})',
+        )
+        statements.append(
+            f'CREATE TABLE IF NOT EXISTS {table}_precip('
+            f'bucket INTEGER, precipitation_type_msg TEXT, count INTEGER, '
+            f'PRIMARY KEY (bucket, precipitation_type_msg)) WITHOUT ROWID',
+        )
+    return statements
+
+
+def _trigger(table: str) -> str:
+    """A trigger recomputing the buckets of a new measurement, each from the
+    finer rollup. Hence it stays correct when a measurement is replaced. The
+    conflict clause of the inserting statement overrides the ones of the
+    trigger, so the buckets are deleted and inserted again.
+    """
+    statements: list[str] = []
+    for length, rollup, source_length, source in _levels():
+        bucket = f'NEW.timestamp - NEW.timestamp % {length}'
+        key = 'timestamp' if source_length is None else 'bucket'
+        where = f'{key} >= {bucket} AND {key} < {bucket} + {length}'
+        precip_source = (
+            source if source_length is None else f'{source}_precip'
+        )
+        statements.extend((
+            f'DELETE FROM {rollup} WHERE bucket = {bucket}',
+            f'INSERT INTO {rollup} '
+            f'SELECT {_aggregate(source_length, bucket)} '
+            f'FROM {source} WHERE {where}',
+            f'DELETE FROM {rollup}_precip WHERE bucket = {bucket}',
+            f'INSERT INTO {rollup}_precip '
+            f'SELECT {bucket}, {_precip(source_length)} '
+            f'FROM {precip_source} WHERE {where} GROUP BY 2',
+        ))
+    body = ';\n'.join(statements)
+    # a measurement inserted into a day packed by compact_days would replace
+    # the rollups of the whole bucket
+    return (
+        f'CREATE TRIGGER IF NOT EXISTS {_TRIGGER} AFTER INSERT ON {table}\n'
+        f'WHEN NOT EXISTS (SELECT 1 FROM measurement_chunks '
+        f'WHERE day = NEW.timestamp / {SECONDS_PER_DAY})\n'
+        f'BEGIN\n{body};\nEND'
+    )
+
+
+def has_rollups(db: sqlite3.Connection) -> bool:
+    """Check whether the database contains the rollup tables
+
+    :param db: an open connection to the sqlite database
+
+    :return: ``True`` if :func:`create_rollups` was called for the database
+    """
+    try:
+        db.execute(f'SELECT 1 FROM {ROLLUPS[SECONDS_PER_DAY]} LIMIT 0')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def create_rollups(db: sqlite3.Connection) -> None:
+    """Create the rollup tables and the trigger, which updates them whenever a
+    measurement is inserted, and compute the rollups of the existing
+    measurements. Calling it again recreates the trigger, e.g. after
+    :func:`vpf_730.storage.migrate_db`.
+
+    :param db: an open connection to the sqlite database
+    """
+    new = not has_rollups(db)
+    with db:
+        if is_compact(db):
+            table = 'measurements_compact'
+        else:
+            db.execute(MEASUREMENT_TABLE)
+            table = 'measurements'
+        db.execute(CHUNK_TABLE)
+        for statement in _schema():
+            db.execute(statement)
+        db.execute(f'DROP TRIGGER IF EXISTS {_TRIGGER}')
+        db.execute(_trigger(table))
+    if new:
+        rebuild_rollups(db)
+
+
+def drop_rollup_trigger(db: sqlite3.Connection) -> None:
+    """Drop the trigger updating the rollups e.g. before bulk-inserting many
+    measurements, which is considerably faster without it. Afterwards the
+    rollups of the inserted range must be rebuilt using
+    :func:`rebuild_rollups` and the trigger recreated using
+    :func:`create_rollups`.
+
+    :param db: an open connection to the sqlite database
+    """
+    db.execute(f'DROP TRIGGER IF EXISTS {_TRIGGER}')
+
+
+def rebuild_rollups(
+        db: sqlite3.Connection,
+        start: int | None = None,
+        end: int | None = None,
+) -> int:
+    """Recompute the rollups of the measurements in a time range from the
+    ``measurements`` table e.g. after bulk-inserting measurements. Buckets
+    without measurements e.g. of days packed by
+    :func:`vpf_730.chunks.compact_days` are kept.
+
+    :param db: an open connection to the sqlite database
+    :param start: optional - unix timestamp (UTC), the start of the range
+    :param end: optional - unix timestamp (UTC), the (exclusive) end of the
+        range
+
+    :return: the number of the finest buckets recomputed
+    """
+    rebuilt = 0
+    with db:
+        for length, rollup, source_length, source in _levels():
+            # include the whole buckets the range overlaps
+            lo = 0 if start is None else start - start % length
+            hi = 2**62 if end is None else end - end % length + length
+            key = 'timestamp' if source_length is None else 'bucket'
+            bucket = f'{key} - {key} % {length}'
+            where = f'{key} >= ? AND {key} < ?'
+            precip_source = (
+                source if source_length is None else f'{source}_precip'
+            )
+            cur = db.execute(
+                f'INSERT OR REPLACE INTO {rollup} '
+                f'SELECT {_aggregate(source_length, bucket)} '
+                f'FROM {source} WHERE {where} GROUP BY 1',
+                (lo, hi),
+            )
+            if source_length is None:
+                rebuilt = cur.rowcount
+            db.execute(
+                f'DELETE FROM {rollup}_precip WHERE bucket IN ('
+                f'SELECT DISTINCT {bucket} FROM {source} WHERE {where})',
+                (lo, hi),
+            )
+            db.execute(
+                f'INSERT INTO {rollup}_precip '
+                f'SELECT {bucket}, {_precip(source_length)} '
+                f'FROM {precip_source} WHERE {where} GROUP BY 1, 2',
+                (lo, hi),
+            )
+    return rebuilt
+
+
+def _has_chunks(db: sqlite3.Connection, start: int, end: int) -> bool:
+    """Whether days packed by :func:`vpf_730.chunks.compact_days` overlap
+    ``[start, end)``
+    """
+    try:
+        ret = db.execute(
+            'SELECT 1 FROM measurement_chunks '
+            'WHERE last_timestamp >= ? AND first_timestamp < ? LIMIT 1',
+            (start, end),
+        )
+    except sqlite3.OperationalError:
+        # nothing was compacted yet
+        return False
+    return ret.fetchone() is not None
+
+
+def _fill_source(db: sqlite3.Connection, start: int, end: int) -> str:
+    """Copy the measurements in ``[start, end)`` including the packed days into
+    a temporary table, so they can be aggregated like the ``measurements``
+    table
+
+    :return: the name of the temporary table
+    """
+    in_transaction = db.in_transaction
+    batch = select_range(db, start=start - 1, end=end - 1)
+    db.execute('DROP TABLE IF EXISTS temp.rollup_source')
+    db.execute(
+        'CREATE TEMP TABLE rollup_source('
+        'timestamp INTEGER, water_in_precip NUMERIC, optical_range NUMERIC, '
+        'temp NUMERIC, precipitation_type_msg TEXT)',
+    )
+    db.executemany(
+        'INSERT INTO temp.rollup_source VALUES (?, ?, ?, ?, ?)',
+        (
+            (
+                m.timestamp, m.water_in_precip, m.optical_range, m.temp,
+                m.precipitation_type_msg,
+            )
+            for m in batch
+        ),
+    )
+    if not in_transaction and db.in_transaction:
+        # only the temporary table was written to
+        db.commit()
+    return 'temp.rollup_source'
+
+
+def select_rollups(
+        db: sqlite3.Connection,
+        start: int,
+        end: int,
+        interval: int,
+) -> list[Rollup]:
+    """Aggregate the measurements with ``start <= timestamp < end`` over
+    intervals of ``interval`` seconds starting at ``start``. The coarsest
+    rollup whose buckets are aligned with ``start``, ``end`` and
+    ``interval`` is used, otherwise the measurements are aggregated,
+    including days packed by :func:`vpf_730.chunks.compact_days`. E.g.
+    hourly sums for a day are computed from 24 rows of the hourly rollup.
+
+    :param db: an open connection to the sqlite database
+    :param start: unix timestamp (UTC), the start of the first interval
+    :param end: unix timestamp (UTC), the (exclusive) end of the last interval
+    :param interval: the length of the intervals in seconds
+
+    :return: one rollup per interval containing measurements, ordered by
+        their start
+    """
+    if interval <= 0:
+        raise ValueError(f'interval must be positive, got: {interval}')
+
+    source_length = None
+    source = 'measurements'
+    if has_rollups(db):
+        for length, rollup in ROLLUPS.items():
+            if start % length == end % length == interval % length == 0:
+                source_length, source = length, rollup
+    if source_length is None and _has_chunks(db, start, end):
+        source = _fill_source(db, start, end)
+
+    key = 'timestamp' if source_length is None else 'bucket'
+    interval_start = f'{key} - ({key} - {int(start)}) % {int(interval)}'
+    where = f'{key} >= ? AND {key} < ?'
+    ret = db.execute(
+        f'SELECT {_aggregate(source_length, interval_start)} '
+        f'FROM {source} WHERE {where} GROUP BY 1 ORDER BY 1',
+        (start, end),
+    )
+    rows = ret.fetchall()
+
+    precip_source = source if source_length is None else f'{source}_precip'
+    ret = db.execute(
+        f'SELECT {interval_start}, {_precip(source_length)} '
+        f'FROM {precip_source} WHERE {where} GROUP BY 1, 2',
+        (start, end),
+    )
+    types: dict[int, list[tuple[int, str]]] = {}
+    for bucket, precip_type, count in ret.fetchall():
+        types.setdefault(bucket, []).append((-count, precip_type))
+    # the most frequent type, the first in alphabetical order on a tie
+    dominant = {bucket: min(counts)[1] for bucket, counts in types.items()}
+
+    if source.startswith('temp.'):
+        db.execute(f'DROP TABLE {source}')
+
+    rollups = []
+    for (
+            bucket, count, water_sum, or_min, or_sum, or_max,
+            temp_min, temp_sum, temp_max,
+    ) in rows:
+        rollups.append(
+            Rollup(
+                start=bucket,
+                nr_measurements=count,
+                water_in_precip_sum=water_sum,
+                optical_range_min=or_min,
+                optical_range_mean=None if or_sum is None else or_sum / count,
+                optical_range_max=or_max,
+                temp_min=temp_min,
+                temp_mean=None if temp_sum is None else temp_sum / count,
+                temp_max=temp_max,
+                precipitation_type_msg=dominant.get(bucket),
+            ),
+        )
+    return rollups
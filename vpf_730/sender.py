@@ -5,18 +5,43 @@ import configparser
 import json
 import logging
 import os
+import sqlite3
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
+from collections.abc import Sequence
 from datetime import datetime
-from datetime import timezone
 from typing import NamedTuple
+from typing import TYPE_CHECKING
 from typing import TypedDict
 
+from vpf_730.clock import Clock
+from vpf_730.clock import SystemClock
+from vpf_730.metrics import BYTES_SENT
+from vpf_730.metrics import HTTP_REQUEST_SECONDS
+from vpf_730.metrics import ROWS_PENDING_UPLOAD
+from vpf_730.metrics import SCHEDULER_OVERRUNS
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import PartitionedDB
 from vpf_730.utils import connect
 
+if TYPE_CHECKING:
+    from vpf_730.batch import MeasurementBatch
+
 logger = logging.getLogger(__name__)
 
+_scheduler_overruns = SCHEDULER_OVERRUNS.labels('sender')
+
+# the seconds to wait for the remote, before a request fails
+HTTP_TIMEOUT = 30.0
+
+
+def _observe_http(endpoint: str, start: float, code: object) -> None:
+    HTTP_REQUEST_SECONDS.labels(endpoint, code).observe(
+        time.perf_counter() - start,
+    )
+
 
 class SenderConfig(NamedTuple):
     """A class representing the configuration of sender.
@@ -28,6 +53,9 @@ class SenderConfig(NamedTuple):
     :param max_req_len: maximum number of measurements to send in one request
     :param get_endpoint: http endpoint to get the status from (latest data)
     :param post_endpoint: http endpoint where the data should be posted to
+    :param retention_days: optional - delete the monthly partitions of the
+        local database (see :func:`vpf_730.partitions.PartitionedDB`) once
+        they were sent and are older than this number of days
     """
     local_db: str
     send_interval: int
@@ -35,6 +63,7 @@ class SenderConfig(NamedTuple):
     post_endpoint: str
     max_req_len: int
     api_key: str
+    retention_days: int | None = None
 
     @classmethod
     def from_env(cls) -> SenderConfig:
@@ -45,10 +74,12 @@ class SenderConfig(NamedTuple):
         * ``VPF730_GET_ENDPOINT`` - http endpoint to get the status from (latest data)
         * ``VPF730_POST_ENDPOINT`` - http endpoint where the data should be posted to
         * ``VPF730_API_KEY`` - the API-key used to authenticate when sending the requests in
+        * ``VPF730_RETENTION_DAYS`` - optional number of days after which sent monthly partitions are deleted
 
         :return: a new instance of :func:`SenderConfig` created from
             environment variables.
         """  # noqa: E501
+        retention_days = os.environ.get('VPF730_RETENTION_DAYS')
         return cls(
             local_db=os.environ['VPF730_LOCAL_DB'],
             send_interval=int(os.environ['VPF730_SEND_INTERVAL']),
@@ -56,6 +87,7 @@ class SenderConfig(NamedTuple):
             get_endpoint=os.environ['VPF730_GET_ENDPOINT'],
             post_endpoint=os.environ['VPF730_POST_ENDPOINT'],
             api_key=os.environ['VPF730_API_KEY'],
+            retention_days=int(retention_days) if retention_days else None,
         )
 
     @classmethod
@@ -72,6 +104,8 @@ class SenderConfig(NamedTuple):
                 post_endpoint=https://api.example/com/vpf-730/data
                 max_req_len=512
                 api_key=deadbeef
+                # optional
+                retention_days=365
 
 
         :param path: path to the ``.ini`` config file with the structure above
@@ -81,6 +115,7 @@ class SenderConfig(NamedTuple):
         """
         config = configparser.ConfigParser()
         config.read(path)
+        retention_days = config['vpf_730'].getint('retention_days')
         return cls(
             config['vpf_730']['local_db'],
             int(config['vpf_730']['send_interval']),
@@ -88,6 +123,7 @@ class SenderConfig(NamedTuple):
             config['vpf_730']['post_endpoint'],
             int(config['vpf_730']['max_req_len']),
             config['vpf_730']['api_key'],
+            retention_days,
         )
 
     @classmethod
@@ -109,6 +145,7 @@ class SenderConfig(NamedTuple):
             post_endpoint=args.post_endpoint,
             max_req_len=args.max_req_len,
             api_key=os.environ['VPF730_API_KEY'],
+            retention_days=getattr(args, 'retention_days', None),
         )
 
     def __repr__(self) -> str:
@@ -119,7 +156,8 @@ class SenderConfig(NamedTuple):
             f'get_endpoint={self.get_endpoint!r}, '
             f'post_endpoint={self.post_endpoint!r}, '
             f'max_req_len={self.max_req_len!r}, '
-            f'api_key=***)'
+            f'api_key=***, '
+            f'retention_days={self.retention_days!r})'
         )
 
 
@@ -142,10 +180,106 @@ class MeasurementDict(TypedDict):
     total_exco: float
 
 
+def _has_chunks(db: sqlite3.Connection, start: int) -> bool:
+    # measurements after start were packed by vpf_730.chunks.compact_days
+    try:
+        ret = db.execute(
+            'SELECT 1 FROM measurement_chunks '
+            'WHERE last_timestamp > ? LIMIT 1',
+            (start,),
+        )
+    except sqlite3.OperationalError:
+        # the table does not exist
+        return False
+    return ret.fetchone() is not None
+
+
+def select_measurements(
+        db: sqlite3.Connection,
+        start: int,
+        limit: int | None = None,
+) -> list[MeasurementDict]:
+    """Select all measurements after ``start`` using an open connection. Days
+    packed by :func:`vpf_730.chunks.compact_days` are decoded transparently.
+
+    :param db: an open connection to the sqlite database
+    :param start: unix timestamp (UTC) after which to get data
+    :param limit: optional - only select the first ``limit`` measurements, the
+        next page starts after the ``timestamp`` of the last one
+
+    :return: data ordered by the timestamp
+    """
+    if _has_chunks(db, start):
+        # imported here, so the sender only imports it when needed
+        from vpf_730.chunks import select_range
+
+        return select_range(db, start=start, limit=limit).to_dicts()
+
+    query = '''\
+        SELECT
+            timestamp,
+            sensor_id,
+            last_measurement_period,
+            time_since_report,
+            optical_range,
+            precipitation_type_msg,
+            obstruction_to_vision,
+            receiver_bg_illumination,
+            water_in_precip,
+            temp,
+            nr_precip_particles,
+            transmission_eq,
+            exco_less_precip_particle,
+            backscatter_exco,
+            self_test,
+            total_exco
+        FROM measurements
+        WHERE timestamp > ?
+        ORDER BY timestamp
+        LIMIT ?
+    '''
+    # a negative limit means no limit in sqlite
+    ret = db.execute(query, (start, -1 if limit is None else limit))
+    val = ret.fetchall()
+    # https://github.com/python/mypy/issues/8890
+    md = MeasurementDict
+    return [md(i) for i in val]  # type: ignore[call-arg, misc]
+
+
+def select_partitioned(
+        db: PartitionedDB,
+        start: int,
+        limit: int | None = None,
+) -> list[MeasurementDict]:
+    """Select all measurements after ``start`` from all monthly partitions,
+    see :func:`select_measurements`
+
+    :param db: the partitioned database
+    :param start: unix timestamp (UTC) after which to get data
+    :param limit: optional - only select the first ``limit`` measurements
+
+    :return: data ordered by the timestamp
+    """
+    ret: list[MeasurementDict] = []
+    for conn in db.attached(start=start):
+        if limit is not None and len(ret) >= limit:
+            break
+        ret.extend(
+            select_measurements(
+                db=conn,
+                start=start,
+                limit=None if limit is None else limit - len(ret),
+            ),
+        )
+    return ret
+
+
 class Sender:
-    def __init__(self, cfg: SenderConfig) -> None:
+    def __init__(self, cfg: SenderConfig, clock: Clock | None = None) -> None:
         self.cfg = cfg
+        self.clock = clock if clock is not None else SystemClock()
         self.sending = True
+        self.sensor_id: int | None = None
 
     @property
     def _sending(self) -> bool:
@@ -154,9 +288,14 @@ class Sender:
 
     def run(self) -> None:
         prev_minute = -1
+        prev_now: datetime | None = None
         while self._sending is True:
-            time.sleep(.1)
-            now = datetime.now(timezone.utc)
+            self.clock.sleep(.1)
+            now = self.clock.now()
+            # we woke up too late, so a scheduled second may have been missed
+            if prev_now and (now - prev_now).total_seconds() > 1:
+                _scheduler_overruns.inc()
+            prev_now = now
             # don't accidentally log the same timestamp twice
             if (
                 now.minute % self.cfg.send_interval == 0 and
@@ -165,49 +304,108 @@ class Sender:
             ):
                 last_date = self.get_remote_timestamp()
                 data = self.get_data_from_db(start=last_date)
-                if not data:
-                    continue
-
-                # we don't exceed the max_req_len and can send the data as one
-                if len(data) <= self.cfg.max_req_len:
-                    self.post_data_to_remote(data=data)
-                    continue
-
-                counter = 0
-                post_stack: list[MeasurementDict] = []
-                for row in data:
-                    post_stack.append(row)
-                    if counter == self.cfg.max_req_len - 1:
-                        self.post_data_to_remote(data=post_stack)
-                        post_stack = []
-                        counter = 0
-                    else:
-                        counter += 1
-
-                # if we have data left which does not fill a max size request
-                else:
-                    if post_stack:
-                        self.post_data_to_remote(data=post_stack)
+                ROWS_PENDING_UPLOAD.set(len(data))
+                self.send(data=data)
+                self.prune(
+                    sent_until=data[-1]['timestamp'] if data else last_date,
+                )
+
+                prev_minute = now.minute
+
+    def send(
+            self,
+            data: Sequence[MeasurementDict] | MeasurementBatch,
+    ) -> None:
+        """Send data to the remote endpoint, split into as many requests as
+        needed for not exceeding ``max_req_len`` measurements per request.
+
+        :param data: the measurements to send, a
+            :func:`vpf_730.batch.MeasurementBatch` is only converted to
+            dictionaries one request at a time
+        """
+        for idx in range(0, len(data), self.cfg.max_req_len):
+            chunk = data[idx:idx + self.cfg.max_req_len]
+            self.post_data_to_remote(data=chunk)
+            ROWS_PENDING_UPLOAD.dec(len(chunk))
+
+    def get_sensor_id(self) -> int | None:
+        """Get the id of the sensor whose measurements are in the local
+        database. It is remembered once found, since a station only has a
+        single sensor.
+
+        :return: the ``sensor_id`` of the newest measurement or ``None`` if
+            the local database does not contain any measurements yet
+        """
+        if self.sensor_id is not None:
+            return self.sensor_id
+
+        if is_partitioned(self.cfg.local_db):
+            partitions = PartitionedDB(self.cfg.local_db).partitions()
+            paths = [p.path for p in reversed(partitions)]
+        else:
+            paths = [self.cfg.local_db]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with connect(path) as db:
+                try:
+                    ret = db.execute(
+                        'SELECT sensor_id FROM measurements '
+                        'ORDER BY timestamp DESC LIMIT 1',
+                    ).fetchone()
+                except sqlite3.OperationalError:
+                    ret = None
+            if ret is not None:
+                self.sensor_id = ret[0]
+                break
+        return self.sensor_id
 
     def get_remote_timestamp(self) -> int:
+        """Get the timestamp of the latest measurement the remote has. The
+        ``sensor_id`` of the local database is sent along, so a remote
+        receiving from many stations does not answer with the latest
+        measurement of another station.
+
+        :return: the latest timestamp the remote has
+        """
+        url = self.cfg.get_endpoint
+        sensor_id = self.get_sensor_id()
+        if sensor_id is not None:
+            sep = '&' if urllib.parse.urlsplit(url).query else '?'
+            url = f'{url}{sep}sensor_id={sensor_id}'
         status_req = urllib.request.Request(
-            url=self.cfg.get_endpoint,
+            url=url,
             headers={
                 'Authorization': self.cfg.api_key,
                 'Content-type': 'application/json',
             },
         )
+        start = time.perf_counter()
         try:
-            status_resp = urllib.request.urlopen(status_req)
+            status_resp = urllib.request.urlopen(
+                status_req, timeout=HTTP_TIMEOUT,
+            )
+            _observe_http('status', start, status_resp.status)
             status_resp_str = status_resp.read().decode()
             return json.loads(status_resp_str)['latest_date']
         except urllib.error.HTTPError as e:
+            _observe_http('status', start, e.code)
             msg = json.loads(e.read().decode())
             logger.exception('http error getting latest date: %s', msg)
             raise
 
-    def post_data_to_remote(self, data: list[MeasurementDict]) -> None:
-        post_data = json.dumps({'data': data}).encode()
+    def post_data_to_remote(
+            self,
+            data: Sequence[MeasurementDict] | MeasurementBatch,
+    ) -> None:
+        # imported here, so the sender does not import pyserial on start-up
+        from vpf_730.batch import MeasurementBatch
+
+        if isinstance(data, MeasurementBatch):
+            rows = data.to_dicts()
+        else:
+            rows = list(data)
+        post_data = json.dumps({'data': rows}).encode()
         req = urllib.request.Request(
             url=self.cfg.post_endpoint,
             data=post_data,
@@ -216,9 +414,13 @@ class Sender:
                 'Content-type': 'application/json',
             },
         )
+        start = time.perf_counter()
         try:
-            urllib.request.urlopen(req)
+            resp = urllib.request.urlopen(req, timeout=HTTP_TIMEOUT)
+            _observe_http('data', start, resp.status)
+            BYTES_SENT.inc(len(post_data))
         except urllib.error.HTTPError as e:
+            _observe_http('data', start, e.code)
             msg = json.loads(e.read().decode())
             logger.exception('http error sending date: %s', msg)
             raise
@@ -230,31 +432,29 @@ class Sender:
 
         :return: data
         """
+        if is_partitioned(self.cfg.local_db):
+            return select_partitioned(
+                db=PartitionedDB(self.cfg.local_db),
+                start=start,
+            )
         with connect(self.cfg.local_db) as db:
-            query = '''\
-                SELECT
-                    timestamp,
-                    sensor_id,
-                    last_measurement_period,
-                    time_since_report,
-                    optical_range,
-                    precipitation_type_msg,
-                    obstruction_to_vision,
-                    receiver_bg_illumination,
-                    water_in_precip,
-                    temp,
-                    nr_precip_particles,
-                    transmission_eq,
-                    exco_less_precip_particle,
-                    backscatter_exco,
-                    self_test,
-                    total_exco
-                FROM measurements
-                WHERE timestamp > ?
-                ORDER BY timestamp
-            '''
-            ret = db.execute(query, (start,))
-            val = ret.fetchall()
-            # https://github.com/python/mypy/issues/8890
-            md = MeasurementDict
-            return [md(i) for i in val]  # type: ignore[call-arg, misc]
+            return select_measurements(db=db, start=start)
+
+    def prune(self, sent_until: int) -> None:
+        """Delete the monthly partitions of the local database, that were
+        sent and are older than ``retention_days``. Nothing is deleted if the
+        local database is not partitioned or no ``retention_days`` are set.
+
+        :param sent_until: unix timestamp (UTC) of the latest measurement the
+            remote has
+        """
+        if (
+                self.cfg.retention_days is None or
+                not is_partitioned(self.cfg.local_db)
+        ):
+            return
+
+        cutoff = self.clock.now().timestamp() - self.cfg.retention_days * 86400
+        PartitionedDB(self.cfg.local_db).prune(
+            before=min(sent_until + 1, int(cutoff)),
+        )
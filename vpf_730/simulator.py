@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import random
+import select
+import threading
+import time
+from types import TracebackType
+from typing import NamedTuple
+
+from vpf_730.vpf_730 import OBSTRUCTION_TO_VISION
+from vpf_730.vpf_730 import PRECIP_TYPES
+
+logger = logging.getLogger(__name__)
+
+# the response to ``R?`` as shown in the manual
+REMOTE_SELF_TEST = (
+    b' 200,2.515,16.5,12.2,5.00,12.3,00.00,00.00,101,086,000,02,03,00,'
+    b'+001.9,4040'
+)
+
+
+def random_msg(rng: random.Random, sensor_id: int | None = None) -> bytes:
+    """Create a message in the format of the VPF-730, with values spread over
+    realistic ranges.
+
+    :param rng: the random number generator to draw the values from
+    :param sensor_id: the sensor id in the header of the message, drawn
+        randomly if not set
+
+    :return: the message without the trailing ``\\r\\n``
+    """
+    if sensor_id is None:
+        sensor_id = rng.randint(1, 99)
+    precip = rng.choice(list(PRECIP_TYPES))
+    obstruction = rng.choice(list(OBSTRUCTION_TO_VISION))
+    exco = rng.uniform(0, 999)
+    return (
+        f'PW{sensor_id:02d},0060,0000,'
+        f'{rng.uniform(0, 999):06.2f} KM,{precip:<3},{obstruction:<2},'
+        f'{rng.uniform(0, 99):05.2f},{rng.uniform(0, 99):07.4f},'
+        f'{rng.uniform(-40, 60):+06.1f} C,{rng.randint(0, 9999):04d},'
+        f'{exco:06.2f},{exco:06.2f},{rng.uniform(-999, 999):+07.2f},'
+        f'  0000,000,{rng.choice(("OOO", "XOO", "OOX"))},{exco:06.2f}'
+    ).encode()
+
+
+class SimulatorConfig(NamedTuple):
+    """A class representing the configuration of the simulator.
+
+    :param sensor_id: the sensor id sent in the messages
+    :param automatic: start with automatic message transmission enabled, like
+        after sending ``OSAM1`` to the sensor
+    :param interval: interval in seconds between automatic messages
+    :param speedup: factor to accelerate the automatic messages e.g. ``60``
+        sends a message every second with an ``interval`` of ``60``
+    :param garbled_rate: probability of a message containing garbage
+    :param partial_rate: probability of a message being cut off without the
+        trailing ``\\r\\n``
+    :param timeout_rate: probability of not answering a poll at all
+    :param seed: optional - seed of the random number generator to make the
+        messages and faults reproducible
+    """
+    sensor_id: int = 1
+    automatic: bool = False
+    interval: float = 60
+    speedup: float = 1
+    garbled_rate: float = 0
+    partial_rate: float = 0
+    timeout_rate: float = 0
+    seed: int | None = None
+
+    @classmethod
+    def from_argparse(cls, args: argparse.Namespace) -> SimulatorConfig:
+        """Constructs a new :func:`SimulatorConfig` from a
+        :func:`argparse.Namespace`, created by the argument parser returned by
+        :func:`vpf_730.main.build_parser`.
+
+        :param args: arguments returned from the argument parser created by
+            :func:`vpf_730.main.build_parser`
+
+        :return: a new instance of :func:`SimulatorConfig` created from CLI
+            arguments
+        """
+        return cls(
+            sensor_id=args.sensor_id,
+            automatic=args.automatic,
+            interval=args.interval,
+            speedup=args.speedup,
+            garbled_rate=args.garbled_rate,
+            partial_rate=args.partial_rate,
+            timeout_rate=args.timeout_rate,
+            seed=args.seed,
+        )
+
+
+class Simulator:
+    """A simulated VPF-730 sensor connected to a pseudo-terminal. It answers
+    the ``D?`` poll and ``R?`` commands, switches the automatic message
+    transmission with ``OSAM0`` and ``OSAM1`` and can inject faults. Unknown
+    commands are not answered.
+
+    :func:`VPF730` can be pointed at :attr:`port`:
+
+    .. code-block:: python
+
+        with Simulator(SimulatorConfig(timeout_rate=.1)) as sim:
+            vpf730 = VPF730(port=sim.port)
+            print(vpf730.measure())
+
+    :param cfg: the configuration of the simulator
+    """
+
+    def __init__(self, cfg: SimulatorConfig) -> None:
+        self.cfg = cfg
+        self.automatic = cfg.automatic
+        self.running = False
+        self._rng = random.Random(cfg.seed)
+        self._master: int | None = None
+        self._slave: int | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> str:
+        """the path of the pseudo-terminal e.g. ``/dev/pts/3``"""
+        if self._slave is None:
+            raise RuntimeError('the simulator is not started')
+        return os.ttyname(self._slave)
+
+    def start(self) -> None:
+        """Open the pseudo-terminal and answer in a background thread"""
+        # only available on unix-like systems
+        import pty
+        import tty
+
+        self._master, self._slave = pty.openpty()
+        # no echo and no translation of line endings, like a serial line. The
+        # slave is kept open, so the port can be re-opened by the client
+        tty.setraw(self._slave)
+        # like a serial line, data is dropped if nobody reads it
+        os.set_blocking(self._master, False)
+        self.running = True
+        self._thread = threading.Thread(
+            target=self.run,
+            name='vpf-730-simulator',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self) -> Simulator:
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    def run(self) -> None:
+        assert self._master is not None
+        buf = b''
+        interval = self.cfg.interval / self.cfg.speedup
+        next_msg = time.monotonic() + interval
+        while self.running is True:
+            if not self.automatic:
+                # the first message is sent one interval after OSAM1
+                next_msg = time.monotonic() + interval
+
+            timeout = min(max(0, next_msg - time.monotonic()), .1)
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                try:
+                    buf += os.read(self._master, 1024)
+                except OSError:
+                    continue
+                *lines, buf = buf.replace(b'\r\n', b'\r').split(b'\r')
+                for line in lines:
+                    self.handle(line.strip())
+
+            if self.automatic and time.monotonic() >= next_msg:
+                self.send_measurement()
+                next_msg += interval
+
+    def handle(self, command: bytes) -> None:
+        """Handle a single command sent to the sensor
+
+        :param command: the command without the trailing ``\\r\\n``
+        """
+        if command == b'D?':
+            self.send_measurement()
+        elif command == b'R?':
+            self._write(REMOTE_SELF_TEST + b'\r\n')
+        elif command in (b'OSAM0', b'OSAM1'):
+            self.automatic = command == b'OSAM1'
+            self._write(b'OK\r\n')
+        else:
+            logger.debug('ignoring unknown command %r', command)
+
+    def send_measurement(self) -> None:
+        """Send a message, possibly injecting one of the configured faults"""
+        msg = random_msg(self._rng, sensor_id=self.cfg.sensor_id)
+        fault = self._rng.random()
+        if fault < self.cfg.timeout_rate:
+            logger.debug('injecting a timeout')
+            return
+
+        fault -= self.cfg.timeout_rate
+        if fault < self.cfg.garbled_rate:
+            logger.debug('injecting a garbled message')
+            garbled = bytearray(msg)
+            for _ in range(self._rng.randint(1, 5)):
+                garbled[self._rng.randrange(len(garbled))] = (
+                    self._rng.randrange(256)
+                )
+            self._write(bytes(garbled) + b'\r\n')
+            return
+
+        fault -= self.cfg.garbled_rate
+        if fault < self.cfg.partial_rate:
+            logger.debug('injecting a partial message')
+            self._write(msg[:self._rng.randrange(len(msg))])
+            return
+
+        self._write(msg + b'\r\n')
+
+    def _write(self, data: bytes) -> None:
+        assert self._master is not None
+        try:
+            os.write(self._master, data)
+        except BlockingIOError:
+            logger.debug('nobody is reading, dropping %r', data)
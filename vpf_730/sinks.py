@@ -0,0 +1,836 @@
+from __future__ import annotations
+
+import contextlib
+import glob
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timezone
+from types import TracebackType
+from typing import Any
+from typing import BinaryIO
+from typing import get_type_hints
+from typing import Literal
+from typing import NamedTuple
+from typing import TextIO
+
+from vpf_730.chunks import select_range
+from vpf_730.metrics import DB_WRITE_SECONDS
+from vpf_730.metrics import MEASUREMENTS
+from vpf_730.metrics import SINK_DROPPED
+from vpf_730.metrics import SINK_SPILLED
+from vpf_730.metrics import SINK_WRITE_SECONDS
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+
+logger = logging.getLogger(__name__)
+
+# the strftime patterns of the supported rotation periods
+PERIODS = {
+    'hourly': '%Y-%m-%dT%H',
+    'daily': '%Y-%m-%d',
+}
+# the seconds after which written measurements are synced to the disk
+FSYNC_INTERVAL = 60.0
+# the number of bytes buffered before they are written to a csv file
+BUFFER_SIZE = 65536
+# the number of measurements per row group of a parquet file, about one day
+ROW_GROUP_SIZE = 1440
+# the number of measurements read from the database at once when exporting
+EXPORT_ROWS = 65536
+# the file in the export directory storing the newest exported timestamp
+WATERMARK_FILE = '.watermark'
+# the number of measurements queued per sink, about 17 hours
+QUEUE_SIZE = 1024
+# the maximum number of queued measurements a sink writes at once
+SINK_BATCH_SIZE = 60
+# the seconds a new measurement waits for room in the queue of a sink with the
+# block policy, so a stuck sink does not stop taking measurements
+BLOCK_TIMEOUT = 1.0
+# what a sink does with a new measurement, when its queue is full
+Overflow = Literal['block', 'drop_oldest', 'drop_newest', 'spill']
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest', 'spill')
+
+# requests to the thread of a sink, which are kept apart from the queued
+# measurements, so they are never dropped when the queue is full
+_STOP = object()
+_MAINTAIN = object()
+# put into the queue of a sink besides measurements, to wake up its thread
+_WAKE = object()
+# errors writing a batch, that would happen again when retrying it
+PERMANENT_ERRORS = (sqlite3.IntegrityError,)
+
+
+class ExportStats(NamedTuple):
+    """Statistics of an export
+
+    :param exported: the number of measurements written to the files
+    :param watermark: unix timestamp (UTC) of the newest measurement exported
+        so far, ``None`` if nothing was exported yet
+    :param seconds: the wall time the export took
+    """
+    exported: int
+    watermark: int | None
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        """The number of measurements exported per second"""
+        return self.exported / self.seconds if self.seconds else 0.0
+
+
+def _repair_csv(path: str, sep: str) -> int | None:
+    """Remove a line that was only partially written e.g. due to a crash
+
+    :return: the timestamp of the last measurement in the file
+    """
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return None
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        pos = max(0, size - BUFFER_SIZE)
+        f.seek(pos)
+        tail = f.read()
+        if tail and not tail.endswith(b'\n'):
+            f.truncate(pos + tail.rfind(b'\n') + 1)
+            tail = tail[:tail.rfind(b'\n') + 1]
+    for line in reversed(tail.splitlines()):
+        timestamp = line.split(sep.encode(), 1)[0]
+        if timestamp.isdigit():
+            return int(timestamp)
+    return None
+
+
+def _parquet() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as e:  # pragma: no cover
+        raise ImportError(
+            'writing parquet files requires pyarrow, install it using: '
+            'pip install vpf-730[parquet]',
+        ) from e
+    return pyarrow
+
+
+def _parquet_schema(pa: Any) -> Any:
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    return pa.schema(
+        [(k, types[v]) for k, v in get_type_hints(Measurement).items()],
+    )
+
+
+class Sink:
+    """Base class for the outputs of the :func:`vpf_730.logger.Logger` e.g.
+    the local database, files or a message broker. Every sink is run by a
+    :class:`QueuedSink` on its own thread, so all methods are called from
+    that thread only and may block without delaying the next measurement.
+    """
+
+    def write_many(self, measurements: Sequence[Measurement]) -> int:
+        """Write a batch of measurements
+
+        :param measurements: the measurements ordered by their timestamp
+
+        :return: the number of measurements written
+        """
+        raise NotImplementedError
+
+    def maintain(self) -> None:
+        """Called regularly when no measurement is due e.g. for housekeeping.
+        It does nothing by default.
+        """
+
+    def close(self) -> None:
+        """Called once after the last measurement was written. It does
+        nothing by default.
+        """
+
+
+class DBSink(Sink):
+    """Store the measurements in the local database, which is kept open
+    instead of opening it for every measurement like
+    :func:`vpf_730.vpf_730.Measurement.to_db`. Measurements with a timestamp
+    that is already stored are skipped.
+
+    :param db_path: path to the sqlite database. If it contains ``{month}``,
+        one file per month is used (see
+        :func:`vpf_730.partitions.PartitionedDB`), which is maintained by
+        :func:`maintain`
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._db: sqlite3.Connection | None = None
+        self._partitioned_db: PartitionedDB | None = None
+        if is_partitioned(db_path):
+            self._partitioned_db = PartitionedDB(db_path)
+
+    def write_many(self, measurements: Sequence[Measurement]) -> int:
+        # a measurement already stored e.g. since it was spilled twice must
+        # not keep the following ones from being written
+        with DB_WRITE_SECONDS.time():
+            if self._partitioned_db is not None:
+                inserted = 0
+                for measurement in measurements:
+                    try:
+                        self._partitioned_db.insert(measurement)
+                    except sqlite3.IntegrityError:
+                        continue
+                    inserted += 1
+            else:
+                if self._db is None:
+                    self._db = sqlite3.connect(self.db_path)
+                with self._db:
+                    inserted = insert_measurements(
+                        self._db, measurements, on_conflict='ignore',
+                    )
+        if inserted < len(measurements):
+            logger.warning(
+                'skipped %d measurements already stored in %s',
+                len(measurements) - inserted, self.db_path,
+            )
+        MEASUREMENTS.inc(inserted)
+        return inserted
+
+    def maintain(self) -> None:
+        if self._partitioned_db is not None:
+            self._partitioned_db.maintain()
+
+    def close(self) -> None:
+        if self._partitioned_db is not None:
+            self._partitioned_db.close()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class FileSink(Sink):
+    """Write measurements to files rotated by time e.g. for other tools,
+    instead of appending every measurement using
+    :func:`vpf_730.vpf_730.Measurement.to_csv`, which opens the file each
+    time.
+
+    The measurements are stored in files named by the ``period`` (a
+    :func:`datetime.strftime` pattern, daily by default) of their timestamp.
+    The current file is kept open and writes are buffered. Every
+    ``fsync_interval`` seconds and when the file is rotated the measurements
+    are synced to the disk, so at most the measurements of the last interval
+    are lost if the computer crashes.
+
+    A csv file is appended to when it is opened again, after removing a line
+    that was only partially written. Measurements, that are not newer than
+    the last one in the file, are skipped, so writing the same measurements
+    again does not duplicate them.
+
+    Parquet files (this requires ``pyarrow``) are written in row groups of
+    ``row_group_size`` measurements and are only readable once they are
+    closed. Until then they are written to a temporary file, hence a file
+    is never incomplete. Since parquet files cannot be appended to, a new
+    file e.g. ``2023-01-01.1.parquet`` is started when the sink is opened
+    again and measurements not newer than the last one in the existing files
+    are skipped.
+
+    .. code-block:: python
+
+        with FileSink('export', period=PERIODS['hourly']) as sink:
+            for measurement in measurements:
+                sink.write(measurement)
+
+    :param directory: the directory the files are stored in
+    :param format: the file format, ``csv`` or ``parquet``
+    :param period: :func:`datetime.strftime` pattern of the measurement time
+        (UTC) naming the files, see :const:`PERIODS`
+    :param fsync_interval: the seconds after which the written measurements
+        are synced to the disk
+    :param row_group_size: the number of measurements per row group of a
+        parquet file
+    :param sep: the separator of the csv files
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            format: Literal['csv', 'parquet'] = 'csv',
+            period: str = PERIODS['daily'],
+            fsync_interval: float = FSYNC_INTERVAL,
+            row_group_size: int = ROW_GROUP_SIZE,
+            sep: str = ',',
+    ) -> None:
+        if format not in ('csv', 'parquet'):
+            raise ValueError(
+                f'format must be one of: csv, parquet, got: {format!r}',
+            )
+        if format == 'parquet':
+            self._pa = _parquet()
+            self._schema = _parquet_schema(self._pa)
+        self.directory = directory
+        self.format = format
+        self.period = period
+        self.fsync_interval = fsync_interval
+        self.row_group_size = row_group_size
+        self.sep = sep
+        self._key: str | None = None
+        # measurements up to this timestamp are already in the file
+        self._skip_until: int | None = None
+        self._csv: TextIO | None = None
+        self._rows: list[Measurement] = []
+        self._path: str | None = None
+        self._parquet_file: BinaryIO | None = None
+        self._parquet_writer: Any = None
+        self._synced = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def _key_for(self, timestamp: int) -> str:
+        dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return dt.strftime(self.period)
+
+    def _parquet_files(self, key: str) -> list[str]:
+        pattern = os.path.join(glob.escape(self.directory), glob.escape(key))
+        return [
+            *glob.glob(f'{pattern}.parquet'),
+            *glob.glob(f'{pattern}.*.parquet'),
+        ]
+
+    def _open(self, key: str) -> None:
+        self.close()
+        if self.format == 'csv':
+            path = os.path.join(self.directory, f'{key}.csv')
+            self._skip_until = _repair_csv(path, self.sep)
+            self._csv = open(path, 'a', buffering=BUFFER_SIZE)
+            # a brand new file, write the header
+            if self._csv.tell() == 0:
+                self._csv.write(f'{self.sep.join(Measurement._fields)}\n')
+        else:
+            files = self._parquet_files(key)
+            last = [
+                self._pa.compute.max(
+                    self._pa.parquet.read_table(f, columns=['timestamp'])[0],
+                ).as_py() for f in files
+            ]
+            self._skip_until = max(
+                (t for t in last if t is not None),
+                default=None,
+            )
+            name = f'{key}.{len(files)}' if files else key
+            self._path = os.path.join(self.directory, f'{name}.parquet')
+        self._key = key
+
+    def write(self, measurement: Measurement) -> bool:
+        """Write a measurement to the file of its period
+
+        :param measurement: the measurement to write
+
+        :return: ``True`` if it was written, ``False`` if it was skipped,
+            since it is not newer than the last one in the file
+        """
+        key = self._key_for(measurement.timestamp)
+        if key != self._key:
+            self._open(key)
+
+        if (
+                self._skip_until is not None and
+                measurement.timestamp <= self._skip_until
+        ):
+            return False
+        if self._csv is not None:
+            self._csv.write(f'{self.sep.join(str(i) for i in measurement)}\n')
+        else:
+            self._rows.append(measurement)
+            if len(self._rows) >= self.row_group_size:
+                self._write_row_group()
+
+        if time.monotonic() - self._synced >= self.fsync_interval:
+            self.flush()
+        return True
+
+    def write_many(self, measurements: Iterable[Measurement]) -> int:
+        """Write many measurements, see :func:`write`
+
+        :param measurements: the measurements to write, e.g. a
+            :class:`vpf_730.batch.MeasurementBatch`
+
+        :return: the number of measurements written
+        """
+        return sum(self.write(m) for m in measurements)
+
+    def _write_row_group(self) -> None:
+        if not self._rows:
+            return
+        if self._parquet_writer is None:
+            assert self._path is not None
+            self._parquet_file = open(f'{self._path}.tmp', 'wb')
+            self._parquet_writer = self._pa.parquet.ParquetWriter(
+                self._parquet_file,
+                self._schema,
+            )
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(col) for col in zip(*self._rows)],
+            schema=self._schema,
+        )
+        self._parquet_writer.write_table(table)
+        self._rows = []
+
+    def flush(self) -> None:
+        """Write the buffered measurements and sync them to the disk. A
+        parquet file only becomes readable once it is closed.
+        """
+        if self._csv is not None:
+            self._csv.flush()
+            os.fsync(self._csv.fileno())
+        elif self._parquet_file is not None or self._rows:
+            self._write_row_group()
+            assert self._parquet_file is not None
+            self._parquet_file.flush()
+            os.fsync(self._parquet_file.fileno())
+        self._synced = time.monotonic()
+
+    def close(self) -> None:
+        """Write the buffered measurements and close the current file"""
+        if self._key is None:
+            return
+        self.flush()
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+        if self._parquet_file is not None:
+            assert self._path is not None
+            self._parquet_writer.close()
+            self._parquet_file.flush()
+            os.fsync(self._parquet_file.fileno())
+            self._parquet_file.close()
+            os.replace(f'{self._path}.tmp', self._path)
+            self._parquet_writer = None
+            self._parquet_file = None
+        self._key = None
+
+    def __enter__(self) -> FileSink:
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class QueuedSink(threading.Thread):
+    """Run a :class:`Sink` on its own thread. Measurements are handed over
+    through a bounded queue and the thread writes everything queued at once,
+    up to ``batch_size`` measurements. Hence a slow sink never delays taking
+    the next measurement.
+
+    When the queue is full, e.g. since the sink is stuck, a new measurement
+    is handled according to ``overflow``:
+
+    * ``block`` - wait for up to ``block_timeout`` seconds for the sink to
+      catch up (backpressure), then it is dropped
+    * ``drop_oldest`` - the oldest queued measurement is dropped
+    * ``drop_newest`` - the new measurement is dropped
+    * ``spill`` - the new measurement and all following ones are appended to
+      the file ``spill_path``, until the sink caught up with the queue and
+      the file. A batch that failed to be written is spilled as well and
+      written again with the next measurement. Since the file is read when
+      the sink is started, nothing is lost, even when the logger is
+      restarted.
+
+    With the other policies, a batch that failed to be written is dropped.
+    A batch failing with one of :const:`PERMANENT_ERRORS` is always dropped,
+    since writing it again would fail as well.
+
+    .. code-block:: python
+
+        sink = QueuedSink(FileSink('export'), overflow='drop_oldest')
+        sink.start()
+        sink.put(measurement)
+        sink.close()
+
+    :param sink: the sink to run
+    :param overflow: what to do with a new measurement, when the queue is
+        full, see :const:`OVERFLOW_POLICIES`
+    :param queue_size: the number of measurements that can be queued
+    :param batch_size: the maximum number of measurements written at once
+    :param block_timeout: the seconds to wait for room in the queue with the
+        ``block`` policy, ``None`` waits until there is room, which stops
+        taking measurements while the sink is stuck
+    :param spill_path: path to the file used by the ``spill`` policy
+    :param name: optional - the name of the sink in the logs and metrics,
+        defaults to the name of its class
+    """
+
+    def __init__(
+            self,
+            sink: Sink,
+            overflow: Overflow = 'block',
+            queue_size: int = QUEUE_SIZE,
+            batch_size: int = SINK_BATCH_SIZE,
+            block_timeout: float | None = BLOCK_TIMEOUT,
+            spill_path: str | None = None,
+            name: str | None = None,
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f'overflow must be one of: {", ".join(OVERFLOW_POLICIES)}, '
+                f'got: {overflow!r}',
+            )
+        if (overflow == 'spill') != (spill_path is not None):
+            raise ValueError(
+                'spill_path must be set if and only if overflow is spill',
+            )
+        self.sink = sink
+        self.sink_name = name if name is not None else type(sink).__name__
+        super().__init__(name=f'vpf-730-sink-{self.sink_name}', daemon=True)
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self._queue: queue.Queue[object] = queue.Queue(maxsize=queue_size)
+        self._requests: queue.SimpleQueue[object] = queue.SimpleQueue()
+        # guards the spill file, which is appended to by the producer
+        self._lock = threading.Lock()
+        # measurements were spilled, so the following ones must be spilled as
+        # well to keep the order
+        self._spilling = spill_path is not None and os.path.exists(spill_path)
+        self._dropped = SINK_DROPPED.labels(self.sink_name)
+        self._spilled = SINK_SPILLED.labels(self.sink_name)
+        self._write_seconds = SINK_WRITE_SECONDS.labels(self.sink_name)
+
+    def put(self, measurement: Measurement) -> None:
+        """Queue a measurement for the sink. This only blocks with the
+        ``block`` policy, when the queue is full.
+
+        :param measurement: the measurement to write
+        """
+        if self.overflow == 'spill':
+            with self._lock:
+                if not self._spilling:
+                    try:
+                        self._queue.put_nowait(measurement)
+                        return
+                    except queue.Full:
+                        self._spilling = True
+                self._spill([measurement])
+            # the sink may wait for a measurement to retry writing
+            with contextlib.suppress(queue.Full):
+                self._queue.put_nowait(_WAKE)
+        elif self.overflow == 'block':
+            try:
+                self._queue.put(measurement, timeout=self.block_timeout)
+            except queue.Full:
+                self._dropped.inc()
+        elif self.overflow == 'drop_newest':
+            try:
+                self._queue.put_nowait(measurement)
+            except queue.Full:
+                self._dropped.inc()
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(measurement)
+                    break
+                except queue.Full:
+                    with contextlib.suppress(queue.Empty):
+                        if isinstance(self._queue.get_nowait(), tuple):
+                            self._dropped.inc()
+
+    def maintain(self) -> None:
+        """Let the sink run its maintenance (see :func:`Sink.maintain`) after
+        the measurements it is currently writing
+        """
+        self._request(_MAINTAIN)
+
+    def stop(self) -> None:
+        """Stop the thread after everything queued was written"""
+        self._request(_STOP)
+
+    def _request(self, request: object) -> None:
+        self._requests.put(request)
+        # if the queue is full, the thread is not waiting for a measurement
+        with contextlib.suppress(queue.Full):
+            self._queue.put_nowait(_WAKE)
+
+    def close(self) -> None:
+        """Stop the thread and wait until everything queued was written and
+        the sink is closed
+        """
+        self.stop()
+        self.join()
+
+    def run(self) -> None:
+        try:
+            self._write_spilled()
+            stop = False
+            while not (stop and self._queue.empty()):
+                item = self._queue.get()
+                batch: list[Measurement] = []
+                while True:
+                    if isinstance(item, tuple):
+                        batch.append(item)  # type: ignore[arg-type]
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                written = self._write(batch)
+                while True:
+                    try:
+                        request = self._requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is _MAINTAIN:
+                        self._call(self.sink.maintain)
+                    else:
+                        stop = True
+
+                # after a failure, the spilled measurements are written again
+                # with the next measurement
+                if written and self._queue.empty():
+                    self._write_spilled()
+        finally:
+            self._call(self.sink.close)
+
+    def _call(self, func: Callable[[], object]) -> None:
+        try:
+            func()
+        except Exception:
+            logger.exception('sink %s failed', self.sink_name)
+
+    def _try_write(self, batch: Sequence[Measurement]) -> bool:
+        """Write a batch and return whether it is done with, i.e. it was
+        written or dropped since it can never be written
+        """
+        with self._write_seconds.time():
+            try:
+                self.sink.write_many(batch)
+            except PERMANENT_ERRORS:
+                logger.exception(
+                    'sink %s failed, dropping %d measurements',
+                    self.sink_name, len(batch),
+                )
+                self._dropped.inc(len(batch))
+            except Exception:
+                logger.exception('sink %s failed', self.sink_name)
+                return False
+        return True
+
+    def _write(self, batch: Sequence[Measurement]) -> bool:
+        if not batch or self._try_write(batch):
+            return True
+        self._give_up(batch)
+        return False
+
+    def _give_up(self, batch: Sequence[Measurement]) -> None:
+        if self.spill_path is None:
+            self._dropped.inc(len(batch))
+            return
+        # the batch is older than everything spilled in the meantime
+        with self._lock:
+            self._spilling = True
+            self._spill(batch, front=True)
+
+    def _spill(
+            self,
+            measurements: Sequence[Measurement],
+            front: bool = False,
+    ) -> None:
+        assert self.spill_path is not None
+        lines = ''.join(f'{json.dumps(m)}\n' for m in measurements)
+        if front and os.path.exists(self.spill_path):
+            with open(self.spill_path) as f:
+                lines += f.read()
+            with open(f'{self.spill_path}.tmp', 'w') as f:
+                f.write(lines)
+            os.replace(f'{self.spill_path}.tmp', self.spill_path)
+        else:
+            with open(self.spill_path, 'a') as f:
+                f.write(lines)
+        self._spilled.inc(len(measurements))
+
+    def _take_spilled(self) -> list[Measurement]:
+        assert self.spill_path is not None
+        try:
+            with open(self.spill_path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        os.remove(self.spill_path)
+        measurements = []
+        for line in lines:
+            try:
+                measurements.append(Measurement(*json.loads(line)))
+            except (ValueError, TypeError):
+                # only partially written e.g. due to a crash
+                logger.warning('skipping invalid spilled line %r', line)
+        return measurements
+
+    def _write_spilled(self) -> None:
+        """Write the spilled measurements until the file stays empty"""
+        while self._spilling:
+            with self._lock:
+                spilled = self._take_spilled()
+                if not spilled:
+                    self._spilling = False
+                    return
+            for idx in range(0, len(spilled), self.batch_size):
+                if not self._try_write(spilled[idx:idx + self.batch_size]):
+                    self._give_up(spilled[idx:])
+                    return
+
+
+class SinkPipeline:
+    """Hand every measurement to many sinks, each running on its own thread
+    (see :class:`QueuedSink`).
+
+    .. code-block:: python
+
+        with SinkPipeline([QueuedSink(DBSink('vpf_730_local.db'))]) as sinks:
+            sinks.put(measurement)
+
+    :param sinks: the sinks every measurement is handed to
+    """
+
+    def __init__(self, sinks: Sequence[QueuedSink]) -> None:
+        self.sinks = list(sinks)
+
+    def start(self) -> None:
+        """Start the threads of all sinks"""
+        for sink in self.sinks:
+            sink.start()
+
+    def put(self, measurement: Measurement) -> None:
+        """Queue a measurement for all sinks, see :func:`QueuedSink.put`
+
+        :param measurement: the measurement to write
+        """
+        for sink in self.sinks:
+            sink.put(measurement)
+
+    def maintain(self) -> None:
+        """Let all sinks run their maintenance"""
+        for sink in self.sinks:
+            sink.maintain()
+
+    def close(self) -> None:
+        """Stop all sinks and wait until everything queued was written"""
+        for sink in self.sinks:
+            sink.stop()
+        for sink in self.sinks:
+            sink.join()
+
+    def __enter__(self) -> SinkPipeline:
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def read_watermark(directory: str) -> int | None:
+    """Read the watermark stored by :func:`export`
+
+    :param directory: the export directory
+
+    :return: unix timestamp (UTC) of the newest measurement exported so far,
+        ``None`` if nothing was exported yet
+    """
+    try:
+        with open(os.path.join(directory, WATERMARK_FILE)) as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_watermark(directory: str, watermark: int) -> None:
+    path = os.path.join(directory, WATERMARK_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        f.write(f'{watermark}\n')
+    os.replace(f'{path}.tmp', path)
+
+
+def _connections(
+        db_path: str,
+        start: int,
+) -> Iterator[sqlite3.Connection]:
+    if is_partitioned(db_path):
+        yield from PartitionedDB(db_path).attached(start)
+    else:
+        with connect(db_path) as db:
+            yield db
+
+
+def export(
+        db_path: str,
+        sink: FileSink,
+        since: int | None = None,
+        chunk_size: int = EXPORT_ROWS,
+) -> ExportStats:
+    """Export the measurements of the local database to the files of a
+    :class:`FileSink`, the same files it writes when receiving the
+    measurements one by one. The measurements are read in chunks of
+    ``chunk_size``, including days packed by
+    :func:`vpf_730.chunks.compact_days`.
+
+    After every chunk the files are closed and the timestamp of the newest
+    measurement exported is stored as the watermark in the directory of the
+    sink. The next export continues after the watermark, so only new
+    measurements are exported, even if the previous one was interrupted.
+    Hence a parquet file is split into two, if its period spans two chunks.
+
+    .. code-block:: python
+
+        with FileSink('export', format='parquet') as sink:
+            export('vpf_730_local.db', sink)
+
+    :param db_path: path to the sqlite database, which may contain
+        ``{month}``
+    :param sink: the sink to write the files
+    :param since: optional - unix timestamp (UTC) after which to export the
+        measurements. By default the export continues after the watermark.
+    :param chunk_size: the number of measurements read at once
+
+    :return: the statistics of the export
+    """
+    t0 = time.perf_counter()
+    watermark = read_watermark(sink.directory) if since is None else since
+    start = -1 if watermark is None else watermark
+    exported = 0
+    for db in _connections(db_path, start):
+        while True:
+            batch = select_range(db, start=start, limit=chunk_size)
+            if not batch:
+                break
+            exported += sink.write_many(batch)
+            # the files must be complete before the watermark moves on
+            sink.close()
+            start = watermark = batch[-1].timestamp
+            _write_watermark(sink.directory, watermark)
+
+    return ExportStats(
+        exported=exported,
+        watermark=watermark,
+        seconds=time.perf_counter() - t0,
+    )
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import sqlite3
+import time
+from typing import NamedTuple
+
+from vpf_730.chunks import select_range
+from vpf_730.partitions import is_partitioned
+from vpf_730.partitions import MONTH_PLACEHOLDER
+from vpf_730.partitions import PartitionedDB
+from vpf_730.storage import insert_measurements
+from vpf_730.utils import connect
+
+logger = logging.getLogger(__name__)
+
+# the number of pages copied per step of the online backup
+SNAPSHOT_PAGES = 256
+# the seconds slept between two steps, so the logger can write in between
+SNAPSHOT_SLEEP = 0.01
+# the number of measurements appended per transaction, about one day
+SNAPSHOT_ROWS = 1440
+
+
+class SnapshotStats(NamedTuple):
+    """Statistics of a snapshot
+
+    :param copied: the number of database files copied entirely
+    :param skipped: the number of partitions that did not change since the
+        last snapshot
+    :param appended: the number of measurements appended to an existing
+        snapshot
+    :param seconds: the wall time the snapshot took
+    """
+    copied: int
+    skipped: int
+    appended: int
+    seconds: float
+
+
+def backup_db(
+        db_path: str,
+        dest: str,
+        pages: int = SNAPSHOT_PAGES,
+        sleep: float = SNAPSHOT_SLEEP,
+) -> None:
+    """Copy a database, that may be written to at the same time, using the
+    online backup API of sqlite. It is copied in steps of ``pages`` pages
+    with a pause of ``sleep`` seconds in between, so a writer is never
+    blocked for long. In ``WAL`` mode a read transaction is held during the
+    backup, hence the copy is consistent without blocking any writer. In the
+    default rollback journal mode, the backup restarts whenever another
+    connection writes in between two steps.
+
+    The copy is written to a temporary file next to ``dest``, which then
+    replaces ``dest``. Hence ``dest`` is never incomplete.
+
+    :param db_path: path to the sqlite database to copy
+    :param dest: path to the copy
+    :param pages: the number of pages copied per step
+    :param sleep: the seconds slept between two steps
+    """
+    tmp = f'{dest}.tmp'
+    with contextlib.closing(
+        sqlite3.connect(db_path, isolation_level=None),
+    ) as src:
+        wal = src.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # a reader sees the same snapshot until its transaction ends and
+            # writers append to the write-ahead log without waiting for it
+            src.execute('BEGIN')
+            src.execute('SELECT count(*) FROM sqlite_master').fetchone()
+
+        last_remaining: int | None = None
+
+        def _progress(status: int, remaining: int, total: int) -> None:
+            nonlocal last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                logger.info('%s was written to, restarting backup', db_path)
+            last_remaining = remaining
+            time.sleep(sleep)
+
+        with contextlib.closing(sqlite3.connect(tmp)) as db:
+            src.backup(db, pages=pages, progress=_progress, sleep=sleep)
+            if wal:
+                src.execute('COMMIT')
+            # the copy is a single file, which is easier to move around
+            db.execute('PRAGMA journal_mode = DELETE')
+    os.replace(tmp, dest)
+
+
+def _fingerprint(db_path: str) -> tuple[int, int | None]:
+    with connect(db_path) as db:
+        try:
+            ret = db.execute(
+                'SELECT count(*), max(timestamp) FROM measurements',
+            )
+        except sqlite3.OperationalError:
+            # not created yet
+            return 0, None
+        count, last = ret.fetchone()
+    return count, last
+
+
+def _append_new(db_path: str, dest: str, sleep: float) -> int:
+    """Append the measurements of ``db_path`` newer than the newest one in
+    ``dest``, one transaction per :const:`SNAPSHOT_ROWS` measurements
+    """
+    appended = 0
+    with connect(db_path) as src, connect(dest) as db:
+        last = db.execute(
+            'SELECT max(timestamp) FROM measurements',
+        ).fetchone()[0]
+        last = -1 if last is None else last
+        while True:
+            batch = select_range(src, start=last, limit=SNAPSHOT_ROWS)
+            if not batch:
+                break
+            with db:
+                appended += insert_measurements(db, batch)
+            last = batch[-1].timestamp
+            time.sleep(sleep)
+    return appended
+
+
+def snapshot(
+        db_path: str,
+        dest: str,
+        incremental: bool = False,
+        pages: int = SNAPSHOT_PAGES,
+        sleep: float = SNAPSHOT_SLEEP,
+) -> SnapshotStats:
+    """Take a consistent snapshot of the local database e.g. for analyses,
+    while the logger keeps writing to it. Every database file is copied by
+    :func:`backup_db`.
+
+    A database partitioned by month is copied partition by partition and
+    ``dest`` must contain ``{month}`` as well. Incremental snapshots only
+    copy partitions, whose number of measurements or newest measurement
+    differ from the snapshot e.g. the partition of the current month. An
+    incremental snapshot of a single database appends the measurements newer
+    than the newest one in the snapshot, including days packed by
+    :func:`vpf_730.chunks.compact_days`. Measurements inserted into older
+    days in the meantime are only copied by a full snapshot.
+
+    .. code-block:: python
+
+        snapshot('vpf_730_local.db', 'analysis.db', incremental=True)
+
+    :param db_path: path to the sqlite database, which may contain
+        ``{month}``
+    :param dest: path to the snapshot, which must contain ``{month}`` if
+        ``db_path`` does
+    :param incremental: only copy what is new since the last snapshot,
+        otherwise everything is copied again
+    :param pages: the number of pages copied per step
+    :param sleep: the seconds slept between two steps
+
+    :return: the statistics of the snapshot
+    """
+    t0 = time.perf_counter()
+    copied = skipped = appended = 0
+    if is_partitioned(db_path):
+        if not is_partitioned(dest):
+            raise ValueError(
+                f'the snapshot of a partitioned database must contain '
+                f'{MONTH_PLACEHOLDER!r}, got: {dest!r}',
+            )
+        for partition in PartitionedDB(db_path).partitions():
+            partition_dest = dest.replace(MONTH_PLACEHOLDER, partition.month)
+            if (
+                    incremental and
+                    os.path.exists(partition_dest) and
+                    _fingerprint(partition.path) ==
+                    _fingerprint(partition_dest)
+            ):
+                skipped += 1
+                continue
+            backup_db(
+                partition.path,
+                partition_dest,
+                pages=pages,
+                sleep=sleep,
+            )
+            copied += 1
+    elif incremental and os.path.exists(dest):
+        appended = _append_new(db_path, dest, sleep=sleep)
+    else:
+        backup_db(db_path, dest, pages=pages, sleep=sleep)
+        copied = 1
+
+    return SnapshotStats(
+        copied=copied,
+        skipped=skipped,
+        appended=appended,
+        seconds=time.perf_counter() - t0,
+    )
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from typing import Any
+from typing import Literal
+
+from vpf_730.utils import connect
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import MEASUREMENT_TABLE
+from vpf_730.vpf_730 import OBSTRUCTION_TO_VISION
+from vpf_730.vpf_730 import PRECIP_TYPES
+
+"""
+The ``INSERT`` statements for bulk-inserting positional rows in the order of
+:func:`vpf_730.vpf_730.Measurement._fields`, by the conflict resolution used
+when a measurement with the same timestamp already exists.
+"""
+INSERT_STATEMENTS = {
+    conflict: (
+        f'INSERT OR {conflict.upper()} INTO measurements('
+        f'{", ".join(Measurement._fields)}) '
+        f'VALUES ({", ".join("?" * len(Measurement._fields))})'
+    )
+    for conflict in ('abort', 'ignore', 'replace')
+}
+
+"""
+The fields stored as integers in the compact schema, by the factor they are
+multiplied with. This is the precision of the fields in the messages of the
+sensor, any further digits are rounded.
+"""
+COMPACT_SCALES = {
+    'optical_range': 100,
+    'receiver_bg_illumination': 100,
+    'water_in_precip': 10000,
+    'temp': 10,
+    'transmission_eq': 100,
+    'exco_less_precip_particle': 100,
+    'backscatter_exco': 100,
+    'total_exco': 100,
+}
+# the fields stored as codes in the compact schema, by the lookup table of the
+# codes and its initial values. Other values are added when they first occur
+_LOOKUP_TABLES = {
+    'precipitation_type_msg': ('precip_types', tuple(PRECIP_TYPES)),
+    'obstruction_to_vision': (
+        'obstructions_to_vision', tuple(OBSTRUCTION_TO_VISION),
+    ),
+    'self_test': ('self_tests', ()),
+}
+
+
+def _compact_schema() -> list[str]:
+    """The statements creating the compact schema. The ``measurements``
+    table is replaced by a view decoding the ``measurements_compact`` table,
+    with a trigger encoding the values inserted into the view.
+    """
+    statements = [
+        f'CREATE TABLE IF NOT EXISTS {table}('
+        f'code INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)'
+        for table, _ in _LOOKUP_TABLES.values()
+    ]
+    columns = ',\n'.join(
+        f'{name} INTEGER{" NOT NULL" if name == "sensor_id" else ""}'
+        for name in Measurement._fields[1:]
+    )
+    statements.append(
+        f'CREATE TABLE IF NOT EXISTS measurements_compact(\n'
+        f'timestamp INTEGER PRIMARY KEY,\n{columns}\n) WITHOUT ROWID',
+    )
+
+    decoded = []
+    encoded = []
+    lookups = []
+    joins = []
+    for name in Measurement._fields:
+        if name in COMPACT_SCALES:
+            decoded.append(
+                f'm.{name} / {float(COMPACT_SCALES[name])} AS {name}',
+            )
+            encoded.append(
+                f'CAST(round(NEW.{name} * {COMPACT_SCALES[name]}) AS INTEGER)',
+            )
+        elif name in _LOOKUP_TABLES:
+            table, _ = _LOOKUP_TABLES[name]
+            decoded.append(f'{table}.value AS {name}')
+            joins.append(
+                f'LEFT JOIN {table} ON {table}.code = m.{name}',
+            )
+            encoded.append(
+                f'(SELECT code FROM {table} WHERE value = NEW.{name})',
+            )
+            # without a conflict, so the conflict resolution of the INSERT
+            # into the view does not apply
+            lookups.append(
+                f'INSERT INTO {table}(value) SELECT NEW.{name} '
+                f'WHERE NEW.{name} IS NOT NULL AND NOT EXISTS ('
+                f'SELECT 1 FROM {table} WHERE value = NEW.{name});',
+            )
+        else:
+            decoded.append(f'm.{name} AS {name}')
+            encoded.append(f'NEW.{name}')
+
+    statements.append(
+        f'CREATE VIEW IF NOT EXISTS measurements AS SELECT\n'
+        f'{", ".join(decoded)}\n'
+        f'FROM measurements_compact AS m\n{" ".join(joins)}',
+    )
+    statements.append(
+        f'CREATE TRIGGER IF NOT EXISTS measurements_insert\n'
+        f'INSTEAD OF INSERT ON measurements\nBEGIN\n'
+        f'{" ".join(lookups)}\n'
+        f'INSERT INTO measurements_compact({", ".join(Measurement._fields)})\n'
+        f'VALUES ({", ".join(encoded)});\nEND',
+    )
+    return statements
+
+
+COMPACT_SCHEMA = _compact_schema()
+_COMPACT_INSERT_STATEMENTS = {
+    conflict: (
+        f'INSERT OR {conflict.upper()} INTO measurements_compact('
+        f'{", ".join(Measurement._fields)}) '
+        f'VALUES ({", ".join("?" * len(Measurement._fields))})'
+    )
+    for conflict in ('abort', 'ignore', 'replace')
+}
+
+
+def create_compact_schema(db: sqlite3.Connection) -> None:
+    """Create the tables of the compact schema in a new database, see
+    :func:`migrate_db`
+
+    :param db: an open connection to the sqlite database
+    """
+    for statement in COMPACT_SCHEMA:
+        db.execute(statement)
+    for table, values in _LOOKUP_TABLES.values():
+        db.executemany(
+            f'INSERT INTO {table}(value) VALUES (?)',
+            ((value,) for value in values),
+        )
+
+
+def is_compact(db: sqlite3.Connection) -> bool:
+    """Check whether the database uses the compact schema, see
+    :func:`migrate_db`
+
+    :param db: an open connection to the sqlite database
+
+    :return: ``True`` if ``measurements`` is a view of the compact table
+    """
+    ret = db.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'measurements'",
+    ).fetchone()
+    return ret is not None and ret[0] == 'view'
+
+
+def _encode(
+        db: sqlite3.Connection,
+        rows: Iterable[Sequence[Any]],
+) -> Iterator[tuple[Any, ...]]:
+    rows = [tuple(row) for row in rows]
+    codes: list[dict[str, int] | None] = []
+    scales: list[int | None] = []
+    for idx, name in enumerate(Measurement._fields):
+        scales.append(COMPACT_SCALES.get(name))
+        if name not in _LOOKUP_TABLES:
+            codes.append(None)
+            continue
+
+        table, _ = _LOOKUP_TABLES[name]
+        table_codes = {
+            value: code
+            for code, value in db.execute(f'SELECT code, value FROM {table}')
+        }
+        for value in {row[idx] for row in rows} - table_codes.keys():
+            if value is not None:
+                cur = db.execute(
+                    f'INSERT INTO {table}(value) VALUES (?)', (value,),
+                )
+                assert cur.lastrowid is not None
+                table_codes[value] = cur.lastrowid
+        codes.append(table_codes)
+
+    for row in rows:
+        yield tuple(
+            None if value is None
+            else table_codes[value] if table_codes is not None
+            else round(value * scale) if scale is not None
+            else value
+            for value, table_codes, scale in zip(row, codes, scales)
+        )
+
+
+def insert_measurements(
+        db: sqlite3.Connection,
+        rows: Iterable[Sequence[Any]],
+        on_conflict: Literal['abort', 'ignore', 'replace'] = 'abort',
+) -> int:
+    """Bulk-insert measurements using a single statement. This is
+    considerably faster than :func:`vpf_730.vpf_730.Measurement.to_db` which
+    opens a connection for every measurement. The table is created if it does
+    not exist yet. The caller is responsible for the transaction e.g.:
+
+    .. code-block:: python
+
+        with connect('vpf_730_local.db') as db:
+            insert_measurements(db, measurements, on_conflict='replace')
+
+    :param db: an open connection to the sqlite database
+    :param rows: the measurements or tuples with the values in the order of
+        :func:`vpf_730.vpf_730.Measurement._fields`
+    :param on_conflict: how to handle a measurement with the same timestamp
+        already being stored, one of ``abort`` (raise an
+        :func:`sqlite3.IntegrityError`), ``ignore`` (keep the stored one) or
+        ``replace`` (overwrite the stored one)
+
+    :return: the number of rows inserted or replaced
+    """
+    if is_compact(db):
+        # encoding the values here is faster than the trigger of the view and
+        # the changes made by the trigger are not counted in the rowcount
+        cur = db.executemany(
+            _COMPACT_INSERT_STATEMENTS[on_conflict],
+            _encode(db, rows),
+        )
+    else:
+        db.execute(MEASUREMENT_TABLE)
+        cur = db.executemany(INSERT_STATEMENTS[on_conflict], rows)
+    return cur.rowcount
+
+
+def migrate_db(
+        db_path: str,
+        schema: Literal['compact', 'plain'] = 'compact',
+) -> bool:
+    """Convert a database to the ``compact`` or back to the ``plain`` schema.
+    A database that does not exist yet is created.
+
+    In the compact schema, the categorical fields are stored as small integer
+    codes referencing lookup tables, the fields with a fixed precision as
+    scaled integers (see :const:`COMPACT_SCALES`) and the table is a
+    ``WITHOUT ROWID`` table. The ``measurements`` table is replaced by a view
+    with the same columns, which decodes the values when reading and encodes
+    them when inserting. Hence everything reading or inserting measurements
+    works with both schemas. Only ``UPDATE`` and ``DELETE`` need to use the
+    ``measurements_compact`` table.
+
+    The database is vacuumed after the conversion, so the file shrinks.
+
+    :param db_path: path to the sqlite database
+    :param schema: the schema to convert to, ``compact`` or ``plain``
+
+    :return: ``True`` if the database was converted, ``False`` if it already
+        used the schema
+    """
+    # imported here, since gaps and rollups import this module
+    from vpf_730.gaps import create_gap_index
+    from vpf_730.gaps import has_gap_index
+    from vpf_730.rollups import create_rollups
+    from vpf_730.rollups import has_rollups
+
+    with connect(db_path) as db:
+        if is_compact(db) == (schema == 'compact'):
+            return False
+
+        with db:
+            if schema == 'compact':
+                db.execute(MEASUREMENT_TABLE)
+                db.execute(
+                    'ALTER TABLE measurements RENAME TO measurements_plain',
+                )
+                create_compact_schema(db)
+                db.execute(
+                    'INSERT INTO measurements '
+                    'SELECT * FROM measurements_plain ORDER BY timestamp',
+                )
+            else:
+                db.execute(
+                    'CREATE TABLE measurements_plain AS '
+                    'SELECT * FROM measurements',
+                )
+                db.execute('DROP VIEW measurements')
+                db.execute('DROP TABLE measurements_compact')
+                for table, _ in _LOOKUP_TABLES.values():
+                    db.execute(f'DROP TABLE {table}')
+                db.execute(MEASUREMENT_TABLE)
+                db.execute(
+                    'INSERT INTO measurements '
+                    'SELECT * FROM measurements_plain ORDER BY timestamp',
+                )
+            db.execute('DROP TABLE measurements_plain')
+
+        # the triggers updating the rollups and gap index were dropped with
+        # the table
+        if has_rollups(db):
+            create_rollups(db)
+        if has_gap_index(db):
+            create_gap_index(db)
+        db.execute('VACUUM')
+    return True
@@ -3,6 +3,7 @@ from __future__ import annotations
 import contextlib
 import sqlite3
 import sys
+from collections import deque
 from collections.abc import Generator
 from collections.abc import ItemsView
 from collections.abc import Iterable
@@ -11,6 +12,7 @@ from collections.abc import Mapping
 from functools import wraps
 from typing import Callable
 from typing import Generic
+from typing import TYPE_CHECKING
 from typing import TypeVar
 
 if sys.version_info >= (3, 10):  # pragma >=3.10 cover
@@ -18,6 +20,9 @@ if sys.version_info >= (3, 10):  # pragma >=3.10 cover
 else:  # pragma <3.10 cover
     from typing_extensions import ParamSpec
 
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
 
 @contextlib.contextmanager
 def connect(db_path: str) -> Generator[sqlite3.Connection]:
@@ -79,6 +84,44 @@ def retry(
     return retry_dec
 
 
+T = TypeVar('T')
+
+
+def process_map(
+        func: Callable[[T], R],
+        tasks: Iterable[T],
+        jobs: int,
+) -> Iterator[R]:
+    """Run a function for every task in a process pool and yield the results
+    in the order of the tasks. Only a few tasks are submitted ahead, so the
+    results waiting to be consumed do not pile up in memory.
+
+    :param func: the function run by the worker processes, it must be defined
+        at the top level of a module, so it can be pickled
+    :param tasks: the argument of every call
+    :param jobs: the number of worker processes. With ``1`` everything is run
+        in the current process
+
+    :return: an iterator of the results in the order of the tasks
+    """
+    if jobs <= 1:
+        yield from map(func, tasks)
+        return
+
+    # only imported when needed, multiprocessing is slow to import and not
+    # used by short-lived commands
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending: deque[Future[R]] = deque()
+        for task in tasks:
+            pending.append(pool.submit(func, task))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 K = TypeVar('K')
 V = TypeVar('V')
 
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+from typing import Any
+from typing import NamedTuple
+
+from vpf_730.vpf_730 import Measurement
+from vpf_730.vpf_730 import OBSTRUCTION_TO_VISION
+from vpf_730.vpf_730 import PRECIP_TYPES
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        'parsing messages in bulk requires numpy, install it using: '
+        'pip install vpf-730[numpy]',
+    ) from e
+
+"""
+The dtype of the structured arrays returned by :func:`parse_many`, with one
+field per field of :func:`vpf_730.vpf_730.Measurement`.
+"""
+MEASUREMENT_DTYPE = np.dtype([
+    ('timestamp', np.int64),
+    ('sensor_id', np.int64),
+    ('last_measurement_period', np.int64),
+    ('time_since_report', np.int64),
+    ('optical_range', np.float64),
+    ('precipitation_type_msg', 'U3'),
+    ('obstruction_to_vision', 'U2'),
+    ('receiver_bg_illumination', np.float64),
+    ('water_in_precip', np.float64),
+    ('temp', np.float64),
+    ('nr_precip_particles', np.int64),
+    ('transmission_eq', np.float64),
+    ('exco_less_precip_particle', np.float64),
+    ('backscatter_exco', np.float64),
+    ('self_test', 'U3'),
+    ('total_exco', np.float64),
+])
+
+# a message in the standard fixed-width format. Messages of the same length
+# are parsed column-wise using the layout of this message, all others are
+# parsed one by one using Measurement.from_msg
+TEMPLATE = (
+    b'PW01,0060,0000,001.19 KM,NP ,HZ,00.06,00.0000,+020.5 C,0000,002.51,'
+    b'002.51,+011.10,  0000,000,OOO,002.51'
+)
+# name, index of the comma-separated field, literal prefix, literal suffix
+_NUMERIC_FIELDS = (
+    ('sensor_id', 0, b'PW', b''),
+    ('last_measurement_period', 1, b'', b''),
+    ('time_since_report', 2, b'', b''),
+    ('optical_range', 3, b'', b' KM'),
+    ('receiver_bg_illumination', 6, b'', b''),
+    ('water_in_precip', 7, b'', b''),
+    ('temp', 8, b'', b' C'),
+    ('nr_precip_particles', 9, b'', b''),
+    ('transmission_eq', 10, b'', b''),
+    ('exco_less_precip_particle', 11, b'', b''),
+    ('backscatter_exco', 12, b'', b''),
+    ('total_exco', 16, b'', b''),
+)
+# name, index of the comma-separated field, the valid codes
+_CODE_FIELDS = (
+    ('precipitation_type_msg', 4, tuple(PRECIP_TYPES)),
+    ('obstruction_to_vision', 5, tuple(OBSTRUCTION_TO_VISION)),
+)
+_SELF_TEST_FIELD = 15
+
+
+class ParseManyResult(NamedTuple):
+    """The result of :func:`parse_many`
+
+    :param data: a structured array with the dtype :const:`MEASUREMENT_DTYPE`
+        containing the successfully parsed messages in their original order
+    :param bad_lines: the indices of the lines that could not be parsed
+    """
+    data: npt.NDArray[np.void]
+    bad_lines: npt.NDArray[np.intp]
+
+
+class _Number(NamedTuple):
+    name: str
+    sign_col: int | None
+    digit_cols: npt.NDArray[np.intp]
+    decimals: int
+    is_float: bool
+
+
+class _Code(NamedTuple):
+    name: str
+    cols: slice
+    keys: npt.NDArray[np.int64]
+    values: npt.NDArray[np.str_]
+
+
+def _field_offsets() -> list[tuple[int, int]]:
+    offsets = []
+    start = 0
+    for field in TEMPLATE.split(b','):
+        offsets.append((start, start + len(field)))
+        start += len(field) + 1
+    return offsets
+
+
+class _Layout(NamedTuple):
+    literal_cols: npt.NDArray[np.intp]
+    literal_values: npt.NDArray[np.uint8]
+    # columns of the fields that are not validated while parsing
+    free_cols: npt.NDArray[np.intp]
+    numbers: list[_Number]
+    codes: list[_Code]
+    self_test: slice
+
+
+def _build_layout() -> _Layout:
+    offsets = _field_offsets()
+    template = np.frombuffer(TEMPLATE, dtype=np.uint8)
+    # columns that must have exactly the same value as in the template
+    literal_cols = [i for i, c in enumerate(TEMPLATE) if c == ord(',')]
+    numbers = []
+    for name, idx, prefix, suffix in _NUMERIC_FIELDS:
+        start, end = offsets[idx]
+        literal_cols.extend(range(start, start + len(prefix)))
+        literal_cols.extend(range(end - len(suffix), end))
+        start += len(prefix)
+        end -= len(suffix)
+        sign_col = None
+        if TEMPLATE[start] in b'+-':
+            sign_col = start
+            start += 1
+        number = TEMPLATE[start:end]
+        decimals = 0
+        if b'.' in number:
+            dot = start + number.index(b'.')
+            literal_cols.append(dot)
+            decimals = end - dot - 1
+        digit_cols = [
+            i for i in range(start, end) if TEMPLATE[i] != ord('.')
+        ]
+        numbers.append(
+            _Number(
+                name=name,
+                sign_col=sign_col,
+                digit_cols=np.array(digit_cols, dtype=np.intp),
+                decimals=decimals,
+                is_float=b'.' in number,
+            ),
+        )
+
+    codes = []
+    for name, idx, valid in _CODE_FIELDS:
+        start, end = offsets[idx]
+        width = end - start
+        # every padding with spaces that is removed by str.strip
+        padded = {
+            (' ' * left + code).ljust(width).encode(): code
+            for code in valid
+            for left in range(width - len(code) + 1)
+        }
+        keys = np.array(
+            [int.from_bytes(k, 'big') for k in padded],
+            dtype=np.int64,
+        )
+        values = np.array(list(padded.values()))
+        order = np.argsort(keys)
+        codes.append(
+            _Code(
+                name=name,
+                cols=slice(start, end),
+                keys=keys[order],
+                values=values[order],
+            ),
+        )
+
+    parsed = {
+        idx for _, idx, _, _ in _NUMERIC_FIELDS
+    } | {idx for _, idx, _ in _CODE_FIELDS}
+    free_cols = [
+        i
+        for idx, (start, end) in enumerate(offsets)
+        if idx not in parsed
+        for i in range(start, end)
+    ]
+    cols = np.array(sorted(literal_cols), dtype=np.intp)
+    return _Layout(
+        literal_cols=cols,
+        literal_values=template[cols],
+        free_cols=np.array(free_cols, dtype=np.intp),
+        numbers=numbers,
+        codes=codes,
+        self_test=slice(*offsets[_SELF_TEST_FIELD]),
+    )
+
+
+_LAYOUT = _build_layout()
+
+
+def _parse_fixed_width(
+        chars: npt.NDArray[np.uint8],
+) -> tuple[npt.NDArray[np.bool_], dict[str, npt.NDArray[Any]]]:
+    """Parse messages in the layout of :const:`TEMPLATE` column-wise
+
+    :param chars: a 2D array with one message per row
+
+    :return: a mask of the rows that were parsed and the parsed columns
+    """
+    ok = (chars[:, _LAYOUT.literal_cols] == _LAYOUT.literal_values).all(
+        axis=1,
+    )
+    # the fields that are not parsed must not contain additional separators,
+    # which would shift the fields for from_msg or non-ASCII characters
+    free = chars[:, _LAYOUT.free_cols]
+    ok &= ((free != ord(',')) & (free < 0x80)).all(axis=1)
+
+    columns: dict[str, npt.NDArray[Any]] = {}
+    for number in _LAYOUT.numbers:
+        digits = chars[:, number.digit_cols].astype(np.int64) - ord('0')
+        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        weights = 10 ** np.arange(len(number.digit_cols) - 1, -1, -1)
+        mantissa = digits @ weights
+        value: npt.NDArray[Any]
+        if number.is_float:
+            # the quotient of two exact integers is correctly rounded, hence
+            # it is the same as float() of the decimal string
+            value = mantissa / 10 ** number.decimals
+        else:
+            value = mantissa
+        if number.sign_col is not None:
+            sign = chars[:, number.sign_col]
+            ok &= (sign == ord('+')) | (sign == ord('-'))
+            value = np.where(sign == ord('-'), -value, value)
+        columns[number.name] = value
+
+    for code in _LAYOUT.codes:
+        raw = chars[:, code.cols].astype(np.int64)
+        key = np.zeros(len(chars), dtype=np.int64)
+        for i in range(raw.shape[1]):
+            key = (key << 8) | raw[:, i]
+        idx = np.searchsorted(code.keys, key).clip(max=len(code.keys) - 1)
+        ok &= code.keys[idx] == key
+        columns[code.name] = code.values[idx]
+
+    self_test = np.ascontiguousarray(chars[:, _LAYOUT.self_test])
+    columns['self_test'] = self_test.view(f'S{self_test.shape[1]}')[:, 0]
+    return ok, columns
+
+
+def parse_many(
+        buffer: bytes,
+        timestamps: npt.ArrayLike,
+) -> ParseManyResult:
+    """Parse many messages at once, e.g. when re-processing archived
+    messages. Messages in the standard fixed-width format are parsed
+    column-wise, all others are passed to
+    :func:`vpf_730.vpf_730.Measurement.from_msg`. The result is the same as
+    calling :func:`vpf_730.vpf_730.Measurement.from_msg` for every line, but
+    lines that cannot be parsed are reported instead of raising an error.
+
+    .. code-block:: python
+
+        result = parse_many(
+            b'PW01,0060,...\\r\\nPW01,0060,...\\r\\n',
+            timestamps=[1672531200, 1672531260],
+        )
+        print(result.data['temp'].mean(), result.bad_lines)
+
+    :param buffer: the messages, separated by ``\\n`` or ``\\r\\n``
+    :param timestamps: one unix timestamp in UTC per line
+
+    :return: a :func:`ParseManyResult` containing a structured array with the
+        dtype :const:`MEASUREMENT_DTYPE` and the indices of the bad lines
+    """
+    arr = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = np.flatnonzero(arr == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(arr)]))
+    if starts[-1] == len(arr):
+        # the buffer ends with a line break
+        starts, ends = starts[:-1], ends[:-1]
+    # without the trailing \r
+    has_cr = np.zeros(len(ends), dtype=np.bool_)
+    non_empty = ends > starts
+    has_cr[non_empty] = arr[ends[non_empty] - 1] == ord('\r')
+    ends = ends - has_cr
+
+    ts = np.asarray(timestamps, dtype=np.int64)
+    if ts.shape != (len(starts),):
+        raise ValueError(
+            f'expected {len(starts)} timestamps (one per line), got '
+            f'{ts.size}',
+        )
+
+    fixed_idx = np.flatnonzero(ends - starts == len(TEMPLATE))
+    if len(fixed_idx):
+        # a view of every possible message start, so selecting the rows does
+        # not need an index per character
+        windows = np.lib.stride_tricks.sliding_window_view(arr, len(TEMPLATE))
+        chars = windows[starts[fixed_idx]]
+    else:
+        chars = np.empty((0, len(TEMPLATE)), dtype=np.uint8)
+    ok, columns = _parse_fixed_width(chars)
+
+    good = np.zeros(len(starts), dtype=np.bool_)
+    good[fixed_idx[ok]] = True
+    fallback = {}
+    for i in np.flatnonzero(~good):
+        try:
+            m = Measurement.from_msg(
+                msg=buffer[starts[i]:ends[i]],
+                timestamp=int(ts[i]),
+            )
+        except (ValueError, IndexError):
+            continue
+        fallback[i] = m
+        good[i] = True
+
+    data = np.empty(np.count_nonzero(good), dtype=MEASUREMENT_DTYPE)
+    pos = np.cumsum(good) - 1
+    fast_pos = pos[fixed_idx[ok]]
+    for name, values in columns.items():
+        data[name][fast_pos] = values[ok]
+    for i, m in fallback.items():
+        data[pos[i]] = tuple(m)
+    data['timestamp'] = ts[good]
+    return ParseManyResult(data=data, bad_lines=np.flatnonzero(~good))
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+import time
 from collections.abc import Generator
+from collections.abc import Iterable
 from contextlib import contextmanager
-from datetime import datetime
-from datetime import timezone
 from typing import Any
 from typing import Literal
 from typing import NamedTuple
+from typing import TYPE_CHECKING
 
 import serial
 
 from vpf_730.utils import connect
 from vpf_730.utils import FrozenDict
 
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+    from vpf_730.archive import RawArchive
+    from vpf_730.clock import Clock
+    from vpf_730.vectorized import ParseManyResult
+
 """
 Frozen Dictionary mapping the precipitation types abbreviations to their full
 name form.
@@ -48,6 +56,23 @@ OBSTRUCTION_TO_VISION = FrozenDict({
 })
 
 
+def _paddings(codes: Iterable[str], width: int) -> dict[bytes, str]:
+    """Map every padding of the codes with spaces up to ``width`` characters
+    to the code, so looking up a field returns the stripped code without
+    creating a new string.
+    """
+    return {
+        (' ' * left + code + ' ' * right).encode(): code
+        for code in codes
+        for left in range(width - len(code) + 1)
+        for right in range(width - len(code) - left + 1)
+    }
+
+
+_PRECIP_TYPE_CODES = _paddings(PRECIP_TYPES, width=3)
+_OBSTRUCTION_TO_VISION_CODES = _paddings(OBSTRUCTION_TO_VISION, width=2)
+
+
 MEASUREMENT_TABLE = '''\
         CREATE TABLE IF NOT EXISTS measurements(
             timestamp INT PRIMARY KEY,
@@ -69,6 +94,45 @@ MEASUREMENT_TABLE = '''\
         )
     '''
 
+INSERT_MEASUREMENT = '''\
+        INSERT INTO measurements(
+            timestamp,
+            sensor_id,
+            last_measurement_period,
+            time_since_report,
+            optical_range,
+            precipitation_type_msg,
+            obstruction_to_vision,
+            receiver_bg_illumination,
+            water_in_precip,
+            temp,
+            nr_precip_particles,
+            transmission_eq,
+            exco_less_precip_particle,
+            backscatter_exco,
+            self_test,
+            total_exco
+        )
+        VALUES (
+            :timestamp,
+            :sensor_id,
+            :last_measurement_period,
+            :time_since_report,
+            :optical_range,
+            :precipitation_type_msg,
+            :obstruction_to_vision,
+            :receiver_bg_illumination,
+            :water_in_precip,
+            :temp,
+            :nr_precip_particles,
+            :transmission_eq,
+            :exco_less_precip_particle,
+            :backscatter_exco,
+            :self_test,
+            :total_exco
+        )
+    '''
+
 
 class Measurement(NamedTuple):
     """``NamedTuple`` class representing a Measurement from the VPF-730 sensor.
@@ -140,6 +204,42 @@ class Measurement(NamedTuple):
 
         :return: a new instance of :func:`Measurement`.
         """  # noqa: E501
+        # fast path for the standard format. It works on the bytes and reuses
+        # the code strings, but is only taken if the result is the same as
+        # the one of the generic parser. Any deviation raises here and the
+        # message is parsed again by the generic parser, which also creates
+        # the error messages
+        if msg.isascii():
+            try:
+                f = msg.strip().split(b',')
+                return tuple.__new__(
+                    cls,
+                    (
+                        timestamp,
+                        int(f[0].lstrip(b'PW')),
+                        int(f[1]),
+                        int(f[2]),
+                        float(f[3].rstrip(b'KM')),
+                        _PRECIP_TYPE_CODES[f[4]],
+                        _OBSTRUCTION_TO_VISION_CODES[f[5]],
+                        float(f[6]),
+                        float(f[7]),
+                        float(f[8].rstrip(b'C')),
+                        int(f[9]),
+                        float(f[10]),
+                        float(f[11]),
+                        float(f[12]),
+                        f[15].decode(),
+                        float(f[16]),
+                    ),
+                )
+            except (ValueError, KeyError, IndexError):
+                pass
+
+        return cls._from_msg_generic(msg=msg, timestamp=timestamp)
+
+    @classmethod
+    def _from_msg_generic(cls, msg: bytes, timestamp: int) -> Measurement:
         # checksum is off by default
         msg_str = msg.decode()
         msg_list = msg_str.strip().split(',')
@@ -179,6 +279,27 @@ class Measurement(NamedTuple):
             total_exco=float(msg_list[16]),
         )
 
+    @classmethod
+    def parse_many(
+            cls,
+            buffer: bytes,
+            timestamps: npt.ArrayLike,
+    ) -> ParseManyResult:
+        """Parse many messages at once into a NumPy structured array. Lines
+        that cannot be parsed are reported instead of raising an error. This
+        requires NumPy to be installed (``pip install vpf-730[numpy]``). See
+        :func:`vpf_730.vectorized.parse_many` for details.
+
+        :param buffer: the messages, separated by ``\\n`` or ``\\r\\n``
+        :param timestamps: one unix timestamp in UTC per line
+
+        :return: a :func:`vpf_730.vectorized.ParseManyResult` containing the
+            parsed measurements and the indices of the bad lines
+        """
+        from vpf_730.vectorized import parse_many
+
+        return parse_many(buffer=buffer, timestamps=timestamps)
+
     def to_csv(self, fname: str | None = None, sep: str = ',') -> str | None:
         """Convert a measurement to a csv formatted string in this format:
         ``timestamp,sensor_id,last_measurement_period,time_since_report,
@@ -227,47 +348,7 @@ class Measurement(NamedTuple):
         """
         with connect(db_path) as db:
             db.execute(MEASUREMENT_TABLE)
-            db.execute(
-                '''\
-                INSERT INTO measurements(
-                    timestamp,
-                    sensor_id,
-                    last_measurement_period,
-                    time_since_report,
-                    optical_range,
-                    precipitation_type_msg,
-                    obstruction_to_vision,
-                    receiver_bg_illumination,
-                    water_in_precip,
-                    temp,
-                    nr_precip_particles,
-                    transmission_eq,
-                    exco_less_precip_particle,
-                    backscatter_exco,
-                    self_test,
-                    total_exco
-                )
-                VALUES (
-                    :timestamp,
-                    :sensor_id,
-                    :last_measurement_period,
-                    :time_since_report,
-                    :optical_range,
-                    :precipitation_type_msg,
-                    :obstruction_to_vision,
-                    :receiver_bg_illumination,
-                    :water_in_precip,
-                    :temp,
-                    :nr_precip_particles,
-                    :transmission_eq,
-                    :exco_less_precip_particle,
-                    :backscatter_exco,
-                    :self_test,
-                    :total_exco
-                )
-                ''',
-                self._asdict(),
-            )
+            db.execute(INSERT_MEASUREMENT, self._asdict())
 
 
 class VPF730:
@@ -288,6 +369,10 @@ class VPF730:
     :param exclusive: Set exclusive access mode (POSIX only). A port cannot be
         opened in exclusive access mode if it is already open in exclusive
         access mode.
+    :param clock: the clock used for the timestamps of the measurements,
+        defaults to the system time (see :mod:`vpf_730.clock`)
+    :param archive: optional - a :func:`vpf_730.archive.RawArchive` every raw
+        message read is appended to
     :param kwargs: any additional keyword arguments
     """  # noqa: E501
 
@@ -307,6 +392,8 @@ class VPF730:
             dsrdtr: bool = False,
             inter_byte_timeout: float | None = None,
             exclusive: bool | None = None,
+            clock: Clock | None = None,
+            archive: RawArchive | None = None,
             **kwargs: Any,
     ) -> None:
         self.port = port
@@ -321,6 +408,8 @@ class VPF730:
         self.dsrdtr = dsrdtr
         self.inter_byte_timeout = inter_byte_timeout
         self.exclusive = exclusive
+        self._clock = clock
+        self.archive = archive
         self._kwargs = kwargs
 
         # defer opening
@@ -347,6 +436,18 @@ class VPF730:
         finally:
             self._ser.close()
 
+    @property
+    def clock(self) -> Clock:
+        if self._clock is None:
+            # only imported when needed, ``comm`` does not use the clock
+            from vpf_730.clock import SystemClock
+            self._clock = SystemClock()
+        return self._clock
+
+    @clock.setter
+    def clock(self, clock: Clock) -> None:
+        self._clock = clock
+
     def send_command(self, command: str) -> bytes:
         """Send an ASCII command to the VPF-730. A detailed description can be
         found in the Biral VPF-XXX Manual starting on page 59:
@@ -361,6 +462,44 @@ class VPF730:
             self._ser.write(cmd.encode())
             return self._ser.read_until(b'\r\n')
 
+    def read(
+            self,
+            polled_mode: bool = True,
+            timestamp: float | None = None,
+    ) -> bytes:
+        """Read a raw message from the VPF-730 sensor. If an ``archive`` is
+        set, the message is appended to it together with the time the sensor
+        was polled, so replaying it results in the same timestamp as
+        :func:`VPF730.measure`.
+
+        :param polled_mode: read the sensor in polled mode (see
+            :func:`VPF730.measure`)
+        :param timestamp: optional - unix timestamp (UTC) the message is
+            archived with, defaults to the time the sensor was polled
+
+        :return: the message as read from the sensor or ``b''`` if the sensor
+            did not return any data
+        """
+        # only imported when needed, ``comm`` does not update any metrics
+        from vpf_730.metrics import SERIAL_EMPTY_READS
+        from vpf_730.metrics import SERIAL_ROUNDTRIP_SECONDS
+
+        if timestamp is None:
+            timestamp = self.clock.now().timestamp()
+        with self.open_ser():
+            start = time.perf_counter()
+            if polled_mode is True:
+                self._ser.write(b'D?\r\n')
+
+            msg = self._ser.read_until(b'\r\n')
+            SERIAL_ROUNDTRIP_SECONDS.observe(time.perf_counter() - start)
+
+        if not msg:
+            SERIAL_EMPTY_READS.inc()
+        elif self.archive is not None:
+            self.archive.append(timestamp, msg)
+        return msg
+
     def measure(self, polled_mode: bool = True) -> Measurement | None:
         """Read the VPF-730 sensor using the previously configured serial
         interface and return a :func:`Measurement` or None, if the sensor did
@@ -374,13 +513,15 @@ class VPF730:
         :return: a new :func:`Measurement` containing the data read from the
             sensor
         """
-        timestamp = int(datetime.now(timezone.utc).timestamp())
-        with self.open_ser():
-            if polled_mode is True:
-                self._ser.write(b'D?\r\n')
+        polled = self.clock.now().timestamp()
+        timestamp = int(polled)
+        msg = self.read(polled_mode=polled_mode, timestamp=polled)
+        if not msg:
+            return None
 
-            msg = self._ser.read_until(b'\r\n')
-            if msg:
-                return Measurement.from_msg(msg=msg, timestamp=timestamp)
-            else:
-                return None
+        try:
+            return Measurement.from_msg(msg=msg, timestamp=timestamp)
+        except (ValueError, IndexError):
+            from vpf_730.metrics import PARSE_FAILURES
+            PARSE_FAILURES.inc()
+            raise